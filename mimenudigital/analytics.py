@@ -0,0 +1,592 @@
+# ============================================================
+# ANALYTICS - Rollups pre-agregados de visitas
+# ============================================================
+# El worker de visitas (app_menu._procesar_batch_visitas) agrega cada
+# batch en memoria y hace UPSERT incremental sobre las tablas resumen:
+#
+# - estadisticas_diarias      (restaurante × día)
+# - estadisticas_horarias     (restaurante × día × hora)
+# - estadisticas_semana_hora  (restaurante × semana × día de semana × hora)
+# - estadisticas_dimensiones  (restaurante × día × dimensión × valor)
+#   dimensiones: dispositivo, origen, os, navegador, app (in-app browser)
+#
+# Los dashboards leen SOLO estas tablas; nunca escanean `visitas`.
+#
+# Además, user_agent y referer se guardan codificados en tablas
+# diccionario (user_agents, referers): cada visita solo lleva el id.
+#
+# Visitantes únicos: un sketch HyperLogLog por restaurante y día en
+# estadisticas_unicos (restaurante_id = 0 es el total de la plataforma).
+#
+# Series temporales: serie_temporal() arma series por hora/día/semana/mes
+# sobre los mismos rollups, con downsampling y caché de buckets cerrados.
+# ============================================================
+
+from collections import OrderedDict
+from datetime import date, datetime, timedelta
+from threading import Lock
+from urllib.parse import urlparse
+import hashlib
+import logging
+
+from hyperloglog import HyperLogLog, unir
+
+logger = logging.getLogger(__name__)
+
+# Dominios para clasificar el origen de la visita (el backfill de la
+# migración 017 repite estas listas en SQL: mantenerlas sincronizadas)
+_DOMINIOS_SOCIALES = (
+    'facebook.', 'fb.', 'instagram.', 'whatsapp.', 'wa.me', 't.co',
+    'twitter.', 'x.com', 'tiktok.', 'linkedin.', 'pinterest.'
+)
+_DOMINIOS_BUSCADORES = (
+    'google.', 'bing.', 'yahoo.', 'duckduckgo.', 'ecosia.', 'yandex.'
+)
+
+
+def dia_semana_mysql(fecha):
+    """Día de la semana con la convención de DAYOFWEEK() de MySQL (1=domingo ... 7=sábado)."""
+    return fecha.isoweekday() % 7 + 1
+
+
+def inicio_semana(fecha):
+    """Lunes de la semana de `fecha` ('YYYY-MM-DD'), clave de estadisticas_semana_hora."""
+    if isinstance(fecha, str):
+        fecha = date.fromisoformat(fecha[:10])
+    elif isinstance(fecha, datetime):
+        fecha = fecha.date()
+    return (fecha - timedelta(days=fecha.weekday())).isoformat()
+
+
+def clasificar_origen(es_qr, referer):
+    """
+    Clasifica el origen de una visita.
+
+    Returns:
+        str: 'qr', 'directo', 'social', 'buscador' o 'referido'
+    """
+    if es_qr:
+        return 'qr'
+    if not referer:
+        return 'directo'
+    try:
+        host = (urlparse(referer).netloc or '').lower()
+    except Exception:
+        host = ''
+    if not host:
+        return 'directo'
+    if any(d in host for d in _DOMINIOS_SOCIALES):
+        return 'social'
+    if any(d in host for d in _DOMINIOS_BUSCADORES):
+        return 'buscador'
+    return 'referido'
+
+
+def _contadores():
+    return {'visitas': 0, 'qr': 0, 'movil': 0, 'desktop': 0}
+
+
+def _sumar(c, v):
+    c['visitas'] += 1
+    if v.get('es_qr'):
+        c['qr'] += 1
+    if v.get('es_movil'):
+        c['movil'] += 1
+    else:
+        c['desktop'] += 1
+
+
+def agregar_visitas(batch):
+    """
+    Agrega un batch de visitas encoladas en los contadores de cada rollup.
+
+    Cada visita es el dict que arma registrar_visita(); si falta 'hora'
+    o 'dia_semana' (visitas encoladas por versiones anteriores) se usa
+    la hora actual.
+
+    Returns:
+        dict: {'diarias': {(rid, fecha): c}, 'horarias': {(rid, fecha, hora): c},
+               'semana_hora': {(rid, semana, dia, hora): c}, 'dimensiones': {(rid, fecha, dim, valor): n}}
+    """
+    diarias = {}
+    horarias = {}
+    semana_hora = {}
+    dimensiones = {}
+    ahora = datetime.now()
+
+    for v in batch:
+        rid = v['restaurante_id']
+        fecha = v.get('fecha') or ahora.date().isoformat()
+        hora = v.get('hora')
+        if hora is None:
+            hora = ahora.hour
+        dia = v.get('dia_semana') or dia_semana_mysql(ahora)
+
+        _sumar(diarias.setdefault((rid, fecha), _contadores()), v)
+        _sumar(horarias.setdefault((rid, fecha, hora), _contadores()), v)
+        _sumar(semana_hora.setdefault((rid, inicio_semana(fecha), dia, hora), _contadores()), v)
+
+        # Mismo dominio que el backfill de la migración 017 (movil, desktop): el
+        # 'tablet' / 'bot' de ua_classifier partiría la serie en la fecha del deploy
+        dispositivo = 'movil' if v.get('es_movil') else 'desktop'
+        origen = v.get('origen') or clasificar_origen(v.get('es_qr'), v.get('referer'))
+        valores = [('dispositivo', dispositivo), ('origen', origen)]
+        # Campos del clasificador de UA (ua_classifier); ausentes en visitas antiguas
+        for dim in ('os', 'navegador', 'app'):
+            if v.get(dim):
+                valores.append((dim, v[dim]))
+        for dim, valor in valores:
+            key = (rid, fecha, dim, valor)
+            dimensiones[key] = dimensiones.get(key, 0) + 1
+
+    return {
+        'diarias': diarias,
+        'horarias': horarias,
+        'semana_hora': semana_hora,
+        'dimensiones': dimensiones,
+    }
+
+
+def escribir_rollups(cur, agregados):
+    """
+    Aplica los contadores agregados con INSERT ... ON DUPLICATE KEY UPDATE.
+    Un executemany por tabla: el costo no depende del tamaño de `visitas`.
+    """
+    diarias = agregados.get('diarias') or {}
+    if diarias:
+        cur.executemany('''
+            INSERT INTO estadisticas_diarias
+            (restaurante_id, fecha, visitas, escaneos_qr, visitas_movil, visitas_desktop)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                visitas = visitas + VALUES(visitas),
+                escaneos_qr = escaneos_qr + VALUES(escaneos_qr),
+                visitas_movil = visitas_movil + VALUES(visitas_movil),
+                visitas_desktop = visitas_desktop + VALUES(visitas_desktop)
+        ''', [
+            (rid, fecha, c['visitas'], c['qr'], c['movil'], c['desktop'])
+            for (rid, fecha), c in diarias.items()
+        ])
+
+    horarias = agregados.get('horarias') or {}
+    if horarias:
+        cur.executemany('''
+            INSERT INTO estadisticas_horarias
+            (restaurante_id, fecha, hora, visitas, escaneos_qr, visitas_movil, visitas_desktop)
+            VALUES (%s, %s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                visitas = visitas + VALUES(visitas),
+                escaneos_qr = escaneos_qr + VALUES(escaneos_qr),
+                visitas_movil = visitas_movil + VALUES(visitas_movil),
+                visitas_desktop = visitas_desktop + VALUES(visitas_desktop)
+        ''', [
+            (rid, fecha, hora, c['visitas'], c['qr'], c['movil'], c['desktop'])
+            for (rid, fecha, hora), c in horarias.items()
+        ])
+
+    semana_hora = agregados.get('semana_hora') or {}
+    if semana_hora:
+        cur.executemany('''
+            INSERT INTO estadisticas_semana_hora
+            (restaurante_id, semana, dia_semana, hora, visitas, escaneos_qr)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                visitas = visitas + VALUES(visitas),
+                escaneos_qr = escaneos_qr + VALUES(escaneos_qr)
+        ''', [
+            (rid, semana, dia, hora, c['visitas'], c['qr'])
+            for (rid, semana, dia, hora), c in semana_hora.items()
+        ])
+
+    dimensiones = agregados.get('dimensiones') or {}
+    if dimensiones:
+        cur.executemany('''
+            INSERT INTO estadisticas_dimensiones
+            (restaurante_id, fecha, dimension, valor, visitas)
+            VALUES (%s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                visitas = visitas + VALUES(visitas)
+        ''', [
+            (rid, fecha, dim, valor[:50], n)
+            for (rid, fecha, dim, valor), n in dimensiones.items()
+        ])
+
+
+# ============================================================
+# DICCIONARIOS user_agents / referers
+# ============================================================
+
+class DiccionarioDimension:
+    """
+    Mapea strings repetidos (user agent, referer) a un id entero.
+    LRU en memoria delante de la tabla; los faltantes se insertan en lote
+    con INSERT IGNORE sobre un hash único (un índice sobre VARCHAR(500)
+    utf8mb4 excede el largo máximo de clave).
+    """
+
+    def __init__(self, tabla, columna, capacidad=2000):
+        self.tabla = tabla
+        self.columna = columna
+        self.capacidad = capacidad
+        self._cache = OrderedDict()  # {valor: id}
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _hash(valor):
+        return hashlib.sha1(valor.encode('utf-8')).hexdigest()
+
+    def _get(self, valor):
+        with self._lock:
+            dim_id = self._cache.get(valor)
+            if dim_id is not None:
+                self._cache.move_to_end(valor)
+            return dim_id
+
+    def _put(self, valor, dim_id):
+        with self._lock:
+            self._cache[valor] = dim_id
+            self._cache.move_to_end(valor)
+            while len(self._cache) > self.capacidad:
+                self._cache.popitem(last=False)
+
+    def resolver(self, cur, valores):
+        """
+        Devuelve {valor: id} para todos los valores no vacíos.
+        Una sola ida a la BD (INSERT IGNORE + SELECT) por batch de faltantes.
+        """
+        ids = {}
+        faltantes = {}
+        for valor in valores:
+            if not valor or valor in ids or valor in faltantes:
+                continue
+            dim_id = self._get(valor)
+            if dim_id is not None:
+                ids[valor] = dim_id
+                self.hits += 1
+            else:
+                faltantes[valor] = self._hash(valor)
+                self.misses += 1
+
+        if faltantes:
+            cur.executemany(
+                f"INSERT IGNORE INTO {self.tabla} (hash, {self.columna}) VALUES (%s, %s)",
+                [(h, valor) for valor, h in faltantes.items()]
+            )
+            por_hash = {h: valor for valor, h in faltantes.items()}
+            placeholders = ','.join(['%s'] * len(por_hash))
+            cur.execute(
+                f"SELECT id, hash FROM {self.tabla} WHERE hash IN ({placeholders})",
+                list(por_hash.keys())
+            )
+            for row in cur.fetchall():
+                valor = por_hash.get(row['hash'])
+                if valor is not None:
+                    ids[valor] = row['id']
+                    self._put(valor, row['id'])
+
+        return ids
+
+    def stats(self):
+        with self._lock:
+            size = len(self._cache)
+        return {'size': size, 'hits': self.hits, 'misses': self.misses}
+
+
+user_agents_dict = DiccionarioDimension('user_agents', 'user_agent')
+referers_dict = DiccionarioDimension('referers', 'referer', capacidad=5000)
+
+
+def normalizar_referer(referer):
+    """Quita query string y fragmento (fbclid, utm_*) para que el diccionario no crezca con cada visita."""
+    if not referer:
+        return ''
+    return referer.split('#', 1)[0].split('?', 1)[0][:500]
+
+
+def filas_visitas(cur, batch):
+    """
+    Arma las filas para el INSERT de `visitas` con user_agent/referer
+    ya codificados como ids de diccionario.
+    """
+    referers = [normalizar_referer(v.get('referer')) for v in batch]
+    ua_ids = user_agents_dict.resolver(cur, (v.get('user_agent') for v in batch))
+    ref_ids = referers_dict.resolver(cur, referers)
+    return [
+        (
+            v['restaurante_id'],
+            v['ip_address'],
+            ua_ids.get(v.get('user_agent')),
+            ref_ids.get(ref),
+            1 if v['es_movil'] else 0,
+            1 if v['es_qr'] else 0,
+        )
+        for v, ref in zip(batch, referers)
+    ]
+
+
+# ============================================================
+# VISITANTES ÚNICOS (HyperLogLog)
+# ============================================================
+
+HLL_GLOBAL_ID = 0  # fila con el sketch de toda la plataforma
+
+
+def visitante_id(v):
+    """Identidad aproximada del visitante: IP + user agent (sin guardar la IP en el sketch)."""
+    return f"{v.get('ip_address') or ''}|{v.get('user_agent') or ''}"
+
+
+def escribir_sketches(conn, cur, batch):
+    """
+    Une los visitantes del batch en los sketches diarios.
+
+    MySQL no puede combinar sketches en SQL, así que es read-modify-write:
+    se crean las filas faltantes (INSERT IGNORE) y luego se bloquean con
+    SELECT ... FOR UPDATE, para que los workers de otros procesos web no
+    pisen el sketch entre la lectura y la escritura.
+    """
+    sketches = {}
+    for v in batch:
+        clave = visitante_id(v)
+        for rid in (v['restaurante_id'], HLL_GLOBAL_ID):
+            sketches.setdefault((rid, v['fecha']), HyperLogLog()).add(clave)
+    if not sketches:
+        return
+
+    keys = sorted(sketches)
+    cur.executemany(
+        "INSERT IGNORE INTO estadisticas_unicos (restaurante_id, fecha, unicos) VALUES (%s, %s, 0)",
+        keys
+    )
+
+    conn.begin()
+    try:
+        condicion = ' OR '.join(['(restaurante_id = %s AND fecha = %s)'] * len(keys))
+        params = [x for key in keys for x in key]
+        cur.execute(
+            f"SELECT restaurante_id, fecha, hll FROM estadisticas_unicos WHERE {condicion} FOR UPDATE",
+            params
+        )
+        for row in cur.fetchall():
+            key = (row['restaurante_id'], str(row['fecha']))
+            if key in sketches and row['hll']:
+                sketches[key].merge(HyperLogLog.from_bytes(row['hll']))
+
+        cur.executemany(
+            "UPDATE estadisticas_unicos SET hll = %s, unicos = %s WHERE restaurante_id = %s AND fecha = %s",
+            [(sketches[k].to_bytes(), sketches[k].count(), k[0], k[1]) for k in keys]
+        )
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def contar_unicos(cur, restaurante_id, desde, hasta):
+    """
+    Visitantes únicos estimados entre `desde` y `hasta` (inclusive).
+    Un solo día usa el estimado ya calculado; un rango une los sketches.
+    """
+    if desde == hasta:
+        cur.execute(
+            "SELECT unicos FROM estadisticas_unicos WHERE restaurante_id = %s AND fecha = %s",
+            (restaurante_id, desde)
+        )
+        row = cur.fetchone()
+        return int(row['unicos']) if row and row['unicos'] else 0
+
+    cur.execute(
+        "SELECT hll FROM estadisticas_unicos WHERE restaurante_id = %s AND fecha BETWEEN %s AND %s",
+        (restaurante_id, desde, hasta)
+    )
+    return unir(row['hll'] for row in cur.fetchall()).count()
+
+
+# ============================================================
+# SERIES TEMPORALES (/api/analytics/series)
+# ============================================================
+# Serie por hora/día/semana/mes sobre los rollups. Los rangos largos se
+# bajan de granularidad (MAX_PUNTOS_SERIE) en vez de devolver miles de
+# puntos. Los buckets anteriores al bucket que contiene "hoy" ya no
+# cambian: se cachean con una clave que incluye su fecha de corte (al
+# cambiar el día la clave cambia sola). Solo el bucket actual se
+# recalcula en cada request.
+
+GRANULARIDADES = ('hora', 'dia', 'semana', 'mes')
+_ALIAS_GRANULARIDAD = {'hour': 'hora', 'day': 'dia', 'week': 'semana', 'month': 'mes'}
+
+# métrica pública -> columna de los rollups ('unicos' sale de los sketches)
+METRICAS_SERIE = {
+    'visitas': 'visitas',
+    'escaneos': 'escaneos_qr',
+    'movil': 'visitas_movil',
+    'desktop': 'visitas_desktop',
+    'unicos': None,
+}
+
+MAX_PUNTOS_SERIE = 400
+SERIE_CACHE_TTL = 6 * 3600
+
+
+def normalizar_granularidad(valor):
+    g = (valor or 'dia').lower()
+    g = _ALIAS_GRANULARIDAD.get(g, g)
+    if g not in GRANULARIDADES:
+        raise ValueError(f"Granularidad inválida: {valor}")
+    return g
+
+
+def inicio_bucket(valor, granularidad):
+    """Inicio del bucket que contiene `valor` (date o datetime)."""
+    if granularidad == 'hora':
+        return valor.replace(minute=0, second=0, microsecond=0)
+    d = valor.date() if isinstance(valor, datetime) else valor
+    if granularidad == 'semana':
+        return d - timedelta(days=d.weekday())
+    if granularidad == 'mes':
+        return d.replace(day=1)
+    return d
+
+
+def _siguiente_bucket(b, granularidad):
+    if granularidad == 'hora':
+        return b + timedelta(hours=1)
+    if granularidad == 'dia':
+        return b + timedelta(days=1)
+    if granularidad == 'semana':
+        return b + timedelta(days=7)
+    return (b.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def buckets(desde, hasta, granularidad):
+    """Inicios de bucket que cubren [desde, hasta] (fechas inclusive)."""
+    if granularidad == 'hora':
+        b = datetime.combine(desde, datetime.min.time())
+        fin = datetime.combine(hasta, datetime.min.time()).replace(hour=23)
+    else:
+        b, fin = inicio_bucket(desde, granularidad), hasta
+    resultado = []
+    while b <= fin:
+        resultado.append(b)
+        b = _siguiente_bucket(b, granularidad)
+    return resultado
+
+
+def granularidad_efectiva(desde, hasta, granularidad):
+    """Baja la granularidad hasta que la serie tenga <= MAX_PUNTOS_SERIE puntos."""
+    dias = (hasta - desde).days + 1
+    puntos = {'hora': dias * 24, 'dia': dias, 'semana': dias / 7, 'mes': dias / 30}
+    idx = GRANULARIDADES.index(granularidad)
+    while idx < len(GRANULARIDADES) - 1 and puntos[GRANULARIDADES[idx]] > MAX_PUNTOS_SERIE:
+        idx += 1
+    return GRANULARIDADES[idx]
+
+
+def _clave_bucket(b):
+    return b.isoformat(timespec='minutes') if isinstance(b, datetime) else b.isoformat()
+
+
+def _calcular_puntos(cur, restaurante_id, desde, hasta, granularidad, metricas):
+    """{clave_bucket: {metrica: valor}} para [desde, hasta] leyendo solo rollups."""
+    puntos = {_clave_bucket(b): {m: 0 for m in metricas} for b in buckets(desde, hasta, granularidad)}
+    columnas = [m for m in metricas if METRICAS_SERIE[m]]
+
+    if columnas:
+        sumas = ', '.join(f"COALESCE(SUM({METRICAS_SERIE[m]}),0) as {m}" for m in columnas)
+        if granularidad == 'hora':
+            cur.execute(f'''
+                SELECT fecha, hora, {sumas}
+                FROM estadisticas_horarias
+                WHERE restaurante_id = %s AND fecha BETWEEN %s AND %s
+                GROUP BY fecha, hora
+            ''', (restaurante_id, desde, hasta))
+        else:
+            cur.execute(f'''
+                SELECT fecha, {sumas}
+                FROM estadisticas_diarias
+                WHERE restaurante_id = %s AND fecha BETWEEN %s AND %s
+                GROUP BY fecha
+            ''', (restaurante_id, desde, hasta))
+        for row in cur.fetchall():
+            if granularidad == 'hora':
+                b = datetime.combine(row['fecha'], datetime.min.time()).replace(hour=int(row['hora']))
+            else:
+                b = inicio_bucket(row['fecha'], granularidad)
+            punto = puntos.get(_clave_bucket(b))
+            if punto is not None:
+                for m in columnas:
+                    punto[m] += int(row[m] or 0)
+
+    # Únicos: no se pueden sumar entre días; se unen los sketches del bucket
+    if 'unicos' in metricas and granularidad != 'hora':
+        columna = 'unicos' if granularidad == 'dia' else 'hll'
+        cur.execute(f'''
+            SELECT fecha, {columna}
+            FROM estadisticas_unicos
+            WHERE restaurante_id = %s AND fecha BETWEEN %s AND %s
+        ''', (restaurante_id, desde, hasta))
+        sketches = {}
+        for row in cur.fetchall():
+            clave = _clave_bucket(inicio_bucket(row['fecha'], granularidad))
+            if granularidad == 'dia':
+                if clave in puntos:
+                    puntos[clave]['unicos'] = int(row['unicos'] or 0)
+            elif row['hll']:
+                sketches.setdefault(clave, []).append(row['hll'])
+        for clave, blobs in sketches.items():
+            if clave in puntos:
+                puntos[clave]['unicos'] = unir(blobs).count()
+
+    return puntos
+
+
+def serie_temporal(cur, restaurante_id, desde, hasta, granularidad='dia', metricas=('visitas',),
+                   cache=None, hoy=None):
+    """
+    Serie temporal de un restaurante sobre los rollups.
+
+    Args:
+        cur: cursor DictCursor
+        desde, hasta: fechas (date) inclusive; `hasta` se recorta a hoy
+        granularidad: 'hora' | 'dia' | 'semana' | 'mes' (o hour/day/week/month)
+        metricas: subconjunto de METRICAS_SERIE
+        cache: objeto con get(key) / set(key, valor, ttl=) (opcional)
+
+    Returns:
+        dict: {'granularidad', 'solicitada', 'downsampled', 'desde', 'hasta', 'puntos': [...]}
+    """
+    hoy = hoy or date.today()
+    solicitada = normalizar_granularidad(granularidad)
+    metricas = tuple(m for m in METRICAS_SERIE if m in metricas) or ('visitas',)
+    hasta = min(hasta, hoy)
+    if desde > hasta:
+        raise ValueError("El rango de fechas es inválido")
+
+    gran = granularidad_efectiva(desde, hasta, solicitada)
+
+    # Buckets cerrados (anteriores al que contiene hoy) son inmutables
+    corte = inicio_bucket(hoy, gran) if gran != 'hora' else hoy
+    puntos = {}
+    if desde < corte:
+        hasta_cerrado = min(hasta, corte - timedelta(days=1))
+        clave = f"serie:{restaurante_id}:{gran}:{desde}:{hasta_cerrado}:{','.join(metricas)}"
+        cerrados = cache.get(clave) if cache is not None else None
+        if cerrados is None:
+            cerrados = _calcular_puntos(cur, restaurante_id, desde, hasta_cerrado, gran, metricas)
+            if cache is not None:
+                cache.set(clave, cerrados, ttl=SERIE_CACHE_TTL)
+        puntos.update(cerrados)
+    if hasta >= corte:
+        puntos.update(_calcular_puntos(cur, restaurante_id, max(desde, corte), hasta, gran, metricas))
+
+    return {
+        'granularidad': gran,
+        'solicitada': solicitada,
+        'downsampled': gran != solicitada,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'metricas': list(metricas),
+        'puntos': [dict(t=k, **v) for k, v in sorted(puntos.items())],
+    }
@@ -54,7 +54,7 @@ if _api_proxy:
 
 from flask import (
     Flask, render_template, request, jsonify, redirect, url_for, 
-    flash, session, g, send_from_directory, make_response
+    flash, session, g, send_from_directory, send_file, abort, make_response, Response, stream_with_context
 )
 import pymysql
 from pymysql.cursors import DictCursor
@@ -75,6 +75,11 @@ import requests
 import hashlib
 import time
 
+import http_client
+from image_jobs import IMAGE_UPLOAD_WORKERS, UPLOAD_BATCH_WORKERS
+from image_preprocess import preprocesar_imagen
+from image_placeholders import calcular_placeholder, registrar_placeholder, aplicar_placeholders
+
 # ============================================================
 # CLOUDINARY - REQUIERE VARIABLE DE ENTORNO
 # ============================================================
@@ -105,13 +110,17 @@ if _cloudinary_url_env and _cloudinary_url_env.startswith('cloudinary://'):
 else:
     logging.getLogger(__name__).warning("CLOUDINARY_URL no configurado - subida de imágenes deshabilitada")
 
-# Sesión de requests con proxy configurado
-_cloudinary_session = requests.Session()
+# Base de la API (upload / Admin API). Se puede apuntar a un emulador local en tests.
+CLOUDINARY_API_BASE = os.environ.get('CLOUDINARY_API_BASE', 'https://api.cloudinary.com/v1_1').rstrip('/')
+
+# Sesión compartida con proxy, pool de conexiones y reintentos (http_client.py).
+# La usan los threads web, el pool de subidas y el de /api/upload-images.
+_cloudinary_session = http_client.sesion(
+    'cloudinary',
+    hilos=http_client.HTTP_POOL_SIZE + IMAGE_UPLOAD_WORKERS + UPLOAD_BATCH_WORKERS,
+    proxy=_api_proxy
+)
 if _api_proxy:
-    _cloudinary_session.proxies = {
-        'http': _api_proxy,
-        'https': _api_proxy
-    }
     logging.getLogger(__name__).info("Cloudinary session configurada con proxy: %s", _api_proxy)
 
 
@@ -128,11 +137,13 @@ def cloudinary_upload(file, **options):
     """
     Sube una imagen a Cloudinary usando requests directamente.
     SIMPLIFICADO: Solo sube la imagen con folder, sin transformaciones complejas.
-    La rotación EXIF se maneja automáticamente por Cloudinary.
+    Los archivos (no las URLs) pasan antes por preprocesar_imagen(): orientación
+    EXIF, lado mayor IMG_MAX_DIM, WebP sin metadata.
     
     Args:
         file: Archivo (file-like object, path string, o URL)
-        **options: Opciones de upload (folder, etc.)
+        **options: Opciones de upload (folder, etc.). preprocesar=False sube
+            el archivo tal cual.
     
     Returns:
         dict con la respuesta de Cloudinary (secure_url, public_id, etc.)
@@ -143,13 +154,14 @@ def cloudinary_upload(file, **options):
     if _cloudinary_config is None:
         raise RuntimeError("CLOUDINARY_URL no está configurado. Configura la variable de entorno.")
     
+    preprocesar = options.pop('preprocesar', True)
     config = _cloudinary_config
     cloud_name = config['cloud_name']
     api_key = config['api_key']
     api_secret = config['api_secret']
     
     # URL del API - siempre usar 'auto' para detectar tipo automáticamente
-    upload_url = f"https://api.cloudinary.com/v1_1/{cloud_name}/auto/upload"
+    upload_url = f"{CLOUDINARY_API_BASE}/{cloud_name}/auto/upload"
     
     # Timestamp
     timestamp = str(int(time.time()))
@@ -172,11 +184,23 @@ def cloudinary_upload(file, **options):
     
     # Preparar archivo
     files = None
-    if isinstance(file, str):
-        if file.startswith(('http://', 'https://', 'ftp://', 's3://', 'data:')):
-            params['file'] = file
-        else:
-            files = {'file': open(file, 'rb')}
+    procesada = None
+    es_url = isinstance(file, str) and file.startswith(('http://', 'https://', 'ftp://', 's3://', 'data:'))
+    if not es_url and preprocesar:
+        procesada = preprocesar_imagen(file)
+    # Dimensiones, color y LQIP para el menú público (image_placeholders.py)
+    if procesada:
+        placeholder = procesada.get('placeholder')
+    elif not es_url:
+        placeholder = calcular_placeholder(file)
+    else:
+        placeholder = None
+    if es_url:
+        params['file'] = file
+    elif procesada:
+        files = {'file': (procesada['filename'], procesada['stream'], procesada['content_type'])}
+    elif isinstance(file, str):
+        files = {'file': open(file, 'rb')}
     else:
         # File-like object
         filename = getattr(file, 'filename', 'upload.jpg')
@@ -187,8 +211,7 @@ def cloudinary_upload(file, **options):
         response = _cloudinary_session.post(
             upload_url,
             data=params,
-            files=files,
-            timeout=120
+            files=files
         )
         
         result = response.json()
@@ -197,10 +220,108 @@ def cloudinary_upload(file, **options):
             error_msg = result['error'].get('message', str(result['error']))
             raise Exception(f"Cloudinary error: {error_msg}")
         
+        _registrar_placeholder(result.get('secure_url') or result.get('url'), placeholder)
+        result['placeholder'] = placeholder
         return result
         
     except requests.exceptions.RequestException as e:
         raise Exception(f"Error de conexión con Cloudinary: {str(e)}")
+    finally:
+        if procesada:
+            procesada['stream'].close()
+
+
+def _registrar_placeholder(url, placeholder):
+    """Guarda los metadatos de una imagen recién subida (sin romper la subida si falla)."""
+    if not url or not placeholder:
+        return
+    try:
+        with db_get_connection() as conn:
+            with conn.cursor() as cur:
+                registrar_placeholder(cur, url, placeholder)
+            conn.commit()
+    except Exception as e:
+        logger.warning("No se pudo registrar el placeholder de %s: %s", url, e)
+
+
+def cloudinary_destroy(public_id, resource_type='image'):
+    """
+    Elimina un asset de Cloudinary (API destroy firmada) por la sesión compartida.
+
+    Returns:
+        dict con la respuesta ({'result': 'ok' | 'not found'})
+    """
+    if _cloudinary_config is None:
+        raise RuntimeError("CLOUDINARY_URL no está configurado. Configura la variable de entorno.")
+    config = _cloudinary_config
+    params = {'public_id': public_id, 'timestamp': str(int(time.time()))}
+    params['signature'] = _cloudinary_sign(params, config['api_secret'])
+    params['api_key'] = config['api_key']
+    try:
+        response = _cloudinary_session.post(
+            f"{CLOUDINARY_API_BASE}/{config['cloud_name']}/{resource_type}/destroy",
+            data=params,
+            timeout=http_client.TIMEOUTS['cloudinary_api']
+        )
+        result = response.json()
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Error de conexión con Cloudinary: {str(e)}")
+    if 'error' in result:
+        raise Exception(f"Cloudinary error: {result['error'].get('message', result['error'])}")
+    return result
+
+
+def cloudinary_borrar_lote(public_ids, resource_type='image'):
+    """
+    Borra hasta 100 assets en una llamada (Admin API delete_resources).
+
+    Returns:
+        dict: {public_id: 'deleted' | 'not_found' | ...}
+    """
+    if _cloudinary_config is None:
+        raise RuntimeError("CLOUDINARY_URL no está configurado. Configura la variable de entorno.")
+    config = _cloudinary_config
+    try:
+        response = _cloudinary_session.delete(
+            f"{CLOUDINARY_API_BASE}/{config['cloud_name']}/resources/{resource_type}/upload",
+            data=[('public_ids[]', pid) for pid in public_ids],
+            auth=(config['api_key'], config['api_secret']),
+            timeout=http_client.TIMEOUTS['cloudinary_api']
+        )
+        result = response.json()
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Error de conexión con Cloudinary: {str(e)}")
+    if 'error' in result:
+        raise Exception(f"Cloudinary error: {result['error'].get('message', result['error'])}")
+    return result.get('deleted', {})
+
+
+def cloudinary_listar_recursos(prefix, next_cursor=None, max_results=500, resource_type='image'):
+    """
+    Una página de assets bajo `prefix` (Admin API, paginada con next_cursor).
+
+    Returns:
+        dict: {'resources': [{'public_id', 'created_at', 'bytes', ...}], 'next_cursor'}
+    """
+    if _cloudinary_config is None:
+        raise RuntimeError("CLOUDINARY_URL no está configurado. Configura la variable de entorno.")
+    config = _cloudinary_config
+    params = {'type': 'upload', 'prefix': prefix, 'max_results': max_results}
+    if next_cursor:
+        params['next_cursor'] = next_cursor
+    try:
+        response = _cloudinary_session.get(
+            f"{CLOUDINARY_API_BASE}/{config['cloud_name']}/resources/{resource_type}",
+            params=params,
+            auth=(config['api_key'], config['api_secret']),
+            timeout=http_client.TIMEOUTS['cloudinary_api']
+        )
+        result = response.json()
+    except requests.exceptions.RequestException as e:
+        raise Exception(f"Error de conexión con Cloudinary: {str(e)}")
+    if 'error' in result:
+        raise Exception(f"Cloudinary error: {result['error'].get('message', result['error'])}")
+    return {'resources': result.get('resources', []), 'next_cursor': result.get('next_cursor')}
 
 
 # También importar cloudinary para funciones auxiliares (URLs, etc.)
@@ -271,12 +392,13 @@ def cloudinary_image_url(public_id, width=None):
     return f"https://res.cloudinary.com/{cloud_name}/image/upload/{trans_str}/{public_id}"
 
 
-def cloudinary_srcset(public_id, widths=None):
-    """Genera un `srcset` (string) para el `public_id` usando los anchos configurados o pasados."""
-    if not CLOUDINARY_AVAILABLE or not public_id:
-        return None
+def cloudinary_srcset(public_id, widths=None, url=None):
+    """Genera un `srcset` (string) para el `public_id` usando los anchos configurados o pasados.
+    Sin Cloudinary (o sin public_id) y con `url` de static/uploads, el srcset apunta a /img/."""
     if widths is None:
         widths = app.config.get('CLOUDINARY_IMAGE_WIDTHS', [320, 640, 1024])
+    if not (public_id and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED):
+        return srcset_derivados(url, widths) if url else None
     parts = []
     for w in widths:
         url = cloudinary_image_url(public_id, width=w)
@@ -285,6 +407,22 @@ def cloudinary_srcset(public_id, widths=None):
     return ', '.join(parts)
 
 
+def imagen_responsiva(public_id, url, width=640):
+    """
+    (src, srcset) de una imagen: Cloudinary si hay public_id y está configurado;
+    derivados locales si es un upload de static/uploads (pendiente o sin
+    Cloudinary); si no, la URL guardada tal cual.
+    """
+    if public_id and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED:
+        generated_url = cloudinary_image_url(public_id, width=width)
+        if generated_url:
+            return generated_url, cloudinary_srcset(public_id)
+    local = url_derivado(url, width)
+    if local:
+        return local, srcset_derivados(url, app.config.get('CLOUDINARY_IMAGE_WIDTHS', [320, 640, 1024]))
+    return url, None
+
+
 import traceback
 from logging.handlers import RotatingFileHandler
 
@@ -296,6 +434,8 @@ except ImportError:
     pdfkit = None
     PDFKIT_AVAILABLE = False
 
+from upload_validation import inspeccionar_upload, tipo_por_firma, ArchivoDemasiadoGrande
+
 # Intentar importar python-magic para MIME sniffing de archivos subidos
 try:
     import magic
@@ -537,6 +677,8 @@ def _lazy_init_services_once():
         init_mercadopago()
         # Ejecutar comprobaciones críticas de entorno (solo lanzará en producción)
         enforce_required_envs()
+        # Jobs periódicos (snapshot de stats, barridos, limpiezas)
+        _iniciar_scheduler_web()
 
         # Registrar helpers de Jinja que usan funciones definidas en este módulo
         try:
@@ -587,7 +729,8 @@ def init_mercadopago():
         logger.warning("MERCADO_PAGO_PUBLIC_KEY no está configurada. La integración del lado cliente puede fallar.")
 
     try:
-        MERCADOPAGO_CLIENT = mercadopago.SDK(access_token)
+        MERCADOPAGO_CLIENT = mercadopago.SDK(access_token, http_client=http_client.ClienteHttpMercadoPago(
+            http_client.sesion('mercadopago', proxy=_api_proxy)))
         logger.info("Mercado Pago configurado correctamente (cliente inicializado).")
         return True
     except Exception:
@@ -611,6 +754,50 @@ UPLOAD_FOLDER = os.path.join(base_dir, 'static', 'uploads')
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
+# Derivados reducidos de static/uploads (image_derivatives.py), servidos en
+# /img/<nombre>?w=N cuando la imagen no está (o no puede estar) en Cloudinary.
+from image_derivatives import CacheDerivados, url_derivado, srcset_derivados, CACHE_MAX_AGE
+cache_derivados = CacheDerivados(
+    UPLOAD_FOLDER,
+    os.path.join(UPLOAD_FOLDER, '.derivados'),
+    anchos=app.config.get('CLOUDINARY_IMAGE_WIDTHS', [320, 640, 1024])
+)
+
+# Subidas asíncronas (image_jobs.py): el request responde con una URL local
+# provisoria y un pool de threads sube a Cloudinary. IMAGENES_ASYNC=0 vuelve
+# a la subida sincrónica.
+from image_jobs import PipelineImagenes, resolver_imagenes, procesar_en_paralelo, UPLOAD_BATCH_MAX
+IMAGENES_ASYNC = os.environ.get('IMAGENES_ASYNC', '1') == '1'
+pipeline_imagenes = PipelineImagenes(
+    app,
+    subir=lambda archivo, **opciones: cloudinary_upload(archivo, **opciones),
+    invalidar=invalidar_cache_restaurante
+)
+
+# Borrado diferido de imágenes en Cloudinary (image_cleanup.py): los endpoints
+# encolan public_ids en su transacción y el job 'borrar_imagenes_cloudinary'
+# los borra de a 100.
+from image_cleanup import (
+    ColaBorrados, encolar_borrado, public_ids_platos, reconciliar_cloudinary, limpiar_archivos_locales
+)
+cola_borrados = ColaBorrados(
+    borrar_lote=lambda public_ids, resource_type: cloudinary_borrar_lote(public_ids, resource_type)
+)
+
+# /api/upload-images recibe hasta UPLOAD_BATCH_MAX archivos en un request;
+# cada archivo sigue limitado a MAX_CONTENT_LENGTH en validate_image_file().
+UPLOAD_BATCH_MAX_BYTES = int(os.environ.get('UPLOAD_BATCH_MAX_MB', '30')) * 1024 * 1024
+
+
+@app.before_request
+def _limite_lote_imagenes():
+    # Registrado antes de CSRFProtect, que lee request.form (y parsea el body)
+    if request.endpoint == 'api_upload_images':
+        try:
+            request.max_content_length = UPLOAD_BATCH_MAX_BYTES
+        except AttributeError:
+            pass  # Flask < 3.1: rige MAX_CONTENT_LENGTH para todo el lote
+
 # ============================================================
 # CONFIGURACIÓN DE BASE DE DATOS
 # ============================================================
@@ -751,7 +938,7 @@ if MERCADO_WEBHOOK_KEY:
 # ============================================================
 # DATABASE - usar `database.py` centralizado con SQLAlchemy Pool
 # ============================================================
-from database import init_app as db_init_app, get_db as db_get_db, get_cursor as db_get_cursor, execute_query as db_execute_query, get_pool_status, _pool as db_pool
+from database import init_app as db_init_app, get_db as db_get_db, get_cursor as db_get_cursor, execute_query as db_execute_query, get_pool_status, _pool as db_pool, get_connection as db_get_connection, run_parallel_queries
 
 # Inicializar el pool de conexiones SQLAlchemy
 db_init_app(app)
@@ -1221,38 +1408,27 @@ def validate_image_file(file):
     if not allowed_file(filename):
         return False, 'Extensión no permitida'
 
-    # Content-Type (por ejemplo: image/jpeg) — usado como heurística, pero no siempre confiable
-    content_type = getattr(file, 'content_type', '') or getattr(file, 'mimetype', '')
-
-    # Tamaño máximo por archivo (intentar comprobar de forma segura)
+    # Tamaño máximo por archivo y cabecera en una pasada (upload_validation.py):
+    # el tamaño sale de content_length / seek, sin leer el archivo
     max_len = app.config.get('MAX_CONTENT_LENGTH', MAX_CONTENT_LENGTH)
-    # Algunos objetos file tienen .content_length
-    cl = getattr(file, 'content_length', None)
-    if cl and cl > max_len:
-        return False, 'Archivo demasiado grande'
-
-    # Intentar inspeccionar parcialmente el stream para chequear tamaño sin consumirlo
     try:
-        pos = file.stream.tell()
-        peek = file.stream.read(max_len + 1)
-        file.stream.seek(pos)
-        if len(peek) > max_len:
-            return False, 'Archivo demasiado grande'
+        _, head = inspeccionar_upload(file, max_len)
+    except ArchivoDemasiadoGrande:
+        return False, 'Archivo demasiado grande'
     except Exception:
-        # Si no podemos medir, no bloquear; será chequeado por request.content_length
-        pass
+        # Si no podemos inspeccionar, no bloquear; será chequeado por request.content_length
+        head = None
 
     # En modo TESTING, ser menos restrictivos para facilitar tests unitarios (aceptar archivos de prueba)
     if app.config.get('TESTING'):
         return True, None
 
-    # Si python-magic está disponible, leer los primeros KB y verificar MIME
+    if head is None:
+        return True, None
+
+    # Si python-magic está disponible, verificar MIME sobre la cabecera ya leída
     if MAGIC_AVAILABLE and magic:
         try:
-            # Mantener posición del stream
-            pos = file.stream.tell()
-            head = file.stream.read(2048)
-            file.stream.seek(pos)
             mtype = magic.from_buffer(head, mime=True)
             if not mtype or not mtype.startswith('image/'):
                 return False, f'Contenido no es imagen (detected: {mtype})'
@@ -1262,22 +1438,8 @@ def validate_image_file(file):
             logger.debug('Error al usar python-magic para detectar MIME: %s', e)
     else:
         # Fallback simple: verificar firmas binarias para tipos comunes si no hay magic
-        try:
-            pos = file.stream.tell()
-            head = file.stream.read(16)
-            file.stream.seek(pos)
-            if head.startswith(b'\xff\xd8\xff'):
-                return True, None  # JPEG
-            if head.startswith(b'\x89PNG'):
-                return True, None  # PNG
-            if head.startswith(b'GIF8'):
-                return True, None  # GIF
-            if len(head) >= 12 and head[0:4] == b'RIFF' and head[8:12] == b'WEBP':
-                return True, None  # WEBP
+        if not tipo_por_firma(head):
             return False, 'Contenido no es imagen'
-        except Exception:
-            # Si no podemos inspeccionar, permitir y confiar en Content-Type or size checks
-            pass
 
     return True, None
 
@@ -1399,6 +1561,7 @@ def verificar_suscripcion(f):
                     fecha_vencimiento = date.today() + timedelta(days=30)
                     cur.execute('UPDATE restaurantes SET fecha_vencimiento = %s, estado_suscripcion = %s WHERE id = %s',
                             (fecha_vencimiento.isoformat(), 'prueba', restaurante_id))
+                    recalcular_estado_efectivo(cur, [restaurante_id])
                     db.commit()
                     session[cache_key] = 'ok'
                     session[cache_time_key] = ahora
@@ -1444,6 +1607,16 @@ def verificar_suscripcion(f):
 from queue import Queue, Empty
 from threading import Thread
 import threading
+from analytics import (
+    agregar_visitas, escribir_rollups, dia_semana_mysql, filas_visitas,
+    escribir_sketches, contar_unicos, HLL_GLOBAL_ID, serie_temporal
+)
+from ua_classifier import clasificar_user_agent, cache_info as ua_cache_info
+from subscription_state import recalcular_estado_efectivo, barrido_vencimientos
+from exports import stream_export, parse_cursor, EXPORTS, FORMATOS
+from menu_bulk import importar_platos, leer_csv, ErrorImportacion, aplicar_orden, MAX_ETIQUETAS
+from menu_sync import marcar_platos, registrar_eliminados, cambios_desde, purgar_lapidas
+from busqueda import buscar_platos
 
 _visitas_queue = Queue(maxsize=5000)  # Aumentado para soportar más tráfico
 _visita_worker_running = False
@@ -1525,57 +1698,23 @@ def _procesar_batch_visitas(batch):
     try:
         conn = _get_worker_connection()
         with conn.cursor() as cur:
-            # Preparar datos para INSERT múltiple de visitas
-            visitas_values = []
-            stats_updates = {}  # {(restaurante_id, fecha): {visitas, qr, movil, desktop}}
-            
-            for v in batch:
-                # Datos para tabla visitas
-                visitas_values.append((
-                    v['restaurante_id'],
-                    v['ip_address'],
-                    v['user_agent'],
-                    v['referer'],
-                    1 if v['es_movil'] else 0,
-                    1 if v['es_qr'] else 0
-                ))
-                
-                # Agregar a estadísticas
-                key = (v['restaurante_id'], v['fecha'])
-                if key not in stats_updates:
-                    stats_updates[key] = {'visitas': 0, 'qr': 0, 'movil': 0, 'desktop': 0}
-                stats_updates[key]['visitas'] += 1
-                if v['es_qr']:
-                    stats_updates[key]['qr'] += 1
-                if v['es_movil']:
-                    stats_updates[key]['movil'] += 1
-                else:
-                    stats_updates[key]['desktop'] += 1
-            
-            # INSERT batch de visitas
+            # INSERT batch de visitas (user_agent/referer como ids de diccionario)
+            visitas_values = filas_visitas(cur, batch)
             if visitas_values:
                 cur.executemany('''
                     INSERT INTO visitas 
-                    (restaurante_id, ip_address, user_agent, referer, es_movil, es_qr, fecha)
+                    (restaurante_id, ip_address, user_agent_id, referer_id, es_movil, es_qr, fecha)
                     VALUES (%s, %s, %s, %s, %s, %s, NOW())
                 ''', visitas_values)
             
-            # UPDATE batch de estadísticas
-            for (rest_id, fecha), stats in stats_updates.items():
-                cur.execute('''
-                    INSERT INTO estadisticas_diarias 
-                    (restaurante_id, fecha, visitas, escaneos_qr, visitas_movil, visitas_desktop)
-                    VALUES (%s, %s, %s, %s, %s, %s)
-                    ON DUPLICATE KEY UPDATE
-                        visitas = visitas + %s,
-                        escaneos_qr = escaneos_qr + %s,
-                        visitas_movil = visitas_movil + %s,
-                        visitas_desktop = visitas_desktop + %s
-                ''', (
-                    rest_id, fecha,
-                    stats['visitas'], stats['qr'], stats['movil'], stats['desktop'],
-                    stats['visitas'], stats['qr'], stats['movil'], stats['desktop']
-                ))
+            # UPSERT incremental de rollups (diario, horario, semana×hora, dimensiones)
+            escribir_rollups(cur, agregar_visitas(batch))
+            
+            # Sketches HyperLogLog de visitantes únicos (no debe frenar el resto)
+            try:
+                escribir_sketches(conn, cur, batch)
+            except Exception as e:
+                logger.warning("Error updating unique visitor sketches: %s", e)
             
             conn.commit()
             logger.debug("Processed batch of %d visits", len(batch))
@@ -1624,9 +1763,9 @@ def registrar_visita(restaurante_id, req):
         user_agent = req.headers.get('User-Agent', '')[:500]
         referer = req.headers.get('Referer', '')[:500]
         
-        # Detectar dispositivo móvil
-        ua_lower = user_agent.lower()
-        es_movil = any(x in ua_lower for x in ['mobile', 'android', 'iphone', 'ipad', 'ipod'])
+        # Detectar dispositivo (regex precompilados + LRU por UA: casi siempre un lookup)
+        info_ua = clasificar_user_agent(user_agent)
+        es_movil = info_ua.es_movil
         
         # Detectar escaneo QR
         es_qr = False
@@ -1634,12 +1773,13 @@ def registrar_visita(restaurante_id, req):
             es_qr = True
         elif es_movil and (not referer or referer == ''):
             es_qr = True
-        elif any(x in ua_lower for x in ['qr', 'scanner', 'barcode', 'zxing', 'nfc']):
+        elif info_ua.ua_qr:
             es_qr = True
         elif referer and 'qr' in referer.lower():
             es_qr = True
         
         # Encolar la visita (no bloquea)
+        ahora = datetime.now()
         visita_data = {
             'restaurante_id': restaurante_id,
             'ip_address': ip_address,
@@ -1647,7 +1787,12 @@ def registrar_visita(restaurante_id, req):
             'referer': referer,
             'es_movil': es_movil,
             'es_qr': es_qr,
-            'fecha': date.today().isoformat()
+            'os': info_ua.os,
+            'navegador': info_ua.navegador,
+            'app': info_ua.app,
+            'fecha': ahora.date().isoformat(),
+            'hora': ahora.hour,
+            'dia_semana': dia_semana_mysql(ahora)
         }
         
         try:
@@ -1674,6 +1819,31 @@ def index():
     return render_template('index.html')
 
 
+@app.route('/api/menu/<string:url_slug>/buscar')
+@rate_limit('public')
+def api_menu_publico_buscar(url_slug):
+    """Búsqueda pública dentro del menú de un restaurante (solo platos y categorías activos)."""
+    texto = request.args.get('q', '').strip()[:100]
+    try:
+        with get_db().cursor() as cur:
+            cur.execute("SELECT id FROM restaurantes WHERE url_slug = %s AND activo = 1", (url_slug,))
+            row = cur.fetchone()
+            if not row:
+                return jsonify({'success': False, 'error': 'Menú no encontrado'}), 404
+            resultados = buscar_platos(cur, row['id'], texto, solo_activos=True, limite=30)
+        
+        campos = ('id', 'categoria_id', 'categoria_nombre', 'nombre', 'descripcion', 'precio', 'precio_oferta', 'imagen_url')
+        return jsonify({
+            'success': True,
+            'q': texto,
+            'resultados': [{k: r.get(k) for k in campos} for r in list_from_rows(resultados)]
+        })
+    except Exception:
+        logger.exception("Error en api_menu_publico_buscar")
+        # Endpoint público: sin detalles internos en la respuesta
+        return jsonify({'success': False, 'error': 'Error interno'}), 500
+
+
 @app.route('/menu/<string:url_slug>')
 def ver_menu_publico(url_slug):
     """Ruta pública para ver el menú. Accesible por QR. Con cache para mejor rendimiento."""
@@ -1720,7 +1890,8 @@ def ver_menu_publico(url_slug):
                 SELECT c.id as categoria_id, c.nombre as categoria_nombre, c.icono as categoria_icono,
                     p.id as plato_id, p.nombre as plato_nombre, p.descripcion, p.precio, 
                     p.precio_oferta, p.imagen_url, p.imagen_public_id, p.etiquetas, p.es_nuevo, p.es_popular,
-                    p.es_vegetariano, p.es_vegano, p.es_sin_gluten, p.es_picante
+                    p.es_vegetariano, p.es_vegano, p.es_sin_gluten, p.es_picante,
+                    p.imagen_ancho, p.imagen_alto, p.imagen_color, p.imagen_lqip
                 FROM categorias c
                 LEFT JOIN platos p ON c.id = p.categoria_id AND p.activo = 1
                 WHERE c.restaurante_id = %s AND c.activo = 1
@@ -1736,7 +1907,8 @@ def ver_menu_publico(url_slug):
                 # Usar placeholders seguros para evitar SQL injection
                 placeholders = ','.join(['%s'] * len(plato_ids))
                 query = '''
-                    SELECT id, plato_id, imagen_url, imagen_public_id, orden, es_principal
+                    SELECT id, plato_id, imagen_url, imagen_public_id, orden, es_principal,
+                           imagen_ancho, imagen_alto, imagen_color, imagen_lqip
                     FROM platos_imagenes 
                     WHERE plato_id IN ({}) AND activo = 1
                     ORDER BY es_principal DESC, orden ASC
@@ -1747,13 +1919,8 @@ def ver_menu_publico(url_slug):
                     if plato_id not in imagenes_por_plato:
                         imagenes_por_plato[plato_id] = []
                     # Generar URL optimizada para cada imagen
-                    img_url = img['imagen_url']
-                    img_pid = img.get('imagen_public_id')
-                    if img_pid and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED:
-                        generated_url = cloudinary_image_url(img_pid, width=640)
-                        img['imagen_src'] = generated_url if generated_url else img_url
-                    else:
-                        img['imagen_src'] = img_url
+                    img['imagen_src'], img['imagen_srcset'] = imagen_responsiva(
+                        img.get('imagen_public_id'), img['imagen_url'])
                     imagenes_por_plato[plato_id].append(dict(img))
 
             # 4. Estructurar el menú
@@ -1772,14 +1939,8 @@ def ver_menu_publico(url_slug):
                     img_url = row['imagen_url']
                     img_public_id = row.get('imagen_public_id')
                     
-                    # Intentar generar URL optimizada, pero siempre caer a imagen_url si falla
-                    if img_public_id and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED:
-                        generated_url = cloudinary_image_url(img_public_id, width=640)
-                        imagen_src = generated_url if generated_url else img_url
-                        imagen_srcset = cloudinary_srcset(img_public_id) if generated_url else None
-                    else:
-                        imagen_src = img_url
-                        imagen_srcset = None
+                    # Cloudinary, derivados locales (/img/) o imagen_url tal cual
+                    imagen_src, imagen_srcset = imagen_responsiva(img_public_id, img_url)
                     
                     # Obtener imágenes múltiples del plato
                     plato_imagenes = imagenes_por_plato.get(row['plato_id'], [])
@@ -1794,6 +1955,11 @@ def ver_menu_publico(url_slug):
                         'imagen_public_id': img_public_id,
                         'imagen_src': imagen_src,
                         'imagen_srcset': imagen_srcset,
+                        # Caja reservada y placeholder inline mientras carga la foto
+                        'imagen_ancho': row.get('imagen_ancho'),
+                        'imagen_alto': row.get('imagen_alto'),
+                        'imagen_color': row.get('imagen_color'),
+                        'imagen_lqip': row.get('imagen_lqip'),
                         'imagenes': plato_imagenes,  # Lista de imágenes múltiples
                         'etiquetas': row['etiquetas'].split(',') if row['etiquetas'] else [],
                         'es_nuevo': row['es_nuevo'],
@@ -2671,6 +2837,7 @@ def webhook_mercado_pago():
                         fecha_ultimo_pago = NOW()
                     WHERE id = %s
                 """, (nueva_fecha, payment_id, restaurante_id))
+                recalcular_estado_efectivo(cur, [restaurante_id])
                 db.commit()
             
             logger.info("Pago aprobado para restaurante %s. Suscripción extendida hasta %s", restaurante_id, nueva_fecha)
@@ -2713,6 +2880,35 @@ def pago_pendiente_status():
 # API - PLATOS
 # ============================================================
 
+def _enriquecer_platos(cur, rows):
+    """Agrega imágenes múltiples y URLs responsivas a una lista de platos."""
+    plato_ids = [r['id'] for r in rows]
+    imagenes_por_plato = {}
+    if plato_ids:
+        # Usar placeholders seguros para evitar SQL injection
+        placeholders = ','.join(['%s'] * len(plato_ids))
+        query = '''
+            SELECT * FROM platos_imagenes 
+            WHERE plato_id IN ({}) AND activo = 1
+            ORDER BY es_principal DESC, orden ASC
+        '''.format(placeholders)
+        cur.execute(query, tuple(plato_ids))
+        for img in cur.fetchall():
+            imagenes_por_plato.setdefault(img['plato_id'], []).append(dict(img))
+    
+    # Enriquecer con URLs responsivas si tenemos imagen_public_id
+    for r in rows:
+        pid = r.get('imagen_public_id')
+        img_url = r.get('imagen_url')
+        
+        # Agregar imágenes múltiples
+        r['imagenes'] = imagenes_por_plato.get(r['id'], [])
+        
+        # Cloudinary, derivados locales (/img/) o la URL guardada en la base de datos
+        r['imagen_src'], r['imagen_srcset'] = imagen_responsiva(pid, img_url)
+    return rows
+
+
 @app.route('/api/platos', methods=['GET', 'POST'])
 @login_required
 def api_platos():
@@ -2723,6 +2919,17 @@ def api_platos():
     try:
         with db.cursor() as cur:
             if request.method == 'GET':
+                # Sincronización delta: ?since=<version> devuelve solo cambios y borrados
+                since = request.args.get('since', type=int)
+                if since is not None:
+                    cambios = cambios_desde(cur, restaurante_id, since)
+                    return jsonify({
+                        'version': cambios['version'],
+                        'completo': cambios['completo'],
+                        'platos': _enriquecer_platos(cur, list_from_rows(cambios['platos'])),
+                        'eliminados': cambios['eliminados'],
+                    })
+                
                 # Paginación opcional
                 page = request.args.get('page', type=int)
                 per_page = request.args.get('per_page', 50, type=int)
@@ -2767,13 +2974,7 @@ def api_platos():
                     for r in rows:
                         pid = r.get('imagen_public_id')
                         img_url = r.get('imagen_url')
-                        if pid and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED:
-                            generated_url = cloudinary_image_url(pid, width=640)
-                            r['imagen_src'] = generated_url if generated_url else img_url
-                            r['imagen_srcset'] = cloudinary_srcset(pid) if generated_url else None
-                        else:
-                            r['imagen_src'] = img_url
-                            r['imagen_srcset'] = None
+                        r['imagen_src'], r['imagen_srcset'] = imagen_responsiva(pid, img_url)
                     
                     return jsonify({
                         'items': rows,
@@ -2785,43 +2986,7 @@ def api_platos():
                 
                 # Sin paginación (compatibilidad hacia atrás)
                 cur.execute(base_query, params)
-                rows = list_from_rows(cur.fetchall())
-                
-                # Cargar imágenes múltiples para cada plato
-                plato_ids = [r['id'] for r in rows]
-                imagenes_por_plato = {}
-                if plato_ids:
-                    # Usar placeholders seguros para evitar SQL injection
-                    placeholders = ','.join(['%s'] * len(plato_ids))
-                    query = '''
-                        SELECT * FROM platos_imagenes 
-                        WHERE plato_id IN ({}) AND activo = 1
-                        ORDER BY es_principal DESC, orden ASC
-                    '''.format(placeholders)
-                    cur.execute(query, tuple(plato_ids))
-                    for img in cur.fetchall():
-                        plato_id = img['plato_id']
-                        if plato_id not in imagenes_por_plato:
-                            imagenes_por_plato[plato_id] = []
-                        imagenes_por_plato[plato_id].append(dict(img))
-                
-                # Enriquecer con URLs responsivas si tenemos imagen_public_id
-                for r in rows:
-                    pid = r.get('imagen_public_id')
-                    img_url = r.get('imagen_url')
-                    
-                    # Agregar imágenes múltiples
-                    r['imagenes'] = imagenes_por_plato.get(r['id'], [])
-                    
-                    # Intentar generar URL optimizada con Cloudinary
-                    if pid and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED:
-                        generated_url = cloudinary_image_url(pid, width=640)
-                        r['imagen_src'] = generated_url if generated_url else img_url
-                        r['imagen_srcset'] = cloudinary_srcset(pid) if generated_url else None
-                    else:
-                        # Usar la URL directa guardada en la base de datos
-                        r['imagen_src'] = img_url
-                        r['imagen_srcset'] = None
+                rows = _enriquecer_platos(cur, list_from_rows(cur.fetchall()))
                 return jsonify(rows)
                 
             if request.method == 'POST':
@@ -2855,6 +3020,7 @@ def api_platos():
                 # Procesar imagen - puede venir como archivo o ya subida previamente
                 imagen_url = data.get('imagen_url', '')
                 imagen_public_id = data.get('imagen_public_id')  # Puede venir del frontend si ya se subió
+                jobs_imagen = []
 
                 if 'imagen' in request.files and request.files['imagen']:
                     file = request.files['imagen']
@@ -2865,50 +3031,60 @@ def api_platos():
                         is_valid, err = validate_image_file(file)
                         if not is_valid:
                             return jsonify({'success': False, 'error': err}), 400
-                        try:
-                            if not is_cloudinary_ready():
-                                return jsonify({'success': False, 'error': 'Cloudinary no está configurado'}), 500
-                            
-                            # Subir a Cloudinary (rotación EXIF se corrige automáticamente)
-                            result = cloudinary_upload(
-                                file,
-                                folder=f"mimenudigital/platos/{restaurante_id}"
-                            )
-                            imagen_url = result.get('secure_url')
-                            imagen_public_id = result.get('public_id')
-                            if not imagen_url:
-                                raise Exception('Cloudinary no retornó URL')
-                        except Exception as e:
-                            logger.exception("Error subiendo imagen a Cloudinary: %s", traceback.format_exc())
-                            # Guardar localmente y crear registro pendiente para reintento
+                        if IMAGENES_ASYNC:
+                            # Subida asíncrona: URL local provisoria, el pool la reemplaza al terminar
+                            job = pipeline_imagenes.encolar(db, file, restaurante_id, tipo='plato')
+                            imagen_url, imagen_public_id = job['url'], None
+                            jobs_imagen.append(job['job_id'])
+                        else:
                             try:
-                                ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'jpg'
-                                unique_filename = f"{restaurante_id}_{uuid.uuid4().hex[:8]}.{ext}"
-                                upload_folder = app.config.get('UPLOAD_FOLDER')
-                                os.makedirs(upload_folder, exist_ok=True)
-                                filepath = os.path.join(upload_folder, unique_filename)
-                                file.save(filepath)
-
-                                # Insertar registro pendiente (sin plato_id, se asociará tras insertar el plato)
-                                with db.cursor() as cur_pending:
-                                    cur_pending.execute('''
-                                        INSERT INTO imagenes_pendientes (restaurante_id, local_path, tipo, attempts, status, created_at)
-                                        VALUES (%s, %s, %s, 0, 'pending', NOW())
-                                    ''', (restaurante_id, filepath, 'plato_upload'))
-                                    db.commit()
-                                    pending_id = cur_pending.lastrowid
-
-                                imagen_url = f"/static/uploads/{unique_filename}"
-                                imagen_public_id = None
-                                # No return aquí; se insertará el plato con la imagen local y se asociará pending luego
-                                logger.info('Imagen guardada localmente y pendiente de subida (pending_id=%s)', pending_id)
-                            except Exception as err:
-                                logger.exception('Error creando pending tras fallo de Cloudinary: %s', err)
-                                return jsonify({'success': False, 'error': f'Error al subir imagen: {str(e)}'}), 500
+                                if not is_cloudinary_ready():
+                                    return jsonify({'success': False, 'error': 'Cloudinary no está configurado'}), 500
+                            
+                                # Subir a Cloudinary (rotación EXIF se corrige automáticamente)
+                                result = cloudinary_upload(
+                                    file,
+                                    folder=f"mimenudigital/platos/{restaurante_id}"
+                                )
+                                imagen_url = result.get('secure_url')
+                                imagen_public_id = result.get('public_id')
+                                if not imagen_url:
+                                    raise Exception('Cloudinary no retornó URL')
+                            except Exception as e:
+                                logger.exception("Error subiendo imagen a Cloudinary: %s", traceback.format_exc())
+                                # Guardar localmente y crear registro pendiente para reintento
+                                try:
+                                    ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else 'jpg'
+                                    unique_filename = f"{restaurante_id}_{uuid.uuid4().hex[:8]}.{ext}"
+                                    upload_folder = app.config.get('UPLOAD_FOLDER')
+                                    os.makedirs(upload_folder, exist_ok=True)
+                                    filepath = os.path.join(upload_folder, unique_filename)
+                                    file.save(filepath)
+
+                                    # Insertar registro pendiente (sin plato_id, se asociará tras insertar el plato)
+                                    with db.cursor() as cur_pending:
+                                        cur_pending.execute('''
+                                            INSERT INTO imagenes_pendientes (restaurante_id, local_path, tipo, attempts, status, created_at)
+                                            VALUES (%s, %s, %s, 0, 'pending', NOW())
+                                        ''', (restaurante_id, filepath, 'plato_upload'))
+                                        db.commit()
+                                        pending_id = cur_pending.lastrowid
+
+                                    imagen_url = f"/static/uploads/{unique_filename}"
+                                    imagen_public_id = None
+                                    # No return aquí; se insertará el plato con la imagen local y se asociará pending luego
+                                    logger.info('Imagen guardada localmente y pendiente de subida (pending_id=%s)', pending_id)
+                                except Exception as err:
+                                    logger.exception('Error creando pending tras fallo de Cloudinary: %s', err)
+                                    return jsonify({'success': False, 'error': f'Error al subir imagen: {str(e)}'}), 500
                 
                 # Sanitizar descripción y etiquetas
                 descripcion = (data.get('descripcion', '') or '')[:1000]  # Límite 1000 chars
-                etiquetas = (data.get('etiquetas', '') or '')[:500]  # Límite 500 chars
+                etiquetas = (data.get('etiquetas', '') or '')[:MAX_ETIQUETAS]
+                
+                # URLs provisorias de subidas asíncronas que ya terminaron -> URL de Cloudinary
+                imagenes = data.get('imagenes', [])
+                imagen_url, imagen_public_id = resolver_imagenes(cur, restaurante_id, imagen_url, imagen_public_id, imagenes)
                 
                 cur.execute('''
                     INSERT INTO platos (restaurante_id, categoria_id, nombre, descripcion, precio, 
@@ -2933,25 +3109,29 @@ def api_platos():
                     1 if data.get('es_popular') else 0,
                     int(data.get('orden', 0))
                 ))
-                db.commit()
                 new_id = cur.lastrowid
                 
-                # Guardar imágenes múltiples si existen
-                imagenes = data.get('imagenes', [])
-                if imagenes:
-                    for img in imagenes:
-                        cur.execute('''
-                            INSERT INTO platos_imagenes (plato_id, restaurante_id, imagen_url, imagen_public_id, orden, es_principal)
-                            VALUES (%s, %s, %s, %s, %s, %s)
-                        ''', (
-                            new_id,
-                            restaurante_id,
-                            img.get('imagen_url', ''),
-                            img.get('imagen_public_id'),
-                            img.get('orden', 0),
-                            img.get('es_principal', 0)
-                        ))
-                    db.commit()
+                # Guardar imágenes múltiples si existen. En la misma transacción que
+                # resolver_imagenes(): sus filas de imagenes_pendientes siguen
+                # bloqueadas (FOR UPDATE) hasta el commit, así un job que termina
+                # ahora encuentra la galería y la corrige (image_jobs._aplicar)
+                for img in imagenes or []:
+                    cur.execute('''
+                        INSERT INTO platos_imagenes (plato_id, restaurante_id, imagen_url, imagen_public_id, orden, es_principal)
+                        VALUES (%s, %s, %s, %s, %s, %s)
+                    ''', (
+                        new_id,
+                        restaurante_id,
+                        img.get('imagen_url', ''),
+                        img.get('imagen_public_id'),
+                        img.get('orden', 0),
+                        img.get('es_principal', 0)
+                    ))
+                # Dimensiones y placeholders de las imágenes subidas (imagenes_meta),
+                # antes de marcar la versión para que ?since= los incluya
+                aplicar_placeholders(cur, restaurante_id, [new_id])
+                marcar_platos(cur, restaurante_id, [new_id])
+                db.commit()
                 
                 # Si existe un pending creado antes (fallo de subida), asociarlo al plato recién creado
                 try:
@@ -2965,8 +3145,10 @@ def api_platos():
 
                 # Invalidar cache del menú público
                 invalidar_cache_restaurante(restaurante_id)
+                for job_id in jobs_imagen:
+                    pipeline_imagenes.despachar(job_id)
                 
-                return jsonify({'success': True, 'id': new_id})
+                return jsonify({'success': True, 'id': new_id, 'jobs_imagen': jobs_imagen})
                 
     except Exception as e:
         try:
@@ -3012,6 +3194,18 @@ def api_upload_image():
         if not is_valid:
             return jsonify({'success': False, 'error': err}), 400
 
+        if IMAGENES_ASYNC:
+            job = pipeline_imagenes.encolar(get_db(), file, session.get('restaurante_id'), tipo='upload')
+            pipeline_imagenes.despachar(job['job_id'])
+            return jsonify({
+                'success': True,
+                'message': 'Imagen recibida, se está subiendo',
+                'url': job['url'],
+                'public_id': None,
+                'job_id': job['job_id'],
+                'pendiente': True
+            })
+
         # Intentar subir a Cloudinary
         try:
             restaurante_id = session.get('restaurante_id') or 'anon'
@@ -3063,6 +3257,90 @@ def api_upload_image():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+def _validar_imagen_lote(file):
+    """Validación de un archivo del lote; devuelve el mensaje de error o None."""
+    if not allowed_file(file.filename):
+        return 'Tipo de archivo no permitido. Usa: PNG, JPG, JPEG, GIF o WEBP'
+    is_valid, err = validate_image_file(file)
+    return None if is_valid else err
+
+
+@app.route('/api/upload-images', methods=['POST'])
+@login_required
+@restaurante_owner_required
+def api_upload_images():
+    """
+    Sube varias imágenes en un request (galería de platos), campo 'images'.
+    Valida los archivos en paralelo y los sube concurrentemente: con
+    IMAGENES_ASYNC se encolan en pipeline_imagenes; si no, se suben en un
+    pool acotado y las que fallan quedan pendientes de reintento.
+    Devuelve un resultado por archivo, en el orden en que se enviaron.
+    """
+    try:
+        if not CLOUDINARY_AVAILABLE:
+            return jsonify({'success': False, 'error': 'Cloudinary SDK no está instalado. Ejecuta: pip install cloudinary'}), 500
+        if not is_cloudinary_ready():
+            return jsonify({'success': False, 'error': 'Cloudinary no está configurado. Añade la variable de entorno CLOUDINARY_URL'}), 500
+
+        archivos = [f for f in request.files.getlist('images') if f and f.filename]
+        if not archivos:
+            return jsonify({'success': False, 'error': 'No se envió ninguna imagen'}), 400
+        if len(archivos) > UPLOAD_BATCH_MAX:
+            return jsonify({'success': False, 'error': f'Máximo {UPLOAD_BATCH_MAX} imágenes por envío'}), 400
+
+        restaurante_id = session.get('restaurante_id')
+        resultados = [{'filename': f.filename} for f in archivos]
+        validos = []
+        for i, (error, exc) in enumerate(procesar_en_paralelo(archivos, _validar_imagen_lote)):
+            error = error or (str(exc) if exc else None)
+            if error:
+                resultados[i].update(success=False, error=error)
+            else:
+                validos.append(i)
+
+        db = get_db()
+        if IMAGENES_ASYNC:
+            a_encolar = validos
+        else:
+            carpeta = f"mimenudigital/platos/{restaurante_id or 'anon'}"
+            subidas = procesar_en_paralelo([archivos[i] for i in validos],
+                                           lambda f: cloudinary_upload(f, folder=carpeta))
+            a_encolar = []
+            for i, (result, exc) in zip(validos, subidas):
+                url = (result or {}).get('secure_url') or (result or {}).get('url')
+                if url:
+                    resultados[i].update(success=True, url=url, public_id=result.get('public_id'))
+                else:
+                    logger.warning("Batch upload of %s failed, queuing for retry: %s", archivos[i].filename, exc)
+                    archivos[i].stream.seek(0)
+                    a_encolar.append(i)
+
+        jobs = []
+        for i in a_encolar:
+            job = pipeline_imagenes.encolar(db, archivos[i], restaurante_id, tipo='upload')
+            jobs.append(job['job_id'])
+            resultados[i].update(success=True, url=job['url'], public_id=None,
+                                 job_id=job['job_id'], pendiente=True)
+        if IMAGENES_ASYNC:
+            for job_id in jobs:
+                pipeline_imagenes.despachar(job_id)
+
+        subidas_ok = sum(1 for r in resultados if r.get('success'))
+        return jsonify({
+            'success': subidas_ok > 0,
+            'subidas': subidas_ok,
+            'errores': len(resultados) - subidas_ok,
+            'resultados': resultados
+        }), 200 if subidas_ok else 400
+
+    except Exception as e:
+        from werkzeug.exceptions import RequestEntityTooLarge as _ReqTooLarge
+        if isinstance(e, _ReqTooLarge):
+            return jsonify({'success': False, 'error': 'Envío demasiado grande'}), 413
+        logger.exception("Error en api_upload_images")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 @app.route('/api/platos/<int:plato_id>', methods=['GET', 'PUT', 'DELETE'])
 @login_required
 @restaurante_owner_required
@@ -3087,6 +3365,7 @@ def api_plato(plato_id):
                 # Procesar imagen - puede venir como archivo o ya subida previamente
                 imagen_url = data.get('imagen_url', '')
                 imagen_public_id = data.get('imagen_public_id')  # Puede venir del frontend si ya se subió
+                jobs_imagen = []
                 
                 if 'imagen' in request.files and request.files['imagen']:
                     file = request.files['imagen']
@@ -3097,20 +3376,47 @@ def api_plato(plato_id):
                         is_valid, err = validate_image_file(file)
                         if not is_valid:
                             return jsonify({'success': False, 'error': err}), 400
-                        try:
-                            if not is_cloudinary_ready():
-                                return jsonify({'success': False, 'error': 'Cloudinary no está configurado'}), 500
+                        if IMAGENES_ASYNC:
+                            # Subida asíncrona: URL local provisoria, el pool la reemplaza al terminar
+                            job = pipeline_imagenes.encolar(db, file, restaurante_id, tipo='plato')
+                            imagen_url, imagen_public_id = job['url'], None
+                            jobs_imagen.append(job['job_id'])
+                        else:
+                            try:
+                                if not is_cloudinary_ready():
+                                    return jsonify({'success': False, 'error': 'Cloudinary no está configurado'}), 500
                             
-                            # Subir a Cloudinary
-                            result = cloudinary_upload(
-                                file,
-                                folder=f"mimenudigital/platos/{restaurante_id}"
-                            )
-                            imagen_url = result.get('secure_url')
-                            imagen_public_id = result.get('public_id')
-                        except Exception as e:
-                            logger.error("Error subiendo imagen a Cloudinary: %s", traceback.format_exc())
-                            return jsonify({'success': False, 'error': f'Error al subir imagen: {str(e)}'}), 500
+                                # Subir a Cloudinary
+                                result = cloudinary_upload(
+                                    file,
+                                    folder=f"mimenudigital/platos/{restaurante_id}"
+                                )
+                                imagen_url = result.get('secure_url')
+                                imagen_public_id = result.get('public_id')
+                            except Exception as e:
+                                logger.error("Error subiendo imagen a Cloudinary: %s", traceback.format_exc())
+                                return jsonify({'success': False, 'error': f'Error al subir imagen: {str(e)}'}), 500
+                
+                # URLs provisorias de subidas asíncronas que ya terminaron -> URL de Cloudinary
+                imagenes = data.get('imagenes', None)
+                imagen_url, imagen_public_id = resolver_imagenes(cur, restaurante_id, imagen_url, imagen_public_id, imagenes)
+                
+                # Imágenes que el plato deja de usar -> cola de borrado (misma transacción)
+                cur.execute("SELECT imagen_url, imagen_public_id FROM platos WHERE id = %s AND restaurante_id = %s",
+                            (plato_id, restaurante_id))
+                anterior = cur.fetchone() or {}
+                cur.execute("SELECT imagen_public_id FROM platos_imagenes WHERE plato_id = %s", (plato_id,))
+                galeria_anterior = {row['imagen_public_id'] for row in cur.fetchall() if row.get('imagen_public_id')}
+                if imagenes is None:
+                    en_uso = galeria_anterior | {imagen_public_id}
+                    sin_uso = set()
+                else:
+                    en_uso = {img.get('imagen_public_id') for img in imagenes} | {imagen_public_id}
+                    sin_uso = galeria_anterior
+                # Sin public_id en el request pero con la misma URL: la imagen principal no cambió
+                if anterior.get('imagen_public_id') and anterior.get('imagen_url') != imagen_url:
+                    sin_uso = sin_uso | {anterior['imagen_public_id']}
+                encolar_borrado(cur, sin_uso - en_uso, restaurante_id, motivo='plato_editado')
                 
                 cur.execute('''
                     UPDATE platos SET 
@@ -3141,25 +3447,7 @@ def api_plato(plato_id):
                 ))
                 
                 # Actualizar imágenes múltiples si se enviaron
-                imagenes = data.get('imagenes', None)
                 if imagenes is not None:
-                    # Limpiar Cloudinary de imágenes viejas que ya no están
-                    try:
-                        cur.execute("SELECT imagen_public_id FROM platos_imagenes WHERE plato_id = %s", (plato_id,))
-                        old_public_ids = {row['imagen_public_id'] for row in cur.fetchall() if row.get('imagen_public_id')}
-                        new_public_ids = {img.get('imagen_public_id') for img in imagenes if img.get('imagen_public_id')}
-                        removed_ids = old_public_ids - new_public_ids
-                        
-                        if removed_ids and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED and hasattr(cloudinary, 'uploader'):
-                            for pid in removed_ids:
-                                try:
-                                    cloudinary.uploader.destroy(pid, resource_type='image')
-                                    logger.info('Imagen Cloudinary %s eliminada (update plato %s)', pid, plato_id)
-                                except Exception:
-                                    pass
-                    except Exception as cleanup_err:
-                        logger.warning("Error limpiando Cloudinary en update: %s", cleanup_err)
-                    
                     # Eliminar imágenes anteriores de la BD
                     cur.execute("DELETE FROM platos_imagenes WHERE plato_id = %s", (plato_id,))
                     # Insertar las nuevas (si hay)
@@ -3176,39 +3464,21 @@ def api_plato(plato_id):
                             img.get('es_principal', 0)
                         ))
                 
+                aplicar_placeholders(cur, restaurante_id, [plato_id])
+                marcar_platos(cur, restaurante_id, [plato_id])
                 db.commit()
                 # Invalidar cache del menú público
                 invalidar_cache_restaurante(restaurante_id)
-                return jsonify({'success': True})
+                for job_id in jobs_imagen:
+                    pipeline_imagenes.despachar(job_id)
+                return jsonify({'success': True, 'jobs_imagen': jobs_imagen})
                 
             if request.method == 'DELETE':
-                # Antes de borrar, limpiar TODAS las imágenes en Cloudinary (principal + galería)
-                try:
-                    all_public_ids = set()
-                    
-                    # Imagen principal del plato
-                    cur.execute("SELECT imagen_public_id FROM platos WHERE id = %s AND restaurante_id = %s", (plato_id, restaurante_id))
-                    row = cur.fetchone()
-                    if row and row.get('imagen_public_id'):
-                        all_public_ids.add(row['imagen_public_id'])
-                    
-                    # Imágenes de galería
-                    cur.execute("SELECT imagen_public_id FROM platos_imagenes WHERE plato_id = %s", (plato_id,))
-                    for img_row in cur.fetchall():
-                        if img_row.get('imagen_public_id'):
-                            all_public_ids.add(img_row['imagen_public_id'])
-                    
-                    # Eliminar todas de Cloudinary
-                    if all_public_ids and CLOUDINARY_AVAILABLE and CLOUDINARY_CONFIGURED and hasattr(cloudinary, 'uploader'):
-                        for pid in all_public_ids:
-                            try:
-                                cloudinary.uploader.destroy(pid, resource_type='image')
-                                logger.info('Imagen Cloudinary %s eliminada para plato %s', pid, plato_id)
-                            except Exception as e:
-                                logger.warning('No se pudo eliminar imagen en Cloudinary: %s', e)
-                except Exception as e:
-                    logger.warning('Error limpiando Cloudinary antes de borrar plato: %s', e)
+                # Todas las imágenes del plato (principal + galería) -> cola de borrado
+                encolar_borrado(cur, public_ids_platos(cur, restaurante_id, plato_ids=[plato_id]),
+                                restaurante_id, motivo='plato_eliminado')
 
+                registrar_eliminados(cur, restaurante_id, [plato_id])
                 cur.execute("DELETE FROM platos WHERE id = %s AND restaurante_id = %s", 
                         (plato_id, restaurante_id))
                 db.commit()
@@ -3284,6 +3554,69 @@ def api_apariencia():
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/platos/buscar')
+@login_required
+def api_platos_buscar():
+    """Búsqueda de platos del restaurante por nombre, descripción y etiquetas (?q=)."""
+    restaurante_id = session.get('restaurante_id')
+    if not restaurante_id:
+        return jsonify({'success': False, 'error': 'Sin restaurante asociado'}), 400
+    
+    texto = request.args.get('q', '').strip()[:100]
+    limite = max(1, min(request.args.get('limite', 50, type=int), 100))
+    try:
+        with get_db().cursor() as cur:
+            resultados = buscar_platos(cur, restaurante_id, texto,
+                                       solo_activos=request.args.get('activos') == '1', limite=limite)
+        return jsonify({'success': True, 'q': texto, 'resultados': list_from_rows(resultados)})
+    except Exception as e:
+        logger.exception("Error en api_platos_buscar")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/platos/importar', methods=['POST'])
+@login_required
+@restaurante_owner_required
+def api_platos_importar():
+    """
+    Importación / actualización masiva de platos.
+    
+    Acepta:
+        - JSON: {"platos": [...], "crear_categorias": true} o directamente la lista
+        - multipart con un archivo CSV en 'archivo' (+ campo crear_categorias)
+        - cuerpo text/csv
+    Las categorías se indican por nombre ('categoria') o por 'categoria_id'.
+    Si alguna fila es inválida no se escribe nada y se devuelven los errores.
+    """
+    restaurante_id = session.get('restaurante_id')
+    if not restaurante_id:
+        return jsonify({'success': False, 'error': 'Sin restaurante asociado'}), 400
+    
+    try:
+        crear_categorias = request.args.get('crear_categorias') == '1' or request.form.get('crear_categorias') == '1'
+        if 'archivo' in request.files:
+            filas = leer_csv(request.files['archivo'].read().decode('utf-8-sig', errors='replace'))
+        elif request.mimetype == 'text/csv':
+            filas = leer_csv(request.get_data(as_text=True))
+        else:
+            data = request.get_json(silent=True)
+            if isinstance(data, dict):
+                crear_categorias = crear_categorias or bool(data.get('crear_categorias'))
+                data = data.get('platos')
+            filas = data if isinstance(data, list) else []
+        
+        db = get_db()
+        resultado = importar_platos(db, restaurante_id, filas, crear_categorias=crear_categorias)
+        # Una sola invalidación para todo el lote
+        invalidar_cache_restaurante(restaurante_id)
+        return jsonify({'success': True, **resultado})
+    except ErrorImportacion as e:
+        return jsonify({'success': False, 'error': str(e), 'errores': e.errores}), 400
+    except Exception as e:
+        logger.exception("Error en api_platos_importar")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============================================================
 # API - CATEGORÍAS
 # ============================================================
@@ -3401,13 +3734,18 @@ def api_categoria(categoria_id):
                     data.get('activo', 1),
                     categoria_id, restaurante_id
                 ))
+                # categoria_nombre viaja con cada plato en el feed de cambios
+                marcar_platos(cur, restaurante_id, categoria_id=categoria_id)
                 db.commit()
                 # Invalidar cache del menú público
                 invalidar_cache_restaurante(restaurante_id)
                 return jsonify({'success': True})
                 
             if request.method == 'DELETE':
-                # Primero eliminar platos de la categoría
+                # Primero eliminar platos de la categoría (dejando lápidas para la sincronización)
+                encolar_borrado(cur, public_ids_platos(cur, restaurante_id, categoria_id=categoria_id),
+                                restaurante_id, motivo='categoria_eliminada')
+                registrar_eliminados(cur, restaurante_id, categoria_id=categoria_id)
                 cur.execute("DELETE FROM platos WHERE categoria_id = %s AND restaurante_id = %s", 
                         (categoria_id, restaurante_id))
                 cur.execute("DELETE FROM categorias WHERE id = %s AND restaurante_id = %s", 
@@ -3426,6 +3764,35 @@ def api_categoria(categoria_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+@app.route('/api/orden', methods=['POST'])
+@login_required
+@restaurante_owner_required
+def api_orden():
+    """
+    Reordenamiento en lote tras un drag-and-drop.
+    
+    Body JSON:
+        categorias: [ids en el orden deseado]
+        platos: [ids en el orden deseado] o {categoria_id: [ids]} para
+                además mover platos entre categorías
+    """
+    restaurante_id = session.get('restaurante_id')
+    if not restaurante_id:
+        return jsonify({'success': False, 'error': 'Sin restaurante asociado'}), 400
+    
+    data = request.get_json(silent=True) or {}
+    try:
+        resultado = aplicar_orden(get_db(), restaurante_id,
+                                  categorias=data.get('categorias'), platos=data.get('platos'))
+        invalidar_cache_restaurante(restaurante_id)
+        return jsonify({'success': True, **resultado})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error en api_orden")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============================================================
 # API - ETIQUETAS PERSONALIZADAS
 # ============================================================
@@ -3679,6 +4046,21 @@ def api_subir_logo():
         return jsonify({'success': False, 'error': 'Archivo vacío'}), 400
     
     if file and allowed_file(file.filename):
+        if IMAGENES_ASYNC:
+            try:
+                db = get_db()
+                job = pipeline_imagenes.encolar(db, file, session['restaurante_id'], tipo='logo')
+                with db.cursor() as cur:
+                    cur.execute("UPDATE restaurantes SET logo_url = %s WHERE id = %s",
+                                (job['url'], session['restaurante_id']))
+                db.commit()
+                invalidar_cache_restaurante(session['restaurante_id'])
+                pipeline_imagenes.despachar(job['job_id'])
+                return jsonify({'success': True, 'logo_url': job['url'], 'job_id': job['job_id'], 'pendiente': True})
+            except Exception as e:
+                logger.exception("Error encolando logo")
+                return jsonify({'success': False, 'error': str(e)}), 500
+        
         try:
             if not is_cloudinary_ready():
                 return jsonify({'success': False, 'error': 'Cloudinary no está configurado'}), 500
@@ -3710,6 +4092,20 @@ def api_subir_logo():
     return jsonify({'success': False, 'error': 'Tipo de archivo no permitido'}), 400
 
 
+@app.route('/api/imagenes/jobs/<int:job_id>')
+@login_required
+def api_imagen_job(job_id):
+    """Estado de una subida asíncrona (para que el frontend reemplace la URL provisoria)."""
+    try:
+        job = pipeline_imagenes.estado(get_db(), job_id, session.get('restaurante_id'))
+        if not job:
+            return jsonify({'success': False, 'error': 'Job no encontrado'}), 404
+        return jsonify({'success': True, **dict_from_row(job)})
+    except Exception as e:
+        logger.exception("Error en api_imagen_job")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============================================================
 # API - DASHBOARD STATS
 # ============================================================
@@ -3775,6 +4171,25 @@ def api_dashboard_stats():
             ''', (restaurante_id,))
             ultimos_7_dias = list_from_rows(cur.fetchall())
             
+            # Visitas de hoy por hora (rollup horario, nunca la tabla visitas)
+            cur.execute('''
+                SELECT hora, visitas, escaneos_qr as scans
+                FROM estadisticas_horarias
+                WHERE restaurante_id = %s AND fecha = %s
+                ORDER BY hora
+            ''', (restaurante_id, hoy))
+            visitas_por_hora_hoy = list_from_rows(cur.fetchall())
+            
+            # Visitantes únicos (sketches HyperLogLog diarios unidos por rango)
+            try:
+                hoy_d = date.today()
+                unicos_hoy = contar_unicos(cur, restaurante_id, hoy_d, hoy_d)
+                unicos_7_dias = contar_unicos(cur, restaurante_id, hoy_d - timedelta(days=6), hoy_d)
+                unicos_mes = contar_unicos(cur, restaurante_id, hoy_d.replace(day=1), hoy_d)
+            except Exception as e:
+                logger.warning("Error estimating unique visitors: %s", e)
+                unicos_hoy = unicos_7_dias = unicos_mes = 0
+            
             result = {
                 'total_platos': stats['total_platos'] if stats else 0,
                 'total_categorias': stats['total_categorias'] if stats else 0,
@@ -3783,6 +4198,10 @@ def api_dashboard_stats():
                 'visitas_hoy': hoy_row['visitas'] if hoy_row else 0,
                 'scans_hoy': hoy_row['scans'] if hoy_row else 0,
                 'ultimos_7_dias': ultimos_7_dias,
+                'visitas_por_hora_hoy': visitas_por_hora_hoy,
+                'visitantes_unicos_hoy': unicos_hoy,
+                'visitantes_unicos_7_dias': unicos_7_dias,
+                'visitantes_unicos_mes': unicos_mes,
                 'url_slug': stats['url_slug'] if stats else '',
                 'base_url': request.host_url.rstrip('/')
             }
@@ -3798,6 +4217,129 @@ def api_dashboard_stats():
         return jsonify({'error': str(e)}), 500
 
 
+SERIE_MAX_DIAS = 3 * 366  # Rango máximo de /api/analytics/series
+
+
+def _restar_anio(d):
+    try:
+        return d.replace(year=d.year - 1)
+    except ValueError:  # 29 de febrero
+        return d.replace(year=d.year - 1, day=28)
+
+
+@app.route('/api/analytics/series')
+@login_required
+def api_analytics_series():
+    """
+    Serie temporal del restaurante desde los rollups.
+    
+    Query params:
+        desde, hasta: YYYY-MM-DD (por defecto últimos 30 días)
+        granularidad: hora | dia | semana | mes (se baja si el rango es largo)
+        metricas: lista separada por comas (visitas, escaneos, movil, desktop, unicos)
+        comparar: 'anio' agrega la misma serie desplazada un año
+    """
+    restaurante_id = session.get('restaurante_id')
+    if not restaurante_id:
+        return jsonify({'success': False, 'error': 'Sin restaurante asociado'}), 400
+    
+    try:
+        hoy = date.today()
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d').date() if request.args.get('desde') else hoy - timedelta(days=29)
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date() if request.args.get('hasta') else hoy
+    except ValueError:
+        return jsonify({'success': False, 'error': 'Formato de fecha inválido. Use YYYY-MM-DD'}), 400
+    
+    if desde > hasta or desde > hoy:
+        return jsonify({'success': False, 'error': 'Rango de fechas inválido'}), 400
+    if (hasta - desde).days >= SERIE_MAX_DIAS:
+        return jsonify({'success': False, 'error': f'El rango máximo es de {SERIE_MAX_DIAS} días'}), 400
+    
+    metricas = [m.strip() for m in request.args.get('metricas', 'visitas').split(',') if m.strip()]
+    cache = get_cache() if SECURITY_MIDDLEWARE_AVAILABLE else None
+    
+    try:
+        db = get_db()
+        with db.cursor() as cur:
+            serie = serie_temporal(cur, restaurante_id, desde, hasta,
+                                   granularidad=request.args.get('granularidad', 'dia'),
+                                   metricas=metricas, cache=cache, hoy=hoy)
+            
+            if request.args.get('comparar') == 'anio':
+                desde_ant = _restar_anio(desde)
+                hasta_ant = _restar_anio(min(hasta, hoy))
+                serie['comparacion'] = serie_temporal(cur, restaurante_id, desde_ant, hasta_ant,
+                                                      granularidad=serie['granularidad'],
+                                                      metricas=serie['metricas'], cache=cache, hoy=hoy)
+        return jsonify({'success': True, **serie})
+    except ValueError as e:
+        return jsonify({'success': False, 'error': str(e)}), 400
+    except Exception as e:
+        logger.exception("Error in api_analytics_series")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/export/<tipo>')
+@login_required
+def api_export(tipo):
+    """
+    Exportación masiva en streaming de visitas o estadísticas diarias.
+    
+    Query params:
+        desde, hasta: YYYY-MM-DD (ambos incluidos, obligatorios)
+        formato: csv | ndjson
+        gzip: 1 (por defecto) comprime al vuelo, 0 entrega texto plano
+        cursor: token de reanudación ("<fecha>_<id>" de la última fila recibida)
+        restaurante_id: solo superadmin; sin él exporta todos los restaurantes
+    """
+    if tipo not in EXPORTS:
+        return jsonify({'success': False, 'error': 'Tipo de exportación inválido'}), 404
+    
+    es_superadmin = session.get('rol') == 'superadmin'
+    if es_superadmin:
+        restaurante_id = request.args.get('restaurante_id', type=int)
+    else:
+        restaurante_id = session.get('restaurante_id')
+        if not restaurante_id:
+            return jsonify({'success': False, 'error': 'Sin restaurante asociado'}), 400
+    
+    try:
+        desde = datetime.strptime(request.args['desde'], '%Y-%m-%d').date()
+        hasta = datetime.strptime(request.args['hasta'], '%Y-%m-%d').date() + timedelta(days=1)
+    except (KeyError, ValueError):
+        return jsonify({'success': False, 'error': 'Parámetros desde/hasta requeridos (YYYY-MM-DD)'}), 400
+    if desde >= hasta:
+        return jsonify({'success': False, 'error': 'Rango de fechas inválido'}), 400
+    
+    formato = request.args.get('formato', 'csv')
+    if formato not in FORMATOS:
+        return jsonify({'success': False, 'error': 'Formato inválido (csv o ndjson)'}), 400
+    
+    cursor = request.args.get('cursor') or None
+    if cursor:
+        try:
+            parse_cursor(cursor, tipo)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'Cursor inválido'}), 400
+    
+    comprimir = request.args.get('gzip', '1') != '0'
+    nombre = f"{tipo}_{restaurante_id or 'todos'}_{desde.isoformat()}_{(hasta - timedelta(days=1)).isoformat()}.{formato}"
+    mimetype = 'text/csv' if formato == 'csv' else 'application/x-ndjson'
+    if comprimir:
+        nombre += '.gz'
+        mimetype = 'application/gzip'
+    
+    generador = stream_export(
+        tipo, desde, hasta, restaurante_id=restaurante_id, formato=formato,
+        comprimir=comprimir, cursor=cursor, incluir_ip=es_superadmin
+    )
+    response = Response(stream_with_context(generador), mimetype=mimetype)
+    response.headers['Content-Disposition'] = f'attachment; filename="{nombre}"'
+    response.headers['Cache-Control'] = 'no-store'
+    response.headers['X-Accel-Buffering'] = 'no'  # nginx: no bufferizar el stream
+    return response
+
+
 # ============================================================
 # RUTAS DE SUPERADMIN
 # ============================================================
@@ -4048,6 +4590,7 @@ def api_superadmin_actualizar_suscripcion(restaurante_id):
                     WHERE id = %s
                 ''', (fecha_mysql, nuevo_estado, restaurante_id))
             
+            recalcular_estado_efectivo(cur, [restaurante_id])
             db.commit()
             
             logger.info("Suscripción actualizada: restaurante=%s (%s), nueva_fecha=%s, estado=%s (anterior: %s)", 
@@ -4584,85 +5127,499 @@ def api_config_pagos_public():
     })
 
 
+def _valor_int(row, key):
+    """Valor entero de una fila (o 0 si la fila/columna no existe)."""
+    return int(row[key]) if row and row.get(key) else 0
+
+
+def _fecha_iso(valor):
+    if not valor:
+        return ''
+    return valor.isoformat() if hasattr(valor, 'isoformat') else str(valor)
+
+
 @app.route('/api/superadmin/stats')
 @login_required
 @superadmin_required
 def api_superadmin_stats():
-    db = get_db()
-    with db.cursor() as cur:
-        # Total restaurantes
-        cur.execute("SELECT COUNT(*) as total FROM restaurantes")
-        total_restaurantes = cur.fetchone()['total']
+    hoy = date.today()
+    # Queries independientes: se ejecutan en paralelo (una conexión del pool cada una)
+    res = run_parallel_queries({
+        'total_restaurantes': ("SELECT COUNT(*) as total FROM restaurantes", None, 'one'),
         # Total usuarios (sin superadmin)
-        cur.execute("SELECT COUNT(*) as total FROM usuarios_admin WHERE rol != 'superadmin'")
-        total_usuarios = cur.fetchone()['total']
+        'total_usuarios': ("SELECT COUNT(*) as total FROM usuarios_admin WHERE rol != 'superadmin'", None, 'one'),
         # Total visitas y escaneos
-        cur.execute("SELECT COALESCE(SUM(visitas),0) as visitas, COALESCE(SUM(escaneos_qr),0) as escaneos FROM estadisticas_diarias")
-        row = cur.fetchone()
-        total_visitas = row['visitas']
-        total_escaneos = row['escaneos']
+        'totales': ("SELECT COALESCE(SUM(visitas),0) as visitas, COALESCE(SUM(escaneos_qr),0) as escaneos FROM estadisticas_diarias", None, 'one'),
         # Visitas últimos 30 días
-        cur.execute("""
+        'visitas_30dias': ("""
             SELECT fecha, COALESCE(SUM(visitas),0) as visitas
             FROM estadisticas_diarias
             WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
             GROUP BY fecha
             ORDER BY fecha
-        """)
-        visitas_30dias = list_from_rows(cur.fetchall())
-        
+        """, None),
         # Tickets pendientes (para notificaciones push)
-        cur.execute("SELECT COUNT(*) as count FROM tickets_soporte WHERE estado IN ('abierto', 'en_proceso')")
-        result = cur.fetchone()
-        tickets_pendientes = int(result['count']) if result and result['count'] else 0
-        
+        'tickets_pendientes': ("SELECT COUNT(*) as count FROM tickets_soporte WHERE estado IN ('abierto', 'en_proceso')", None, 'one'),
+        # Visitantes únicos de la plataforma (sketch global)
+        'unicos': lambda cur: (
+            contar_unicos(cur, HLL_GLOBAL_ID, hoy, hoy),
+            contar_unicos(cur, HLL_GLOBAL_ID, hoy - timedelta(days=29), hoy)
+        ),
+    }, defaults={'unicos': (0, 0), 'visitas_30dias': []})
+    
+    if res.errors:
+        logger.warning("Superadmin stats queries with errors: %s", res.errors)
+    
+    unicos_hoy, unicos_30dias = res['unicos']
+    
     return jsonify({
-        'total_restaurantes': int(total_restaurantes) if total_restaurantes else 0,
-        'total_usuarios': int(total_usuarios) if total_usuarios else 0,
-        'total_visitas': int(total_visitas) if total_visitas else 0,
-        'total_escaneos': int(total_escaneos) if total_escaneos else 0,
-        'visitas_30dias': visitas_30dias,
-        'tickets_pendientes': int(tickets_pendientes)
+        'total_restaurantes': _valor_int(res['total_restaurantes'], 'total'),
+        'total_usuarios': _valor_int(res['total_usuarios'], 'total'),
+        'total_visitas': _valor_int(res['totales'], 'visitas'),
+        'total_escaneos': _valor_int(res['totales'], 'escaneos'),
+        'visitas_30dias': list_from_rows(res['visitas_30dias']),
+        'visitantes_unicos_hoy': unicos_hoy,
+        'visitantes_unicos_30dias': unicos_30dias,
+        'tickets_pendientes': _valor_int(res['tickets_pendientes'], 'count')
     })
 
 
-def _determinar_estado_suscripcion(r, planes_premium, planes_gratuitos, hoy):
-    """Determina el estado real de suscripción de un restaurante."""
-    estado = (r.get('estado_suscripcion') or '').lower().strip()
-    plan_id = r.get('plan_id')
-    fecha_venc = r.get('fecha_vencimiento')
-    activo = r.get('activo', 1)
-    
-    if fecha_venc and hasattr(fecha_venc, 'date'):
-        fecha_venc = fecha_venc.date()
-    
-    es_plan_premium = plan_id in planes_premium if planes_premium else (plan_id and plan_id > 1)
-    
-    # Si está explícitamente marcado como prueba/trial
-    if estado in ('prueba', 'trial', 'periodo_prueba'):
-        return 'prueba'
-    
-    # Si está suspendido/inactivo
-    if estado in ('suspendida', 'suspendido', 'suspended', 'inactiva', 'inactivo', 'cancelada', 'cancelado') or activo == 0:
-        return 'suspendida'
+# ============================================================
+# SNAPSHOT DE ESTADÍSTICAS SUPERADMIN
+# ============================================================
+# estadisticas.html hace polling de /api/superadmin/stats-extended; en vez
+# de ~15 agregaciones por request, el job `snapshot_stats` del scheduler
+# recalcula el payload cada STATS_SNAPSHOT_INTERVAL segundos y lo guarda en `estadisticas_snapshot`
+# (compartido entre workers web) y en el caché en memoria.
+
+import json
+
+STATS_SNAPSHOT_KEY = 'superadmin_stats'
+STATS_SNAPSHOT_INTERVAL = int(os.environ.get('STATS_SNAPSHOT_INTERVAL', 300))  # 5 min
+_stats_snapshot_lock = threading.Lock()
+_stats_historicos_cache = {'corte': None, 'data': None}
+
+
+def _sumar_diarias(cur, where, params):
+    cur.execute(f"""
+        SELECT COALESCE(SUM(visitas),0) as visitas,
+            COALESCE(SUM(escaneos_qr),0) as escaneos,
+            COALESCE(SUM(visitas_movil),0) as movil,
+            COALESCE(SUM(visitas_desktop),0) as desktop
+        FROM estadisticas_diarias
+        WHERE {where}
+    """, params)
+    row = cur.fetchone() or {}
+    return {k: int(row.get(k) or 0) for k in ('visitas', 'escaneos', 'movil', 'desktop')}
+
+
+def _totales_historicos(cur):
+    """
+    Totales históricos de visitas sin recorrer toda la tabla en cada snapshot.
+    Los días anteriores a ayer ya no cambian: se suman una vez por día y se
+    cachean; solo ayer y hoy (que el worker aún puede tocar) se leen siempre.
+    """
+    corte = date.today() - timedelta(days=1)
+    if _stats_historicos_cache['corte'] != corte:
+        _stats_historicos_cache['data'] = _sumar_diarias(cur, 'fecha < %s', (corte,))
+        _stats_historicos_cache['corte'] = corte
+    recientes = _sumar_diarias(cur, 'fecha >= %s', (corte,))
+    cerrados = _stats_historicos_cache['data']
+    return {k: cerrados[k] + recientes[k] for k in cerrados}
+
+
+def _construir_snapshot_stats(conn):
+    """Recalcula el payload completo y lo persiste en estadisticas_snapshot y en el caché."""
+    with conn.cursor() as cur:
+        payload = _calcular_stats_extendidas()
+        payload['computed_at'] = datetime.now().isoformat(timespec='seconds')
+        try:
+            cur.execute('''
+                INSERT INTO estadisticas_snapshot (clave, payload, computed_at)
+                VALUES (%s, %s, NOW())
+                ON DUPLICATE KEY UPDATE payload = VALUES(payload), computed_at = VALUES(computed_at)
+            ''', (STATS_SNAPSHOT_KEY, json.dumps(payload, default=str)))
+            conn.commit()
+        except Exception as e:
+            logger.warning("Could not persist stats snapshot: %s", e)
+    if SECURITY_MIDDLEWARE_AVAILABLE:
+        get_cache().set(f"stats_snapshot:{STATS_SNAPSHOT_KEY}", payload, ttl=STATS_SNAPSHOT_INTERVAL)
+    return payload
+
+
+def _leer_snapshot_persistido(conn):
+    """Devuelve el snapshot de la tabla si tiene menos de STATS_SNAPSHOT_INTERVAL segundos."""
+    try:
+        with conn.cursor() as cur:
+            cur.execute('''
+                SELECT payload, TIMESTAMPDIFF(SECOND, computed_at, NOW()) as edad
+                FROM estadisticas_snapshot WHERE clave = %s
+            ''', (STATS_SNAPSHOT_KEY,))
+            row = cur.fetchone()
+    except Exception as e:
+        logger.debug("Stats snapshot table not available: %s", e)
+        return None, None
+    if not row or row.get('payload') is None:
+        return None, None
+    return json.loads(row['payload']), int(row['edad'] or 0)
+
+
+def obtener_snapshot_stats(forzar=False):
+    """
+    Payload de estadísticas del superadmin en O(1): caché en memoria ->
+    tabla estadisticas_snapshot -> recálculo. `forzar` recalcula siempre.
+    """
+    cache_key = f"stats_snapshot:{STATS_SNAPSHOT_KEY}"
     
-    # Si tiene plan premium y fecha válida
-    if es_plan_premium and fecha_venc and fecha_venc >= hoy:
-        return 'activa'
+    if not forzar:
+        if SECURITY_MIDDLEWARE_AVAILABLE:
+            cached = get_cache().get(cache_key)
+            if cached:
+                return cached
+        payload, edad = _leer_snapshot_persistido(get_db())
+        if payload is not None and edad < STATS_SNAPSHOT_INTERVAL:
+            if SECURITY_MIDDLEWARE_AVAILABLE:
+                get_cache().set(cache_key, payload, ttl=max(1, STATS_SNAPSHOT_INTERVAL - edad))
+            return payload
     
-    # Si tiene plan premium pero fecha vencida
-    if es_plan_premium and fecha_venc and fecha_venc < hoy:
-        return 'vencida'
+    with _stats_snapshot_lock:
+        # Si otro request lo recalculó mientras esperábamos el lock, reutilizarlo
+        if not forzar and SECURITY_MIDDLEWARE_AVAILABLE:
+            cached = get_cache().get(cache_key)
+            if cached:
+                return cached
+        return _construir_snapshot_stats(get_db())
+
+
+def _calcular_stats_extendidas():
+    """
+    Calcula el payload completo de estadísticas del superadmin (usado por el snapshot).
+    Las queries son independientes entre sí: se ejecutan en paralelo con
+    run_parallel_queries y el procesamiento en Python se hace al final.
+    """
+    hoy = date.today()
+    
+    res = run_parallel_queries({
+        # Métricas básicas
+        'total_restaurantes': ("SELECT COUNT(*) as total FROM restaurantes", None, 'one'),
+        'restaurantes_activos': ("""
+            SELECT COUNT(DISTINCT restaurante_id) as activos 
+            FROM estadisticas_diarias 
+            WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+        """, None, 'one'),
+        'total_usuarios': ("SELECT COUNT(*) as total FROM usuarios_admin WHERE rol != 'superadmin'", None, 'one'),
+        'total_platos': ("SELECT COUNT(*) as total FROM platos WHERE activo = 1", None, 'one'),
+        'total_categorias': ("SELECT COUNT(*) as total FROM categorias WHERE activo = 1", None, 'one'),
+        
+        # Visitas y escaneos (solo rollups)
+        # Total histórico incremental: días cerrados cacheados + últimos 2 días
+        'totales': _totales_historicos,
+        'visitas_30dias': ("""
+            SELECT DATE_FORMAT(fecha, %s) as fecha, 
+                COALESCE(SUM(visitas),0) as visitas,
+                COALESCE(SUM(escaneos_qr),0) as escaneos,
+                COALESCE(SUM(visitas_movil),0) as movil,
+                COALESCE(SUM(visitas_desktop),0) as desktop
+            FROM estadisticas_diarias
+            WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+            GROUP BY DATE(fecha)
+            ORDER BY fecha
+        """, ('%Y-%m-%d',)),
+        'mes_actual': ("""
+            SELECT COALESCE(SUM(visitas),0) as visitas,
+                COALESCE(SUM(escaneos_qr),0) as escaneos
+            FROM estadisticas_diarias
+            WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+        """, None, 'one'),
+        'mes_anterior': ("""
+            SELECT COALESCE(SUM(visitas),0) as visitas,
+                COALESCE(SUM(escaneos_qr),0) as escaneos
+            FROM estadisticas_diarias
+            WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 60 DAY)
+            AND fecha < DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+        """, None, 'one'),
+        'hoy': ("""
+            SELECT COALESCE(SUM(visitas),0) as visitas,
+                COALESCE(SUM(escaneos_qr),0) as escaneos
+            FROM estadisticas_diarias
+            WHERE fecha = CURDATE()
+        """, None, 'one'),
+        'visitas_por_hora': ("""
+            SELECT hora, COALESCE(SUM(visitas),0) as visitas,
+                COALESCE(SUM(escaneos_qr),0) as escaneos
+            FROM estadisticas_horarias
+            WHERE fecha = CURDATE()
+            GROUP BY hora
+            ORDER BY hora
+        """, None),
+        # Visitantes únicos de la plataforma (sketch global HyperLogLog)
+        'unicos': lambda cur: (
+            contar_unicos(cur, HLL_GLOBAL_ID, hoy, hoy),
+            contar_unicos(cur, HLL_GLOBAL_ID, hoy - timedelta(days=29), hoy)
+        ),
+        'visitas_por_dia': ("""
+            SELECT DAYOFWEEK(fecha) as dia, 
+                COALESCE(AVG(visitas),0) as promedio
+            FROM estadisticas_diarias
+            WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+            GROUP BY DAYOFWEEK(fecha)
+            ORDER BY dia
+        """, None),
+        'mapa_calor': ("""
+            SELECT dia_semana, hora, COALESCE(SUM(visitas),0) as visitas
+            FROM estadisticas_semana_hora
+            WHERE semana >= DATE_SUB(CURDATE(), INTERVAL 12 WEEK)
+            GROUP BY dia_semana, hora
+            ORDER BY dia_semana, hora
+        """, None),
+        'desglose_30dias': ("""
+            SELECT dimension, valor, COALESCE(SUM(visitas),0) as visitas
+            FROM estadisticas_dimensiones
+            WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
+            GROUP BY dimension, valor
+            ORDER BY visitas DESC
+        """, None),
+        
+        # Suscripciones (estado_efectivo indexado, migración 021)
+        'suscripciones': ("""
+            SELECT estado_efectivo, COUNT(*) as total
+            FROM restaurantes
+            GROUP BY estado_efectivo
+        """, None),
+        'por_vencer': ("""
+            SELECT id, nombre, DATE_FORMAT(fecha_vencimiento, %s) as fecha_vencimiento, estado_suscripcion
+            FROM restaurantes
+            WHERE estado_efectivo IN ('activa', 'prueba', 'gratuito')
+            AND fecha_vencimiento BETWEEN CURDATE() AND DATE_ADD(CURDATE(), INTERVAL 7 DAY)
+            ORDER BY fecha_vencimiento
+            LIMIT 10
+        """, ('%Y-%m-%d',)),
+        'nuevos_este_mes': ("""
+            SELECT COUNT(*) as nuevos
+            FROM restaurantes
+            WHERE fecha_creacion >= DATE_FORMAT(CURDATE(), %s)
+        """, ('%Y-%m-01',), 'one'),
+        
+        # Rankings
+        'top_restaurantes': ("""
+            SELECT r.id, r.nombre, r.estado_efectivo, r.url_slug,
+                COALESCE(SUM(e.visitas), 0) as total_visitas,
+                COALESCE(SUM(e.escaneos_qr), 0) as total_escaneos
+            FROM restaurantes r
+            LEFT JOIN estadisticas_diarias e ON r.id = e.restaurante_id
+            GROUP BY r.id, r.nombre, r.estado_efectivo, r.url_slug
+            ORDER BY total_visitas DESC
+            LIMIT 10
+        """, None),
+        'top_escaneos': ("""
+            SELECT r.id, r.nombre, r.estado_efectivo,
+                COALESCE(SUM(e.escaneos_qr), 0) as total_escaneos
+            FROM restaurantes r
+            LEFT JOIN estadisticas_diarias e ON r.id = e.restaurante_id
+            GROUP BY r.id, r.nombre, r.estado_efectivo
+            HAVING total_escaneos > 0
+            ORDER BY total_escaneos DESC
+            LIMIT 10
+        """, None),
+        
+        # Actividad reciente (usar fecha_creacion, no created_at)
+        'ultimos_restaurantes': ("""
+            SELECT id, nombre, fecha_creacion, estado_efectivo
+            FROM restaurantes
+            ORDER BY fecha_creacion DESC
+            LIMIT 5
+        """, None),
+        'ultimos_tickets': ("""
+            SELECT id, asunto, estado, fecha_creacion, tipo
+            FROM tickets_soporte
+            ORDER BY fecha_creacion DESC
+            LIMIT 5
+        """, None),
+    })
     
-    # Si está marcado como activo explícitamente
-    if estado in ('activa', 'activo', 'premium', 'active', 'pagada', 'pagado', 'paid'):
-        return 'activa'
+    if res.errors:
+        logger.warning("Stats queries with errors: %s", res.errors)
+    
+    # Las métricas básicas son obligatorias (igual que antes, sin try/except)
+    for nombre in ('total_restaurantes', 'total_usuarios'):
+        if nombre in res.errors:
+            raise RuntimeError(f"Error en {nombre}: {res.errors[nombre]}")
+    
+    # ============================================
+    # VISITAS Y ESCANEOS
+    # ============================================
+    
+    totales = res['totales'] or {}
+    visitas_30dias = [{
+        'fecha': str(r['fecha']),
+        'visitas': _valor_int(r, 'visitas'),
+        'escaneos': _valor_int(r, 'escaneos'),
+        'movil': _valor_int(r, 'movil'),
+        'desktop': _valor_int(r, 'desktop')
+    } for r in (res['visitas_30dias'] or [])]
+    
+    visitas_mes_actual = _valor_int(res['mes_actual'], 'visitas')
+    escaneos_mes_actual = _valor_int(res['mes_actual'], 'escaneos')
+    visitas_mes_anterior = _valor_int(res['mes_anterior'], 'visitas')
+    escaneos_mes_anterior = _valor_int(res['mes_anterior'], 'escaneos')
+    
+    # Calcular tendencia (%)
+    if visitas_mes_anterior > 0:
+        tendencia_visitas = round(((visitas_mes_actual - visitas_mes_anterior) / visitas_mes_anterior) * 100, 1)
+    else:
+        tendencia_visitas = 100 if visitas_mes_actual > 0 else 0
+        
+    if escaneos_mes_anterior > 0:
+        tendencia_escaneos = round(((escaneos_mes_actual - escaneos_mes_anterior) / escaneos_mes_anterior) * 100, 1)
+    else:
+        tendencia_escaneos = 100 if escaneos_mes_actual > 0 else 0
+    
+    visitas_por_hora = [{
+        'hora': int(r['hora']),
+        'visitas': _valor_int(r, 'visitas'),
+        'escaneos': _valor_int(r, 'escaneos')
+    } for r in (res['visitas_por_hora'] or [])]
+    
+    visitantes_unicos_hoy, visitantes_unicos_30dias = res['unicos'] or (0, 0)
+    
+    visitas_por_dia = [{
+        'dia': int(r['dia']),
+        'promedio': float(r['promedio']) if r['promedio'] else 0
+    } for r in (res['visitas_por_dia'] or [])]
+    
+    mapa_calor = [{
+        'dia': int(r['dia_semana']),
+        'hora': int(r['hora']),
+        'visitas': _valor_int(r, 'visitas')
+    } for r in (res['mapa_calor'] or [])]
+    
+    desglose_30dias = {}
+    for r in (res['desglose_30dias'] or []):
+        desglose_30dias.setdefault(r['dimension'], {})[r['valor']] = _valor_int(r, 'visitas')
+    
+    # ============================================
+    # SUSCRIPCIONES - Conteo por estado_efectivo (indexado)
+    # ============================================
+    
+    conteo = {r['estado_efectivo']: _valor_int(r, 'total') for r in (res['suscripciones'] or [])}
+    subs_activas = conteo.get('activa', 0)
+    subs_prueba = conteo.get('prueba', 0) + conteo.get('gratuito', 0)
+    subs_vencidas = conteo.get('vencida', 0)
+    subs_suspendidas = conteo.get('suspendida', 0)
+    
+    por_vencer = [{
+        'id': r['id'],
+        'nombre': r['nombre'],
+        'fecha_vencimiento': str(r['fecha_vencimiento']) if r['fecha_vencimiento'] else '',
+        'estado_suscripcion': r['estado_suscripcion']
+    } for r in (res['por_vencer'] or [])]
+    
+    nuevos_este_mes = _valor_int(res['nuevos_este_mes'], 'nuevos')
+    
+    # ============================================
+    # INGRESOS
+    # ============================================
     
-    # Plan gratuito
-    if not es_plan_premium or plan_id in planes_gratuitos:
-        return 'gratuito'
+    config = get_config_global()
+    precio_mensual = int(config.get('precio_mensual', 14990))
+    ingreso_mensual = subs_activas * precio_mensual
+    ingreso_anual_proyectado = ingreso_mensual * 12
+    
+    # ============================================
+    # TOP RESTAURANTES
+    # ============================================
+    
+    top_restaurantes = [{
+        'id': r['id'],
+        'nombre': r['nombre'],
+        'estado_suscripcion': r['estado_efectivo'],
+        'url_slug': r['url_slug'],
+        'total_visitas': _valor_int(r, 'total_visitas'),
+        'total_escaneos': _valor_int(r, 'total_escaneos')
+    } for r in (res['top_restaurantes'] or [])]
+    
+    top_escaneos = [{
+        'id': r['id'],
+        'nombre': r['nombre'],
+        'estado_suscripcion': r['estado_efectivo'],
+        'total_escaneos': _valor_int(r, 'total_escaneos')
+    } for r in (res['top_escaneos'] or [])]
+    
+    # ============================================
+    # ACTIVIDAD RECIENTE
+    # ============================================
+    
+    ultimos_restaurantes = [{
+        'id': r['id'],
+        'nombre': r['nombre'],
+        'created_at': _fecha_iso(r['fecha_creacion']),
+        'estado_suscripcion': r['estado_efectivo']
+    } for r in (res['ultimos_restaurantes'] or [])]
+    
+    # La tabla tickets_soporte puede no existir (queda en res.errors)
+    ultimos_tickets = [{
+        'id': r['id'],
+        'asunto': r['asunto'] or '',
+        'estado': r['estado'] or 'abierto',
+        'created_at': _fecha_iso(r['fecha_creacion']),
+        'tipo': r['tipo'] or 'consulta'
+    } for r in (res['ultimos_tickets'] or [])]
+    
+    tickets_pendientes = sum(1 for t in ultimos_tickets if t.get('estado') in ('abierto', 'en_proceso'))
     
-    return 'activa'
+    return {
+        # Métricas básicas
+        'total_restaurantes': _valor_int(res['total_restaurantes'], 'total'),
+        'restaurantes_activos': _valor_int(res['restaurantes_activos'], 'activos'),
+        'total_usuarios': _valor_int(res['total_usuarios'], 'total'),
+        'total_platos': _valor_int(res['total_platos'], 'total'),
+        'total_categorias': _valor_int(res['total_categorias'], 'total'),
+        
+        # Visitas y escaneos
+        'total_visitas': totales.get('visitas', 0),
+        'total_escaneos': totales.get('escaneos', 0),
+        'total_movil': totales.get('movil', 0),
+        'total_desktop': totales.get('desktop', 0),
+        'visitas_hoy': _valor_int(res['hoy'], 'visitas'),
+        'escaneos_hoy': _valor_int(res['hoy'], 'escaneos'),
+        'visitantes_unicos_hoy': visitantes_unicos_hoy,
+        'visitantes_unicos_30dias': visitantes_unicos_30dias,
+        'visitas_mes_actual': visitas_mes_actual,
+        'escaneos_mes_actual': escaneos_mes_actual,
+        'tendencia_visitas': tendencia_visitas,
+        'tendencia_escaneos': tendencia_escaneos,
+        'visitas_30dias': visitas_30dias,
+        'visitas_por_dia': visitas_por_dia,
+        'visitas_por_hora': visitas_por_hora,
+        'mapa_calor': mapa_calor,
+        'origenes_30dias': desglose_30dias.get('origen', {}),
+        'dispositivos_30dias': desglose_30dias.get('dispositivo', {}),
+        'sistemas_30dias': desglose_30dias.get('os', {}),
+        'navegadores_30dias': desglose_30dias.get('navegador', {}),
+        'apps_30dias': desglose_30dias.get('app', {}),
+        
+        # Suscripciones
+        'subs_activas': subs_activas,
+        'subs_prueba': subs_prueba,
+        'subs_vencidas': subs_vencidas,
+        'subs_suspendidas': subs_suspendidas,
+        'por_vencer': por_vencer,
+        'nuevos_este_mes': nuevos_este_mes,
+        
+        # Ingresos
+        'ingreso_mensual': ingreso_mensual,
+        'ingreso_anual_proyectado': ingreso_anual_proyectado,
+        'precio_mensual': precio_mensual,
+        
+        # Rankings
+        'top_restaurantes': top_restaurantes,
+        'top_escaneos': top_escaneos,
+        
+        # Actividad reciente
+        'ultimos_restaurantes': ultimos_restaurantes,
+        'ultimos_tickets': ultimos_tickets,
+        'tickets_pendientes': tickets_pendientes
+    }
 
 
 @app.route('/api/superadmin/stats-extended')
@@ -4671,461 +5628,8 @@ def _determinar_estado_suscripcion(r, planes_premium, planes_gratuitos, hoy):
 def api_superadmin_stats_extended():
     """API extendida de estadísticas con ingresos, tendencias y desglose completo."""
     try:
-        db = get_db()
-        with db.cursor() as cur:
-            # ============================================
-            # MÉTRICAS BÁSICAS
-            # ============================================
-            
-            # Total restaurantes
-            cur.execute("SELECT COUNT(*) as total FROM restaurantes")
-            total_restaurantes = cur.fetchone()['total'] or 0
-            
-            # Restaurantes activos (con actividad en últimos 30 días)
-            try:
-                cur.execute("""
-                    SELECT COUNT(DISTINCT restaurante_id) as activos 
-                    FROM estadisticas_diarias 
-                    WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-                """)
-                restaurantes_activos = cur.fetchone()['activos'] or 0
-            except Exception:
-                restaurantes_activos = 0
-            
-            # Total usuarios (sin superadmin)
-            cur.execute("SELECT COUNT(*) as total FROM usuarios_admin WHERE rol != 'superadmin'")
-            total_usuarios = cur.fetchone()['total'] or 0
-            
-            # Total platos y categorías
-            try:
-                cur.execute("SELECT COUNT(*) as total FROM platos WHERE activo = 1")
-                total_platos = cur.fetchone()['total'] or 0
-            except Exception:
-                total_platos = 0
-            
-            try:
-                cur.execute("SELECT COUNT(*) as total FROM categorias WHERE activo = 1")
-                total_categorias = cur.fetchone()['total'] or 0
-            except Exception:
-                total_categorias = 0
-            
-            # ============================================
-            # VISITAS Y ESCANEOS
-            # ============================================
-            
-            # Total histórico
-            try:
-                cur.execute("""
-                    SELECT COALESCE(SUM(visitas),0) as visitas, 
-                        COALESCE(SUM(escaneos_qr),0) as escaneos,
-                        COALESCE(SUM(visitas_movil),0) as movil,
-                        COALESCE(SUM(visitas_desktop),0) as desktop
-                    FROM estadisticas_diarias
-                """)
-                row = cur.fetchone()
-                total_visitas = int(row['visitas']) if row and row['visitas'] else 0
-                total_escaneos = int(row['escaneos']) if row and row['escaneos'] else 0
-                total_movil = int(row['movil']) if row and row['movil'] else 0
-                total_desktop = int(row['desktop']) if row and row['desktop'] else 0
-            except Exception:
-                total_visitas = total_escaneos = total_movil = total_desktop = 0
-            
-            # Visitas últimos 30 días
-            try:
-                cur.execute("""
-                    SELECT DATE_FORMAT(fecha, '%%Y-%%m-%%d') as fecha, 
-                        COALESCE(SUM(visitas),0) as visitas,
-                        COALESCE(SUM(escaneos_qr),0) as escaneos,
-                        COALESCE(SUM(visitas_movil),0) as movil,
-                        COALESCE(SUM(visitas_desktop),0) as desktop
-                    FROM estadisticas_diarias
-                    WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-                    GROUP BY DATE(fecha)
-                    ORDER BY fecha
-                """)
-                visitas_30dias = []
-                for r in cur.fetchall():
-                    visitas_30dias.append({
-                        'fecha': str(r['fecha']),
-                        'visitas': int(r['visitas']) if r['visitas'] else 0,
-                        'escaneos': int(r['escaneos']) if r['escaneos'] else 0,
-                        'movil': int(r['movil']) if r['movil'] else 0,
-                        'desktop': int(r['desktop']) if r['desktop'] else 0
-                    })
-            except Exception as e:
-                logger.warning("Error getting visitas_30dias: %s", e)
-                visitas_30dias = []
-            
-            # Totales de los últimos 30 días
-            try:
-                cur.execute("""
-                    SELECT COALESCE(SUM(visitas),0) as visitas,
-                        COALESCE(SUM(escaneos_qr),0) as escaneos
-                    FROM estadisticas_diarias
-                    WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-                """)
-                row_30 = cur.fetchone()
-                visitas_mes_actual = int(row_30['visitas']) if row_30 and row_30['visitas'] else 0
-                escaneos_mes_actual = int(row_30['escaneos']) if row_30 and row_30['escaneos'] else 0
-            except Exception:
-                visitas_mes_actual = escaneos_mes_actual = 0
-            
-            # Totales del mes anterior (para comparar)
-            try:
-                cur.execute("""
-                    SELECT COALESCE(SUM(visitas),0) as visitas,
-                        COALESCE(SUM(escaneos_qr),0) as escaneos
-                    FROM estadisticas_diarias
-                    WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 60 DAY)
-                    AND fecha < DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-                """)
-                row_ant = cur.fetchone()
-                visitas_mes_anterior = int(row_ant['visitas']) if row_ant and row_ant['visitas'] else 0
-                escaneos_mes_anterior = int(row_ant['escaneos']) if row_ant and row_ant['escaneos'] else 0
-            except Exception:
-                visitas_mes_anterior = escaneos_mes_anterior = 0
-            
-            # Calcular tendencia (%)
-            if visitas_mes_anterior > 0:
-                tendencia_visitas = round(((visitas_mes_actual - visitas_mes_anterior) / visitas_mes_anterior) * 100, 1)
-            else:
-                tendencia_visitas = 100 if visitas_mes_actual > 0 else 0
-                
-            if escaneos_mes_anterior > 0:
-                tendencia_escaneos = round(((escaneos_mes_actual - escaneos_mes_anterior) / escaneos_mes_anterior) * 100, 1)
-            else:
-                tendencia_escaneos = 100 if escaneos_mes_actual > 0 else 0
-            
-            # Visitas de hoy - consultar estadisticas_diarias Y visitas como fallback
-            try:
-                cur.execute("""
-                    SELECT COALESCE(SUM(visitas),0) as visitas,
-                        COALESCE(SUM(escaneos_qr),0) as escaneos
-                    FROM estadisticas_diarias
-                    WHERE fecha = CURDATE()
-                """)
-                row_hoy = cur.fetchone()
-                visitas_hoy = int(row_hoy['visitas']) if row_hoy and row_hoy['visitas'] else 0
-                escaneos_hoy = int(row_hoy['escaneos']) if row_hoy and row_hoy['escaneos'] else 0
-                
-                # SIEMPRE verificar tabla visitas directamente para datos más frescos
-                try:
-                    cur.execute("""
-                        SELECT COUNT(*) as visitas,
-                            COALESCE(SUM(CASE WHEN es_qr = 1 THEN 1 ELSE 0 END), 0) as escaneos
-                        FROM visitas
-                        WHERE DATE(fecha) = CURDATE()
-                    """)
-                    row_visitas = cur.fetchone()
-                    if row_visitas:
-                        visitas_directas = int(row_visitas['visitas']) if row_visitas['visitas'] else 0
-                        escaneos_directos = int(row_visitas['escaneos']) if row_visitas['escaneos'] else 0
-                        # Usar el mayor de los dos (estadísticas o directo)
-                        if visitas_directas > visitas_hoy:
-                            visitas_hoy = visitas_directas
-                        if escaneos_directos > escaneos_hoy:
-                            escaneos_hoy = escaneos_directos
-                except Exception as e:
-                    logger.debug("Fallback visitas query: %s", e)
-            except Exception:
-                visitas_hoy = escaneos_hoy = 0
-            
-            # Visitas por día de la semana (últimos 30 días)
-            try:
-                cur.execute("""
-                    SELECT DAYOFWEEK(fecha) as dia, 
-                        COALESCE(AVG(visitas),0) as promedio
-                    FROM estadisticas_diarias
-                    WHERE fecha >= DATE_SUB(CURDATE(), INTERVAL 30 DAY)
-                    GROUP BY DAYOFWEEK(fecha)
-                    ORDER BY dia
-                """)
-                visitas_por_dia = []
-                for r in cur.fetchall():
-                    visitas_por_dia.append({
-                        'dia': int(r['dia']),
-                        'promedio': float(r['promedio']) if r['promedio'] else 0
-                    })
-            except Exception:
-                visitas_por_dia = []
-            
-            # ============================================
-            # SUSCRIPCIONES - Lógica mejorada basada en plan + fecha
-            # ============================================
-            
-            # Primero obtener IDs de planes para identificar Gratuito vs Premium
-            planes_gratuitos = []
-            planes_premium = []
-            try:
-                cur.execute("SELECT id, nombre FROM planes")
-                for p in cur.fetchall():
-                    nombre_plan = (p['nombre'] or '').lower()
-                    if 'gratis' in nombre_plan or 'gratuito' in nombre_plan or 'free' in nombre_plan:
-                        planes_gratuitos.append(p['id'])
-                    else:
-                        planes_premium.append(p['id'])
-            except Exception:
-                pass
-            
-            # Contar suscripciones de forma inteligente
-            cur.execute("""
-                SELECT 
-                    r.id,
-                    r.plan_id,
-                    LOWER(TRIM(COALESCE(r.estado_suscripcion, ''))) as estado,
-                    r.fecha_vencimiento,
-                    r.activo
-                FROM restaurantes r
-            """)
-            all_restaurants = cur.fetchall()
-            
-            subs_activas = 0
-            subs_prueba = 0
-            subs_vencidas = 0
-            subs_suspendidas = 0
-            hoy = date.today()
-            
-            for r in all_restaurants:
-                plan_id = r['plan_id']
-                estado = (r['estado'] or '').lower().strip()
-                fecha_venc = r['fecha_vencimiento']
-                es_activo = r['activo']
-                
-                # Convertir fecha si es necesario
-                if fecha_venc and hasattr(fecha_venc, 'date'):
-                    fecha_venc = fecha_venc.date()
-                
-                # Determinar si es plan premium
-                es_plan_premium = plan_id in planes_premium if planes_premium else (plan_id and plan_id > 1)
-                
-                # Lógica de clasificación:
-                # 1. Si está suspendida/cancelada explícitamente -> suspendida
-                if estado in ('suspendida', 'suspendido', 'suspended', 'inactiva', 'inactivo', 'cancelada', 'cancelado'):
-                    subs_suspendidas += 1
-                # 2. Si es plan premium Y fecha vigente -> activa
-                elif es_plan_premium and fecha_venc and fecha_venc >= hoy:
-                    subs_activas += 1
-                # 3. Si es plan premium PERO fecha vencida -> vencida
-                elif es_plan_premium and (not fecha_venc or fecha_venc < hoy):
-                    subs_vencidas += 1
-                # 4. Si es plan gratuito -> prueba
-                elif not es_plan_premium:
-                    subs_prueba += 1
-                # 5. Si el estado dice explícitamente activa -> activa
-                elif estado in ('activa', 'activo', 'premium', 'active', 'pagada', 'pagado', 'paid'):
-                    subs_activas += 1
-                # 6. Default -> prueba
-                else:
-                    subs_prueba += 1
-            
-            # Restaurantes que vencen en los próximos 7 días
-            try:
-                cur.execute("""
-                    SELECT id, nombre, DATE_FORMAT(fecha_vencimiento, %s) as fecha_vencimiento, estado_suscripcion
-                    FROM restaurantes
-                    WHERE fecha_vencimiento BETWEEN CURDATE() AND DATE_ADD(CURDATE(), INTERVAL 7 DAY)
-                    AND LOWER(TRIM(COALESCE(estado_suscripcion, ''))) IN ('activa', 'activo', 'premium', 'active', 'pagada', 'prueba', 'trial', 'demo', '')
-                    ORDER BY fecha_vencimiento
-                    LIMIT 10
-                """, ('%Y-%m-%d',))
-                por_vencer = []
-                for r in cur.fetchall():
-                    por_vencer.append({
-                        'id': r['id'],
-                        'nombre': r['nombre'],
-                        'fecha_vencimiento': str(r['fecha_vencimiento']) if r['fecha_vencimiento'] else '',
-                        'estado_suscripcion': r['estado_suscripcion']
-                    })
-            except Exception:
-                por_vencer = []
-            
-            # Nuevos restaurantes este mes
-            try:
-                cur.execute("""
-                    SELECT COUNT(*) as nuevos
-                    FROM restaurantes
-                    WHERE fecha_creacion >= DATE_FORMAT(CURDATE(), %s)
-                """, ('%Y-%m-01',))
-                result = cur.fetchone()
-                nuevos_este_mes = result['nuevos'] if result and result['nuevos'] else 0
-            except Exception:
-                nuevos_este_mes = 0
-            
-            # ============================================
-            # INGRESOS
-            # ============================================
-            
-            config = get_config_global()
-            precio_mensual = int(config.get('precio_mensual', 14990))
-            ingreso_mensual = subs_activas * precio_mensual
-            ingreso_anual_proyectado = ingreso_mensual * 12
-            
-            # ============================================
-            # TOP RESTAURANTES
-            # ============================================
-            
-            try:
-                cur.execute("""
-                    SELECT r.id, r.nombre, r.estado_suscripcion, r.url_slug,
-                        r.plan_id, r.fecha_vencimiento, r.activo,
-                        COALESCE(SUM(e.visitas), 0) as total_visitas,
-                        COALESCE(SUM(e.escaneos_qr), 0) as total_escaneos
-                    FROM restaurantes r
-                    LEFT JOIN estadisticas_diarias e ON r.id = e.restaurante_id
-                    GROUP BY r.id, r.nombre, r.estado_suscripcion, r.url_slug, r.plan_id, r.fecha_vencimiento, r.activo
-                    ORDER BY total_visitas DESC
-                    LIMIT 10
-                """)
-                top_restaurantes = []
-                for r in cur.fetchall():
-                    # Determinar estado real de suscripción
-                    estado_real = _determinar_estado_suscripcion(r, planes_premium, planes_gratuitos, hoy)
-                    top_restaurantes.append({
-                        'id': r['id'],
-                        'nombre': r['nombre'],
-                        'estado_suscripcion': estado_real,
-                        'url_slug': r['url_slug'],
-                        'total_visitas': int(r['total_visitas']) if r['total_visitas'] else 0,
-                        'total_escaneos': int(r['total_escaneos']) if r['total_escaneos'] else 0
-                    })
-            except Exception as e:
-                logger.warning("Error getting top_restaurantes: %s", e)
-                top_restaurantes = []
-            
-            # Top restaurantes por escaneos QR
-            try:
-                cur.execute("""
-                    SELECT r.id, r.nombre, r.estado_suscripcion,
-                        r.plan_id, r.fecha_vencimiento, r.activo,
-                        COALESCE(SUM(e.escaneos_qr), 0) as total_escaneos
-                    FROM restaurantes r
-                    LEFT JOIN estadisticas_diarias e ON r.id = e.restaurante_id
-                    GROUP BY r.id, r.nombre, r.estado_suscripcion, r.plan_id, r.fecha_vencimiento, r.activo
-                    HAVING total_escaneos > 0
-                    ORDER BY total_escaneos DESC
-                    LIMIT 10
-                """)
-                top_escaneos = []
-                for r in cur.fetchall():
-                    estado_real = _determinar_estado_suscripcion(r, planes_premium, planes_gratuitos, hoy)
-                    top_escaneos.append({
-                        'id': r['id'],
-                        'nombre': r['nombre'],
-                        'estado_suscripcion': estado_real,
-                        'total_escaneos': int(r['total_escaneos']) if r['total_escaneos'] else 0
-                    })
-            except Exception:
-                top_escaneos = []
-            
-            # ============================================
-            # ACTIVIDAD RECIENTE
-            # ============================================
-            
-            # Últimos restaurantes creados (usar fecha_creacion, no created_at)
-            try:
-                cur.execute("""
-                    SELECT id, nombre, fecha_creacion, estado_suscripcion, plan_id, fecha_vencimiento, activo
-                    FROM restaurantes
-                    ORDER BY fecha_creacion DESC
-                    LIMIT 5
-                """)
-                ultimos_restaurantes = []
-                for r in cur.fetchall():
-                    fecha = r['fecha_creacion']
-                    if fecha:
-                        if hasattr(fecha, 'isoformat'):
-                            fecha_str = fecha.isoformat()
-                        else:
-                            fecha_str = str(fecha)
-                    else:
-                        fecha_str = ''
-                    estado_real = _determinar_estado_suscripcion(r, planes_premium, planes_gratuitos, hoy)
-                    ultimos_restaurantes.append({
-                        'id': r['id'],
-                        'nombre': r['nombre'],
-                        'created_at': fecha_str,
-                        'estado_suscripcion': estado_real
-                    })
-            except Exception as e:
-                logger.warning("Error getting ultimos_restaurantes: %s", e)
-                ultimos_restaurantes = []
-            
-            # Tickets recientes (usar fecha_creacion, no created_at)
-            try:
-                cur.execute("""
-                    SELECT id, asunto, estado, fecha_creacion, tipo
-                    FROM tickets_soporte
-                    ORDER BY fecha_creacion DESC
-                    LIMIT 5
-                """)
-                ultimos_tickets = []
-                for r in cur.fetchall():
-                    fecha = r['fecha_creacion']
-                    if fecha:
-                        if hasattr(fecha, 'isoformat'):
-                            fecha_str = fecha.isoformat()
-                        else:
-                            fecha_str = str(fecha)
-                    else:
-                        fecha_str = ''
-                    ultimos_tickets.append({
-                        'id': r['id'],
-                        'asunto': r['asunto'] or '',
-                        'estado': r['estado'] or 'abierto',
-                        'created_at': fecha_str,
-                        'tipo': r['tipo'] or 'consulta'
-                    })
-            except Exception as e:
-                # La tabla puede no existir
-                logger.warning("Error getting ultimos_tickets (table may not exist): %s", e)
-                ultimos_tickets = []
-            
-            tickets_pendientes = sum(1 for t in ultimos_tickets if t.get('estado') in ('abierto', 'en_proceso'))
-            
-        return jsonify({
-            # Métricas básicas
-            'total_restaurantes': total_restaurantes,
-            'restaurantes_activos': restaurantes_activos,
-            'total_usuarios': total_usuarios,
-            'total_platos': total_platos,
-            'total_categorias': total_categorias,
-            
-            # Visitas y escaneos
-            'total_visitas': total_visitas,
-            'total_escaneos': total_escaneos,
-            'total_movil': total_movil,
-            'total_desktop': total_desktop,
-            'visitas_hoy': visitas_hoy,
-            'escaneos_hoy': escaneos_hoy,
-            'visitas_mes_actual': visitas_mes_actual,
-            'escaneos_mes_actual': escaneos_mes_actual,
-            'tendencia_visitas': tendencia_visitas,
-            'tendencia_escaneos': tendencia_escaneos,
-            'visitas_30dias': visitas_30dias,
-            'visitas_por_dia': visitas_por_dia,
-            
-            # Suscripciones
-            'subs_activas': subs_activas,
-            'subs_prueba': subs_prueba,
-            'subs_vencidas': subs_vencidas,
-            'subs_suspendidas': subs_suspendidas,
-            'por_vencer': por_vencer,
-            'nuevos_este_mes': nuevos_este_mes,
-            
-            # Ingresos
-            'ingreso_mensual': ingreso_mensual,
-            'ingreso_anual_proyectado': ingreso_anual_proyectado,
-            'precio_mensual': precio_mensual,
-            
-            # Rankings
-            'top_restaurantes': top_restaurantes,
-            'top_escaneos': top_escaneos,
-            
-            # Actividad reciente
-            'ultimos_restaurantes': ultimos_restaurantes,
-            'ultimos_tickets': ultimos_tickets,
-            'tickets_pendientes': tickets_pendientes
-        })
+        forzar = request.args.get('refresh') == '1'
+        return jsonify(obtener_snapshot_stats(forzar=forzar))
     except Exception as e:
         logger.exception("Error in api_superadmin_stats_extended")
         return jsonify({
@@ -5141,12 +5645,21 @@ def api_superadmin_stats_extended():
             'total_desktop': 0,
             'visitas_hoy': 0,
             'escaneos_hoy': 0,
+            'visitantes_unicos_hoy': 0,
+            'visitantes_unicos_30dias': 0,
             'visitas_mes_actual': 0,
             'escaneos_mes_actual': 0,
             'tendencia_visitas': 0,
             'tendencia_escaneos': 0,
             'visitas_30dias': [],
             'visitas_por_dia': [],
+            'visitas_por_hora': [],
+            'mapa_calor': [],
+            'origenes_30dias': {},
+            'dispositivos_30dias': {},
+            'sistemas_30dias': {},
+            'navegadores_30dias': {},
+            'apps_30dias': {},
             'subs_activas': 0,
             'subs_prueba': 0,
             'subs_vencidas': 0,
@@ -5207,9 +5720,11 @@ def api_restaurantes():
                     data.get('plan_id', 1),  # Plan gratis por defecto
                     fecha_vencimiento
                 ))
+                nuevo_id = cur.lastrowid
+                recalcular_estado_efectivo(cur, [nuevo_id])
                 db.commit()
                 logger.info("Nuevo restaurante creado: %s con vencimiento %s", data['nombre'], fecha_vencimiento)
-                return jsonify({'success': True, 'id': cur.lastrowid})
+                return jsonify({'success': True, 'id': nuevo_id})
 
     except pymysql.IntegrityError as e:
         try:
@@ -5262,6 +5777,8 @@ def api_restaurante(rest_id):
                     data.get('activo', 1),
                     rest_id
                 ))
+                # `activo` participa en el estado efectivo
+                recalcular_estado_efectivo(cur, [rest_id])
                 db.commit()
                 return jsonify({'success': True})
                 
@@ -5450,6 +5967,150 @@ def api_usuario(user_id):
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
+# ============================================================
+# JOBS PROGRAMADOS (MANTENIMIENTO)
+# ============================================================
+# Los jobs se coordinan con un lease en `jobs_programados` (scheduler.py),
+# así que nunca se ejecutan dos veces. En producción corren en una
+# always-on task de PythonAnywhere (scripts/run_scheduler.py). Con
+# SCHEDULER_EN_WEB=1 cada worker web arranca además un thread
+# "scheduler" (solo para instalaciones sin tasks: uno por worker uWSGI).
+
+from scheduler import Scheduler
+import retention
+
+SCHEDULER_EN_WEB = os.environ.get('SCHEDULER_EN_WEB', '0') == '1'
+SCHEDULER_TICK = int(os.environ.get('SCHEDULER_TICK', 30))
+
+scheduler = Scheduler(app)
+_scheduler_thread_lock = threading.Lock()
+_scheduler_thread_running = False
+
+
+@scheduler.job('snapshot_stats', cada=STATS_SNAPSHOT_INTERVAL, lease=120)
+def job_snapshot_stats():
+    """Recalcula el snapshot de estadísticas del superadmin."""
+    with db_get_connection() as conn:
+        with _stats_snapshot_lock:
+            payload = _construir_snapshot_stats(conn)
+    return {'computed_at': payload.get('computed_at')}
+
+
+@scheduler.job('barrido_suscripciones', cron='5 0 * * *')
+def job_barrido_suscripciones():
+    """Marca suscripciones vencidas y completa estado_efectivo."""
+    with db_get_connection() as conn:
+        return barrido_vencimientos(conn)
+
+
+@scheduler.job('limpiar_password_resets', cada=3600)
+def job_limpiar_password_resets():
+    """Elimina tokens de recuperación de contraseña expirados o usados."""
+    with db_get_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM password_resets WHERE fecha_expiracion < %s OR utilizado = 1",
+                        (datetime.utcnow(),))
+            eliminados = cur.rowcount
+        conn.commit()
+    return {'eliminados': eliminados}
+
+
+@scheduler.job('purgar_visitas', cron='30 3 * * *', lease=3600)
+def job_purgar_visitas():
+    """Archiva y purga visitas fuera de la ventana de retención."""
+    with db_get_connection() as conn:
+        return retention.purgar_visitas(conn, max_chunks=500)
+
+
+@scheduler.job('imagenes_pendientes', cada=600, lease=900)
+def job_imagenes_pendientes():
+    """Reintenta las subidas de imágenes pendientes (fallidas o perdidas en un reinicio)."""
+    return pipeline_imagenes.procesar_pendientes(limite=50)
+
+
+@scheduler.job('borrar_imagenes_cloudinary', cada=120, lease=600)
+def job_borrar_imagenes_cloudinary():
+    """Borra en Cloudinary las imágenes que los platos dejaron de usar (de a 100)."""
+    if not CLOUDINARY_CONFIGURED:
+        return {'omitido': 'Cloudinary no configurado'}
+    return cola_borrados.procesar(limite=1000)
+
+
+@scheduler.job('reconciliar_imagenes', cron='45 4 * * *', lease=3600)
+def job_reconciliar_imagenes():
+    """Encola assets de Cloudinary huérfanos y borra uploads locales que nadie usa."""
+    resultado = {
+        'local': limpiar_archivos_locales(app.config['UPLOAD_FOLDER']),
+        'derivados': cache_derivados.podar(),
+    }
+    if CLOUDINARY_CONFIGURED:
+        resultado['cloudinary'] = reconciliar_cloudinary(
+            lambda prefix, cursor: cloudinary_listar_recursos(prefix, next_cursor=cursor)
+        )
+    return resultado
+
+
+@scheduler.job('purgar_lapidas_platos', cron='15 4 * * *')
+def job_purgar_lapidas_platos():
+    """Elimina lápidas de platos borrados hace más de 30 días."""
+    with db_get_connection() as conn:
+        return purgar_lapidas(conn)
+
+
+@scheduler.job('limpiar_historial_jobs', cron='0 4 * * *')
+def job_limpiar_historial_jobs():
+    """Elimina historial de jobs antiguo."""
+    return scheduler.limpiar_historial()
+
+
+def _iniciar_scheduler_web():
+    """Inicia el thread del scheduler en este worker web (si está habilitado)."""
+    global _scheduler_thread_running
+    if not SCHEDULER_EN_WEB or _scheduler_thread_running or app.config.get('TESTING'):
+        return
+    with _scheduler_thread_lock:
+        if not _scheduler_thread_running:
+            _scheduler_thread_running = True
+            Thread(target=scheduler.bucle, kwargs={'tick': SCHEDULER_TICK}, daemon=True, name="scheduler").start()
+            logger.info("Scheduler thread started (tick %ss)", SCHEDULER_TICK)
+
+
+@app.route('/superadmin/jobs')
+@login_required
+@superadmin_required
+def superadmin_jobs():
+    return render_template('superadmin/jobs.html')
+
+
+@app.route('/api/superadmin/jobs')
+@login_required
+@superadmin_required
+def api_superadmin_jobs():
+    """Estado de los jobs programados e historial reciente."""
+    try:
+        return jsonify(scheduler.estado())
+    except Exception as e:
+        logger.exception("Error in api_superadmin_jobs")
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/api/superadmin/jobs/<nombre>/ejecutar', methods=['POST'])
+@login_required
+@superadmin_required
+def api_superadmin_ejecutar_job(nombre):
+    """Ejecuta un job ahora (si no está corriendo en otro worker)."""
+    if nombre not in {j.nombre for j in scheduler.jobs()}:
+        return jsonify({'success': False, 'error': 'Job no encontrado'}), 404
+    try:
+        resultado = scheduler.ejecutar(nombre, forzar=True)
+        if resultado is None:
+            return jsonify({'success': False, 'error': 'El job ya se está ejecutando'}), 409
+        return jsonify({'success': resultado['estado'] == 'ok', **resultado})
+    except Exception as e:
+        logger.exception("Error running job %s", nombre)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
 # ============================================================
 # INICIALIZACIÓN DE BASE DE DATOS
 # ============================================================
@@ -5612,7 +6273,8 @@ def healthz():
         components['visit_queue'] = {
             'size': _visitas_queue.qsize(),
             'max': 1000,
-            'worker_running': _visita_worker_running
+            'worker_running': _visita_worker_running,
+            'ua_cache': ua_cache_info()
         }
     except Exception as e:
         components['visit_queue'] = str(e)
@@ -5627,6 +6289,9 @@ def healthz():
         'api_proxy': os.environ.get('API_PROXY', 'not set')
     }
     
+    # Latencia y errores de las llamadas salientes (http_client.py)
+    components['http'] = http_client.metricas()
+    
     # Intentar re-inicializar si no está configurado
     if not CLOUDINARY_CONFIGURED and CLOUDINARY_AVAILABLE and cloudinary_url:
         try:
@@ -5933,12 +6598,19 @@ def admin_cloudinary_test_upload():
 @login_required
 @restaurante_owner_required
 def admin_cloudinary_process_pendings():
-    """Trigger processing of pending image uploads (synchronous). Accepts JSON: {"limit": 50, "max_attempts": 5, "dry_run": false}.
-    Returns 200 on success and a brief summary."""
-    data = request.get_json() or {}
-    limit = int(data.get('limit', 50))
-    max_attempts = int(data.get('max_attempts', 5))
+    """Encola un lote de subidas pendientes y responde sin esperar (202).
+    Accepts JSON: {"limit": 50, "max_attempts": 5, "dry_run": false}.
+    El lote se sube en el pool de pipeline_imagenes; su avance se consulta en
+    GET /admin/cloudinary/process-pendings/<lote>. Un admin solo procesa las
+    imágenes de su restaurante; el superadmin, las de todos."""
+    data = request.get_json(silent=True) or {}
+    try:
+        limit = max(1, min(int(data.get('limit', 50)), 500))
+        max_attempts = int(data.get('max_attempts', 5))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'error': 'limit y max_attempts deben ser enteros'}), 400
     dry_run = bool(data.get('dry_run', False))
+    restaurante_id = None if session.get('rol') == 'superadmin' else session.get('restaurante_id')
 
     if not CLOUDINARY_AVAILABLE:
         return jsonify({'success': False, 'error': 'Cloudinary SDK no instalado.'}), 500
@@ -5946,17 +6618,35 @@ def admin_cloudinary_process_pendings():
         return jsonify({'success': False, 'error': 'Cloudinary no está configurado.'}), 500
 
     try:
-        # Import local script and run
-        from scripts.process_pending_images import process
-        exit_code = process(limit=limit, max_attempts=max_attempts, dry_run=dry_run)
-        if exit_code == 0:
-            return jsonify({'success': True, 'message': 'Procesamiento completado'}), 200
-        elif exit_code == 2:
-            return jsonify({'success': False, 'error': 'Cloudinary no disponible o no configurado'}), 500
-        else:
-            return jsonify({'success': False, 'error': 'Error durante el procesamiento'}), 500
+        if dry_run:
+            pendientes = pipeline_imagenes.contar_pendientes(restaurante_id, max_attempts)
+            return jsonify({'success': True, 'dry_run': True, 'pendientes': pendientes}), 200
+        resumen = pipeline_imagenes.procesar_pendientes(limite=limit, restaurante_id=restaurante_id,
+                                                        max_intentos=max_attempts, esperar=False)
+        return jsonify({
+            'success': True,
+            'lote': resumen['lote'],
+            'reclamados': resumen['reclamados'],
+            'estado_url': url_for('admin_cloudinary_pendings_lote', lote=resumen['lote']),
+        }), 202
     except Exception as e:
-        logger.exception('Error ejecutando procesador de pendings: %s', e)
+        logger.exception('Error encolando lote de pendings: %s', e)
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+
+@app.route('/admin/cloudinary/process-pendings/<lote>')
+@login_required
+@restaurante_owner_required
+def admin_cloudinary_pendings_lote(lote):
+    """Avance de un lote encolado por admin_cloudinary_process_pendings."""
+    restaurante_id = None if session.get('rol') == 'superadmin' else session.get('restaurante_id')
+    try:
+        estado = pipeline_imagenes.estado_lote(get_db(), lote, restaurante_id)
+        if not estado:
+            return jsonify({'success': False, 'error': 'Lote no encontrado'}), 404
+        return jsonify({'success': True, **estado})
+    except Exception as e:
+        logger.exception('Error consultando lote de pendings: %s', e)
         return jsonify({'success': False, 'error': str(e)}), 500
 
 
@@ -5967,6 +6657,22 @@ def uploaded_file(filename):
     return send_from_directory(upload_folder, filename)
 
 
+@app.route('/img/<nombre>')
+def imagen_derivada(nombre):
+    """Sirve un upload local reducido al ancho ?w= (derivado cacheado en disco)."""
+    # Literal: image/* también lo envían navegadores sin soporte de WebP
+    webp = 'image/webp' in request.headers.get('Accept', '')
+    derivado = cache_derivados.obtener(nombre, request.args.get('w', type=int), webp=webp)
+    if derivado is None:
+        abort(404)
+    response = send_file(derivado['ruta'], mimetype=derivado['content_type'], etag=derivado['etag'],
+                         conditional=True, max_age=CACHE_MAX_AGE)
+    response.cache_control.public = True
+    response.cache_control.immutable = True
+    response.vary.add('Accept')
+    return response
+
+
 # ============================================================
 # EJECUTAR APLICACIÓN
 # ============================================================
@@ -0,0 +1,197 @@
+# ============================================================
+# BUSQUEDA - Búsqueda de platos (FULLTEXT + índice en memoria)
+# ============================================================
+# Reemplaza el LOWER(nombre) LIKE '%x%' (no indexable) por un índice
+# FULLTEXT sobre platos(nombre, descripcion, etiquetas) (migración 024).
+#
+# - Modo BOOLEAN con prefijo: "lom pob" -> "+lom* +pob*", así la búsqueda
+#   responde mientras se escribe.
+# - Acentos y mayúsculas: la colación utf8mb4_unicode_ci de la tabla ya
+#   es insensible a ambos, FULLTEXT la respeta ("cafe" encuentra "Café").
+# - Relevancia: coincidencia en el nombre primero, luego el score de MATCH.
+# - Palabras más cortas que innodb_ft_min_token_size (3) no se indexan;
+#   se filtran con LIKE sobre los resultados o, si no queda ninguna palabra
+#   indexable, sobre los platos del restaurante.
+#
+# IndiceBusqueda es un índice invertido en memoria con las mismas reglas
+# (tokens sin acentos, prefijos, nombre con más peso). Se usa cuando el
+# índice FULLTEXT no existe (MySQL error 1191, migración no aplicada) y
+# en los tests sin MySQL.
+# ============================================================
+
+import logging
+import re
+import unicodedata
+
+import pymysql
+
+logger = logging.getLogger(__name__)
+
+MIN_TOKEN_FULLTEXT = 3
+MAX_TERMINOS = 8
+LIMITE_RESULTADOS = 50
+_ERROR_SIN_INDICE_FULLTEXT = 1191
+
+_PESOS = {'nombre': 3, 'etiquetas': 2, 'descripcion': 1}
+_TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+COLUMNAS_RESULTADO = '''
+    p.id, p.categoria_id, c.nombre as categoria_nombre, p.nombre, p.descripcion,
+    p.precio, p.precio_oferta, p.imagen_url, p.imagen_public_id, p.etiquetas, p.activo
+'''
+
+
+def normalizar(texto):
+    """Minúsculas y sin acentos: 'Ñandú Café' -> 'nandu cafe'."""
+    texto = unicodedata.normalize('NFKD', str(texto or '').lower())
+    return ''.join(ch for ch in texto if not unicodedata.combining(ch))
+
+
+def tokens(texto):
+    return _TOKEN_RE.findall(normalizar(texto))
+
+
+def terminos_busqueda(texto):
+    """Términos únicos de la consulta, en orden, limitados a MAX_TERMINOS."""
+    vistos = []
+    for t in tokens(texto):
+        if t not in vistos:
+            vistos.append(t)
+    return vistos[:MAX_TERMINOS]
+
+
+def consulta_booleana(terminos):
+    """['lomo', 'po'] -> '+lomo*' (los términos cortos los resuelve el LIKE)."""
+    return ' '.join(f'+{t}*' for t in terminos if len(t) >= MIN_TOKEN_FULLTEXT)
+
+
+def _like(t):
+    return '%' + t.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+
+
+def buscar_platos(cur, restaurante_id, texto, solo_activos=False, limite=LIMITE_RESULTADOS):
+    """
+    Busca platos del restaurante por nombre, descripción y etiquetas.
+
+    Returns:
+        list: platos ordenados por relevancia (con 'relevancia')
+    """
+    terminos = terminos_busqueda(texto)
+    if not terminos:
+        return []
+
+    booleana = consulta_booleana(terminos)
+    cortos = [t for t in terminos if len(t) < MIN_TOKEN_FULLTEXT]
+    where = ['p.restaurante_id = %s']
+    params = [restaurante_id]
+    if solo_activos:
+        where.append('p.activo = 1 AND c.activo = 1')
+    for t in cortos:
+        where.append('CONCAT_WS(\' \', p.nombre, p.descripcion, p.etiquetas) LIKE %s')
+        params.append(_like(t))
+
+    if booleana:
+        match = 'MATCH(p.nombre, p.descripcion, p.etiquetas) AGAINST (%s IN BOOLEAN MODE)'
+        sql = f'''
+            SELECT {COLUMNAS_RESULTADO}, {match} as relevancia,
+                (p.nombre LIKE %s) as en_nombre
+            FROM platos p
+            LEFT JOIN categorias c ON p.categoria_id = c.id
+            WHERE {' AND '.join(where)} AND {match}
+            ORDER BY en_nombre DESC, relevancia DESC, p.nombre
+            LIMIT %s
+        '''
+        params = [booleana, _like(terminos[0])] + params + [booleana, limite]
+    else:
+        sql = f'''
+            SELECT {COLUMNAS_RESULTADO}, 0 as relevancia, (p.nombre LIKE %s) as en_nombre
+            FROM platos p
+            LEFT JOIN categorias c ON p.categoria_id = c.id
+            WHERE {' AND '.join(where)}
+            ORDER BY en_nombre DESC, p.nombre
+            LIMIT %s
+        '''
+        params = [_like(terminos[0])] + params + [limite]
+
+    try:
+        cur.execute(sql, params)
+        return list(cur.fetchall() or [])
+    except pymysql.err.MySQLError as e:
+        if e.args and e.args[0] == _ERROR_SIN_INDICE_FULLTEXT:
+            logger.warning("FULLTEXT index missing on platos (run migration 024); using in-memory search")
+            return buscar_en_memoria(cur, restaurante_id, texto, solo_activos, limite)
+        raise
+
+
+def buscar_en_memoria(cur, restaurante_id, texto, solo_activos=False, limite=LIMITE_RESULTADOS):
+    """Fallback: carga los platos del restaurante y busca con IndiceBusqueda."""
+    where = 'p.restaurante_id = %s' + (' AND p.activo = 1 AND c.activo = 1' if solo_activos else '')
+    cur.execute(f'''
+        SELECT {COLUMNAS_RESULTADO}
+        FROM platos p
+        LEFT JOIN categorias c ON p.categoria_id = c.id
+        WHERE {where}
+    ''', (restaurante_id,))
+    return IndiceBusqueda(cur.fetchall() or []).buscar(texto, limite)
+
+
+class IndiceBusqueda:
+    """
+    Índice invertido en memoria: token normalizado -> {id: peso}.
+    Todos los términos deben coincidir (como '+t*'), por prefijo.
+    """
+
+    def __init__(self, platos=()):
+        self._platos = {}
+        self._indice = {}
+        for p in platos:
+            self.agregar(p)
+
+    def agregar(self, plato):
+        pid = plato['id']
+        self.quitar(pid)
+        self._platos[pid] = plato
+        for campo, peso in _PESOS.items():
+            for t in tokens(plato.get(campo)):
+                pesos = self._indice.setdefault(t, {})
+                pesos[pid] = pesos.get(pid, 0) + peso
+
+    def quitar(self, plato_id):
+        if self._platos.pop(plato_id, None) is None:
+            return
+        for pesos in self._indice.values():
+            pesos.pop(plato_id, None)
+
+    def _coincidencias(self, termino):
+        """{id: peso} de los tokens que empiezan con el término."""
+        total = {}
+        for token, pesos in self._indice.items():
+            if token.startswith(termino):
+                for pid, peso in pesos.items():
+                    total[pid] = total.get(pid, 0) + peso
+        return total
+
+    def buscar(self, texto, limite=LIMITE_RESULTADOS):
+        terminos = terminos_busqueda(texto)
+        if not terminos:
+            return []
+        puntajes = None
+        for t in terminos:
+            encontrados = self._coincidencias(t)
+            if puntajes is None:
+                puntajes = encontrados
+            else:
+                puntajes = {pid: puntajes[pid] + peso for pid, peso in encontrados.items() if pid in puntajes}
+            if not puntajes:
+                return []
+
+        def orden(pid):
+            en_nombre = any(n.startswith(terminos[0]) for n in tokens(self._platos[pid].get('nombre')))
+            return (not en_nombre, -puntajes[pid], normalizar(self._platos[pid].get('nombre')))
+
+        resultado = []
+        for pid in sorted(puntajes, key=orden)[:limite]:
+            plato = dict(self._platos[pid])
+            plato['relevancia'] = puntajes[pid]
+            resultado.append(plato)
+        return resultado
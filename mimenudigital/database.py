@@ -11,6 +11,7 @@
 # - Reciclaje automático de conexiones antiguas
 # - Métricas de uso en tiempo real
 # - Liberación GARANTIZADA incluso en errores
+# - Fan-out de queries independientes en paralelo
 # - Zero dependency (solo PyMySQL + Flask)
 # ============================================================
 
@@ -22,6 +23,7 @@ import logging
 import threading
 import queue
 import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from functools import wraps
 
 logger = logging.getLogger(__name__)
@@ -598,6 +600,146 @@ def execute_many(query, params_list, commit=True):
         cursor.close()
 
 
+# ============================================================
+# FAN-OUT DE QUERIES INDEPENDIENTES
+# ============================================================
+
+FANOUT_TIMEOUT = 10         # Segundos máximo por query en fan-out
+FANOUT_GRACIA = 0.2         # Margen para que MySQL corte la query (MAX_EXECUTION_TIME)
+FANOUT_CONEXIONES_LIBRES = 2  # Conexiones del pool que el fan-out deja a los requests
+
+
+class ParallelResults(dict):
+    """Resultados por nombre; `errors` guarda {nombre: mensaje} de las queries que fallaron."""
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.errors = {}
+
+
+def _workers_fanout(n_queries):
+    """Un thread por query, sin tomar más conexiones de las que el pool tiene libres."""
+    status = _pool.status
+    libres = status['max_total'] - status['in_use'] - FANOUT_CONEXIONES_LIBRES
+    return max(1, min(n_queries, libres))
+
+
+def _run_fanout_task(spec, timeout, al_iniciar=None):
+    """Ejecuta una query del fan-out en su propia conexión del pool."""
+    with get_connection() as conn:
+        if al_iniciar:
+            al_iniciar()
+        cursor = conn.cursor()
+        try:
+            # Corta la query en el servidor si excede el timeout (MySQL 5.7.8+, solo SELECT)
+            try:
+                cursor.execute("SET SESSION MAX_EXECUTION_TIME = %s", (int(timeout * 1000),))
+            except Exception:
+                pass
+            
+            if callable(spec):
+                return spec(cursor)
+            
+            query, params = spec[0], spec[1] if len(spec) > 1 else None
+            fetch = spec[2] if len(spec) > 2 else 'all'
+            cursor.execute(query, params)
+            return cursor.fetchone() if fetch == 'one' else cursor.fetchall()
+        finally:
+            try:
+                cursor.execute("SET SESSION MAX_EXECUTION_TIME = 0")
+            except Exception:
+                pass
+            cursor.close()
+
+
+def run_parallel_queries(queries, timeout=FANOUT_TIMEOUT, defaults=None):
+    """
+    Ejecuta queries de SOLO LECTURA independientes en paralelo, cada una en
+    una conexión distinta del pool.
+    
+    Se usa un thread por query, acotado por las conexiones libres del pool,
+    así que el tiempo total pasa a ser el de la query más lenta (no la suma).
+    El `timeout` es por query y se cuenta desde que la query toma su
+    conexión: MAX_EXECUTION_TIME la corta en el servidor y libera la
+    conexión. Una query que falla o excede `timeout` no aborta las demás:
+    su nombre queda en `results.errors` y su valor es `defaults.get(nombre)`.
+    
+    Args:
+        queries: {nombre: (sql, params) | (sql, params, 'one') | callable(cursor)}
+        timeout: Segundos máximos para cada query
+        defaults: {nombre: valor} a usar si la query falla
+        
+    Returns:
+        ParallelResults: dict {nombre: filas | fila | valor} con atributo `errors`
+        
+    Example:
+        res = run_parallel_queries({
+            'total': ("SELECT COUNT(*) as total FROM platos", None, 'one'),
+            'ultimos': ("SELECT id FROM platos ORDER BY id DESC LIMIT 5", None),
+        })
+        total = res['total']['total'] if res['total'] else 0
+    """
+    defaults = defaults or {}
+    results = ParallelResults()
+    if not queries:
+        return results
+    
+    workers = _workers_fanout(len(queries))
+    executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='db-fanout')
+    started = time.monotonic()
+    inicios = {}
+    
+    def _marcar(nombre):
+        return lambda: inicios.setdefault(nombre, time.monotonic())
+    
+    futures = {
+        executor.submit(_run_fanout_task, spec, timeout, _marcar(nombre)): nombre
+        for nombre, spec in queries.items()
+    }
+    limite = timeout + FANOUT_GRACIA
+    # Si faltan conexiones las queries corren por tandas: ninguna espera más que eso
+    plazo_total = started + limite * -(-len(queries) // workers) + POOL_TIMEOUT
+    pendientes = set(futures)
+    
+    try:
+        while pendientes:
+            ahora = time.monotonic()
+            vencidas = {
+                f for f in pendientes
+                if not f.done() and (ahora >= plazo_total or ahora - inicios.get(futures[f], ahora) >= limite)
+            }
+            for future in vencidas:
+                nombre = futures[future]
+                future.cancel()
+                logger.warning(f"Fan-out query '{nombre}' timed out after {timeout}s")
+                results.errors[nombre] = 'timeout'
+                results[nombre] = defaults.get(nombre)
+            pendientes -= vencidas
+            if not pendientes:
+                break
+            
+            # Despertar en el próximo vencimiento posible (las que aún no
+            # empezaron vencen, como pronto, dentro de `limite`)
+            proximo = min([inicios.get(futures[f], ahora) + limite for f in pendientes] + [plazo_total])
+            done, _ = wait(pendientes, timeout=max(0.01, proximo - ahora), return_when=FIRST_COMPLETED)
+            for future in done:
+                nombre = futures[future]
+                try:
+                    results[nombre] = future.result()
+                except Exception as e:
+                    logger.warning(f"Fan-out query '{nombre}' failed: {e}")
+                    results.errors[nombre] = str(e)
+                    results[nombre] = defaults.get(nombre)
+            pendientes -= done
+    finally:
+        # No esperar a las vencidas: terminan (y devuelven su conexión) al cortarlas MySQL
+        executor.shutdown(wait=False)
+    
+    logger.debug(f"Fan-out of {len(queries)} queries on {workers} threads in "
+                 f"{(time.monotonic() - started) * 1000:.0f}ms")
+    return results
+
+
 # ============================================================
 # FUNCIONES DE UTILIDAD
 # ============================================================
@@ -0,0 +1,208 @@
+# ============================================================
+# EXPORTS - Exportación masiva en streaming (CSV / NDJSON gzip)
+# ============================================================
+# Exporta visitas crudas o estadísticas diarias por rango de fechas sin
+# cargar el resultado en memoria:
+#
+# - Paginación keyset por chunks: (fecha, id) > último visto, usando el
+#   índice (restaurante_id, fecha) / (fecha). Nunca OFFSET.
+# - Cada chunk usa una conexión del pool con cursor del lado servidor
+#   (SSDictCursor): las filas se codifican a medida que llegan del socket.
+#   La conexión se libera ANTES de entregar los bytes al cliente, así un
+#   cliente lento no retiene una conexión del pool.
+# - gzip al vuelo (zlib con wbits=31) y respuesta chunked.
+# - Reanudable: cada fila lleva su clave y el token de cursor es legible
+#   ("2026-01-31T10:00:00_12345" / "2026-01-31_7"); en NDJSON además se
+#   emite un checkpoint {"_cursor": ...} al final de cada chunk.
+# ============================================================
+
+import csv
+import io
+import json
+import logging
+import zlib
+from datetime import date, datetime
+
+from pymysql.cursors import SSDictCursor
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+EXPORT_CHUNK = 5000
+FORMATOS = ('csv', 'ndjson')
+
+
+class _Export:
+    """Definición de una exportación: columnas, SELECT y clave keyset."""
+
+    def __init__(self, columnas, select, clave_fecha, clave_id, clave_restaurante):
+        self.columnas = columnas
+        self.select = select
+        self.clave_fecha = clave_fecha
+        self.clave_id = clave_id
+        self.clave_restaurante = clave_restaurante
+
+
+EXPORTS = {
+    'visitas': _Export(
+        columnas=('id', 'restaurante_id', 'fecha', 'ip_address', 'user_agent', 'referer', 'es_movil', 'es_qr'),
+        select='''
+            SELECT v.id, v.restaurante_id, v.fecha, v.ip_address,
+                COALESCE(ua.user_agent, v.user_agent) as user_agent,
+                COALESCE(rf.referer, v.referer) as referer,
+                v.es_movil, v.es_qr
+            FROM visitas v
+            LEFT JOIN user_agents ua ON ua.id = v.user_agent_id
+            LEFT JOIN referers rf ON rf.id = v.referer_id
+        ''',
+        clave_fecha='v.fecha',
+        clave_id='v.id',
+        clave_restaurante='v.restaurante_id',
+    ),
+    'diarias': _Export(
+        columnas=('fecha', 'restaurante_id', 'visitas', 'escaneos_qr', 'visitas_movil', 'visitas_desktop'),
+        select='''
+            SELECT e.fecha, e.restaurante_id, e.visitas, e.escaneos_qr,
+                e.visitas_movil, e.visitas_desktop
+            FROM estadisticas_diarias e
+        ''',
+        clave_fecha='e.fecha',
+        clave_id='e.restaurante_id',
+        clave_restaurante='e.restaurante_id',
+    ),
+}
+
+
+def _valor(v):
+    if isinstance(v, (datetime, date)):
+        return v.isoformat()
+    if isinstance(v, bytes):
+        return v.decode('utf-8', 'replace')
+    return v
+
+
+def token_cursor(fila, tipo):
+    """Token de reanudación para la última fila entregada."""
+    if tipo == 'visitas':
+        return f"{_valor(fila['fecha'])}_{fila['id']}"
+    return f"{_valor(fila['fecha'])}_{fila['restaurante_id']}"
+
+
+def parse_cursor(token, tipo):
+    """'<fecha>_<id>' -> (fecha, id). Lanza ValueError si el token es inválido."""
+    fecha_str, _, id_str = (token or '').rpartition('_')
+    if not fecha_str:
+        raise ValueError("Cursor inválido")
+    if tipo == 'visitas':
+        fecha = datetime.fromisoformat(fecha_str)
+    else:
+        fecha = date.fromisoformat(fecha_str)
+    return fecha, int(id_str)
+
+
+def _query_chunk(exp, restaurante_id, desde, hasta, despues_de, limite):
+    where = [f"{exp.clave_fecha} >= %s", f"{exp.clave_fecha} < %s"]
+    params = [desde, hasta]
+    if restaurante_id is not None:
+        where.insert(0, f"{exp.clave_restaurante} = %s")
+        params.insert(0, restaurante_id)
+    if despues_de is not None:
+        where.append(f"({exp.clave_fecha} > %s OR ({exp.clave_fecha} = %s AND {exp.clave_id} > %s))")
+        params.extend([despues_de[0], despues_de[0], despues_de[1]])
+    sql = f"{exp.select} WHERE {' AND '.join(where)} ORDER BY {exp.clave_fecha}, {exp.clave_id} LIMIT %s"
+    params.append(limite)
+    return sql, params
+
+
+class _Encoder:
+    """Serializa filas a CSV o NDJSON y opcionalmente comprime en gzip."""
+
+    def __init__(self, formato, columnas, comprimir):
+        self.formato = formato
+        self.columnas = columnas
+        self._gzip = zlib.compressobj(6, zlib.DEFLATED, 31) if comprimir else None
+        self._buf = io.StringIO()
+        self._csv = csv.writer(self._buf) if formato == 'csv' else None
+
+    def cabecera(self):
+        if self._csv:
+            self._csv.writerow(self.columnas)
+
+    def fila(self, row):
+        if self._csv:
+            self._csv.writerow([_valor(row.get(c)) for c in self.columnas])
+        else:
+            self._buf.write(json.dumps({c: _valor(row.get(c)) for c in self.columnas}, ensure_ascii=False))
+            self._buf.write('\n')
+
+    def checkpoint(self, token):
+        if not self._csv:
+            self._buf.write(json.dumps({'_cursor': token}) + '\n')
+
+    def drenar(self):
+        """Bytes pendientes (comprimidos si corresponde)."""
+        data = self._buf.getvalue().encode('utf-8')
+        self._buf.seek(0)
+        self._buf.truncate()
+        return self._gzip.compress(data) if self._gzip else data
+
+    def cerrar(self):
+        data = self.drenar()
+        return data + self._gzip.flush() if self._gzip else data
+
+
+def stream_export(tipo, desde, hasta, restaurante_id=None, formato='csv', comprimir=True,
+                  cursor=None, chunk_size=EXPORT_CHUNK, incluir_ip=True):
+    """
+    Generador de bytes con la exportación completa.
+
+    Args:
+        tipo: 'visitas' | 'diarias'
+        desde, hasta: rango [desde, hasta) (date/datetime)
+        restaurante_id: None = todos los restaurantes (solo superadmin)
+        formato: 'csv' | 'ndjson'
+        comprimir: gzip al vuelo
+        cursor: token de reanudación (excluye las filas hasta ese punto)
+        incluir_ip: False omite ip_address (exportaciones de restaurantes)
+    """
+    if tipo not in EXPORTS:
+        raise ValueError(f"Tipo de exportación inválido: {tipo}")
+    if formato not in FORMATOS:
+        raise ValueError(f"Formato inválido: {formato}")
+
+    exp = EXPORTS[tipo]
+    columnas = tuple(c for c in exp.columnas if incluir_ip or c != 'ip_address')
+    despues_de = parse_cursor(cursor, tipo) if cursor else None
+    encoder = _Encoder(formato, columnas, comprimir)
+    if not cursor:
+        encoder.cabecera()
+
+    total = 0
+    while True:
+        sql, params = _query_chunk(exp, restaurante_id, desde, hasta, despues_de, chunk_size)
+        n = 0
+        ultima = None
+        with get_connection() as conn:
+            cur = conn.cursor(SSDictCursor)
+            try:
+                cur.execute(sql, params)
+                for row in cur:
+                    encoder.fila(row)
+                    ultima = row
+                    n += 1
+            finally:
+                cur.close()
+        # Conexión ya devuelta al pool: recién ahora se entregan los bytes
+        if ultima is not None:
+            despues_de = (ultima['fecha'], ultima['id'] if tipo == 'visitas' else ultima['restaurante_id'])
+            encoder.checkpoint(token_cursor(ultima, tipo))
+        total += n
+        if n < chunk_size:
+            break
+        data = encoder.drenar()
+        if data:
+            yield data
+
+    logger.info("Export %s finished: %d rows (%s, gzip=%s)", tipo, total, formato, comprimir)
+    yield encoder.cerrar()
@@ -0,0 +1,196 @@
+# ============================================================
+# HTTP CLIENT - Sesiones HTTP salientes (Cloudinary, Mercado Pago)
+# ============================================================
+# Todo el tráfico saliente pasa por el proxy de PythonAnywhere. Una
+# requests.Session por servicio, compartida entre threads:
+#
+# - HTTPAdapter con pool_maxsize igual a los threads que la usan a la vez;
+#   las conexiones (y el túnel CONNECT del proxy) quedan vivas entre
+#   llamadas en vez de abrir una por subida.
+# - Reintentos con backoff exponencial (urllib3 Retry) en errores de
+#   conexión y en 502/503/504. Los POST solo se reintentan si la conexión
+#   no llegó a establecerse: una subida o un pago nunca se envían dos veces.
+# - Timeout (conexión, lectura) por servicio, ver TIMEOUTS.
+# - Latencia y errores por servicio en memoria, expuestos en /healthz.
+#
+# Uso:
+#     sesion = http_client.sesion('cloudinary', proxy=api_proxy)
+#     sesion.post(url, data=..., files=...)   # usa TIMEOUTS['cloudinary']
+# ============================================================
+
+import logging
+import os
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util import Retry
+
+try:
+    from mercadopago.http.http_client import HttpClient as _HttpClientMercadoPago
+    MERCADOPAGO_HTTP_AVAILABLE = True
+except ImportError:
+    _HttpClientMercadoPago = object
+    MERCADOPAGO_HTTP_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+HTTP_POOL_SIZE = int(os.environ.get('HTTP_POOL_SIZE', '10'))   # Threads web que pueden llamar a la vez
+HTTP_REINTENTOS = int(os.environ.get('HTTP_REINTENTOS', '3'))
+HTTP_BACKOFF = 0.5          # 0.5 s, 1 s, 2 s entre reintentos
+STATUS_REINTENTABLES = (502, 503, 504)
+MUESTRAS_LATENCIA = 256     # Últimas llamadas por servicio para p50/p95
+
+# servicio -> (timeout de conexión, timeout de lectura) en segundos
+TIMEOUTS = {
+    'cloudinary': (10, 120),     # Subidas de hasta 5 MB por el proxy
+    'cloudinary_api': (10, 30),  # destroy / Admin API
+    'mercadopago': (10, 30),
+}
+TIMEOUT_DEFAULT = (10, 30)
+
+
+# ============================================================
+# MÉTRICAS
+# ============================================================
+
+class _Metricas:
+    """Contadores y latencias recientes por servicio (thread-safe)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._servicios = {}
+
+    def registrar(self, servicio, ms, status=None, error=None):
+        with self._lock:
+            m = self._servicios.setdefault(servicio, {
+                'llamadas': 0, 'errores': 0, 'latencias': deque(maxlen=MUESTRAS_LATENCIA),
+                'ultimo_error': None,
+            })
+            m['llamadas'] += 1
+            m['latencias'].append(ms)
+            if error or (status is not None and status >= 500):
+                m['errores'] += 1
+                m['ultimo_error'] = {'error': error or f'HTTP {status}', 'en': time.strftime('%Y-%m-%d %H:%M:%S')}
+
+    def resumen(self):
+        with self._lock:
+            copia = {s: dict(m, latencias=sorted(m['latencias'])) for s, m in self._servicios.items()}
+        resultado = {}
+        for servicio, m in copia.items():
+            lat = m['latencias']
+            resultado[servicio] = {
+                'llamadas': m['llamadas'],
+                'errores': m['errores'],
+                'ms_p50': lat[len(lat) // 2] if lat else None,
+                'ms_p95': lat[min(len(lat) - 1, int(len(lat) * 0.95))] if lat else None,
+                'ms_max': lat[-1] if lat else None,
+                'ultimo_error': m['ultimo_error'],
+            }
+        return resultado
+
+    def reiniciar(self):
+        with self._lock:
+            self._servicios.clear()
+
+
+_metricas = _Metricas()
+
+
+def metricas():
+    """Latencia y errores por servicio (para /healthz)."""
+    return _metricas.resumen()
+
+
+# ============================================================
+# SESIONES
+# ============================================================
+
+class SesionServicio(requests.Session):
+    """Session con timeout por defecto del servicio y métricas por llamada."""
+
+    def __init__(self, servicio, timeout=None):
+        super().__init__()
+        self.servicio = servicio
+        self.timeout = timeout or TIMEOUTS.get(servicio, TIMEOUT_DEFAULT)
+
+    def request(self, method, url, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        inicio = time.monotonic()
+        try:
+            respuesta = super().request(method, url, **kwargs)
+        except requests.exceptions.RequestException as e:
+            _metricas.registrar(self.servicio, int((time.monotonic() - inicio) * 1000), error=type(e).__name__)
+            raise
+        _metricas.registrar(self.servicio, int((time.monotonic() - inicio) * 1000), status=respuesta.status_code)
+        return respuesta
+
+
+def crear_sesion(servicio, hilos=HTTP_POOL_SIZE, reintentos=HTTP_REINTENTOS, proxy=None, timeout=None):
+    """
+    Crea una sesión para un servicio.
+
+    Args:
+        hilos: threads que pueden usarla a la vez (tamaño del pool de conexiones)
+        reintentos: reintentos ante errores de conexión / 502-504
+        proxy: URL del proxy HTTP(S), o None
+    """
+    retry = Retry(
+        total=reintentos,
+        connect=reintentos,
+        read=reintentos,
+        status=reintentos,
+        backoff_factor=HTTP_BACKOFF,
+        status_forcelist=STATUS_REINTENTABLES,
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,  # Sin POST: no se repiten subidas ni pagos
+        raise_on_status=False,
+    )
+    adapter = HTTPAdapter(pool_connections=2, pool_maxsize=max(hilos, 1), max_retries=retry)
+    sesion_nueva = SesionServicio(servicio, timeout)
+    sesion_nueva.mount('https://', adapter)
+    sesion_nueva.mount('http://', adapter)
+    if proxy:
+        sesion_nueva.proxies = {'http': proxy, 'https': proxy}
+    return sesion_nueva
+
+
+_sesiones = {}
+_sesiones_lock = threading.Lock()
+
+
+def sesion(servicio, **opciones):
+    """Sesión compartida del servicio (se crea en la primera llamada con `opciones`)."""
+    if servicio not in _sesiones:
+        with _sesiones_lock:
+            if servicio not in _sesiones:
+                _sesiones[servicio] = crear_sesion(servicio, **opciones)
+    return _sesiones[servicio]
+
+
+# ============================================================
+# MERCADO PAGO
+# ============================================================
+
+class ClienteHttpMercadoPago(_HttpClientMercadoPago):
+    """
+    http_client para mercadopago.SDK. El HttpClient del SDK abre una Session
+    nueva por llamada (sin keep-alive); este usa la sesión compartida y su
+    timeout, y deja los reintentos al adapter.
+    """
+
+    def __init__(self, sesion_http=None):
+        self.sesion = sesion_http or sesion('mercadopago')
+
+    def request(self, method, url, maxretries=None, **kwargs):
+        kwargs.pop('timeout', None)
+        api_result = self.sesion.request(method, url, **kwargs)
+        response = {'status': api_result.status_code, 'response': None}
+        if api_result.status_code != 204 and api_result.content:
+            try:
+                response['response'] = api_result.json()
+            except ValueError:
+                logger.warning("Mercado Pago returned non-JSON body (HTTP %s)", api_result.status_code)
+        return response
@@ -0,0 +1,333 @@
+# ============================================================
+# IMAGE CLEANUP - Borrado diferido de imágenes en Cloudinary
+# ============================================================
+# Editar o borrar un plato llamaba a cloudinary.uploader.destroy dentro
+# del request, una vez por imagen. Ahora:
+#
+# 1. El endpoint registra los public_id que dejaron de usarse con
+#    encolar_borrado(cur, ...) en SU transacción: si el cambio no se
+#    confirma, tampoco se borra nada.
+# 2. El job 'borrar_imagenes_cloudinary' (ColaBorrados.procesar) reclama
+#    filas con un claim_token (como imagenes_pendientes), descarta las que
+#    volvieron a usarse y borra el resto de a BORRADO_LOTE public_ids por
+#    llamada a la Admin API (delete_resources).
+# 3. Los fallos vuelven a 'pending' con backoff exponencial; tras
+#    MAX_INTENTOS quedan en 'failed'.
+#
+# Tabla: cloudinary_borrados (migración 027).
+#
+# Reconciliación (job 'reconciliar_imagenes'): las imágenes se suben antes
+# de guardar el plato, así que un formulario abandonado deja assets que
+# nadie usa, y los pendings fallidos dejan archivos en static/uploads.
+# - reconciliar_cloudinary() recorre los assets bajo mimenudigital/platos/
+#   con la Admin API (de a una página, siguiendo next_cursor) y encola
+#   los que ningún plato ni galería usa y tienen más de GC_GRACIA_HORAS.
+# - limpiar_archivos_locales() hace lo mismo con static/uploads.
+# Ninguna de las dos carga el inventario completo en memoria: cada página
+# o lote se compara con la BD por IN (...) y se descarta.
+# ============================================================
+
+import logging
+import os
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from database import get_connection
+from image_jobs import BACKOFF_BASE, BACKOFF_MAX, RECLAMO_VENCIDO_MIN, URL_LOCAL_PREFIJO
+
+logger = logging.getLogger(__name__)
+
+BORRADO_LOTE = 100      # Máximo de public_ids por llamada a delete_resources
+MAX_INTENTOS = 5
+ESTADOS_BORRADO = ('deleted', 'not_found')
+
+GC_GRACIA_HORAS = int(os.environ.get('IMG_GC_GRACIA_HORAS', '48'))   # Formularios abiertos / pendings en curso
+GC_PREFIJO = 'mimenudigital/platos/'
+GC_MAX_PAGINAS = 200    # 200 x 500 assets por corrida
+GC_LOTE_LOCAL = 500
+
+
+def encolar_borrado(cur, public_ids, restaurante_id=None, motivo=None, resource_type='image'):
+    """
+    Registra assets para borrar (no hace commit: va en la transacción del llamador).
+
+    Returns:
+        int: cantidad de public_ids encolados
+    """
+    ids = sorted({p for p in public_ids if p})
+    if not ids:
+        return 0
+    cur.executemany('''
+        INSERT INTO cloudinary_borrados (public_id, resource_type, restaurante_id, motivo, status, created_at)
+        VALUES (%s, %s, %s, %s, 'pending', NOW())
+        ON DUPLICATE KEY UPDATE status = 'pending', attempts = 0, next_attempt_at = NULL,
+            claim_token = NULL, last_error = NULL, motivo = VALUES(motivo)
+    ''', [(p, resource_type, restaurante_id, motivo) for p in ids])
+    return len(ids)
+
+
+def public_ids_platos(cur, restaurante_id, plato_ids=None, categoria_id=None):
+    """
+    public_ids (principal + galería) de los platos indicados, o de todos los
+    platos de la categoría. Se llama ANTES de borrar los platos.
+    """
+    if categoria_id is not None:
+        filtro, params = "p.categoria_id = %s", [categoria_id]
+    else:
+        ids = [int(i) for i in (plato_ids or []) if i]
+        if not ids:
+            return set()
+        filtro, params = f"p.id IN ({','.join(['%s'] * len(ids))})", ids
+    cur.execute(f'''
+        SELECT p.imagen_public_id as public_id FROM platos p
+        WHERE p.restaurante_id = %s AND {filtro}
+        UNION
+        SELECT pi.imagen_public_id FROM platos_imagenes pi JOIN platos p ON p.id = pi.plato_id
+        WHERE p.restaurante_id = %s AND {filtro}
+    ''', [restaurante_id, *params, restaurante_id, *params])
+    return {r['public_id'] for r in cur.fetchall() or [] if r.get('public_id')}
+
+
+def public_ids_en_uso(cur, public_ids):
+    """Subconjunto de public_ids que algún plato o galería sigue usando."""
+    if not public_ids:
+        return set()
+    placeholders = ','.join(['%s'] * len(public_ids))
+    cur.execute(f'''
+        SELECT imagen_public_id as public_id FROM platos WHERE imagen_public_id IN ({placeholders})
+        UNION
+        SELECT imagen_public_id FROM platos_imagenes WHERE imagen_public_id IN ({placeholders})
+    ''', [*public_ids, *public_ids])
+    return {r['public_id'] for r in cur.fetchall() or []}
+
+
+def _lotes(items, n):
+    for i in range(0, len(items), n):
+        yield items[i:i + n]
+
+
+class ColaBorrados:
+    """Procesa cloudinary_borrados en lotes de BORRADO_LOTE."""
+
+    def __init__(self, borrar_lote=None, conexion=None, lote=BORRADO_LOTE, max_intentos=MAX_INTENTOS):
+        # borrar_lote(public_ids, resource_type) -> {public_id: 'deleted' | 'not_found' | ...}
+        self.borrar_lote = borrar_lote
+        self.conexion = conexion
+        self.lote = lote
+        self.max_intentos = max_intentos
+
+    def _conectar(self):
+        return (self.conexion or get_connection)()
+
+    def _reclamar(self, limite):
+        token = uuid.uuid4().hex
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f'''
+                    UPDATE cloudinary_borrados SET status = 'pending', claim_token = NULL
+                    WHERE status = 'processing' AND updated_at < NOW() - INTERVAL {RECLAMO_VENCIDO_MIN} MINUTE
+                ''')
+                cur.execute('''
+                    UPDATE cloudinary_borrados
+                    SET status = 'processing', claim_token = %s, updated_at = NOW()
+                    WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+                    ORDER BY id
+                    LIMIT %s
+                ''', (token, limite))
+                cur.execute('''
+                    SELECT id, public_id, resource_type, attempts FROM cloudinary_borrados
+                    WHERE claim_token = %s AND status = 'processing'
+                ''', (token,))
+                filas = list(cur.fetchall() or [])
+                # Un public_id que volvió a usarse (deshacer, importación) no se borra
+                en_uso = public_ids_en_uso(cur, [f['public_id'] for f in filas])
+                if en_uso:
+                    self._marcar(cur, token, en_uso, "status = 'cancelled', processed_at = NOW()")
+                    filas = [f for f in filas if f['public_id'] not in en_uso]
+            conn.commit()
+        return token, filas, len(en_uso)
+
+    @staticmethod
+    def _marcar(cur, token, public_ids, asignaciones, params=()):
+        public_ids = list(public_ids)
+        placeholders = ','.join(['%s'] * len(public_ids))
+        cur.execute(f'''
+            UPDATE cloudinary_borrados SET {asignaciones}, updated_at = NOW()
+            WHERE claim_token = %s AND public_id IN ({placeholders})
+        ''', [*params, token, *public_ids])
+
+    def _registrar(self, token, borrados, fallidos, error):
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                if borrados:
+                    self._marcar(cur, token, borrados,
+                                 "status = 'deleted', claim_token = NULL, last_error = NULL, processed_at = NOW()")
+                if fallidos:
+                    # MySQL evalúa el SET en orden: status y next_attempt_at ven attempts ya incrementado
+                    self._marcar(cur, token, fallidos, '''
+                        attempts = attempts + 1,
+                        status = IF(attempts >= %s, 'failed', 'pending'),
+                        next_attempt_at = NOW() + INTERVAL LEAST(%s * POW(2, attempts - 1), %s) SECOND,
+                        claim_token = NULL, last_error = %s
+                    ''', (self.max_intentos, BACKOFF_BASE, BACKOFF_MAX, str(error)[:1000]))
+            conn.commit()
+
+    def procesar(self, limite=1000):
+        """
+        Reclama hasta `limite` borrados pendientes y los ejecuta por lotes.
+
+        Returns:
+            dict: {'reclamados', 'deleted', 'reintentar', 'cancelled', 'llamadas'}
+        """
+        token, filas, cancelados = self._reclamar(limite)
+        resumen = {'reclamados': len(filas) + cancelados, 'deleted': 0, 'reintentar': 0,
+                   'cancelled': cancelados, 'llamadas': 0}
+        por_tipo = {}
+        for f in filas:
+            por_tipo.setdefault(f['resource_type'] or 'image', []).append(f['public_id'])
+
+        for resource_type, ids in por_tipo.items():
+            for lote in _lotes(ids, self.lote):
+                resumen['llamadas'] += 1
+                try:
+                    resultado = self.borrar_lote(lote, resource_type) or {}
+                    borrados = [p for p in lote if resultado.get(p) in ESTADOS_BORRADO]
+                    fallidos = [p for p in lote if resultado.get(p) not in ESTADOS_BORRADO]
+                    error = 'sin confirmación de borrado' if fallidos else None
+                except Exception as e:
+                    logger.warning("Cloudinary bulk delete of %s assets failed: %s", len(lote), e)
+                    borrados, fallidos, error = [], lote, e
+                self._registrar(token, borrados, fallidos, error)
+                resumen['deleted'] += len(borrados)
+                resumen['reintentar'] += len(fallidos)
+
+        if resumen['reclamados']:
+            logger.info("Cloudinary deletions: %s", resumen)
+        return resumen
+
+
+# ============================================================
+# RECONCILIACIÓN
+# ============================================================
+
+def _restaurante_de(public_id):
+    """mimenudigital/platos/<id>/xxx -> id (None si la carpeta no es numérica)."""
+    partes = public_id[len(GC_PREFIJO):].split('/', 1)
+    return int(partes[0]) if partes[0].isdigit() else None
+
+
+def _creado_antes(asset, corte):
+    try:
+        creado = datetime.strptime(asset.get('created_at') or '', '%Y-%m-%dT%H:%M:%SZ')
+    except ValueError:
+        return False   # Sin fecha confiable: se trata como reciente
+    return creado.replace(tzinfo=timezone.utc) < corte
+
+
+def reconciliar_cloudinary(listar, conexion=None, prefijo=GC_PREFIJO, gracia_horas=GC_GRACIA_HORAS,
+                           max_paginas=GC_MAX_PAGINAS, ahora=None):
+    """
+    Encola para borrado los assets bajo `prefijo` que no usa ningún plato.
+
+    Args:
+        listar: listar(prefix, next_cursor) -> {'resources': [...], 'next_cursor'}
+        conexion: context manager de conexión (get_connection por defecto)
+
+    Returns:
+        dict: {'paginas', 'revisados', 'en_gracia', 'huerfanos', 'completo'}
+    """
+    corte = (ahora or datetime.now(timezone.utc)) - timedelta(hours=gracia_horas)
+    resumen = {'paginas': 0, 'revisados': 0, 'en_gracia': 0, 'huerfanos': 0, 'completo': False}
+    cursor = None
+    while resumen['paginas'] < max_paginas:
+        pagina = listar(prefijo, cursor)
+        resumen['paginas'] += 1
+        assets = pagina.get('resources') or []
+        resumen['revisados'] += len(assets)
+        candidatos = sorted(a['public_id'] for a in assets if _creado_antes(a, corte))
+        resumen['en_gracia'] += len(assets) - len(candidatos)
+        if candidatos:
+            with (conexion or get_connection)() as conn:
+                with conn.cursor() as cur:
+                    huerfanos = sorted(set(candidatos) - public_ids_en_uso(cur, candidatos))
+                    por_restaurante = {}
+                    for public_id in huerfanos:
+                        por_restaurante.setdefault(_restaurante_de(public_id), []).append(public_id)
+                    for restaurante_id, ids in por_restaurante.items():
+                        encolar_borrado(cur, ids, restaurante_id, motivo='huerfano')
+                conn.commit()
+            resumen['huerfanos'] += len(huerfanos)
+        cursor = pagina.get('next_cursor')
+        if not cursor:
+            resumen['completo'] = True
+            break
+    if not resumen['completo']:
+        logger.warning("Cloudinary reconciliation stopped after %s pages", resumen['paginas'])
+    logger.info("Cloudinary reconciliation: %s", resumen)
+    return resumen
+
+
+def _urls_locales_en_uso(cur, urls):
+    """Subconjunto de URLs /static/uploads/... que siguen referenciadas."""
+    placeholders = ','.join(['%s'] * len(urls))
+    cur.execute(f'''
+        SELECT imagen_url as url FROM platos WHERE imagen_url IN ({placeholders})
+        UNION
+        SELECT imagen_url FROM platos_imagenes WHERE imagen_url IN ({placeholders})
+        UNION
+        SELECT logo_url FROM restaurantes WHERE logo_url IN ({placeholders})
+        UNION
+        SELECT local_url FROM imagenes_pendientes
+        WHERE status IN ('pending', 'processing') AND local_url IN ({placeholders})
+    ''', [*urls, *urls, *urls, *urls])
+    return {r['url'] for r in cur.fetchall() or []}
+
+
+def _lote_local(conexion, carpeta, lote, resumen):
+    urls = [URL_LOCAL_PREFIJO + nombre for nombre, _ in lote]
+    with (conexion or get_connection)() as conn:
+        with conn.cursor() as cur:
+            en_uso = _urls_locales_en_uso(cur, urls)
+    for nombre, tamano in lote:
+        if URL_LOCAL_PREFIJO + nombre in en_uso:
+            continue
+        try:
+            os.remove(os.path.join(carpeta, nombre))
+        except OSError as e:
+            logger.warning("Could not remove orphaned upload %s: %s", nombre, e)
+            continue
+        resumen['borrados'] += 1
+        resumen['bytes'] += tamano
+
+
+def limpiar_archivos_locales(carpeta, conexion=None, gracia_horas=GC_GRACIA_HORAS, lote=GC_LOTE_LOCAL, ahora=None):
+    """
+    Borra de `carpeta` (static/uploads) los archivos con más de `gracia_horas`
+    que ningún plato, logo ni job pendiente referencia. Solo el primer nivel:
+    los QR viven en uploads/qrs.
+
+    Returns:
+        dict: {'revisados', 'borrados', 'bytes'}
+    """
+    corte = (ahora or datetime.now(timezone.utc)).timestamp() - gracia_horas * 3600
+    resumen = {'revisados': 0, 'borrados': 0, 'bytes': 0}
+    if not os.path.isdir(carpeta):
+        return resumen
+    pendientes = []
+    with os.scandir(carpeta) as entradas:
+        for entrada in entradas:
+            if entrada.name.startswith('.') or not entrada.is_file(follow_symlinks=False):
+                continue
+            info = entrada.stat(follow_symlinks=False)
+            if info.st_mtime >= corte:
+                continue
+            resumen['revisados'] += 1
+            pendientes.append((entrada.name, info.st_size))
+            if len(pendientes) >= lote:
+                _lote_local(conexion, carpeta, pendientes, resumen)
+                pendientes = []
+    if pendientes:
+        _lote_local(conexion, carpeta, pendientes, resumen)
+    if resumen['borrados']:
+        logger.info("Local uploads cleanup: %s", resumen)
+    return resumen
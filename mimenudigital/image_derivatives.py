@@ -0,0 +1,173 @@
+# ============================================================
+# IMAGE DERIVATIVES - Versiones reducidas de static/uploads
+# ============================================================
+# Sin Cloudinary (no configurado, caído, o imagen aún pendiente de subir)
+# el menú servía el archivo original de static/uploads, de varios MB. Ahora
+# /img/<nombre>?w=640 sirve un derivado:
+#
+# - El ancho se ajusta al más cercano de IMG_ANCHOS (hacia arriba), así
+#   que hay a lo sumo len(IMG_ANCHOS) x 2 formatos derivados por imagen.
+# - Se genera con preprocesar_imagen() en la primera petición y se guarda
+#   en disco con clave <sha256 del contenido>_<ancho>.<ext>: dos archivos
+#   iguales comparten derivados y un archivo reemplazado no sirve uno viejo.
+# - WebP si el navegador lo acepta, JPEG si no (Vary: Accept).
+# - Los uploads no cambian de contenido bajo el mismo nombre: se sirven con
+#   Cache-Control de un año y ETag del hash.
+#
+# Sin Pillow, o si el derivado no pesaría menos, se sirve el original.
+# ============================================================
+
+import hashlib
+import logging
+import os
+import shutil
+import tempfile
+import threading
+from functools import lru_cache
+from urllib.parse import quote
+
+from image_jobs import URL_LOCAL_PREFIJO, es_url_local
+from image_preprocess import FORMATOS_SALIDA, preprocesar_imagen
+
+logger = logging.getLogger(__name__)
+
+IMG_ANCHOS = (320, 640, 1024)
+IMG_ANCHO_DEFAULT = 640
+IMG_CACHE_MAX_MB = int(os.environ.get('IMG_CACHE_MAX_MB', '512'))
+URL_DERIVADO_PREFIJO = '/img/'
+CACHE_MAX_AGE = 365 * 24 * 3600
+
+
+@lru_cache(maxsize=4096)
+def _hash_contenido(ruta, mtime_ns, tamano):
+    """sha256 del archivo (memoizado por ruta + mtime + tamaño)."""
+    h = hashlib.sha256()
+    with open(ruta, 'rb') as fh:
+        for bloque in iter(lambda: fh.read(64 * 1024), b''):
+            h.update(bloque)
+    return h.hexdigest()
+
+
+def ajustar_ancho(ancho, anchos=IMG_ANCHOS):
+    """Ancho permitido más chico que cubre `ancho` (el mayor si ninguno alcanza)."""
+    if not ancho or ancho <= 0:
+        return IMG_ANCHO_DEFAULT if IMG_ANCHO_DEFAULT in anchos else anchos[-1]
+    for permitido in sorted(anchos):
+        if permitido >= ancho:
+            return permitido
+    return max(anchos)
+
+
+def url_derivado(url, ancho):
+    """/static/uploads/x.jpg -> /img/x.jpg?w=640 (None si no es un upload local)."""
+    if not es_url_local(url):
+        return None
+    nombre = url[len(URL_LOCAL_PREFIJO):]
+    return f"{URL_DERIVADO_PREFIJO}{quote(nombre)}?w={ancho}"
+
+
+def srcset_derivados(url, anchos=IMG_ANCHOS):
+    """srcset equivalente al de Cloudinary para un upload local."""
+    if not es_url_local(url):
+        return None
+    return ', '.join(f"{url_derivado(url, w)} {w}w" for w in anchos)
+
+
+class CacheDerivados:
+    """Genera y guarda en disco los derivados de una carpeta de uploads."""
+
+    def __init__(self, origen, destino, anchos=IMG_ANCHOS):
+        self.origen = origen
+        self.destino = destino
+        self.anchos = tuple(sorted(anchos))
+        self._sin_reduccion = set()   # Claves cuyo original ya pesa menos que el derivado
+        self._lock = threading.Lock()
+
+    def _fuente(self, nombre):
+        # Solo archivos del primer nivel de uploads (los QR de uploads/qrs no)
+        if not nombre or nombre != os.path.basename(nombre) or nombre.startswith('.'):
+            return None
+        ruta = os.path.join(self.origen, nombre)
+        return ruta if os.path.isfile(ruta) else None
+
+    def obtener(self, nombre, ancho=None, webp=True):
+        """
+        Derivado de `nombre` para `ancho`, generándolo si no existe.
+
+        Returns:
+            dict: {'ruta', 'content_type', 'etag'}; o None si el upload no existe
+        """
+        fuente = self._fuente(nombre)
+        if fuente is None:
+            return None
+        info = os.stat(fuente)
+        digest = _hash_contenido(fuente, info.st_mtime_ns, info.st_size)
+        ancho = ajustar_ancho(ancho, self.anchos)
+        formato = 'webp' if webp else 'jpeg'
+        _, content_type, ext = FORMATOS_SALIDA[formato]
+        clave = f"{digest[:32]}_{ancho}.{ext}"
+        ruta = os.path.join(self.destino, clave)
+
+        if clave not in self._sin_reduccion:
+            try:
+                if os.path.exists(ruta) or self._generar(fuente, ruta, ancho, formato):
+                    return {'ruta': ruta, 'content_type': content_type, 'etag': clave}
+                with self._lock:
+                    self._sin_reduccion.add(clave)
+            except OSError:
+                logger.exception("Could not store image derivative %s", ruta)
+        return {'ruta': fuente, 'content_type': None, 'etag': f"{digest[:32]}_orig"}
+
+    def _generar(self, fuente, ruta, ancho, formato):
+        resultado = preprocesar_imagen(fuente, formato=formato, ancho_max=ancho)
+        if resultado is None:
+            return False
+        try:
+            os.makedirs(self.destino, exist_ok=True)
+        except OSError:
+            resultado['stream'].close()
+            raise
+        # Escribir aparte y renombrar: otro worker nunca ve un derivado a medias
+        fd, temporal = tempfile.mkstemp(dir=self.destino, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as fh, resultado['stream'] as stream:
+                shutil.copyfileobj(stream, fh)
+            os.replace(temporal, ruta)
+        except OSError:
+            try:
+                os.remove(temporal)
+            except OSError:
+                pass
+            raise
+        logger.info("Image derivative generated: %s (%s bytes)", os.path.basename(ruta), resultado['bytes'])
+        return True
+
+    def podar(self, max_bytes=IMG_CACHE_MAX_MB * 1024 * 1024):
+        """
+        Borra los derivados usados hace más tiempo hasta quedar bajo `max_bytes`.
+
+        Returns:
+            dict: {'archivos', 'bytes', 'borrados'}
+        """
+        resumen = {'archivos': 0, 'bytes': 0, 'borrados': 0}
+        if not os.path.isdir(self.destino):
+            return resumen
+        archivos = []
+        with os.scandir(self.destino) as entradas:
+            for entrada in entradas:
+                if entrada.is_file(follow_symlinks=False):
+                    info = entrada.stat(follow_symlinks=False)
+                    archivos.append((max(info.st_atime, info.st_mtime), info.st_size, entrada.path))
+        resumen['archivos'] = len(archivos)
+        total = sum(tamano for _, tamano, _ in archivos)
+        for _, tamano, ruta in sorted(archivos):
+            if total <= max_bytes:
+                break
+            try:
+                os.remove(ruta)
+            except OSError:
+                continue
+            total -= tamano
+            resumen['borrados'] += 1
+        resumen['bytes'] = total
+        return resumen
@@ -0,0 +1,483 @@
+# ============================================================
+# IMAGE JOBS - Subida asíncrona de imágenes a Cloudinary
+# ============================================================
+# La subida a Cloudinary pasa por el proxy de PythonAnywhere (timeout de
+# 120 s). Hacerla dentro del request deja un worker uWSGI bloqueado y los
+# menús públicos sin quien los sirva.
+#
+# Flujo:
+# 1. El request guarda el archivo en static/uploads, inserta una fila en
+#    imagenes_pendientes y responde al instante con job_id y una URL local
+#    provisoria (/static/uploads/...), que el frontend usa como cualquier
+#    otra URL de imagen.
+# 2. Un pool acotado de threads sube el archivo y, en una transacción,
+#    reemplaza la URL provisoria por la de Cloudinary donde se haya usado:
+#    platos, platos_imagenes y restaurantes.logo_url. Luego invalida la
+#    caché del menú y borra el archivo local.
+# 3. Si el frontend guarda la URL provisoria DESPUÉS de que el job terminó,
+#    resolver_urls() la traduce a la definitiva. La fila del job se lee
+#    con FOR UPDATE en ambos lados, así ningún orden deja una URL local.
+#
+# Los jobs que fallan vuelven a 'pending' con next_attempt_at (backoff
+# exponencial) y los reintenta procesar_pendientes(): job programado
+# 'imagenes_pendientes', scripts/process_pending_images.py (lote o daemon)
+# o el endpoint admin. Cada lote reclama sus filas con un claim_token
+# (migración 026), así varios procesos pueden vaciar la cola a la vez.
+#
+# Placeholders (migración 028): encolar() registra dimensiones, color y
+# LQIP para la URL provisoria; al aplicar el job se registran para la URL
+# de Cloudinary y se copian a los platos que la usan.
+# ============================================================
+
+import logging
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from database import get_connection
+from image_placeholders import aplicar_placeholders, calcular_placeholder, registrar_placeholder
+from menu_sync import marcar_platos
+
+logger = logging.getLogger(__name__)
+
+IMAGE_UPLOAD_WORKERS = int(os.environ.get('IMAGE_UPLOAD_WORKERS', '2'))
+UPLOAD_BATCH_WORKERS = int(os.environ.get('UPLOAD_BATCH_WORKERS', '4'))
+UPLOAD_BATCH_MAX = 10      # Archivos por request en /api/upload-images
+MAX_INTENTOS = 5
+URL_LOCAL_PREFIJO = '/static/uploads/'
+BACKOFF_BASE = 60          # Segundos antes del primer reintento
+BACKOFF_MAX = 3600         # Tope del backoff
+RECLAMO_VENCIDO_MIN = 15   # Jobs en 'processing' más tiempo que esto se dan por perdidos
+
+_COLUMNAS_JOB = 'id, restaurante_id, plato_id, tipo, local_path, local_url, attempts, max_attempts'
+
+_CARPETAS = {
+    'logo': 'mimenudigital/logos',
+}
+
+
+def carpeta_cloudinary(tipo, restaurante_id):
+    return _CARPETAS.get(tipo, f"mimenudigital/platos/{restaurante_id}")
+
+
+def es_url_local(url):
+    return bool(url) and str(url).startswith(URL_LOCAL_PREFIJO)
+
+
+def espera_reintento(intentos):
+    """Backoff exponencial en segundos: 1 min, 2, 4, ... hasta BACKOFF_MAX."""
+    return min(BACKOFF_BASE * 2 ** max(intentos - 1, 0), BACKOFF_MAX)
+
+
+def _ms_desde(inicio):
+    return int((time.monotonic() - inicio) * 1000)
+
+
+def procesar_en_paralelo(items, funcion, max_workers=UPLOAD_BATCH_WORKERS):
+    """
+    Aplica funcion(item) a cada item en un pool acotado (validación y subida
+    de un lote de archivos). Un error en un item no corta los demás.
+
+    Returns:
+        list: [(resultado, excepcion)] en el orden de `items`
+    """
+    def _uno(item):
+        try:
+            return funcion(item), None
+        except Exception as e:
+            return None, e
+
+    items = list(items)
+    if len(items) <= 1 or max_workers <= 1:
+        return [_uno(item) for item in items]
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(items)), thread_name_prefix='img-lote') as executor:
+        return list(executor.map(_uno, items))
+
+
+def _registrar_placeholder_seguro(cur, url, placeholder):
+    """registrar_placeholder() sin interrumpir el job si falla (p. ej. sin migración 028)."""
+    try:
+        return registrar_placeholder(cur, url, placeholder)
+    except Exception as e:
+        logger.warning("Could not store image placeholder for %s: %s", url, e)
+        return False
+
+
+def resolver_urls(cur, restaurante_id, urls):
+    """
+    Traduce URLs provisorias de jobs ya subidos a su URL de Cloudinary.
+    Bloquea las filas de los jobs hasta el commit del llamador.
+
+    Returns:
+        dict: {url_local: (url, public_id)} solo para jobs terminados
+    """
+    locales = sorted({u for u in urls if es_url_local(u)})
+    if not locales:
+        return {}
+    placeholders = ','.join(['%s'] * len(locales))
+    cur.execute(f'''
+        SELECT local_url, url, public_id, status FROM imagenes_pendientes
+        WHERE restaurante_id = %s AND local_url IN ({placeholders})
+        FOR UPDATE
+    ''', [restaurante_id, *locales])
+    return {
+        r['local_url']: (r['url'], r['public_id'])
+        for r in cur.fetchall() or []
+        if r['status'] == 'uploaded' and r.get('url')
+    }
+
+
+def resolver_imagenes(cur, restaurante_id, imagen_url, imagen_public_id, imagenes=None):
+    """
+    Aplica resolver_urls() a la imagen principal y a la galería de un plato.
+    Modifica `imagenes` en el lugar.
+
+    Returns:
+        tuple: (imagen_url, imagen_public_id)
+    """
+    imagenes = imagenes or []
+    resueltas = resolver_urls(cur, restaurante_id, [imagen_url] + [img.get('imagen_url') for img in imagenes])
+    if not resueltas:
+        return imagen_url, imagen_public_id
+    for img in imagenes:
+        if img.get('imagen_url') in resueltas:
+            img['imagen_url'], img['imagen_public_id'] = resueltas[img['imagen_url']]
+    return resueltas.get(imagen_url, (imagen_url, imagen_public_id))
+
+
+class PipelineImagenes:
+    """Cola de subidas: encolar en el request, subir en un pool de threads."""
+
+    def __init__(self, app=None, subir=None, invalidar=None, max_workers=IMAGE_UPLOAD_WORKERS, conexion=None):
+        self.app = app
+        self.subir = subir
+        self.invalidar = invalidar
+        self.max_workers = max_workers
+        self.conexion = conexion
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _conectar(self):
+        """Context manager de conexión (uno por thread). Por defecto database.get_connection."""
+        return (self.conexion or get_connection)()
+
+    def init_app(self, app, subir, invalidar=None):
+        self.app = app
+        self.subir = subir
+        self.invalidar = invalidar
+
+    # --------------------------------------------------------
+    # Lado request
+    # --------------------------------------------------------
+
+    def encolar(self, db, archivo, restaurante_id, tipo='upload', plato_id=None):
+        """
+        Guarda el archivo en disco y registra el job (hace commit).
+        Llamar a despachar(job_id) cuando la transacción que usa la URL
+        provisoria ya esté confirmada.
+
+        Returns:
+            dict: {'job_id', 'url'}
+        """
+        nombre = getattr(archivo, 'filename', '') or ''
+        ext = nombre.rsplit('.', 1)[1].lower() if '.' in nombre else 'jpg'
+        unique_filename = f"{restaurante_id}_{uuid.uuid4().hex}.{ext}"
+        carpeta = self.app.config['UPLOAD_FOLDER']
+        os.makedirs(carpeta, exist_ok=True)
+        local_path = os.path.join(carpeta, unique_filename)
+        archivo.save(local_path)
+        local_url = URL_LOCAL_PREFIJO + unique_filename
+        placeholder = calcular_placeholder(local_path)
+
+        with db.cursor() as cur:
+            cur.execute('''
+                INSERT INTO imagenes_pendientes
+                    (restaurante_id, plato_id, tipo, local_path, local_url, attempts, max_attempts, status, created_at)
+                VALUES (%s, %s, %s, %s, %s, 0, %s, 'pending', NOW())
+            ''', (restaurante_id, plato_id, tipo, local_path, local_url, MAX_INTENTOS))
+            job_id = cur.lastrowid
+            _registrar_placeholder_seguro(cur, local_url, placeholder)
+        db.commit()
+        logger.info("Image job %s queued (%s, restaurant %s)", job_id, tipo, restaurante_id)
+        return {'job_id': job_id, 'url': local_url}
+
+    def despachar(self, job_id):
+        """Envía el job al pool de subidas (no bloquea)."""
+        return self._enviar(self.procesar, job_id)
+
+    def _enviar(self, funcion, *args):
+        if self.app is not None and self.app.config.get('TESTING'):
+            return None
+        return self._get_executor().submit(funcion, *args)
+
+    def _get_executor(self):
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=self.max_workers,
+                                                        thread_name_prefix='img-upload')
+        return self._executor
+
+    def cerrar(self):
+        """Espera los jobs en curso y libera el pool (fin del script)."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+
+    # --------------------------------------------------------
+    # Lado worker
+    # --------------------------------------------------------
+
+    def _tomar(self, job_id):
+        """Reclama el job (pending -> processing). Devuelve la fila o None si otro lo tomó."""
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    UPDATE imagenes_pendientes
+                    SET status = 'processing', claim_token = %s, attempts = attempts + 1, updated_at = NOW()
+                    WHERE id = %s AND status = 'pending'
+                ''', (uuid.uuid4().hex, job_id))
+                if cur.rowcount != 1:
+                    conn.commit()
+                    return None
+                cur.execute(f'SELECT {_COLUMNAS_JOB} FROM imagenes_pendientes WHERE id = %s', (job_id,))
+                fila = cur.fetchone()
+            conn.commit()
+        return fila
+
+    def reclamar(self, limite=50, restaurante_id=None, max_intentos=MAX_INTENTOS):
+        """
+        Reclama hasta `limite` jobs vencidos con un token nuevo. El UPDATE
+        bloquea cada fila y un reclamo concurrente ya la ve en 'processing',
+        así ninguna fila queda en dos lotes.
+
+        Returns:
+            tuple: (token, filas)
+        """
+        token = uuid.uuid4().hex
+        where = [
+            "status = 'pending'",
+            '(next_attempt_at IS NULL OR next_attempt_at <= NOW())',
+            'attempts < COALESCE(max_attempts, %s)',
+        ]
+        params = [max_intentos]
+        if restaurante_id:
+            where.append('restaurante_id = %s')
+            params.append(restaurante_id)
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f'''
+                    UPDATE imagenes_pendientes
+                    SET status = 'processing', claim_token = %s, attempts = attempts + 1, updated_at = NOW()
+                    WHERE {' AND '.join(where)}
+                    ORDER BY created_at ASC
+                    LIMIT %s
+                ''', [token, *params, limite])
+                cur.execute(f'''
+                    SELECT {_COLUMNAS_JOB} FROM imagenes_pendientes
+                    WHERE claim_token = %s AND status = 'processing'
+                ''', (token,))
+                filas = list(cur.fetchall() or [])
+            conn.commit()
+        return token, filas
+
+    def procesar(self, job_id):
+        """
+        Sube un job y aplica el resultado.
+
+        Returns:
+            str: 'uploaded' | 'pending' (se reintentará) | 'failed' | None (tomado por otro)
+        """
+        fila = self._tomar(job_id)
+        if not fila:
+            return None
+        return self._procesar_fila(fila)
+
+    def _procesar_fila(self, fila):
+        """Sube una fila ya reclamada. Nunca lanza por errores de subida."""
+        inicio = time.monotonic()
+        job_id = fila['id']
+        local_path = fila['local_path']
+        try:
+            if not local_path or not os.path.exists(local_path):
+                raise FileNotFoundError('local_file_missing')
+            with open(local_path, 'rb') as fh:
+                result = self.subir(fh, folder=carpeta_cloudinary(fila['tipo'], fila['restaurante_id']))
+            url = result.get('secure_url') or result.get('url')
+            public_id = result.get('public_id')
+            if not url:
+                raise RuntimeError('Cloudinary no retornó URL')
+        except Exception as e:
+            return self._registrar_fallo(fila, e, _ms_desde(inicio))
+
+        ms_subida = _ms_desde(inicio)
+        placeholder = result.get('placeholder') or calcular_placeholder(local_path)
+        self._aplicar(fila, url, public_id, _ms_desde(inicio), placeholder)
+        if self.invalidar and fila['restaurante_id']:
+            try:
+                if self.app is not None:
+                    with self.app.app_context():
+                        self.invalidar(fila['restaurante_id'])
+                else:
+                    self.invalidar(fila['restaurante_id'])
+            except Exception as e:
+                logger.warning("Cache invalidation after image job %s failed: %s", job_id, e)
+        try:
+            os.remove(local_path)
+        except OSError:
+            pass
+        logger.info("Image job %s uploaded in %s ms (upload %s ms) -> %s",
+                    job_id, _ms_desde(inicio), ms_subida, public_id)
+        return 'uploaded'
+
+    def _aplicar(self, fila, url, public_id, duracion_ms=None, placeholder=None):
+        """Marca el job como subido y reemplaza la URL provisoria en una transacción."""
+        rid, local_url = fila['restaurante_id'], fila.get('local_url')
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    UPDATE imagenes_pendientes
+                    SET status = 'uploaded', url = %s, public_id = %s, last_error = NULL,
+                        next_attempt_at = NULL, duracion_ms = %s, processed_at = NOW(), updated_at = NOW()
+                    WHERE id = %s
+                ''', (url, public_id, duracion_ms, fila['id']))
+                if local_url:
+                    cur.execute('''
+                        SELECT id FROM platos WHERE restaurante_id = %s AND imagen_url = %s
+                        UNION
+                        SELECT plato_id FROM platos_imagenes WHERE restaurante_id = %s AND imagen_url = %s
+                    ''', (rid, local_url, rid, local_url))
+                    plato_ids = [r['id'] for r in cur.fetchall() or []]
+                    cur.execute("UPDATE platos SET imagen_url = %s, imagen_public_id = %s WHERE restaurante_id = %s AND imagen_url = %s",
+                                (url, public_id, rid, local_url))
+                    cur.execute("UPDATE platos_imagenes SET imagen_url = %s, imagen_public_id = %s WHERE restaurante_id = %s AND imagen_url = %s",
+                                (url, public_id, rid, local_url))
+                    cur.execute("UPDATE restaurantes SET logo_url = %s WHERE id = %s AND logo_url = %s",
+                                (url, rid, local_url))
+                    if plato_ids:
+                        marcar_platos(cur, rid, plato_ids)
+                elif fila.get('plato_id'):
+                    # Filas anteriores a la migración 025: sin URL provisoria
+                    plato_ids = [fila['plato_id']]
+                    cur.execute("UPDATE platos SET imagen_url = %s, imagen_public_id = %s WHERE id = %s AND restaurante_id = %s",
+                                (url, public_id, fila['plato_id'], rid))
+                    marcar_platos(cur, rid, plato_ids)
+                else:
+                    plato_ids = []
+                if _registrar_placeholder_seguro(cur, url, placeholder) and plato_ids:
+                    aplicar_placeholders(cur, rid, plato_ids)
+            conn.commit()
+
+    def _registrar_fallo(self, fila, error, duracion_ms=None):
+        intentos = fila.get('attempts') or 0
+        maximo = fila.get('max_attempts') or MAX_INTENTOS
+        estado = 'failed' if intentos >= maximo or isinstance(error, FileNotFoundError) else 'pending'
+        espera = espera_reintento(intentos)
+        logger.warning("Image job %s attempt %s failed after %s ms (%s, retry in %ss): %s",
+                       fila['id'], intentos, duracion_ms, estado, espera if estado == 'pending' else '-', error)
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    UPDATE imagenes_pendientes
+                    SET status = %s, last_error = %s, next_attempt_at = NOW() + INTERVAL %s SECOND,
+                        duracion_ms = %s, updated_at = NOW()
+                    WHERE id = %s
+                ''', (estado, str(error)[:1000], espera, duracion_ms, fila['id']))
+            conn.commit()
+        return estado
+
+    def _preparar_cola(self, restaurante_id=None, max_intentos=MAX_INTENTOS):
+        """Recupera jobs perdidos en un reinicio y cierra los que agotaron intentos."""
+        filtro, params = ('', []) if not restaurante_id else (' AND restaurante_id = %s', [restaurante_id])
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f'''
+                    UPDATE imagenes_pendientes SET status = 'pending', claim_token = NULL
+                    WHERE status = 'processing' AND updated_at < NOW() - INTERVAL {RECLAMO_VENCIDO_MIN} MINUTE{filtro}
+                ''', params)
+                cur.execute(f'''
+                    UPDATE imagenes_pendientes
+                    SET status = 'failed', last_error = COALESCE(last_error, 'max_attempts_exceeded'), updated_at = NOW()
+                    WHERE status = 'pending' AND attempts >= COALESCE(max_attempts, %s){filtro}
+                ''', [max_intentos, *params])
+            conn.commit()
+
+    def contar_pendientes(self, restaurante_id=None, max_intentos=MAX_INTENTOS):
+        """Jobs que un lote reclamaría ahora (dry run)."""
+        filtro, params = ('', []) if not restaurante_id else (' AND restaurante_id = %s', [restaurante_id])
+        with self._conectar() as conn:
+            with conn.cursor() as cur:
+                cur.execute(f'''
+                    SELECT COUNT(*) as total FROM imagenes_pendientes
+                    WHERE status = 'pending' AND (next_attempt_at IS NULL OR next_attempt_at <= NOW())
+                        AND attempts < COALESCE(max_attempts, %s){filtro}
+                ''', [max_intentos, *params])
+                fila = cur.fetchone()
+        return (fila or {}).get('total') or 0
+
+    def procesar_pendientes(self, limite=50, restaurante_id=None, max_intentos=MAX_INTENTOS, esperar=True):
+        """
+        Reclama un lote de jobs vencidos y lo sube en el pool.
+
+        esperar=True bloquea hasta terminar (job programado, script);
+        esperar=False vuelve apenas se encola (endpoint admin).
+
+        Returns:
+            dict: {'lote', 'reclamados', <estado>: n}
+        """
+        self._preparar_cola(restaurante_id, max_intentos)
+        lote, filas = self.reclamar(limite, restaurante_id, max_intentos)
+        resumen = {'lote': lote, 'reclamados': len(filas)}
+        if not filas:
+            return resumen
+        if not esperar:
+            for fila in filas:
+                self._enviar(self._procesar_fila, fila)
+            return resumen
+
+        inicio = time.monotonic()
+        futuros = [self._get_executor().submit(self._procesar_fila, fila) for fila in filas]
+        for futuro in futuros:
+            estado = futuro.result()
+            resumen[estado] = resumen.get(estado, 0) + 1
+        resumen['duracion_ms'] = _ms_desde(inicio)
+        logger.info("Image batch %s: %s", lote, resumen)
+        return resumen
+
+    def estado_lote(self, db, lote, restaurante_id=None):
+        """
+        Avance de un lote: jobs por estado con su duración promedio y máxima.
+        Un job que falló y se reintenta en otro lote deja de contarse aquí.
+
+        Returns:
+            dict o None si el lote no existe (o no es del restaurante)
+        """
+        filtro, params = ('', [lote]) if not restaurante_id else (' AND restaurante_id = %s', [lote, restaurante_id])
+        with db.cursor() as cur:
+            cur.execute(f'''
+                SELECT status, COUNT(*) as total, AVG(duracion_ms) as ms_promedio, MAX(duracion_ms) as ms_max
+                FROM imagenes_pendientes WHERE claim_token = %s{filtro}
+                GROUP BY status
+            ''', params)
+            filas = cur.fetchall() or []
+        if not filas:
+            return None
+        estados = {
+            f['status']: {
+                'total': int(f['total']),
+                'ms_promedio': int(f['ms_promedio']) if f['ms_promedio'] is not None else None,
+                'ms_max': int(f['ms_max']) if f['ms_max'] is not None else None,
+            }
+            for f in filas
+        }
+        return {'lote': lote, 'estados': estados, 'terminado': 'processing' not in estados}
+
+    def estado(self, db, job_id, restaurante_id):
+        with db.cursor() as cur:
+            cur.execute('''
+                SELECT id, tipo, status, attempts, url, public_id, local_url, last_error, created_at, processed_at
+                FROM imagenes_pendientes WHERE id = %s AND restaurante_id = %s
+            ''', (job_id, restaurante_id))
+            return cur.fetchone()
@@ -0,0 +1,157 @@
+# ============================================================
+# IMAGE PLACEHOLDERS - Dimensiones, color dominante y LQIP
+# ============================================================
+# El menú público cargaba las fotos de los platos sin tamaño intrínseco
+# ni placeholder. Al subir una imagen se calcula:
+#
+# - ancho / alto (ya orientados según EXIF): el <img> lleva width/height.
+# - color dominante (#rrggbb): fondo mientras carga.
+# - LQIP: miniatura de LQIP_LADO px en base64 (~200 bytes en WebP), que
+#   se muestra desenfocada detrás de la foto sin otra petición.
+#
+# Las subidas ocurren antes de guardar el plato, así que los metadatos se
+# registran en imagenes_meta por URL (migración 028): cloudinary_upload()
+# con la URL de Cloudinary, PipelineImagenes.encolar() con la URL local
+# provisoria. Al guardar un plato, aplicar_placeholders() los copia a
+# platos / platos_imagenes según la URL de cada imagen.
+#
+# Pillow es opcional: sin él no hay placeholders y el menú se ve como antes.
+# ============================================================
+
+import base64
+import hashlib
+import io
+import logging
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    ImageOps = None
+    PIL_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+LQIP_LADO = 16
+LQIP_MAX_CHARS = 1024      # Cabe en imagenes_meta.lqip; si no, solo color
+_ORIENTACIONES_ROTADAS = (5, 6, 7, 8)
+
+
+def _a_rgb(img):
+    """RGB con la transparencia sobre blanco."""
+    if img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info):
+        rgba = img.convert('RGBA')
+        fondo = Image.new('RGB', img.size, (255, 255, 255))
+        fondo.paste(rgba, mask=rgba.getchannel('A'))
+        return fondo
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+
+def _lqip(miniatura):
+    for formato, mime, opciones in (('WEBP', 'image/webp', {'quality': 40}),
+                                    ('JPEG', 'image/jpeg', {'quality': 40, 'optimize': True})):
+        buf = io.BytesIO()
+        try:
+            miniatura.save(buf, format=formato, **opciones)
+        except (OSError, KeyError):
+            continue   # Pillow sin soporte WebP
+        uri = f"data:{mime};base64,{base64.b64encode(buf.getvalue()).decode('ascii')}"
+        return uri if len(uri) <= LQIP_MAX_CHARS else None
+    return None
+
+
+def placeholder_de_imagen(img, ancho=None, alto=None):
+    """
+    Placeholder de una imagen ya abierta y orientada.
+
+    Returns:
+        dict: {'ancho', 'alto', 'color', 'lqip'}
+    """
+    if img.mode not in ('RGB', 'RGBA'):
+        img = img.convert('RGBA')
+    escala = LQIP_LADO / max(img.size)
+    tamano = (max(1, round(img.width * escala)), max(1, round(img.height * escala)))
+    # resize() con reducing_gap reduce por bloques: no copia la imagen completa
+    miniatura = _a_rgb(img.resize(tamano, getattr(Image, 'Resampling', Image).BILINEAR, reducing_gap=2.0))
+    # Color dominante: el más frecuente tras reducir la paleta a 4 colores
+    paleta = miniatura.quantize(colors=4)
+    _, indice = max(paleta.getcolors())
+    r, g, b = paleta.getpalette()[indice * 3:indice * 3 + 3]
+    return {
+        'ancho': ancho or img.width,
+        'alto': alto or img.height,
+        'color': f"#{r:02x}{g:02x}{b:02x}",
+        'lqip': _lqip(miniatura),
+    }
+
+
+def calcular_placeholder(fuente):
+    """
+    Placeholder de una ruta o file-like (el file-like vuelve a su posición).
+
+    Returns:
+        dict: {'ancho', 'alto', 'color', 'lqip'}; o None si no es una imagen
+    """
+    if not PIL_AVAILABLE:
+        return None
+    inicio = None
+    if not isinstance(fuente, str):
+        try:
+            inicio = fuente.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+    try:
+        with Image.open(fuente) as img:
+            ancho, alto = img.size
+            if img.getexif().get(0x0112) in _ORIENTACIONES_ROTADAS:
+                ancho, alto = alto, ancho
+            if img.format == 'JPEG':
+                # Decodifica a 1/8 de la resolución: alcanza para 16 px
+                img.draft('RGB', (LQIP_LADO * 4, LQIP_LADO * 4))
+            return placeholder_de_imagen(ImageOps.exif_transpose(img), ancho, alto)
+    except Exception as e:
+        logger.info("Image placeholder skipped (%s): %s", type(e).__name__, e)
+        return None
+    finally:
+        if inicio is not None:
+            fuente.seek(inicio)
+
+
+def _hash_url(url):
+    return hashlib.sha1(url.encode('utf-8')).hexdigest()
+
+
+def registrar_placeholder(cur, url, placeholder):
+    """Guarda los metadatos de la imagen subida a `url` (no hace commit)."""
+    if not url or not placeholder:
+        return False
+    cur.execute('''
+        INSERT INTO imagenes_meta (url_hash, url, ancho, alto, color, lqip)
+        VALUES (%s, %s, %s, %s, %s, %s)
+        ON DUPLICATE KEY UPDATE ancho = VALUES(ancho), alto = VALUES(alto),
+            color = VALUES(color), lqip = VALUES(lqip)
+    ''', (_hash_url(url), url[:500], min(placeholder['ancho'], 65535), min(placeholder['alto'], 65535),
+          placeholder.get('color'), placeholder.get('lqip')))
+    return True
+
+
+def aplicar_placeholders(cur, restaurante_id, plato_ids):
+    """
+    Copia a platos y platos_imagenes los metadatos de la URL de cada imagen
+    (NULL si la URL no tiene). Llamar después de escribir las URLs.
+    """
+    ids = [int(i) for i in plato_ids if i]
+    if not ids:
+        return
+    placeholders = ','.join(['%s'] * len(ids))
+    cur.execute(f'''
+        UPDATE platos p LEFT JOIN imagenes_meta m ON m.url_hash = SHA1(p.imagen_url)
+        SET p.imagen_ancho = m.ancho, p.imagen_alto = m.alto, p.imagen_color = m.color, p.imagen_lqip = m.lqip
+        WHERE p.restaurante_id = %s AND p.id IN ({placeholders})
+    ''', [restaurante_id, *ids])
+    cur.execute(f'''
+        UPDATE platos_imagenes pi LEFT JOIN imagenes_meta m ON m.url_hash = SHA1(pi.imagen_url)
+        SET pi.imagen_ancho = m.ancho, pi.imagen_alto = m.alto, pi.imagen_color = m.color, pi.imagen_lqip = m.lqip
+        WHERE pi.restaurante_id = %s AND pi.plato_id IN ({placeholders})
+    ''', [restaurante_id, *ids])
@@ -0,0 +1,178 @@
+# ============================================================
+# IMAGE PREPROCESS - Reducción de imágenes antes de subirlas
+# ============================================================
+# Los teléfonos suben originales de 4-5 MB (MAX_CONTENT_LENGTH = 5 MB) y
+# cloudinary_upload() los reenviaba tal cual por el proxy. Antes de subir:
+#
+# - Se aplica la orientación EXIF (la foto queda derecha sin depender
+#   de la metadata).
+# - Se reduce a IMG_MAX_DIM px en el lado mayor. Para JPEG se usa
+#   Image.draft(), que decodifica directamente a 1/2, 1/4 u 1/8 de la
+#   resolución: una foto de 12 MP no se expande entera en memoria.
+# - Se re-codifica a WebP (o JPEG) con IMG_CALIDAD, sin EXIF (GPS, modelo
+#   del teléfono). Se conserva el perfil ICC para no alterar los colores.
+# - La salida va a un SpooledTemporaryFile: queda en memoria si es chica
+#   y pasa a disco si no.
+#
+# Pillow es opcional: sin él, o si el archivo no es una imagen que Pillow
+# entienda (SVG, GIF animado, archivo dañado), se sube el original.
+# ============================================================
+
+import logging
+import os
+import tempfile
+
+try:
+    from PIL import Image, ImageOps
+    PIL_AVAILABLE = True
+except ImportError:
+    Image = None
+    ImageOps = None
+    PIL_AVAILABLE = False
+
+from image_placeholders import placeholder_de_imagen
+
+logger = logging.getLogger(__name__)
+
+IMG_MAX_DIM = int(os.environ.get('IMG_MAX_DIM', '2048'))
+IMG_FORMATO = os.environ.get('IMG_FORMATO', 'webp').lower()
+IMG_CALIDAD = int(os.environ.get('IMG_CALIDAD', '82'))
+SPOOL_MAX_BYTES = 1024 * 1024
+
+# formato -> (formato Pillow, content-type, extensión)
+FORMATOS_SALIDA = {
+    'webp': ('WEBP', 'image/webp', 'webp'),
+    'jpeg': ('JPEG', 'image/jpeg', 'jpg'),
+}
+
+
+def _nombre_base(fuente):
+    if isinstance(fuente, str):
+        nombre = os.path.basename(fuente)
+    else:
+        nombre = getattr(fuente, 'filename', None) or os.path.basename(str(getattr(fuente, 'name', '') or ''))
+    return os.path.splitext(nombre or 'upload')[0] or 'upload'
+
+
+def _tamano(fuente):
+    """Bytes del archivo original (None si no se puede saber sin leerlo)."""
+    if isinstance(fuente, str):
+        try:
+            return os.path.getsize(fuente)
+        except OSError:
+            return None
+    try:
+        inicio = fuente.tell()
+        fuente.seek(0, os.SEEK_END)
+        total = fuente.tell() - inicio
+        fuente.seek(inicio)
+        return total
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _tiene_alfa(img):
+    return img.mode in ('RGBA', 'LA', 'PA') or (img.mode == 'P' and 'transparency' in img.info)
+
+
+def _modo_salida(img, formato):
+    """Convierte al modo que acepta el formato de salida (JPEG no tiene alfa)."""
+    if formato == 'JPEG':
+        if _tiene_alfa(img):
+            fondo = Image.new('RGB', img.size, (255, 255, 255))
+            fondo.paste(img.convert('RGBA'), mask=img.convert('RGBA').getchannel('A'))
+            return fondo
+        return img if img.mode == 'RGB' else img.convert('RGB')
+    if _tiene_alfa(img):
+        return img if img.mode == 'RGBA' else img.convert('RGBA')
+    return img if img.mode == 'RGB' else img.convert('RGB')
+
+
+def preprocesar_imagen(fuente, max_dim=None, formato=None, calidad=None, ancho_max=None):
+    """
+    Orienta, reduce y re-codifica una imagen antes de subirla.
+
+    Args:
+        fuente: ruta o file-like (FileStorage, archivo abierto)
+        max_dim: lado mayor máximo en px (IMG_MAX_DIM)
+        formato: 'webp' o 'jpeg' (IMG_FORMATO)
+        calidad: 1-100 (IMG_CALIDAD)
+        ancho_max: limita además el ancho en px (derivados para srcset)
+
+    Returns:
+        dict con stream, filename, content_type, ancho, alto, bytes_original,
+        bytes y placeholder (image_placeholders); o None si hay que subir el original (el file-like queda
+        en su posición inicial).
+    """
+    if not PIL_AVAILABLE:
+        return None
+    max_dim = max_dim or IMG_MAX_DIM
+    formato_pil, content_type, ext = FORMATOS_SALIDA.get(formato or IMG_FORMATO, FORMATOS_SALIDA['webp'])
+    calidad = calidad or IMG_CALIDAD
+
+    inicio = None
+    if not isinstance(fuente, str):
+        try:
+            inicio = fuente.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+    bytes_original = _tamano(fuente)
+
+    def _original():
+        if inicio is not None:
+            fuente.seek(inicio)
+        return None
+
+    try:
+        with Image.open(fuente) as img:
+            if getattr(img, 'n_frames', 1) > 1:
+                return _original()
+            ancho = min(ancho_max or max_dim, max_dim)
+            caja = (ancho, max_dim)
+            if img.format == 'JPEG':
+                # draft() garantiza al menos este tamaño en ambos lados (antes de rotar)
+                img.draft('RGB', (ancho, ancho))
+            icc = img.info.get('icc_profile')
+            salida = ImageOps.exif_transpose(img)
+            salida.thumbnail(caja, getattr(Image, 'Resampling', Image).LANCZOS)
+            salida = _modo_salida(salida, formato_pil)
+
+            opciones = {'quality': calidad}
+            if icc:
+                opciones['icc_profile'] = icc
+            if formato_pil == 'WEBP':
+                opciones['method'] = 4
+            else:
+                opciones.update(optimize=True, progressive=True)
+
+            stream = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+            salida.save(stream, format=formato_pil, **opciones)
+            ancho, alto = salida.size
+            try:
+                placeholder = placeholder_de_imagen(salida)
+            except Exception as e:
+                logger.info("Image placeholder skipped (%s): %s", type(e).__name__, e)
+                placeholder = None
+    except Exception as e:
+        logger.info("Image preprocessing skipped (%s): %s", type(e).__name__, e)
+        return _original()
+
+    total = stream.tell()
+    if bytes_original is not None and total >= bytes_original:
+        # Ya venía optimizada: el original pesa menos
+        stream.close()
+        return _original()
+
+    stream.seek(0)
+    logger.info("Image preprocessed: %s -> %s bytes (%sx%s %s)",
+                bytes_original, total, ancho, alto, formato_pil)
+    return {
+        'stream': stream,
+        'filename': f"{_nombre_base(fuente)}.{ext}",
+        'content_type': content_type,
+        'ancho': ancho,
+        'alto': alto,
+        'bytes_original': bytes_original,
+        'bytes': total,
+        'placeholder': placeholder,
+    }
@@ -0,0 +1,362 @@
+# ============================================================
+# MENU BULK - Importación / actualización masiva de platos
+# ============================================================
+# Para cargar un menú completo (cientos de platos) en un solo request:
+#
+# - Acepta JSON (lista de platos) o CSV con encabezados.
+# - Las categorías se resuelven por nombre (sin distinguir mayúsculas);
+#   opcionalmente se crean las que no existen.
+# - Todo se valida en memoria ANTES de escribir: si una fila es inválida
+#   no se escribe nada y se devuelven los errores por fila.
+# - Un plato se actualiza si trae 'id' o si ya existe uno con el mismo
+#   nombre en la misma categoría; si no, se inserta. Al actualizar solo
+#   se escriben las columnas que trae la fila (un CSV de precios no borra
+#   descripciones ni reactiva platos ocultos).
+# - Escritura con INSERT ... ON DUPLICATE KEY UPDATE multi-fila, en una
+#   sola transacción. La invalidación de caché queda a cargo del llamador
+#   (una sola vez).
+#
+# También el reordenamiento en lote (/api/orden): listas completas de ids
+# en el orden deseado, aplicadas con un UPDATE ... CASE por tabla.
+# ============================================================
+
+import csv
+import io
+import logging
+
+from menu_sync import marcar_platos, siguiente_version
+
+logger = logging.getLogger(__name__)
+
+MAX_FILAS_IMPORT = 1000
+UPSERT_CHUNK = 200
+MAX_ETIQUETAS = 500   # Mismo límite que api_platos
+
+_FLAGS = ('es_vegetariano', 'es_vegano', 'es_sin_gluten', 'es_picante', 'es_nuevo', 'es_popular')
+_VERDADEROS = ('1', 'true', 'si', 'sí', 'x', 'yes')
+
+COLUMNAS_PLATO = (
+    'id', 'restaurante_id', 'categoria_id', 'nombre', 'descripcion', 'precio', 'precio_oferta',
+    'etiquetas', *_FLAGS, 'orden', 'activo', 'row_version'
+)
+# Columnas que una actualización solo escribe si vienen en la fila
+COLUMNAS_OPCIONALES = ('descripcion', 'precio_oferta', 'etiquetas', *_FLAGS, 'orden', 'activo')
+
+
+class ErrorImportacion(ValueError):
+    """Filas inválidas: no se escribió nada."""
+
+    def __init__(self, errores):
+        super().__init__(f"{len(errores)} fila(s) con errores")
+        self.errores = errores
+
+
+def leer_csv(texto):
+    """CSV con encabezados -> lista de dicts. Acepta ',' o ';' (Excel en español)."""
+    texto = texto.lstrip('\ufeff')
+    try:
+        dialecto = csv.Sniffer().sniff(texto[:2048], delimiters=',;')
+    except csv.Error:
+        dialecto = csv.excel
+    return [
+        {(k or '').strip().lower(): (v.strip() if isinstance(v, str) else v) for k, v in fila.items()}
+        for fila in csv.DictReader(io.StringIO(texto), dialect=dialecto)
+    ]
+
+
+def _bool(v, default=0):
+    if v is None or v == '':
+        return default
+    if isinstance(v, str):
+        return 1 if v.strip().lower() in _VERDADEROS else 0
+    return 1 if v else 0
+
+
+def _precio(v, obligatorio):
+    if v is None or v == '':
+        if obligatorio:
+            raise ValueError('Precio es obligatorio')
+        return None
+    if isinstance(v, str):
+        # "14.990" / "14990" / "14990,5"
+        v = v.replace('$', '').replace(' ', '')
+        if ',' in v:
+            v = v.replace('.', '').replace(',', '.')
+        elif v.count('.') == 1 and len(v.split('.')[1]) == 3:
+            v = v.replace('.', '')
+    precio = float(v)
+    if precio < 0:
+        raise ValueError('Precio no puede ser negativo')
+    return precio
+
+
+def _clave(texto):
+    return ' '.join((texto or '').split()).lower()
+
+
+def validar_filas(filas, categorias, crear_categorias=False):
+    """
+    Valida y normaliza en memoria.
+
+    Args:
+        filas: lista de dicts (JSON o CSV)
+        categorias: {nombre_normalizado: id} del restaurante
+        crear_categorias: si False, una categoría desconocida es un error
+
+    Returns:
+        tuple: (platos normalizados, nombres de categorías nuevas)
+
+    Raises:
+        ErrorImportacion con la lista de errores por fila
+    """
+    if not filas:
+        raise ErrorImportacion([{'fila': 0, 'error': 'No se recibieron platos'}])
+    if len(filas) > MAX_FILAS_IMPORT:
+        raise ErrorImportacion([{'fila': 0, 'error': f'Máximo {MAX_FILAS_IMPORT} platos por importación'}])
+
+    ids_categoria = set(categorias.values())
+    platos, errores, nuevas = [], [], {}
+    for n, fila in enumerate(filas, start=1):
+        try:
+            if not isinstance(fila, dict):
+                raise ValueError('Formato de fila inválido')
+            nombre = ' '.join(str(fila.get('nombre') or '').split())
+            if not nombre or len(nombre) > 150:
+                raise ValueError('Nombre es obligatorio (máx 150 caracteres)')
+
+            categoria_id = fila.get('categoria_id')
+            categoria = _clave(str(fila.get('categoria') or ''))
+            if categoria_id not in (None, ''):
+                categoria_id = int(categoria_id)
+                if categoria_id not in ids_categoria:
+                    raise ValueError('Categoría no válida')
+            elif categoria in categorias:
+                categoria_id = categorias[categoria]
+            elif categoria and crear_categorias:
+                if len(categoria) > 100:
+                    raise ValueError('Nombre de categoría demasiado largo (máx 100)')
+                nuevas.setdefault(categoria, ' '.join(str(fila['categoria']).split()))
+                categoria_id = None
+            elif categoria:
+                raise ValueError(f"Categoría '{fila.get('categoria')}' no existe")
+            else:
+                raise ValueError('Categoría es obligatoria')
+
+            plato_id = fila.get('id')
+            presentes = tuple(c for c in COLUMNAS_OPCIONALES if c in fila)
+            platos.append({
+                'fila': n,
+                'id': int(plato_id) if plato_id not in (None, '') else None,
+                'categoria_id': categoria_id,
+                'categoria': categoria,
+                'nombre': nombre,
+                'descripcion': str(fila.get('descripcion') or '')[:1000],
+                'precio': _precio(fila.get('precio'), obligatorio=True),
+                'precio_oferta': _precio(fila.get('precio_oferta'), obligatorio=False),
+                'etiquetas': str(fila.get('etiquetas') or '')[:MAX_ETIQUETAS],
+                **{f: _bool(fila.get(f)) for f in _FLAGS},
+                'orden': int(fila.get('orden') or 0),
+                'activo': _bool(fila.get('activo'), default=1),
+                'presentes': presentes,
+            })
+        except (ValueError, TypeError) as e:
+            errores.append({'fila': n, 'nombre': (fila.get('nombre') if isinstance(fila, dict) else None), 'error': str(e)})
+
+    if errores:
+        raise ErrorImportacion(errores)
+    return platos, list(nuevas.values())
+
+
+def _cargar_categorias(cur, restaurante_id):
+    cur.execute("SELECT id, nombre FROM categorias WHERE restaurante_id = %s", (restaurante_id,))
+    categorias = {}
+    for c in cur.fetchall() or []:
+        categorias.setdefault(_clave(c['nombre']), c['id'])
+    return categorias
+
+
+def importar_platos(db, restaurante_id, filas, crear_categorias=False):
+    """
+    Valida e importa platos en una sola transacción.
+
+    Returns:
+        dict: {'creados', 'actualizados', 'categorias_creadas'}
+
+    Raises:
+        ErrorImportacion si alguna fila es inválida (no se escribe nada)
+    """
+    try:
+        with db.cursor() as cur:
+            categorias = _cargar_categorias(cur, restaurante_id)
+            platos, nuevas = validar_filas(filas, categorias, crear_categorias)
+
+            if nuevas:
+                cur.execute("SELECT COALESCE(MAX(orden), 0) as max_orden FROM categorias WHERE restaurante_id = %s",
+                            (restaurante_id,))
+                base = (cur.fetchone() or {}).get('max_orden') or 0
+                valores = []
+                for i, nombre in enumerate(nuevas, start=1):
+                    valores.extend([restaurante_id, nombre, base + i])
+                cur.execute(
+                    "INSERT INTO categorias (restaurante_id, nombre, orden, activo) VALUES "
+                    + ','.join(['(%s, %s, %s, 1)'] * len(nuevas)),
+                    valores
+                )
+                categorias = _cargar_categorias(cur, restaurante_id)
+                for p in platos:
+                    if p['categoria_id'] is None:
+                        p['categoria_id'] = categorias[p['categoria']]
+
+            # Platos existentes: para validar ids y emparejar por (categoría, nombre)
+            cur.execute("SELECT id, categoria_id, nombre FROM platos WHERE restaurante_id = %s FOR UPDATE",
+                        (restaurante_id,))
+            existentes = cur.fetchall() or []
+            ids_propios = {r['id'] for r in existentes}
+            por_nombre = {(r['categoria_id'], _clave(r['nombre'])): r['id'] for r in existentes}
+
+            errores, vistos = [], set()
+            for p in platos:
+                clave = (p['categoria_id'], _clave(p['nombre']))
+                if p['id'] is not None and p['id'] not in ids_propios:
+                    errores.append({'fila': p['fila'], 'nombre': p['nombre'], 'error': 'Plato no encontrado'})
+                elif p['id'] is None and clave in vistos:
+                    errores.append({'fila': p['fila'], 'nombre': p['nombre'], 'error': 'Plato duplicado en la importación'})
+                elif p['id'] is None:
+                    p['id'] = por_nombre.get(clave)
+                vistos.add(clave)
+            if errores:
+                raise ErrorImportacion(errores)
+
+            actualizados = sum(1 for p in platos if p['id'] is not None)
+            version = siguiente_version(cur, restaurante_id)
+            extra = {'restaurante_id': restaurante_id, 'row_version': version}
+            fila_sql = '(' + ', '.join(['%s'] * len(COLUMNAS_PLATO)) + ')'
+            # Un INSERT (con todas las columnas, para los nuevos) por conjunto de
+            # columnas presentes: el UPDATE de los existentes solo toca esas
+            grupos = {}
+            for p in platos:
+                grupos.setdefault(p['presentes'], []).append(p)
+            for presentes, grupo in grupos.items():
+                update_sql = ', '.join(
+                    f"{c} = VALUES({c})" for c in COLUMNAS_PLATO
+                    if c not in ('id', 'restaurante_id') and (c not in COLUMNAS_OPCIONALES or c in presentes)
+                )
+                for i in range(0, len(grupo), UPSERT_CHUNK):
+                    lote = grupo[i:i + UPSERT_CHUNK]
+                    params = []
+                    for p in lote:
+                        params.extend(extra[c] if c in extra else p[c] for c in COLUMNAS_PLATO)
+                    cur.execute(
+                        f"INSERT INTO platos ({', '.join(COLUMNAS_PLATO)}) VALUES "
+                        f"{', '.join([fila_sql] * len(lote))} "
+                        f"ON DUPLICATE KEY UPDATE {update_sql}",
+                        params
+                    )
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    resultado = {
+        'creados': len(platos) - actualizados,
+        'actualizados': actualizados,
+        'categorias_creadas': len(nuevas),
+    }
+    logger.info("Bulk import for restaurant %s: %s", restaurante_id, resultado)
+    return resultado
+
+
+# ============================================================
+# REORDENAMIENTO EN LOTE
+# ============================================================
+
+def _ids_ordenados(valor, campo):
+    if not isinstance(valor, list):
+        raise ValueError(f"'{campo}' debe ser una lista de ids")
+    try:
+        ids = [int(i) for i in valor]
+    except (TypeError, ValueError):
+        raise ValueError(f"'{campo}' contiene ids inválidos")
+    if len(set(ids)) != len(ids):
+        raise ValueError(f"'{campo}' contiene ids repetidos")
+    return ids
+
+
+def _verificar_propios(cur, tabla, restaurante_id, ids):
+    placeholders = ','.join(['%s'] * len(ids))
+    cur.execute(f"SELECT id FROM {tabla} WHERE restaurante_id = %s AND id IN ({placeholders})",
+                [restaurante_id, *ids])
+    propios = {r['id'] for r in cur.fetchall() or []}
+    ajenos = [i for i in ids if i not in propios]
+    if ajenos:
+        raise ValueError(f"Ids no encontrados en {tabla}: {ajenos[:10]}")
+
+
+def _update_case(cur, tabla, restaurante_id, valores, columna='orden'):
+    """UPDATE tabla SET columna = CASE id WHEN .. THEN .. END para {id: valor}."""
+    ids = list(valores)
+    casos = ' '.join(['WHEN %s THEN %s'] * len(ids))
+    params = [x for i in ids for x in (i, valores[i])]
+    placeholders = ','.join(['%s'] * len(ids))
+    cur.execute(
+        f"UPDATE {tabla} SET {columna} = CASE id {casos} END "
+        f"WHERE restaurante_id = %s AND id IN ({placeholders})",
+        params + [restaurante_id] + ids
+    )
+
+
+def aplicar_orden(db, restaurante_id, categorias=None, platos=None):
+    """
+    Aplica el orden completo de categorías y/o platos en una transacción.
+
+    Args:
+        categorias: lista de ids de categoría en el orden deseado
+        platos: lista de ids de plato en el orden deseado, o
+                {categoria_id: [ids]} para además mover platos de categoría
+
+    Returns:
+        dict: {'categorias': n, 'platos': n}
+
+    Raises:
+        ValueError si los datos son inválidos o hay ids de otro restaurante
+    """
+    orden_categorias = _ids_ordenados(categorias, 'categorias') if categorias is not None else []
+    platos_categoria = {}
+    if isinstance(platos, dict):
+        orden_platos = []
+        for cat_id, ids in platos.items():
+            try:
+                cat_id = int(cat_id)
+            except (TypeError, ValueError):
+                raise ValueError("'platos' contiene categorías inválidas")
+            for pid in _ids_ordenados(ids, 'platos'):
+                orden_platos.append(pid)
+                platos_categoria[pid] = cat_id
+        if len(set(orden_platos)) != len(orden_platos):
+            raise ValueError("'platos' contiene ids repetidos")
+    else:
+        orden_platos = _ids_ordenados(platos, 'platos') if platos is not None else []
+
+    if not orden_categorias and not orden_platos:
+        raise ValueError('No se recibió ningún orden')
+
+    try:
+        with db.cursor() as cur:
+            if orden_categorias:
+                _verificar_propios(cur, 'categorias', restaurante_id, orden_categorias)
+                _update_case(cur, 'categorias', restaurante_id,
+                             {cid: n for n, cid in enumerate(orden_categorias, start=1)})
+            if orden_platos:
+                _verificar_propios(cur, 'platos', restaurante_id, orden_platos)
+                if platos_categoria:
+                    _verificar_propios(cur, 'categorias', restaurante_id, sorted(set(platos_categoria.values())))
+                    _update_case(cur, 'platos', restaurante_id, platos_categoria, columna='categoria_id')
+                _update_case(cur, 'platos', restaurante_id,
+                             {pid: n for n, pid in enumerate(orden_platos, start=1)})
+                marcar_platos(cur, restaurante_id, orden_platos)
+        db.commit()
+    except Exception:
+        db.rollback()
+        raise
+
+    return {'categorias': len(orden_categorias), 'platos': len(orden_platos)}
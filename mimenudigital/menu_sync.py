@@ -0,0 +1,144 @@
+# ============================================================
+# MENU SYNC - Sincronización delta de platos (change feed)
+# ============================================================
+# Cada escritura sobre platos toma una versión nueva del contador del
+# restaurante (restaurantes.sync_version) y la guarda en
+# platos.row_version; los borrados dejan una lápida en platos_eliminados.
+#
+# El editor pide GET /api/platos?since=<version> y recibe solo los platos
+# cambiados, los ids eliminados y el nuevo cursor. Ver migración 023.
+#
+# Las funciones no hacen commit: se llaman dentro de la transacción que
+# modifica los platos, así versión y cambio se confirman juntos.
+# ============================================================
+
+import logging
+
+logger = logging.getLogger(__name__)
+
+LAPIDAS_DIAS = 30
+
+
+def siguiente_version(cur, restaurante_id):
+    """Incrementa y devuelve el contador de versión del restaurante (bloquea su fila hasta el commit)."""
+    cur.execute(
+        "UPDATE restaurantes SET sync_version = LAST_INSERT_ID(sync_version + 1) WHERE id = %s",
+        (restaurante_id,)
+    )
+    cur.execute("SELECT LAST_INSERT_ID() as version")
+    row = cur.fetchone() or {}
+    return int(row.get('version') or 0)
+
+
+def marcar_platos(cur, restaurante_id, plato_ids=None, categoria_id=None):
+    """
+    Marca platos como modificados con una versión nueva.
+
+    Args:
+        plato_ids: ids concretos, o
+        categoria_id: todos los platos de una categoría
+
+    Returns:
+        int: versión asignada (0 si no había nada que marcar)
+    """
+    ids = [int(i) for i in (plato_ids or []) if i]
+    if not ids and categoria_id is None:
+        return 0
+    version = siguiente_version(cur, restaurante_id)
+    if ids:
+        placeholders = ','.join(['%s'] * len(ids))
+        cur.execute(
+            f"UPDATE platos SET row_version = %s WHERE restaurante_id = %s AND id IN ({placeholders})",
+            [version, restaurante_id, *ids]
+        )
+    else:
+        cur.execute(
+            "UPDATE platos SET row_version = %s WHERE restaurante_id = %s AND categoria_id = %s",
+            (version, restaurante_id, categoria_id)
+        )
+    return version
+
+
+def registrar_eliminados(cur, restaurante_id, plato_ids=None, categoria_id=None):
+    """
+    Deja lápidas ANTES de borrar los platos (con categoria_id se buscan
+    los platos de la categoría).
+
+    Returns:
+        int: versión asignada (0 si no había platos)
+    """
+    if categoria_id is not None:
+        cur.execute("SELECT id FROM platos WHERE restaurante_id = %s AND categoria_id = %s",
+                    (restaurante_id, categoria_id))
+        plato_ids = [r['id'] for r in cur.fetchall() or []]
+    ids = [int(i) for i in (plato_ids or []) if i]
+    if not ids:
+        return 0
+    version = siguiente_version(cur, restaurante_id)
+    cur.executemany('''
+        INSERT INTO platos_eliminados (restaurante_id, plato_id, row_version)
+        VALUES (%s, %s, %s)
+        ON DUPLICATE KEY UPDATE row_version = VALUES(row_version), fecha_eliminacion = CURRENT_TIMESTAMP
+    ''', [(restaurante_id, pid, version) for pid in ids])
+    return version
+
+
+def cambios_desde(cur, restaurante_id, since):
+    """
+    Cambios de platos posteriores a `since`.
+
+    Returns:
+        dict: {'version', 'completo', 'platos' (filas), 'eliminados' (ids)}
+        'completo' es True cuando el cliente debe reemplazar su copia local
+        (since=0 o cursor anterior a las lápidas purgadas).
+    """
+    cur.execute("SELECT sync_version, sync_purgado_hasta FROM restaurantes WHERE id = %s", (restaurante_id,))
+    estado = cur.fetchone() or {}
+    version = int(estado.get('sync_version') or 0)
+    completo = since <= 0 or since < int(estado.get('sync_purgado_hasta') or 0) or since > version
+
+    where = "p.restaurante_id = %s" if completo else "p.restaurante_id = %s AND p.row_version > %s"
+    params = (restaurante_id,) if completo else (restaurante_id, since)
+    cur.execute(f'''
+        SELECT p.*, c.nombre as categoria_nombre
+        FROM platos p
+        LEFT JOIN categorias c ON p.categoria_id = c.id
+        WHERE {where}
+        ORDER BY p.orden, p.nombre
+    ''', params)
+    platos = cur.fetchall() or []
+
+    eliminados = []
+    if not completo:
+        cur.execute('''
+            SELECT plato_id FROM platos_eliminados
+            WHERE restaurante_id = %s AND row_version > %s
+        ''', (restaurante_id, since))
+        eliminados = [r['plato_id'] for r in cur.fetchall() or []]
+
+    return {'version': version, 'completo': completo, 'platos': platos, 'eliminados': eliminados}
+
+
+def purgar_lapidas(db, dias=LAPIDAS_DIAS):
+    """
+    Borra lápidas viejas y sube sync_purgado_hasta para que los clientes
+    con un cursor anterior recarguen completo.
+
+    Returns:
+        dict: {'eliminadas': n}
+    """
+    with db.cursor() as cur:
+        cur.execute('''
+            UPDATE restaurantes r
+            JOIN (
+                SELECT restaurante_id, MAX(row_version) as hasta
+                FROM platos_eliminados
+                WHERE fecha_eliminacion < NOW() - INTERVAL %s DAY
+                GROUP BY restaurante_id
+            ) t ON t.restaurante_id = r.id
+            SET r.sync_purgado_hasta = GREATEST(r.sync_purgado_hasta, t.hasta)
+        ''', (dias,))
+        cur.execute("DELETE FROM platos_eliminados WHERE fecha_eliminacion < NOW() - INTERVAL %s DAY", (dias,))
+        eliminadas = cur.rowcount
+    db.commit()
+    return {'eliminadas': eliminadas}
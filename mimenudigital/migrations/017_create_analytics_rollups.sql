@@ -0,0 +1,133 @@
+-- ============================================================
+-- MIGRACIÓN 017: Rollups pre-agregados de analítica
+-- ============================================================
+-- Propósito: Los dashboards dejan de escanear `visitas` (millones de
+-- filas) para "hoy" y el desglose semanal. El worker de visitas
+-- mantiene estas tablas incrementalmente (ver analytics.py).
+-- ============================================================
+
+-- ============================================================
+-- TABLA: ESTADISTICAS_HORARIAS (restaurante × día × hora)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS estadisticas_horarias (
+    restaurante_id INT NOT NULL,
+    fecha DATE NOT NULL,
+    hora TINYINT UNSIGNED NOT NULL,
+    visitas INT NOT NULL DEFAULT 0,
+    escaneos_qr INT NOT NULL DEFAULT 0,
+    visitas_movil INT NOT NULL DEFAULT 0,
+    visitas_desktop INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (restaurante_id, fecha, hora),
+    INDEX idx_horarias_fecha (fecha, hora),
+    FOREIGN KEY (restaurante_id) REFERENCES restaurantes(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- TABLA: ESTADISTICAS_SEMANA_HORA (mapa de calor por semana)
+-- semana es el lunes de la semana; el mapa suma un rango de semanas.
+-- dia_semana sigue DAYOFWEEK(): 1=domingo ... 7=sábado
+-- ============================================================
+CREATE TABLE IF NOT EXISTS estadisticas_semana_hora (
+    restaurante_id INT NOT NULL,
+    semana DATE NOT NULL,
+    dia_semana TINYINT UNSIGNED NOT NULL,
+    hora TINYINT UNSIGNED NOT NULL,
+    visitas INT NOT NULL DEFAULT 0,
+    escaneos_qr INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (restaurante_id, semana, dia_semana, hora),
+    INDEX idx_semana_hora_semana (semana),
+    FOREIGN KEY (restaurante_id) REFERENCES restaurantes(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- TABLA: ESTADISTICAS_DIMENSIONES (contadores por dispositivo/origen)
+-- dimension: 'dispositivo' (movil, desktop) | 'origen' (qr, directo, social, buscador, referido)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS estadisticas_dimensiones (
+    restaurante_id INT NOT NULL,
+    fecha DATE NOT NULL,
+    dimension VARCHAR(20) NOT NULL,
+    valor VARCHAR(50) NOT NULL,
+    visitas INT NOT NULL DEFAULT 0,
+
+    PRIMARY KEY (restaurante_id, fecha, dimension, valor),
+    INDEX idx_dimensiones_fecha (fecha, dimension),
+    FOREIGN KEY (restaurante_id) REFERENCES restaurantes(id) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- BACKFILL (una sola vez, idempotente: sobreescribe los contadores)
+-- Ejecutar en horario de bajo tráfico; recorre `visitas` completa.
+-- ============================================================
+INSERT INTO estadisticas_horarias
+    (restaurante_id, fecha, hora, visitas, escaneos_qr, visitas_movil, visitas_desktop)
+SELECT
+    restaurante_id,
+    DATE(fecha),
+    HOUR(fecha),
+    COUNT(*),
+    SUM(CASE WHEN es_qr = 1 THEN 1 ELSE 0 END),
+    SUM(CASE WHEN es_movil = 1 THEN 1 ELSE 0 END),
+    SUM(CASE WHEN es_movil = 0 THEN 1 ELSE 0 END)
+FROM visitas
+GROUP BY restaurante_id, DATE(fecha), HOUR(fecha)
+ON DUPLICATE KEY UPDATE
+    visitas = VALUES(visitas),
+    escaneos_qr = VALUES(escaneos_qr),
+    visitas_movil = VALUES(visitas_movil),
+    visitas_desktop = VALUES(visitas_desktop);
+
+INSERT INTO estadisticas_semana_hora
+    (restaurante_id, semana, dia_semana, hora, visitas, escaneos_qr)
+SELECT
+    restaurante_id,
+    DATE_SUB(DATE(fecha), INTERVAL WEEKDAY(fecha) DAY) AS semana,
+    DAYOFWEEK(fecha),
+    HOUR(fecha),
+    COUNT(*),
+    SUM(CASE WHEN es_qr = 1 THEN 1 ELSE 0 END)
+FROM visitas
+GROUP BY restaurante_id, semana, DAYOFWEEK(fecha), HOUR(fecha)
+ON DUPLICATE KEY UPDATE
+    visitas = VALUES(visitas),
+    escaneos_qr = VALUES(escaneos_qr);
+
+INSERT INTO estadisticas_dimensiones (restaurante_id, fecha, dimension, valor, visitas)
+SELECT restaurante_id, DATE(fecha), 'dispositivo',
+    CASE WHEN es_movil = 1 THEN 'movil' ELSE 'desktop' END,
+    COUNT(*)
+FROM visitas
+GROUP BY restaurante_id, DATE(fecha), es_movil
+ON DUPLICATE KEY UPDATE visitas = VALUES(visitas);
+
+-- Misma clasificación que analytics.clasificar_origen(): host del referer
+-- (lo que urlparse() deja en netloc) contra las listas de dominios.
+INSERT INTO estadisticas_dimensiones (restaurante_id, fecha, dimension, valor, visitas)
+SELECT restaurante_id, DATE(fecha), 'origen', origen, COUNT(*)
+FROM (
+    SELECT restaurante_id, fecha,
+        CASE
+            WHEN es_qr = 1 THEN 'qr'
+            WHEN host = '' THEN 'directo'
+            WHEN host LIKE '%facebook.%' OR host LIKE '%fb.%' OR host LIKE '%instagram.%'
+                OR host LIKE '%whatsapp.%' OR host LIKE '%wa.me%' OR host LIKE '%t.co%'
+                OR host LIKE '%twitter.%' OR host LIKE '%x.com%' OR host LIKE '%tiktok.%'
+                OR host LIKE '%linkedin.%' OR host LIKE '%pinterest.%' THEN 'social'
+            WHEN host LIKE '%google.%' OR host LIKE '%bing.%' OR host LIKE '%yahoo.%'
+                OR host LIKE '%duckduckgo.%' OR host LIKE '%ecosia.%' OR host LIKE '%yandex.%' THEN 'buscador'
+            ELSE 'referido'
+        END AS origen
+    FROM (
+        SELECT restaurante_id, fecha, es_qr,
+            CASE WHEN LOCATE('://', COALESCE(referer, '')) > 0
+                THEN LOWER(SUBSTRING_INDEX(SUBSTRING_INDEX(SUBSTRING_INDEX(
+                    SUBSTRING_INDEX(referer, '://', -1), '/', 1), '?', 1), '#', 1))
+                ELSE ''
+            END AS host
+        FROM visitas
+    ) v
+) o
+GROUP BY restaurante_id, DATE(fecha), origen
+ON DUPLICATE KEY UPDATE visitas = VALUES(visitas);
@@ -0,0 +1,56 @@
+-- ============================================================
+-- MIGRACIÓN 018: Codificación por diccionario de user_agent y referer
+-- ============================================================
+-- Propósito: `visitas` repetía hasta 1000 caracteres por fila en
+-- user_agent/referer aunque existen pocos cientos de valores distintos.
+-- Ahora el worker de visitas guarda solo user_agent_id/referer_id
+-- (ver analytics.DiccionarioDimension).
+-- ============================================================
+
+-- ============================================================
+-- TABLA: USER_AGENTS
+-- hash = SHA1(user_agent); un UNIQUE sobre VARCHAR(500) utf8mb4
+-- superaría el largo máximo de clave de InnoDB
+-- ============================================================
+CREATE TABLE IF NOT EXISTS user_agents (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    hash CHAR(40) NOT NULL,
+    user_agent VARCHAR(500) NOT NULL,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uk_user_agents_hash (hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- TABLA: REFERERS (sin query string ni fragmento)
+-- ============================================================
+CREATE TABLE IF NOT EXISTS referers (
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    hash CHAR(40) NOT NULL,
+    referer VARCHAR(500) NOT NULL,
+    fecha_creacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    UNIQUE KEY uk_referers_hash (hash)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- ============================================================
+-- VISITAS: columnas de id (las de texto quedan NULL para filas nuevas)
+-- ============================================================
+ALTER TABLE visitas
+    ADD COLUMN user_agent_id INT NULL AFTER ip_address,
+    ADD COLUMN referer_id INT NULL AFTER user_agent_id;
+
+-- ============================================================
+-- BACKFILL OPCIONAL (tablas grandes: preferir purgar primero con
+-- scripts/purge_visitas.py para reducir el volumen)
+-- ============================================================
+-- INSERT IGNORE INTO user_agents (hash, user_agent)
+--     SELECT DISTINCT SHA1(user_agent), user_agent FROM visitas
+--     WHERE user_agent IS NOT NULL AND user_agent <> '';
+-- UPDATE visitas v JOIN user_agents ua ON ua.hash = SHA1(v.user_agent)
+--     SET v.user_agent_id = ua.id, v.user_agent = NULL
+--     WHERE v.user_agent_id IS NULL;
+--
+-- Una vez migradas todas las filas (y con el archivo histórico exportado):
+-- ALTER TABLE visitas DROP COLUMN user_agent, DROP COLUMN referer;
+-- ============================================================
@@ -0,0 +1,22 @@
+-- ============================================================
+-- MIGRACIÓN 019: Visitantes únicos con HyperLogLog
+-- ============================================================
+-- Propósito: estimar visitantes distintos por restaurante y día sin
+-- COUNT(DISTINCT ip_address) sobre `visitas`. El worker de visitas
+-- mantiene un sketch serializado por fila (ver hyperloglog.py);
+-- los rangos semanales/mensuales se obtienen uniendo los sketches.
+--
+-- restaurante_id = 0 guarda el sketch de toda la plataforma, por eso
+-- no hay FOREIGN KEY a restaurantes.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS estadisticas_unicos (
+    restaurante_id INT NOT NULL,
+    fecha DATE NOT NULL,
+    hll BLOB NULL,
+    unicos INT NOT NULL DEFAULT 0,
+    fecha_actualizacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (restaurante_id, fecha),
+    INDEX idx_unicos_fecha (fecha)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,14 @@
+-- ============================================================
+-- MIGRACIÓN 020: Snapshot de estadísticas del superadmin
+-- ============================================================
+-- Propósito: /api/superadmin/stats-extended sirve un payload
+-- precalculado cada STATS_SNAPSHOT_INTERVAL segundos en lugar de
+-- ejecutar ~15 agregaciones por request. La tabla se comparte entre
+-- los workers web; ?refresh=1 fuerza el recálculo.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS estadisticas_snapshot (
+    clave VARCHAR(50) PRIMARY KEY,
+    payload MEDIUMTEXT NOT NULL,
+    computed_at DATETIME NOT NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,61 @@
+-- ============================================================
+-- MIGRACIÓN 021: Estado efectivo de suscripción persistido
+-- ============================================================
+-- Propósito: guardar el estado real de la suscripción (calculado a
+-- partir de estado_suscripcion, plan_id, fecha_vencimiento y activo)
+-- para que los conteos del superadmin sean un GROUP BY indexado y la
+-- lista "por vencer" un rango, en vez de recorrer todos los
+-- restaurantes en Python.
+--
+-- Valores: 'activa', 'prueba', 'gratuito', 'vencida', 'suspendida'
+-- Lo mantienen el webhook de Mercado Pago, la edición de suscripción
+-- del superadmin y el barrido diario (subscription_state.py).
+-- ============================================================
+
+ALTER TABLE restaurantes
+    ADD COLUMN estado_efectivo VARCHAR(20) NULL DEFAULT NULL AFTER estado_suscripcion;
+
+CREATE INDEX idx_restaurantes_estado_efectivo
+    ON restaurantes (estado_efectivo, fecha_vencimiento);
+
+-- Backfill: misma lógica que subscription_state.calcular_estado_efectivo()
+-- (mantenerlas sincronizadas). Premium = plan cuyo nombre no dice
+-- gratis/gratuito/free; si no hay ningún plan premium, plan_id > 1.
+-- Lo que quede en NULL lo completa el barrido diario
+-- (scripts/sweep_suscripciones.py).
+UPDATE restaurantes r
+LEFT JOIN (
+    SELECT id, NOT (LOWER(nombre) LIKE '%gratis%' OR LOWER(nombre) LIKE '%gratuito%'
+        OR LOWER(nombre) LIKE '%free%') AS premium
+    FROM planes
+) p ON p.id = r.plan_id
+CROSS JOIN (
+    SELECT COUNT(*) AS total
+    FROM planes
+    WHERE NOT (LOWER(nombre) LIKE '%gratis%' OR LOWER(nombre) LIKE '%gratuito%'
+        OR LOWER(nombre) LIKE '%free%')
+) np
+SET r.estado_efectivo = CASE
+    WHEN LOWER(TRIM(COALESCE(r.estado_suscripcion, ''))) IN ('prueba', 'trial', 'periodo_prueba')
+        THEN 'prueba'
+    WHEN LOWER(TRIM(COALESCE(r.estado_suscripcion, ''))) IN
+            ('suspendida', 'suspendido', 'suspended', 'inactiva', 'inactivo', 'cancelada', 'cancelado')
+        OR r.activo = 0
+        THEN 'suspendida'
+    WHEN IF(np.total = 0, COALESCE(r.plan_id, 0) > 1, COALESCE(p.premium, 0) = 1)
+        AND r.fecha_vencimiento IS NOT NULL
+        THEN IF(DATE(r.fecha_vencimiento) >= CURDATE(), 'activa', 'vencida')
+    WHEN LOWER(TRIM(COALESCE(r.estado_suscripcion, ''))) IN
+            ('activa', 'activo', 'premium', 'active', 'pagada', 'pagado', 'paid')
+        THEN 'activa'
+    WHEN NOT IF(np.total = 0, COALESCE(r.plan_id, 0) > 1, COALESCE(p.premium, 0) = 1)
+        OR p.premium = 0
+        THEN 'gratuito'
+    ELSE 'activa'
+END
+WHERE r.estado_efectivo IS NULL;
+
+-- Verificar el resultado
+SELECT estado_efectivo, COUNT(*) as cantidad
+FROM restaurantes
+GROUP BY estado_efectivo;
@@ -0,0 +1,36 @@
+-- ============================================================
+-- MIGRACIÓN 022: Scheduler de jobs de mantenimiento
+-- ============================================================
+-- Propósito: coordinar los jobs periódicos (scheduler.py) entre los
+-- workers web y las tasks de PythonAnywhere.
+-- - jobs_programados: una fila por job; lease_owner/lease_hasta
+--   garantizan que un solo proceso ejecute cada job a la vez.
+-- - jobs_historial: una fila por ejecución (duración, estado, error).
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS jobs_programados (
+    nombre VARCHAR(100) PRIMARY KEY,
+    lease_owner VARCHAR(150) NULL,
+    lease_hasta DATETIME NULL,
+    ultima_ejecucion DATETIME NULL,
+    proxima_ejecucion DATETIME NULL,
+    ultimo_estado VARCHAR(20) NULL,
+    ultimo_error TEXT NULL,
+    ultima_duracion_ms INT NULL,
+    ejecuciones INT NOT NULL DEFAULT 0,
+    fallos INT NOT NULL DEFAULT 0
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+CREATE TABLE IF NOT EXISTS jobs_historial (
+    id BIGINT AUTO_INCREMENT PRIMARY KEY,
+    nombre VARCHAR(100) NOT NULL,
+    worker VARCHAR(150) NOT NULL,
+    inicio DATETIME NOT NULL,
+    fin DATETIME NOT NULL,
+    duracion_ms INT NOT NULL,
+    estado VARCHAR(20) NOT NULL,
+    error TEXT NULL,
+    resultado TEXT NULL,
+    INDEX idx_jobs_historial_nombre_inicio (nombre, inicio),
+    INDEX idx_jobs_historial_inicio (inicio)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
@@ -0,0 +1,39 @@
+-- ============================================================
+-- MIGRACIÓN 023: Versión de fila para sincronización delta de platos
+-- ============================================================
+-- Propósito: que el editor de platos (gestion/platos.html) mantenga una
+-- copia local y pida solo lo que cambió:
+--   GET /api/platos?since=<version>
+--
+-- - restaurantes.sync_version: contador por restaurante. Cada escritura
+--   sobre platos lo incrementa (UPDATE ... LAST_INSERT_ID(sync_version + 1)),
+--   lo que además serializa las escrituras del mismo restaurante y hace
+--   que las versiones se confirmen en orden.
+-- - platos.row_version: versión de la última modificación del plato.
+-- - platos_eliminados: lápidas de platos borrados. Se purgan a los 30
+--   días; restaurantes.sync_purgado_hasta guarda la versión más alta
+--   purgada y un cliente con un cursor anterior recibe la lista completa.
+-- ============================================================
+
+ALTER TABLE restaurantes
+    ADD COLUMN sync_version BIGINT UNSIGNED NOT NULL DEFAULT 0,
+    ADD COLUMN sync_purgado_hasta BIGINT UNSIGNED NOT NULL DEFAULT 0;
+
+ALTER TABLE platos
+    ADD COLUMN row_version BIGINT UNSIGNED NOT NULL DEFAULT 0;
+
+CREATE INDEX idx_platos_row_version ON platos (restaurante_id, row_version);
+
+CREATE TABLE IF NOT EXISTS platos_eliminados (
+    restaurante_id INT NOT NULL,
+    plato_id INT NOT NULL,
+    row_version BIGINT UNSIGNED NOT NULL,
+    fecha_eliminacion TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+
+    PRIMARY KEY (restaurante_id, plato_id),
+    INDEX idx_platos_eliminados_version (restaurante_id, row_version),
+    INDEX idx_platos_eliminados_fecha (fecha_eliminacion)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+-- Los platos existentes quedan con row_version = 0: un cliente sin
+-- cursor (since=0) los recibe completos.
@@ -0,0 +1,21 @@
+-- ============================================================
+-- MIGRACIÓN 024: Índice FULLTEXT para búsqueda de platos
+-- ============================================================
+-- Propósito: búsqueda de platos (gestión y menú público) con
+-- MATCH ... AGAINST en vez de LOWER(nombre) LIKE '%x%', que obliga a
+-- recorrer la tabla completa.
+--
+-- La tabla usa utf8mb4_unicode_ci: el índice hereda esa colación y es
+-- insensible a mayúsculas y acentos ("cafe" encuentra "Café",
+-- "nandu" encuentra "Ñandú").
+--
+-- Palabras de menos de innodb_ft_min_token_size (3 por defecto) no se
+-- indexan; busqueda.py las resuelve con LIKE sobre el restaurante.
+-- Sin este índice la aplicación usa el índice en memoria (más lento).
+-- ============================================================
+
+ALTER TABLE platos
+    ADD FULLTEXT INDEX ft_platos_busqueda (nombre, descripcion, etiquetas);
+
+-- Verificar
+SHOW INDEX FROM platos WHERE Key_name = 'ft_platos_busqueda';
@@ -0,0 +1,21 @@
+-- ============================================================
+-- MIGRACIÓN 025: Subida asíncrona de imágenes
+-- ============================================================
+-- Propósito: los endpoints de subida ya no llaman a Cloudinary dentro
+-- del request. Guardan el archivo en static/uploads, registran un job en
+-- imagenes_pendientes y responden con una URL local provisoria.
+--
+-- local_url: URL provisoria entregada al frontend. Al terminar la subida
+-- se reemplaza por la de Cloudinary en platos, platos_imagenes y
+-- restaurantes.logo_url (ver image_jobs.py).
+-- ============================================================
+
+ALTER TABLE imagenes_pendientes
+    ADD COLUMN local_url VARCHAR(255) NULL DEFAULT NULL AFTER local_path;
+
+CREATE INDEX idx_imagenes_pendientes_local_url
+    ON imagenes_pendientes (restaurante_id, local_url);
+
+-- Estado del job para el polling del frontend
+CREATE INDEX idx_imagenes_pendientes_status_fecha
+    ON imagenes_pendientes (status, created_at);
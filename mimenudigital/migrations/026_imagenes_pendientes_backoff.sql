@@ -0,0 +1,27 @@
+-- ============================================================
+-- MIGRACIÓN 026: Procesador concurrente de imagenes_pendientes
+-- ============================================================
+-- Propósito: varios workers (pool del proceso web, script en daemon,
+-- job programado) procesan la cola a la vez sin pisarse.
+--
+-- claim_token: cada lote reclama sus filas con un UPDATE condicional
+-- (status = 'pending') que marca el token; luego lee solo las suyas.
+-- Funciona igual en MySQL 5.7, que no tiene SKIP LOCKED. El token también
+-- es el id de lote que devuelve /admin/cloudinary/process-pendings.
+--
+-- next_attempt_at: backoff exponencial entre reintentos (1, 2, 4 ... 60 min).
+-- duracion_ms: tiempo del último intento (subida + aplicación).
+-- ============================================================
+
+ALTER TABLE imagenes_pendientes
+    ADD COLUMN next_attempt_at DATETIME NULL DEFAULT NULL AFTER max_attempts,
+    ADD COLUMN claim_token CHAR(32) NULL DEFAULT NULL AFTER next_attempt_at,
+    ADD COLUMN duracion_ms INT UNSIGNED NULL DEFAULT NULL AFTER claim_token;
+
+-- Reclamo de jobs vencidos
+CREATE INDEX idx_imagenes_pendientes_status_next
+    ON imagenes_pendientes (status, next_attempt_at);
+
+-- Estado de un lote
+CREATE INDEX idx_imagenes_pendientes_claim
+    ON imagenes_pendientes (claim_token);
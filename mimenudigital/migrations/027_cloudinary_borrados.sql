@@ -0,0 +1,34 @@
+-- ============================================================
+-- MIGRACIÓN 027: Cola de borrado de imágenes en Cloudinary
+-- ============================================================
+-- Propósito: editar o borrar un plato ya no llama a Cloudinary dentro
+-- del request (una llamada destroy por imagen). Los public_id que dejan
+-- de usarse se registran aquí en la misma transacción del cambio, y el
+-- job 'borrar_imagenes_cloudinary' los borra de a 100 con la Admin API
+-- (delete_resources), con reintentos y backoff (ver image_cleanup.py).
+--
+-- status: pending -> processing -> deleted | failed | cancelled
+-- (cancelled: el public_id volvió a usarse antes de borrarlo).
+-- UNIQUE (resource_type, public_id): encolar dos veces el mismo asset no
+-- duplica trabajo.
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS cloudinary_borrados (
+    id INT AUTO_INCREMENT PRIMARY KEY,
+    public_id VARCHAR(255) NOT NULL,
+    resource_type VARCHAR(20) NOT NULL DEFAULT 'image',
+    restaurante_id INT NULL,
+    motivo VARCHAR(50) NULL,
+    status ENUM('pending', 'processing', 'deleted', 'failed', 'cancelled') NOT NULL DEFAULT 'pending',
+    attempts INT NOT NULL DEFAULT 0,
+    next_attempt_at DATETIME NULL DEFAULT NULL,
+    claim_token CHAR(32) NULL DEFAULT NULL,
+    last_error TEXT NULL,
+    created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+    updated_at DATETIME DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+    processed_at DATETIME NULL DEFAULT NULL,
+
+    UNIQUE KEY uq_cloudinary_borrados_asset (resource_type, public_id),
+    INDEX idx_cloudinary_borrados_status (status, next_attempt_at),
+    INDEX idx_cloudinary_borrados_claim (claim_token)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
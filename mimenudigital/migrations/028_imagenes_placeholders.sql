@@ -0,0 +1,33 @@
+-- ============================================================
+-- MIGRACIÓN 028: Dimensiones y placeholders por imagen
+-- ============================================================
+-- Propósito: el menú público reserva el espacio de cada foto (width /
+-- height) y muestra un placeholder inline (color dominante + LQIP en
+-- base64) mientras carga, sin requests extra.
+--
+-- imagenes_meta: metadatos calculados al subir, por URL (sha1). Las
+-- subidas ocurren antes de guardar el plato; al guardar, los platos y
+-- sus galerías copian los metadatos de su URL (image_placeholders.py).
+-- ============================================================
+
+CREATE TABLE IF NOT EXISTS imagenes_meta (
+    url_hash CHAR(40) NOT NULL PRIMARY KEY,    -- SHA1(url)
+    url VARCHAR(500) NOT NULL,
+    ancho SMALLINT UNSIGNED NOT NULL,
+    alto SMALLINT UNSIGNED NOT NULL,
+    color CHAR(7) NULL DEFAULT NULL,           -- #rrggbb
+    lqip VARCHAR(1024) NULL DEFAULT NULL,      -- data:image/...;base64,...
+    created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_unicode_ci;
+
+ALTER TABLE platos
+    ADD COLUMN imagen_ancho SMALLINT UNSIGNED NULL DEFAULT NULL AFTER imagen_public_id,
+    ADD COLUMN imagen_alto SMALLINT UNSIGNED NULL DEFAULT NULL AFTER imagen_ancho,
+    ADD COLUMN imagen_color CHAR(7) NULL DEFAULT NULL AFTER imagen_alto,
+    ADD COLUMN imagen_lqip VARCHAR(1024) NULL DEFAULT NULL AFTER imagen_color;
+
+ALTER TABLE platos_imagenes
+    ADD COLUMN imagen_ancho SMALLINT UNSIGNED NULL DEFAULT NULL AFTER imagen_public_id,
+    ADD COLUMN imagen_alto SMALLINT UNSIGNED NULL DEFAULT NULL AFTER imagen_ancho,
+    ADD COLUMN imagen_color CHAR(7) NULL DEFAULT NULL AFTER imagen_alto,
+    ADD COLUMN imagen_lqip VARCHAR(1024) NULL DEFAULT NULL AFTER imagen_color;
@@ -0,0 +1,155 @@
+# ============================================================
+# RETENCIÓN - Purga y archivado de la tabla `visitas`
+# ============================================================
+# `visitas` guarda una fila por hit y nunca se limpiaba. Los dashboards
+# ya leen solo rollups (analytics.py), así que el detalle crudo solo se
+# necesita por un tiempo limitado.
+#
+# Estrategia: tabla de archivo en disco (CSV gzip por mes) + purga por
+# chunks pequeños. Se descartó el particionado RANGE mensual porque
+# InnoDB no soporta FOREIGN KEY en tablas particionadas y `visitas`
+# tiene FK a restaurantes; además la PK tendría que incluir `fecha`.
+#
+# Cada chunk:
+#   1. SELECT ... WHERE fecha < corte ORDER BY fecha, id LIMIT n
+#      (usa idx_visitas_fecha_sola de la migración 013)
+#   2. Append al archivo visitas-YYYY-MM.csv.gz (fsync)
+#   3. DELETE ... WHERE id IN (...) + COMMIT  -> locks cortos
+#   4. Pausa breve para no saturar el buffer pool / la replicación
+# ============================================================
+
+import csv
+import gzip
+import io
+import os
+import time
+import logging
+from datetime import date, datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+RETENCION_DIAS_DEFAULT = int(os.environ.get('VISITAS_RETENCION_DIAS', 180))
+CHUNK_SIZE_DEFAULT = 2000
+PAUSA_DEFAULT = 0.2  # segundos entre chunks
+ARCHIVO_DIR_DEFAULT = os.environ.get(
+    'VISITAS_ARCHIVO_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), 'archivos', 'visitas')
+)
+
+COLUMNAS_ARCHIVO = ('id', 'restaurante_id', 'ip_address', 'user_agent', 'referer', 'es_movil', 'es_qr', 'fecha')
+
+
+def fecha_corte(dias, hoy=None):
+    """Primer instante que se conserva: medianoche de (hoy - dias)."""
+    hoy = hoy or date.today()
+    return datetime.combine(hoy - timedelta(days=dias), datetime.min.time())
+
+
+def _mes(valor):
+    if hasattr(valor, 'strftime'):
+        return valor.strftime('%Y-%m')
+    return str(valor)[:7]
+
+
+def exportar_chunk(rows, archivo_dir):
+    """
+    Agrega las filas a archivos CSV gzip agrupados por mes.
+    gzip admite varios miembros concatenados, por lo que el append es seguro.
+
+    Returns:
+        list: rutas de los archivos escritos
+    """
+    os.makedirs(archivo_dir, exist_ok=True)
+    por_mes = {}
+    for r in rows:
+        por_mes.setdefault(_mes(r['fecha']), []).append(r)
+
+    rutas = []
+    for mes, filas in sorted(por_mes.items()):
+        ruta = os.path.join(archivo_dir, f'visitas-{mes}.csv.gz')
+        nuevo = not os.path.exists(ruta)
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        if nuevo:
+            writer.writerow(COLUMNAS_ARCHIVO)
+        for r in filas:
+            writer.writerow([r.get(c) for c in COLUMNAS_ARCHIVO])
+        with open(ruta, 'ab') as raw:
+            with gzip.GzipFile(fileobj=raw, mode='ab') as gz:
+                gz.write(buf.getvalue().encode('utf-8'))
+            raw.flush()
+            os.fsync(raw.fileno())
+        rutas.append(ruta)
+    return rutas
+
+
+def purgar_visitas(db, dias=RETENCION_DIAS_DEFAULT, chunk_size=CHUNK_SIZE_DEFAULT,
+                   archivo_dir=ARCHIVO_DIR_DEFAULT, pausa=PAUSA_DEFAULT,
+                   max_chunks=None, exportar=True, dry_run=False):
+    """
+    Exporta y elimina visitas anteriores a `dias` días en chunks pequeños.
+
+    Args:
+        db: conexión PyMySQL (DictCursor)
+        dias: días de detalle crudo a conservar
+        chunk_size: filas por DELETE (mantener bajo para locks cortos)
+        archivo_dir: directorio de los CSV gzip
+        pausa: segundos de espera entre chunks
+        max_chunks: límite de chunks por ejecución (None = hasta terminar)
+        exportar: si es False se elimina sin archivar
+        dry_run: solo cuenta las filas candidatas
+
+    Returns:
+        dict: {'corte', 'filas_eliminadas', 'chunks', 'archivos'}
+    """
+    corte = fecha_corte(dias)
+    resultado = {'corte': corte.isoformat(), 'filas_eliminadas': 0, 'chunks': 0, 'archivos': []}
+
+    if dry_run:
+        with db.cursor() as cur:
+            cur.execute("SELECT COUNT(*) as total FROM visitas WHERE fecha < %s", (corte,))
+            row = cur.fetchone()
+            resultado['candidatas'] = int(row['total']) if row and row['total'] else 0
+        return resultado
+
+    archivos = set()
+    while max_chunks is None or resultado['chunks'] < max_chunks:
+        with db.cursor() as cur:
+            # user_agent/referer viven en tablas diccionario (migración 018);
+            # COALESCE mantiene legibles las filas anteriores a la codificación
+            cur.execute('''
+                SELECT v.id, v.restaurante_id, v.ip_address,
+                    COALESCE(ua.user_agent, v.user_agent) as user_agent,
+                    COALESCE(rf.referer, v.referer) as referer,
+                    v.es_movil, v.es_qr, v.fecha
+                FROM visitas v
+                LEFT JOIN user_agents ua ON ua.id = v.user_agent_id
+                LEFT JOIN referers rf ON rf.id = v.referer_id
+                WHERE v.fecha < %s
+                ORDER BY v.fecha, v.id
+                LIMIT %s
+            ''', (corte, chunk_size))
+            rows = cur.fetchall()
+            if not rows:
+                break
+
+            # Archivar ANTES de borrar: si la exportación falla no se pierde nada
+            if exportar:
+                archivos.update(exportar_chunk(rows, archivo_dir))
+
+            ids = [r['id'] for r in rows]
+            placeholders = ','.join(['%s'] * len(ids))
+            cur.execute(f"DELETE FROM visitas WHERE id IN ({placeholders})", ids)
+            db.commit()
+
+        resultado['filas_eliminadas'] += len(rows)
+        resultado['chunks'] += 1
+        logger.info("Purga visitas: chunk %d, %d filas (corte %s)", resultado['chunks'], len(rows), corte)
+
+        if len(rows) < chunk_size:
+            break
+        if pausa:
+            time.sleep(pausa)
+
+    resultado['archivos'] = sorted(archivos)
+    return resultado
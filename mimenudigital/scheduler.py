@@ -0,0 +1,324 @@
+# ============================================================
+# SCHEDULER - Jobs periódicos de mantenimiento
+# ============================================================
+# Registro de jobs con nombre y programación por intervalo (cada=N
+# segundos) o cron de 5 campos ("min hora dia mes dia_semana").
+#
+# Coordinación entre procesos (workers web, always-on task, scheduled
+# task de PythonAnywhere): cada job tiene una fila en
+# `jobs_programados` (migración 022) que actúa como lease. Un proceso
+# solo ejecuta el job si logra el UPDATE condicional
+#     lease libre/expirado AND proxima_ejecucion <= ahora
+# así que aunque varios procesos hagan tick a la vez, corre uno solo.
+# Cada ejecución queda en `jobs_historial` (duración, estado, error).
+#
+# Uso:
+#     scheduler = Scheduler(app)
+#
+#     @scheduler.job('limpiar_tokens', cada=3600)
+#     def limpiar_tokens():
+#         ...
+#
+#     scheduler.ejecutar_pendientes()   # un tick (scheduled task)
+#     scheduler.bucle()                 # loop (always-on task / thread)
+# ============================================================
+
+import json
+import logging
+import os
+import socket
+import threading
+from datetime import datetime, timedelta
+
+from database import get_connection
+
+logger = logging.getLogger(__name__)
+
+TICK_DEFAULT = 30            # Segundos entre ticks del loop
+LEASE_DEFAULT = 600          # Segundos que un worker retiene un job en ejecución
+HISTORIAL_DIAS_DEFAULT = 30  # Días de historial a conservar
+
+
+# ============================================================
+# CRON
+# ============================================================
+
+class CronSpec:
+    """
+    Expresión cron de 5 campos: minuto hora día mes día_semana.
+    Soporta '*', números, listas (1,15), rangos (1-5) y pasos (*/10, 8-18/2).
+    día_semana: 0-6 con 0 = domingo (7 también es domingo).
+    """
+
+    _RANGOS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expr):
+        partes = expr.split()
+        if len(partes) != 5:
+            raise ValueError(f"Expresión cron inválida (se esperan 5 campos): {expr!r}")
+        self.expr = expr
+        campos = [self._parse(p, lo, hi) for p, (lo, hi) in zip(partes, self._RANGOS)]
+        self.minutos, self.horas, self.dias, self.meses, dows = campos
+        self.dias_semana = {d % 7 for d in dows}
+        self._dia_libre = partes[2] == '*'
+        self._dow_libre = partes[4] == '*'
+
+    @staticmethod
+    def _parse(campo, lo, hi):
+        valores = set()
+        for parte in campo.split(','):
+            paso = 1
+            if '/' in parte:
+                parte, paso_str = parte.split('/', 1)
+                paso = int(paso_str)
+                if paso <= 0:
+                    raise ValueError(f"Paso cron inválido: {campo!r}")
+            if parte == '*':
+                ini, fin = lo, hi
+            elif '-' in parte:
+                ini, fin = (int(x) for x in parte.split('-', 1))
+            else:
+                ini = int(parte)
+                fin = hi if paso > 1 else ini
+            if ini < lo or fin > hi or ini > fin:
+                raise ValueError(f"Valor cron fuera de rango: {campo!r}")
+            valores.update(range(ini, fin + 1, paso))
+        return valores
+
+    def _dia_coincide(self, dt):
+        dia_ok = dt.day in self.dias
+        dow_ok = (dt.weekday() + 1) % 7 in self.dias_semana
+        # Semántica cron clásica: si ambos campos están restringidos basta con uno
+        if self._dia_libre or self._dow_libre:
+            return dia_ok and dow_ok
+        return dia_ok or dow_ok
+
+    def siguiente(self, desde):
+        """Primer instante (resolución de minuto) estrictamente posterior a `desde`."""
+        dt = desde.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limite = dt + timedelta(days=366 * 5)
+        while dt < limite:
+            if dt.month not in self.meses:
+                dt = (dt.replace(day=1, hour=0, minute=0) + timedelta(days=32)).replace(day=1)
+                continue
+            if not self._dia_coincide(dt):
+                dt = dt.replace(hour=0, minute=0) + timedelta(days=1)
+                continue
+            if dt.hour not in self.horas:
+                dt = dt.replace(minute=0) + timedelta(hours=1)
+                continue
+            if dt.minute not in self.minutos:
+                dt += timedelta(minutes=1)
+                continue
+            return dt
+        raise ValueError(f"La expresión cron nunca se cumple: {self.expr!r}")
+
+
+# ============================================================
+# JOBS Y SCHEDULER
+# ============================================================
+
+class Job:
+    """Job registrado: función sin argumentos + programación."""
+
+    def __init__(self, nombre, funcion, cada=None, cron=None, lease=LEASE_DEFAULT, descripcion=''):
+        if (cada is None) == (cron is None):
+            raise ValueError(f"Job {nombre!r}: indicar exactamente uno de `cada` o `cron`")
+        self.nombre = nombre
+        self.funcion = funcion
+        self.cada = int(cada) if cada is not None else None
+        self.cron = CronSpec(cron) if cron else None
+        self.lease = int(lease)
+        self.descripcion = descripcion or (funcion.__doc__ or '').strip().split('\n')[0]
+
+    @property
+    def programacion(self):
+        return f"cada {self.cada}s" if self.cada else f"cron {self.cron.expr}"
+
+    def siguiente(self, desde):
+        if self.cron:
+            return self.cron.siguiente(desde)
+        return desde + timedelta(seconds=self.cada)
+
+    def primera(self, ahora):
+        """Primera ejecución al registrar el job: los cron esperan su horario (no corren al desplegar)."""
+        return self.siguiente(ahora) if self.cron else ahora
+
+
+class Scheduler:
+    """Registro de jobs con lease en BD para que cada job corra en un solo worker."""
+
+    def __init__(self, app=None, worker_id=None):
+        self.app = app
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}"
+        self._jobs = {}
+        self._stop = threading.Event()
+
+    def job(self, nombre, cada=None, cron=None, lease=LEASE_DEFAULT, descripcion=''):
+        """Decorador para registrar un job."""
+        def decorator(funcion):
+            self.registrar(nombre, funcion, cada=cada, cron=cron, lease=lease, descripcion=descripcion)
+            return funcion
+        return decorator
+
+    def registrar(self, nombre, funcion, cada=None, cron=None, lease=LEASE_DEFAULT, descripcion=''):
+        self._jobs[nombre] = Job(nombre, funcion, cada=cada, cron=cron, lease=lease, descripcion=descripcion)
+        return self._jobs[nombre]
+
+    def jobs(self):
+        return list(self._jobs.values())
+
+    # ---------------- lease ----------------
+
+    def _tomar_lease(self, job, ahora, forzar=False):
+        """Intenta tomar el lease del job. Devuelve True si este worker debe ejecutarlo."""
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    INSERT IGNORE INTO jobs_programados (nombre, proxima_ejecucion)
+                    VALUES (%s, %s)
+                ''', (job.nombre, job.primera(ahora)))
+                cur.execute(f'''
+                    UPDATE jobs_programados
+                    SET lease_owner = %s, lease_hasta = %s
+                    WHERE nombre = %s
+                    AND (lease_hasta IS NULL OR lease_hasta < %s)
+                    {'' if forzar else 'AND (proxima_ejecucion IS NULL OR proxima_ejecucion <= %s)'}
+                ''', (self.worker_id, ahora + timedelta(seconds=job.lease), job.nombre, ahora)
+                    + (() if forzar else (ahora,)))
+                tomado = cur.rowcount == 1
+            conn.commit()
+        return tomado
+
+    def _liberar_lease(self, job, inicio, fin, estado, error, resultado):
+        duracion_ms = int((fin - inicio).total_seconds() * 1000)
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    UPDATE jobs_programados
+                    SET lease_owner = NULL, lease_hasta = NULL,
+                        ultima_ejecucion = %s, proxima_ejecucion = %s,
+                        ultimo_estado = %s, ultimo_error = %s, ultima_duracion_ms = %s,
+                        ejecuciones = ejecuciones + 1, fallos = fallos + %s
+                    WHERE nombre = %s AND lease_owner = %s
+                ''', (inicio, job.siguiente(fin), estado, error, duracion_ms,
+                      1 if estado == 'error' else 0, job.nombre, self.worker_id))
+                cur.execute('''
+                    INSERT INTO jobs_historial (nombre, worker, inicio, fin, duracion_ms, estado, error, resultado)
+                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s)
+                ''', (job.nombre, self.worker_id, inicio, fin, duracion_ms, estado, error, resultado))
+            conn.commit()
+        return duracion_ms
+
+    # ---------------- ejecución ----------------
+
+    def _invocar(self, job):
+        if self.app is not None:
+            with self.app.app_context():
+                return job.funcion()
+        return job.funcion()
+
+    def ejecutar(self, nombre, forzar=False):
+        """
+        Ejecuta un job si le corresponde (o siempre con forzar=True, respetando el lease).
+
+        Returns:
+            dict | None: {'nombre', 'estado', 'duracion_ms', 'error'} o None si no se ejecutó
+        """
+        job = self._jobs[nombre]
+        ahora = datetime.now()
+        if not self._tomar_lease(job, ahora, forzar=forzar):
+            return None
+
+        inicio = datetime.now()
+        estado, error, resultado = 'ok', None, None
+        try:
+            salida = self._invocar(job)
+            if salida is not None:
+                resultado = json.dumps(salida, default=str)[:2000]
+        except Exception as e:
+            estado, error = 'error', str(e)[:1000]
+            logger.exception("Job %s failed", nombre)
+        fin = datetime.now()
+
+        try:
+            duracion_ms = self._liberar_lease(job, inicio, fin, estado, error, resultado)
+        except Exception as e:
+            # El lease expira solo; el job se reintentará en el próximo tick libre
+            logger.error("Could not record run of job %s: %s", nombre, e)
+            duracion_ms = int((fin - inicio).total_seconds() * 1000)
+
+        logger.info("Job %s finished: %s in %dms", nombre, estado, duracion_ms)
+        return {'nombre': nombre, 'estado': estado, 'duracion_ms': duracion_ms, 'error': error}
+
+    def ejecutar_pendientes(self):
+        """Un tick: ejecuta los jobs vencidos. Pensado para una scheduled task."""
+        resultados = []
+        for nombre in list(self._jobs):
+            try:
+                r = self.ejecutar(nombre)
+            except Exception as e:
+                logger.warning("Scheduler tick failed for job %s: %s", nombre, e)
+                continue
+            if r:
+                resultados.append(r)
+        return resultados
+
+    def bucle(self, tick=TICK_DEFAULT):
+        """Loop de ticks hasta detener(). Pensado para una always-on task o un thread."""
+        logger.info("Scheduler loop started (worker=%s, tick=%ss, jobs=%s)",
+                    self.worker_id, tick, ', '.join(self._jobs))
+        while not self._stop.is_set():
+            self.ejecutar_pendientes()
+            self._stop.wait(tick)
+
+    def detener(self):
+        self._stop.set()
+
+    # ---------------- métricas ----------------
+
+    def estado(self, limite_historial=30):
+        """Estado de cada job registrado + historial reciente (para la vista del superadmin)."""
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute('''
+                    SELECT nombre, lease_owner, lease_hasta, ultima_ejecucion, proxima_ejecucion,
+                        ultimo_estado, ultimo_error, ultima_duracion_ms, ejecuciones, fallos
+                    FROM jobs_programados
+                ''')
+                filas = {r['nombre']: r for r in cur.fetchall()}
+                cur.execute('''
+                    SELECT nombre, worker, inicio, duracion_ms, estado, error
+                    FROM jobs_historial
+                    ORDER BY id DESC
+                    LIMIT %s
+                ''', (limite_historial,))
+                historial = cur.fetchall()
+
+        jobs = []
+        for job in self._jobs.values():
+            fila = filas.get(job.nombre) or {}
+            jobs.append({
+                'nombre': job.nombre,
+                'descripcion': job.descripcion,
+                'programacion': job.programacion,
+                'en_ejecucion': bool(fila.get('lease_hasta') and fila['lease_hasta'] > datetime.now()),
+                'lease_owner': fila.get('lease_owner'),
+                'ultima_ejecucion': fila.get('ultima_ejecucion'),
+                'proxima_ejecucion': fila.get('proxima_ejecucion'),
+                'ultimo_estado': fila.get('ultimo_estado'),
+                'ultimo_error': fila.get('ultimo_error'),
+                'ultima_duracion_ms': fila.get('ultima_duracion_ms'),
+                'ejecuciones': int(fila.get('ejecuciones') or 0),
+                'fallos': int(fila.get('fallos') or 0),
+            })
+        return {'worker': self.worker_id, 'jobs': jobs, 'historial': list(historial)}
+
+    def limpiar_historial(self, dias=HISTORIAL_DIAS_DEFAULT):
+        with get_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("DELETE FROM jobs_historial WHERE inicio < %s",
+                            (datetime.now() - timedelta(days=dias),))
+                eliminados = cur.rowcount
+            conn.commit()
+        return {'eliminados': eliminados}
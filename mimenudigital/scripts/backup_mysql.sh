@@ -1,6 +1,9 @@
 #!/usr/bin/env bash
 # Small helper script to create a MySQL dump. Configure environment variables in your host:
 # MYSQL_HOST, MYSQL_USER, MYSQL_PASSWORD, MYSQL_DB
+# Optional: BACKUP_SKIP_VISITAS_DATA=1 dumps only the structure of `visitas`.
+#   Raw visits are archived to CSV gzip by scripts/purge_visitas.py and the
+#   aggregates live in estadisticas_*, so the big table can be left out.
 # Example usage (PythonAnywhere):
 # ~/envs/mimenudigital/bin/python -c "import os; print(os.getenv('MYSQL_HOST'))"
 
@@ -25,7 +28,14 @@ fi
 export MYSQL_PWD="${MYSQL_PASSWORD:-}"
 
 echo "Creating DB dump to $DUMP_FILE"
-mysqldump -h "$MYSQL_HOST" -u "$MYSQL_USER" "$MYSQL_DB" | gzip > "$DUMP_FILE"
+if [ "${BACKUP_SKIP_VISITAS_DATA:-0}" = "1" ]; then
+  {
+    mysqldump --single-transaction -h "$MYSQL_HOST" -u "$MYSQL_USER" --ignore-table="$MYSQL_DB.visitas" "$MYSQL_DB"
+    mysqldump --single-transaction -h "$MYSQL_HOST" -u "$MYSQL_USER" --no-data "$MYSQL_DB" visitas
+  } | gzip > "$DUMP_FILE"
+else
+  mysqldump --single-transaction -h "$MYSQL_HOST" -u "$MYSQL_USER" "$MYSQL_DB" | gzip > "$DUMP_FILE"
+fi
 if [ $? -eq 0 ]; then
   echo "Backup saved to $DUMP_FILE"
 else
@@ -2,18 +2,23 @@
 """
 Worker script to process records in `imagenes_pendientes`.
 Usage:
-    python scripts/process_pending_images.py [--limit N] [--max-attempts M] [--dry-run]
-
-It will attempt to upload local files to Cloudinary and update the record, set status to 'uploaded' on success
-or increment attempts and set status to 'failed' after max attempts. It logs progress and returns non-zero
-code on unrecoverable errors.
+    python scripts/process_pending_images.py [--limit N] [--max-attempts M] [--workers W] [--dry-run]
+    python scripts/process_pending_images.py --daemon [--interval S]   # always-on task
+
+Each run claims a batch of due rows (status 'pending' and next_attempt_at reached)
+with a claim token, so several processes can drain the queue at the same time,
+and uploads them on a bounded thread pool (see image_jobs.PipelineImagenes).
+Failed uploads go back to 'pending' with exponential backoff, or to 'failed'
+after max attempts. Per-item timings are stored in `duracion_ms` and logged.
+Returns a non-zero code on unrecoverable errors.
 """
-import os
 import sys
 import argparse
 import logging
-import time
+import signal
+import threading
 
+from contextlib import contextmanager
 from pathlib import Path
 
 # Make sure we can import app context
@@ -21,93 +26,88 @@ PROJECT_ROOT = Path(__file__).resolve().parents[1]
 sys.path.insert(0, str(PROJECT_ROOT))
 
 import app_menu as app_menu_mod
+from image_jobs import PipelineImagenes, IMAGE_UPLOAD_WORKERS
 
 logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
 logger = logging.getLogger('process_pending_images')
 
 DEFAULT_MAX_ATTEMPTS = 5
+DEFAULT_INTERVAL = 30
+
+
+@contextmanager
+def _connection():
+    # One app context per call: each worker thread gets its own pooled
+    # connection, released by the app's teardown.
+    with app_menu_mod.app.app_context():
+        yield app_menu_mod.get_db()
+
 
+def _build_pipeline(workers):
+    return PipelineImagenes(
+        app_menu_mod.app,
+        subir=lambda archivo, **opciones: app_menu_mod.cloudinary_upload(archivo, **opciones),
+        invalidar=app_menu_mod.invalidar_cache_restaurante,
+        max_workers=workers,
+        conexion=_connection,
+    )
 
-def process(limit=50, max_attempts=DEFAULT_MAX_ATTEMPTS, dry_run=False):
+
+def _cloudinary_ready():
     # Attempt to initialize Cloudinary at runtime to be test-friendly
     try:
         app_menu_mod.init_cloudinary()
     except Exception as e:
         logger.debug('init_cloudinary failed: %s', e)
+    return app_menu_mod.CLOUDINARY_AVAILABLE and app_menu_mod.CLOUDINARY_CONFIGURED
+
 
-    if not app_menu_mod.CLOUDINARY_AVAILABLE or not app_menu_mod.CLOUDINARY_CONFIGURED:
+def process(limit=50, max_attempts=DEFAULT_MAX_ATTEMPTS, dry_run=False, workers=IMAGE_UPLOAD_WORKERS):
+    """Bounded run: process one batch of up to `limit` due rows and exit."""
+    if not _cloudinary_ready():
         logger.error('Cloudinary not available or not configured. Aborting.')
         return 2
 
-    db = app_menu_mod.get_db()
-    processed = 0
-
+    pipeline = _build_pipeline(workers)
     try:
-        with db.cursor() as cur:
-            cur.execute("SELECT id, restaurante_id, plato_id, local_path, source_url, attempts, status FROM imagenes_pendientes WHERE status = 'pending' ORDER BY created_at ASC LIMIT %s", (limit,))
-            rows = cur.fetchall()
-
-            for row in rows:
-                pid = row['id']
-                restaurante_id = row['restaurante_id']
-                local_path = row['local_path']
-                attempts = row.get('attempts', 0) or 0
-
-                logger.info('Processing pending id=%s attempts=%s local_path=%s', pid, attempts, local_path)
-
-                if not os.path.exists(local_path):
-                    logger.warning('Local path missing for pending id=%s. Marking as failed.', pid)
-                    cur.execute("UPDATE imagenes_pendientes SET status=%s, last_error=%s, attempts=%s, updated_at=NOW() WHERE id=%s", ('failed', 'local_file_missing', attempts + 1, pid))
-                    db.commit()
-                    processed += 1
-                    continue
-
-                if attempts >= max_attempts:
-                    logger.warning('Max attempts reached for pending id=%s. Marking as failed.', pid)
-                    cur.execute("UPDATE imagenes_pendientes SET status=%s, last_error=%s, attempts=%s, updated_at=NOW() WHERE id=%s", ('failed', 'max_attempts_exceeded', attempts, pid))
-                    db.commit()
-                    processed += 1
-                    continue
-
-                if dry_run:
-                    logger.info('Dry-run: would attempt upload for pending id=%s', pid)
-                    continue
-
-                try:
-                    with open(local_path, 'rb') as fh:
-                        result = app_menu_mod.cloudinary_upload(fh, folder=f"mimenudigital/platos/{restaurante_id}", quality='auto', fetch_format='auto', resource_type='auto')
-
-                    public_id = result.get('public_id')
-                    secure_url = result.get('secure_url')
-
-                    if not public_id or not secure_url:
-                        raise Exception('Cloudinary did not return public_id or secure_url')
-
-                    # Update imagenes_pendientes
-                    cur.execute("UPDATE imagenes_pendientes SET status=%s, attempts=%s, public_id=%s, url=%s, updated_at=NOW() WHERE id=%s", ('uploaded', attempts + 1, public_id, secure_url, pid))
-
-                    # If it has a plato_id, update platos table imagen_public_id and imagen_url
-                    cur.execute("SELECT plato_id FROM imagenes_pendientes WHERE id=%s", (pid,))
-                    res = cur.fetchone()
-                    plato_id = res.get('plato_id') if res else None
-                    if plato_id:
-                        cur.execute("UPDATE platos SET imagen_public_id=%s, imagen_url=%s WHERE id=%s", (public_id, secure_url, plato_id))
-
-                    db.commit()
-                    logger.info('Uploaded pending id=%s -> public_id=%s', pid, public_id)
-                    processed += 1
-
-                except Exception as e:
-                    logger.exception('Error processing pending id=%s: %s', pid, e)
-                    cur.execute("UPDATE imagenes_pendientes SET attempts=%s, last_error=%s, updated_at=NOW() WHERE id=%s", (attempts + 1, str(e), pid))
-                    db.commit()
-                    processed += 1
-
+        if dry_run:
+            logger.info('Dry-run: %s pending rows are due', pipeline.contar_pendientes(max_intentos=max_attempts))
+            return 0
+        summary = pipeline.procesar_pendientes(limite=limit, max_intentos=max_attempts)
     except Exception as ex:
         logger.exception('Fatal error during processing: %s', ex)
         return 1
+    finally:
+        pipeline.cerrar()
 
-    logger.info('Processing complete, processed=%s', processed)
+    logger.info('Processing complete: %s', summary)
+    return 0
+
+
+def run_daemon(limit=50, max_attempts=DEFAULT_MAX_ATTEMPTS, workers=IMAGE_UPLOAD_WORKERS, interval=DEFAULT_INTERVAL):
+    """Long-lived loop: drain due batches back to back, sleep `interval` when idle."""
+    if not _cloudinary_ready():
+        logger.error('Cloudinary not available or not configured. Aborting.')
+        return 2
+
+    stop = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *a: stop.set())
+    pipeline = _build_pipeline(workers)
+    logger.info('Daemon started (workers=%s, limit=%s, interval=%ss)', workers, limit, interval)
+    try:
+        while not stop.is_set():
+            try:
+                summary = pipeline.procesar_pendientes(limite=limit, max_intentos=max_attempts)
+            except Exception as ex:
+                logger.exception('Batch failed: %s', ex)
+                summary = {'reclamados': 0}
+            if not summary['reclamados']:
+                stop.wait(interval)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        pipeline.cerrar()
+    logger.info('Daemon stopped')
     return 0
 
 
@@ -115,6 +115,11 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description='Process pending Cloudinary uploads')
     parser.add_argument('--limit', type=int, default=50)
     parser.add_argument('--max-attempts', type=int, default=DEFAULT_MAX_ATTEMPTS)
+    parser.add_argument('--workers', type=int, default=IMAGE_UPLOAD_WORKERS, help='Concurrent uploads')
     parser.add_argument('--dry-run', action='store_true')
+    parser.add_argument('--daemon', action='store_true', help='Keep running and poll for due rows')
+    parser.add_argument('--interval', type=int, default=DEFAULT_INTERVAL, help='Seconds to sleep when idle (daemon)')
     args = parser.parse_args()
-    sys.exit(process(limit=args.limit, max_attempts=args.max_attempts, dry_run=args.dry_run))
\ No newline at end of file
+    if args.daemon:
+        sys.exit(run_daemon(limit=args.limit, max_attempts=args.max_attempts, workers=args.workers, interval=args.interval))
+    sys.exit(process(limit=args.limit, max_attempts=args.max_attempts, dry_run=args.dry_run, workers=args.workers))
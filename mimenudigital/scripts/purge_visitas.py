@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Retention job for the `visitas` table.
+Usage:
+    python scripts/purge_visitas.py [--days N] [--chunk-size N] [--max-chunks N] [--no-export] [--dry-run]
+
+Exports visits older than the retention window to monthly CSV gzip files
+(VISITAS_ARCHIVO_DIR) and deletes them in small chunks so locks stay short.
+Aggregates in estadisticas_* are not touched. Suitable for a PythonAnywhere
+scheduled task (daily, off-peak).
+"""
+import sys
+import argparse
+import logging
+
+from pathlib import Path
+
+# Make sure we can import app context
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import app_menu as app_menu_mod  # noqa: F401  (configures the connection pool)
+import retention
+from database import get_connection
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('purge_visitas')
+
+
+def run(days=retention.RETENCION_DIAS_DEFAULT, chunk_size=retention.CHUNK_SIZE_DEFAULT,
+        max_chunks=None, export=True, dry_run=False):
+    try:
+        # Pooled connection without a Flask app context (get_db() needs one)
+        with get_connection() as db:
+            result = retention.purgar_visitas(
+                db, dias=days, chunk_size=chunk_size, max_chunks=max_chunks,
+                exportar=export, dry_run=dry_run
+            )
+    except Exception as ex:
+        logger.exception('Fatal error during visitas purge: %s', ex)
+        return 1
+
+    logger.info('Purge complete: %s', result)
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Archive and purge old rows from visitas')
+    parser.add_argument('--days', type=int, default=retention.RETENCION_DIAS_DEFAULT)
+    parser.add_argument('--chunk-size', type=int, default=retention.CHUNK_SIZE_DEFAULT)
+    parser.add_argument('--max-chunks', type=int, default=None)
+    parser.add_argument('--no-export', action='store_true')
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+    sys.exit(run(days=args.days, chunk_size=args.chunk_size, max_chunks=args.max_chunks,
+                 export=not args.no_export, dry_run=args.dry_run))
@@ -0,0 +1,71 @@
+#!/usr/bin/env python3
+"""
+Entry point for the maintenance job scheduler.
+Usage:
+    python scripts/run_scheduler.py            # loop (PythonAnywhere always-on task)
+    python scripts/run_scheduler.py --once     # single tick (scheduled task, e.g. hourly)
+    python scripts/run_scheduler.py --job NAME # run one job now
+    python scripts/run_scheduler.py --list     # show registered jobs
+
+Jobs are registered in app_menu (section JOBS PROGRAMADOS). A DB lease in
+`jobs_programados` makes sure each job runs in a single process even when
+web workers (SCHEDULER_EN_WEB=1, off by default) also tick the scheduler.
+"""
+import sys
+import argparse
+import logging
+
+from pathlib import Path
+
+# Make sure we can import app context
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import app_menu as app_menu_mod
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('run_scheduler')
+
+
+def run(once=False, job=None, tick=None, list_jobs=False):
+    scheduler = app_menu_mod.scheduler
+
+    if list_jobs:
+        for j in scheduler.jobs():
+            print(f"{j.nombre:30} {j.programacion:20} {j.descripcion}")
+        return 0
+
+    try:
+        if job:
+            if job not in {j.nombre for j in scheduler.jobs()}:
+                logger.error('Unknown job: %s', job)
+                return 2
+            result = scheduler.ejecutar(job, forzar=True)
+            if result is None:
+                logger.warning('Job %s is already running in another worker', job)
+                return 1
+            logger.info('Job result: %s', result)
+            return 0 if result['estado'] == 'ok' else 1
+
+        if once:
+            results = scheduler.ejecutar_pendientes()
+            logger.info('Tick complete: %d jobs run', len(results))
+            return 1 if any(r['estado'] != 'ok' for r in results) else 0
+
+        scheduler.bucle(tick=tick or app_menu_mod.SCHEDULER_TICK)
+    except KeyboardInterrupt:
+        scheduler.detener()
+    except Exception as ex:
+        logger.exception('Fatal error in scheduler: %s', ex)
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run periodic maintenance jobs')
+    parser.add_argument('--once', action='store_true', help='Run due jobs once and exit')
+    parser.add_argument('--job', default=None, help='Run a single job now')
+    parser.add_argument('--tick', type=int, default=None, help='Seconds between ticks in loop mode')
+    parser.add_argument('--list', action='store_true', help='List registered jobs')
+    args = parser.parse_args()
+    sys.exit(run(once=args.once, job=args.job, tick=args.tick, list_jobs=args.list))
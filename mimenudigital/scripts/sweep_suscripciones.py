@@ -0,0 +1,43 @@
+#!/usr/bin/env python3
+"""
+Daily subscription-state sweep.
+Usage:
+    python scripts/sweep_suscripciones.py
+
+Marks active subscriptions whose fecha_vencimiento has passed as 'vencida'
+and fills restaurantes.estado_efectivo for rows that still have it NULL
+(migration 021 backfills existing rows in SQL). Suitable for a PythonAnywhere scheduled
+task (daily, shortly after midnight).
+"""
+import sys
+import logging
+
+from pathlib import Path
+
+# Make sure we can import app context
+PROJECT_ROOT = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(PROJECT_ROOT))
+
+import app_menu as app_menu_mod  # noqa: F401  (configures the connection pool)
+import subscription_state
+from database import get_connection
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(message)s')
+logger = logging.getLogger('sweep_suscripciones')
+
+
+def run():
+    try:
+        # Pooled connection without a Flask app context (get_db() needs one)
+        with get_connection() as db:
+            result = subscription_state.barrido_vencimientos(db)
+    except Exception as ex:
+        logger.exception('Fatal error during subscription sweep: %s', ex)
+        return 1
+
+    logger.info('Sweep complete: %s', result)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run())
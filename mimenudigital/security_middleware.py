@@ -350,6 +350,7 @@ def gzip_response(response):
     if (response.status_code < 200 or 
         response.status_code >= 300 or
         response.direct_passthrough or
+        response.is_streamed or  # get_data() cargaría el stream completo en memoria
         'gzip' not in request.accept_encodings or
         'Content-Encoding' in response.headers or
         len(response.get_data()) < 500):  # No comprimir respuestas < 500 bytes
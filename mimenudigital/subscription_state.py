@@ -0,0 +1,149 @@
+# ============================================================
+# SUBSCRIPTION STATE - Estado efectivo de suscripción persistido
+# ============================================================
+# El estado "real" de una suscripción depende de estado_suscripcion,
+# plan_id, fecha_vencimiento y activo. Antes se recalculaba en Python
+# recorriendo todos los restaurantes en cada request de estadísticas.
+#
+# Ahora se guarda en restaurantes.estado_efectivo (migración 021,
+# índice (estado_efectivo, fecha_vencimiento)) y se mantiene:
+# - al aprobar un pago (webhook_mercado_pago)
+# - al editar la suscripción desde el superadmin
+# - al crear/editar restaurantes
+# - con un barrido diario: la única transición que ocurre solo por el
+#   paso del tiempo es 'activa' -> 'vencida' al pasar fecha_vencimiento
+#
+# Los conteos pasan a ser GROUP BY estado_efectivo y "por vencer" un
+# rango sobre el mismo índice.
+# ============================================================
+
+import logging
+from datetime import date
+
+logger = logging.getLogger(__name__)
+
+ESTADOS_EFECTIVOS = ('activa', 'prueba', 'gratuito', 'vencida', 'suspendida')
+
+_ESTADOS_PRUEBA = ('prueba', 'trial', 'periodo_prueba')
+_ESTADOS_SUSPENDIDA = ('suspendida', 'suspendido', 'suspended', 'inactiva', 'inactivo', 'cancelada', 'cancelado')
+_ESTADOS_ACTIVA = ('activa', 'activo', 'premium', 'active', 'pagada', 'pagado', 'paid')
+
+
+def clasificar_planes(planes):
+    """
+    Separa los planes en gratuitos y premium según su nombre.
+
+    Returns:
+        tuple: (ids_premium, ids_gratuitos)
+    """
+    premium, gratuitos = [], []
+    for p in planes:
+        nombre = (p.get('nombre') or '').lower()
+        if 'gratis' in nombre or 'gratuito' in nombre or 'free' in nombre:
+            gratuitos.append(p['id'])
+        else:
+            premium.append(p['id'])
+    return premium, gratuitos
+
+
+def calcular_estado_efectivo(r, planes_premium, planes_gratuitos, hoy=None):
+    """Determina el estado real de suscripción de un restaurante."""
+    hoy = hoy or date.today()
+    estado = (r.get('estado_suscripcion') or '').lower().strip()
+    plan_id = r.get('plan_id')
+    fecha_venc = r.get('fecha_vencimiento')
+    activo = r.get('activo', 1)
+
+    if fecha_venc and hasattr(fecha_venc, 'date'):
+        fecha_venc = fecha_venc.date()
+
+    es_plan_premium = plan_id in planes_premium if planes_premium else bool(plan_id and plan_id > 1)
+
+    # Si está explícitamente marcado como prueba/trial
+    if estado in _ESTADOS_PRUEBA:
+        return 'prueba'
+
+    # Si está suspendido/inactivo
+    if estado in _ESTADOS_SUSPENDIDA or activo == 0:
+        return 'suspendida'
+
+    # Plan premium: manda la fecha de vencimiento
+    if es_plan_premium and fecha_venc and fecha_venc >= hoy:
+        return 'activa'
+    if es_plan_premium and fecha_venc and fecha_venc < hoy:
+        return 'vencida'
+
+    # Si está marcado como activo explícitamente
+    if estado in _ESTADOS_ACTIVA:
+        return 'activa'
+
+    # Plan gratuito
+    if not es_plan_premium or plan_id in planes_gratuitos:
+        return 'gratuito'
+
+    return 'activa'
+
+
+def cargar_planes(cur):
+    cur.execute("SELECT id, nombre FROM planes")
+    return clasificar_planes(cur.fetchall() or [])
+
+
+def _recalcular(cur, where, params, hoy):
+    cur.execute(f'''
+        SELECT id, plan_id, estado_suscripcion, fecha_vencimiento, activo, estado_efectivo
+        FROM restaurantes
+        WHERE {where}
+    ''', params)
+    rows = cur.fetchall() or []
+    if not rows:
+        return 0
+
+    premium, gratuitos = cargar_planes(cur)
+    cambios = []
+    for r in rows:
+        nuevo = calcular_estado_efectivo(r, premium, gratuitos, hoy)
+        if nuevo != r.get('estado_efectivo'):
+            cambios.append((nuevo, r['id']))
+
+    if cambios:
+        cur.executemany("UPDATE restaurantes SET estado_efectivo = %s WHERE id = %s", cambios)
+    return len(cambios)
+
+
+def recalcular_estado_efectivo(cur, restaurante_ids, hoy=None):
+    """
+    Recalcula y guarda estado_efectivo de los restaurantes indicados.
+    No hace commit: se llama dentro de la transacción que modificó la suscripción.
+
+    Returns:
+        int: filas cuyo estado cambió
+    """
+    ids = [int(i) for i in restaurante_ids if i]
+    if not ids:
+        return 0
+    placeholders = ','.join(['%s'] * len(ids))
+    return _recalcular(cur, f"id IN ({placeholders})", ids, hoy or date.today())
+
+
+def barrido_vencimientos(db, hoy=None):
+    """
+    Barrido diario: marca como vencidas las suscripciones activas cuya
+    fecha ya pasó y completa las filas sin estado_efectivo (backfill de
+    la migración 021 o restaurantes creados por otra vía).
+
+    Returns:
+        dict: {'actualizados': n}
+    """
+    hoy = hoy or date.today()
+    with db.cursor() as cur:
+        actualizados = _recalcular(
+            cur,
+            "(estado_efectivo = 'activa' AND fecha_vencimiento < %s) OR estado_efectivo IS NULL",
+            (hoy,),
+            hoy
+        )
+    db.commit()
+    if actualizados:
+        logger.info("Subscription sweep: %d restaurants updated", actualizados)
+    return {'actualizados': actualizados}
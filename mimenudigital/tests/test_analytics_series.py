@@ -0,0 +1,105 @@
+from datetime import date, timedelta
+
+import pytest
+
+from analytics import buckets, granularidad_efectiva, serie_temporal
+from hyperloglog import HyperLogLog
+
+HOY = date(2026, 3, 11)  # miércoles
+
+
+class FakeCache:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ttl=None):
+        self.data[key] = value
+
+
+class FakeRollupCursor:
+    """estadisticas_diarias con 1 visita por día y sketches con 2 visitantes fijos por día."""
+
+    def __init__(self):
+        self.queries = []
+        self._rows = []
+
+    def execute(self, query, params=None):
+        rid, desde, hasta = params
+        self.queries.append((query, desde, hasta))
+        dias = [desde + timedelta(days=i) for i in range((hasta - desde).days + 1)]
+        if 'FROM estadisticas_unicos' in query:
+            blobs = []
+            for d in dias:
+                h = HyperLogLog()
+                h.add('a')
+                h.add(d.isoformat())
+                blobs.append({'fecha': d, 'hll': h.to_bytes(), 'unicos': 2})
+            self._rows = blobs
+        else:
+            self._rows = [{'fecha': d, 'visitas': 1, 'escaneos': 0} for d in dias]
+
+    def fetchall(self):
+        return self._rows
+
+
+def test_buckets_semana_y_mes():
+    assert buckets(date(2026, 3, 4), date(2026, 3, 16), 'semana') == [
+        date(2026, 3, 2), date(2026, 3, 9), date(2026, 3, 16)
+    ]
+    assert buckets(date(2025, 12, 15), date(2026, 2, 1), 'mes') == [
+        date(2025, 12, 1), date(2026, 1, 1), date(2026, 2, 1)
+    ]
+    assert len(buckets(HOY, HOY, 'hora')) == 24
+
+
+def test_rangos_largos_bajan_granularidad():
+    assert granularidad_efectiva(date(2026, 1, 1), date(2026, 1, 10), 'hora') == 'hora'
+    assert granularidad_efectiva(date(2026, 1, 1), date(2026, 3, 1), 'hora') == 'dia'
+    assert granularidad_efectiva(date(2024, 1, 1), date(2026, 1, 1), 'dia') == 'semana'
+
+
+def test_serie_cachea_buckets_cerrados_y_recalcula_el_actual():
+    cache = FakeCache()
+    cur = FakeRollupCursor()
+    serie = serie_temporal(cur, 7, date(2026, 3, 1), HOY, 'dia', ['visitas'], cache=cache, hoy=HOY)
+
+    assert len(serie['puntos']) == 11
+    assert all(p['visitas'] == 1 for p in serie['puntos'])
+    # Una query para los días cerrados y otra solo para hoy
+    assert [(d, h) for _, d, h in cur.queries] == [(date(2026, 3, 1), date(2026, 3, 10)), (HOY, HOY)]
+
+    cur.queries.clear()
+    serie_temporal(cur, 7, date(2026, 3, 1), HOY, 'dia', ['visitas'], cache=cache, hoy=HOY)
+    assert [(d, h) for _, d, h in cur.queries] == [(HOY, HOY)]
+
+
+def test_serie_semanal_une_sketches_de_unicos():
+    cur = FakeRollupCursor()
+    serie = serie_temporal(cur, 7, date(2026, 3, 2), HOY, 'semana', ['visitas', 'unicos'], hoy=HOY)
+
+    # Semana en curso (lun 9 - mié 11): bucket no cerrado, calculado en vivo
+    assert [p['t'] for p in serie['puntos']] == ['2026-03-02', '2026-03-09']
+    assert serie['puntos'][0]['visitas'] == 7
+    # 'a' se repite todos los días: 7 días -> 8 visitantes distintos, no 14
+    assert serie['puntos'][0]['unicos'] == 8
+    assert serie['puntos'][1]['unicos'] == 4
+
+
+def test_hasta_se_recorta_a_hoy():
+    serie = serie_temporal(FakeRollupCursor(), 7, HOY, HOY + timedelta(days=30), 'dia', ['visitas'], hoy=HOY)
+    assert serie['hasta'] == HOY.isoformat()
+    with pytest.raises(ValueError):
+        serie_temporal(FakeRollupCursor(), 7, HOY, HOY, 'minuto', ['visitas'], hoy=HOY)
+
+
+def test_api_series_valida_fechas(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['restaurante_id'] = 7
+    res = client.get('/api/analytics/series?desde=2026-13-01')
+    assert res.status_code == 400
+    res = client.get('/api/analytics/series?desde=2020-01-01&hasta=2026-01-01')
+    assert res.status_code == 400
@@ -0,0 +1,98 @@
+import pymysql
+
+from busqueda import IndiceBusqueda, buscar_platos, consulta_booleana, terminos_busqueda
+
+PLATOS = [
+    {'id': 1, 'nombre': 'Café cortado', 'descripcion': 'Espresso con leche', 'etiquetas': ''},
+    {'id': 2, 'nombre': 'Torta de chocolate', 'descripcion': 'Con café y crema', 'etiquetas': 'postre'},
+    {'id': 3, 'nombre': 'Lomo a lo pobre', 'descripcion': 'Con huevo y papas fritas', 'etiquetas': 'popular'},
+    {'id': 4, 'nombre': 'Ñandú al jugo', 'descripcion': '', 'etiquetas': 'exótico'},
+]
+
+
+def test_terminos_sin_acentos_y_consulta_booleana():
+    assert terminos_busqueda('  CAFÉ café Ñandú ') == ['cafe', 'nandu']
+    assert consulta_booleana(['lomo', 'a', 'pob']) == '+lomo* +pob*'
+
+
+def test_indice_en_memoria_prefijos_acentos_y_ranking():
+    indice = IndiceBusqueda(PLATOS)
+    # Coincidencia en el nombre antes que en la descripción
+    assert [p['id'] for p in indice.buscar('cafe')] == [1, 2]
+    assert [p['id'] for p in indice.buscar('lom pob')] == [3]
+    assert [p['id'] for p in indice.buscar('nandu')] == [4]
+    assert [p['id'] for p in indice.buscar('EXOTICO')] == [4]
+    assert indice.buscar('lomo chocolate') == []
+
+    indice.quitar(1)
+    assert [p['id'] for p in indice.buscar('cafe')] == [2]
+
+
+class FakeCursor:
+    def __init__(self, sin_fulltext=False):
+        self.sin_fulltext = sin_fulltext
+        self.queries = []
+        self._last = []
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        if 'MATCH(' in query and self.sin_fulltext:
+            raise pymysql.err.OperationalError(1191, "Can't find FULLTEXT index matching the column list")
+        self._last = PLATOS
+
+    def fetchall(self):
+        return self._last
+
+
+def test_sql_fulltext_con_terminos_cortos():
+    cur = FakeCursor()
+    buscar_platos(cur, 9, 'lomo al', solo_activos=True)
+    sql, params = cur.queries[0]
+    assert 'AGAINST (%s IN BOOLEAN MODE)' in sql
+    assert params[0] == '+lomo*' and '%al%' in params
+    assert 'p.activo = 1' in sql
+    assert 'LOWER(' not in sql
+
+
+def test_fallback_en_memoria_sin_indice_fulltext():
+    cur = FakeCursor(sin_fulltext=True)
+    assert [p['id'] for p in buscar_platos(cur, 9, 'café')] == [1, 2]
+    assert 'MATCH(' not in cur.queries[-1][0]
+
+
+class _FakeConn:
+    def cursor(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+
+def test_api_buscar_acota_el_limite(client, monkeypatch):
+    import app_menu
+    limites = []
+    monkeypatch.setattr(app_menu, 'get_db', lambda: _FakeConn())
+    monkeypatch.setattr(app_menu, 'buscar_platos', lambda cur, rid, q, solo_activos, limite: limites.append(limite) or [])
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['rol'] = 'admin'
+        sess['restaurante_id'] = 7
+
+    for valor in ('-1', '0', '500', '20'):
+        assert client.get(f'/api/platos/buscar?q=lomo&limite={valor}').status_code == 200
+    assert limites == [1, 1, 100, 20]
+
+
+def test_busqueda_publica_no_expone_errores_internos(client, monkeypatch):
+    import app_menu
+
+    def falla():
+        raise RuntimeError("Table 'menu.platos' doesn't exist")
+    monkeypatch.setattr(app_menu, 'get_db', falla)
+
+    res = client.get('/api/menu/mi-local/buscar?q=lomo')
+    assert res.status_code == 500
+    assert res.get_json() == {'success': False, 'error': 'Error interno'}
@@ -0,0 +1,128 @@
+import csv
+import gzip
+import io
+import json
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+
+import pytest
+
+import exports
+from exports import stream_export, parse_cursor
+
+
+def _visitas(n):
+    base = datetime(2026, 1, 1, 12, 0)
+    return [{'id': i + 1, 'restaurante_id': 7, 'fecha': base + timedelta(hours=i // 2),
+             'ip_address': '10.0.0.1', 'user_agent': 'UA', 'referer': None,
+             'es_movil': 1, 'es_qr': 0} for i in range(n)]
+
+
+class FakeSSCursor:
+    """Aplica el keyset (fecha, id) > cursor y el LIMIT sobre filas en memoria."""
+
+    def __init__(self, db):
+        self.db = db
+        self._rows = []
+
+    def execute(self, query, params=None):
+        self.db.queries.append((query, params))
+        limite = params[-1]
+        filas = self.db.filas
+        if 'OR (' in query:
+            fecha, id_ = params[-4], params[-2]
+            filas = [r for r in filas if (r['fecha'], r['id']) > (fecha, id_)]
+        self._rows = filas[:limite]
+
+    def __iter__(self):
+        self.db.abiertos += 1
+        try:
+            yield from self._rows
+        finally:
+            self.db.abiertos -= 1
+
+    def close(self):
+        pass
+
+
+class FakeDB:
+    def __init__(self, filas):
+        self.filas = filas
+        self.queries = []
+        self.abiertos = 0
+        self.conexiones_activas = 0
+
+    def cursor(self, cursor_class=None):
+        assert cursor_class is exports.SSDictCursor
+        return FakeSSCursor(self)
+
+
+@pytest.fixture
+def fake_db(monkeypatch):
+    db = FakeDB(_visitas(7))
+
+    @contextmanager
+    def fake_get_connection():
+        db.conexiones_activas += 1
+        try:
+            yield db
+        finally:
+            db.conexiones_activas -= 1
+
+    monkeypatch.setattr(exports, 'get_connection', fake_get_connection)
+    return db
+
+
+def test_csv_gzip_por_chunks_sin_retener_conexion(fake_db):
+    partes = []
+    for parte in stream_export('visitas', date(2026, 1, 1), date(2026, 2, 1), restaurante_id=7,
+                               chunk_size=3, incluir_ip=False):
+        # Los bytes se entregan con la conexión ya devuelta al pool
+        assert fake_db.conexiones_activas == 0
+        partes.append(parte)
+
+    filas = list(csv.reader(io.StringIO(gzip.decompress(b''.join(partes)).decode())))
+    assert filas[0] == ['id', 'restaurante_id', 'fecha', 'user_agent', 'referer', 'es_movil', 'es_qr']
+    assert [int(f[0]) for f in filas[1:]] == list(range(1, 8))
+    assert len(fake_db.queries) == 3  # 3 + 3 + 1 filas
+    assert 'ORDER BY v.fecha, v.id' in fake_db.queries[0][0]
+    assert 'OFFSET' not in fake_db.queries[1][0]
+
+
+def test_ndjson_emite_checkpoints_y_se_reanuda(fake_db):
+    salida = b''.join(stream_export('visitas', date(2026, 1, 1), date(2026, 2, 1),
+                                    formato='ndjson', comprimir=False, chunk_size=3))
+    lineas = [json.loads(l) for l in salida.decode().splitlines()]
+    checkpoints = [l['_cursor'] for l in lineas if '_cursor' in l]
+    assert checkpoints[0] == '2026-01-01T13:00:00_3'
+    assert lineas[0]['ip_address'] == '10.0.0.1'
+
+    reanudado = b''.join(stream_export('visitas', date(2026, 1, 1), date(2026, 2, 1),
+                                       formato='ndjson', comprimir=False, cursor=checkpoints[0]))
+    ids = [json.loads(l)['id'] for l in reanudado.decode().splitlines() if '_cursor' not in l]
+    assert ids == [4, 5, 6, 7]
+
+
+def test_parse_cursor():
+    assert parse_cursor('2026-01-31T10:00:00_12', 'visitas') == (datetime(2026, 1, 31, 10), 12)
+    assert parse_cursor('2026-01-31_7', 'diarias') == (date(2026, 1, 31), 7)
+    with pytest.raises(ValueError):
+        parse_cursor('basura', 'visitas')
+
+
+def test_api_export_valida_y_limita_al_restaurante(client, fake_db):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['rol'] = 'admin'
+        sess['restaurante_id'] = 7
+
+    assert client.get('/api/export/visitas').status_code == 400
+    assert client.get('/api/export/pedidos?desde=2026-01-01&hasta=2026-01-31').status_code == 404
+    assert client.get('/api/export/visitas?desde=2026-01-01&hasta=2026-01-31&cursor=x').status_code == 400
+
+    res = client.get('/api/export/visitas?desde=2026-01-01&hasta=2026-01-31&restaurante_id=99&gzip=0')
+    assert res.status_code == 200
+    assert res.is_streamed
+    assert 'visitas_7_2026-01-01_2026-01-31.csv' in res.headers['Content-Disposition']
+    assert b'ip_address' not in res.get_data()
+    assert fake_db.queries[0][1][0] == 7
@@ -0,0 +1,90 @@
+import json
+
+import requests
+from requests.adapters import BaseAdapter
+
+import http_client
+
+
+class FakeAdapter(BaseAdapter):
+    """Responde sin red y guarda cada request con sus kwargs."""
+
+    def __init__(self, status=200, cuerpo=None, error=None):
+        super().__init__()
+        self.status, self.cuerpo, self.error = status, cuerpo, error
+        self.llamadas = []
+
+    def send(self, request, **kwargs):
+        self.llamadas.append((request, kwargs))
+        if self.error:
+            raise self.error
+        r = requests.Response()
+        r.status_code = self.status
+        r._content = json.dumps(self.cuerpo).encode() if self.cuerpo is not None else b''
+        r.request = request
+        return r
+
+    def close(self):
+        pass
+
+
+def _sesion(servicio, adapter):
+    s = http_client.crear_sesion(servicio)
+    s.mount('https://', adapter)
+    return s
+
+
+def test_sesion_aplica_timeout_y_registra_metricas():
+    http_client._metricas.reiniciar()
+    ok = FakeAdapter(cuerpo={'ok': True})
+    s = _sesion('cloudinary', ok)
+    s.get('https://api.example.com/a')
+    s.post('https://api.example.com/b', timeout=3)
+    assert ok.llamadas[0][1]['timeout'] == http_client.TIMEOUTS['cloudinary']
+    assert ok.llamadas[1][1]['timeout'] == 3
+
+    caido = _sesion('mercadopago', FakeAdapter(error=requests.exceptions.ConnectionError('proxy')))
+    try:
+        caido.get('https://api.example.com/c')
+    except requests.exceptions.ConnectionError:
+        pass
+    _sesion('mercadopago', FakeAdapter(status=503)).get('https://api.example.com/d')
+
+    m = http_client.metricas()
+    assert (m['cloudinary']['llamadas'], m['cloudinary']['errores']) == (2, 0)
+    assert m['cloudinary']['ms_p95'] is not None
+    assert (m['mercadopago']['llamadas'], m['mercadopago']['errores']) == (2, 2)
+    assert m['mercadopago']['ultimo_error']['error'] == 'HTTP 503'
+
+
+def test_politica_de_reintentos_no_repite_post():
+    s = http_client.crear_sesion('cloudinary', hilos=7, proxy='http://proxy:3128')
+    adapter = s.get_adapter('https://api.cloudinary.com')
+    assert adapter._pool_maxsize == 7
+    assert 503 in adapter.max_retries.status_forcelist
+    assert 'POST' not in adapter.max_retries.allowed_methods
+    assert adapter.max_retries.connect == http_client.HTTP_REINTENTOS
+    assert s.proxies['https'] == 'http://proxy:3128'
+
+
+def test_cliente_mercadopago_usa_sesion_compartida():
+    fake = FakeAdapter(status=201, cuerpo={'id': 'pref-1'})
+    cliente = http_client.ClienteHttpMercadoPago(_sesion('mercadopago', fake))
+    res = cliente.post('https://api.mercadopago.com/checkout/preferences', headers={}, data='{}',
+                       timeout=60, maxretries=3)
+    assert res == {'status': 201, 'response': {'id': 'pref-1'}}
+    # El timeout del SDK se reemplaza por el del servicio
+    assert fake.llamadas[0][1]['timeout'] == http_client.TIMEOUTS['mercadopago']
+
+
+def test_cloudinary_destroy_firma_y_usa_sesion(monkeypatch):
+    import app_menu
+    fake = FakeAdapter(cuerpo={'result': 'ok'})
+    monkeypatch.setattr(app_menu, '_cloudinary_session', _sesion('cloudinary', fake))
+    monkeypatch.setattr(app_menu, '_cloudinary_config', {'cloud_name': 'demo', 'api_key': 'k', 'api_secret': 's'})
+
+    assert app_menu.cloudinary_destroy('mimenudigital/platos/1/abc') == {'result': 'ok'}
+    req, kwargs = fake.llamadas[0]
+    assert req.url == 'https://api.cloudinary.com/v1_1/demo/image/destroy'
+    assert 'public_id=mimenudigital%2Fplatos%2F1%2Fabc' in req.body and 'signature=' in req.body
+    assert kwargs['timeout'] == http_client.TIMEOUTS['cloudinary_api']
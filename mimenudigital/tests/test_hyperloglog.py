@@ -0,0 +1,86 @@
+from datetime import date
+
+import analytics
+from hyperloglog import HyperLogLog, unir
+
+
+def test_estimacion_dentro_del_error_esperado():
+    h = HyperLogLog()
+    for i in range(20000):
+        h.add(f'visitante-{i}')
+    assert abs(h.count() - 20000) / 20000 < 0.05
+
+
+def test_rango_bajo_es_casi_exacto_y_repetidos_no_suman():
+    h = HyperLogLog()
+    for _ in range(3):
+        for i in range(50):
+            h.add(str(i))
+    assert 48 <= h.count() <= 52
+
+
+def test_union_de_sketches_serializados():
+    a, b = HyperLogLog(), HyperLogLog()
+    for i in range(3000):
+        a.add(str(i))
+    for i in range(1500, 4500):
+        b.add(str(i))
+    total = unir([a.to_bytes(), None, b.to_bytes()])
+    assert abs(total.count() - 4500) / 4500 < 0.05
+    # El blob es compacto y vuelve al mismo sketch
+    assert len(a.to_bytes()) < 4096
+    assert HyperLogLog.from_bytes(a.to_bytes()).registros == a.registros
+
+
+class FakeCursor:
+    def __init__(self, tabla):
+        self.tabla = tabla
+        self._rows = []
+
+    def executemany(self, query, params):
+        q = ' '.join(query.split())
+        for p in params:
+            if q.startswith('INSERT IGNORE'):
+                self.tabla.setdefault((p[0], str(p[1])), {'hll': None, 'unicos': 0})
+            elif q.startswith('UPDATE'):
+                self.tabla[(p[2], str(p[3]))] = {'hll': p[0], 'unicos': p[1]}
+
+    def execute(self, query, params=None):
+        assert 'FOR UPDATE' in query
+        pares = list(zip(params[::2], params[1::2]))
+        self._rows = [{'restaurante_id': r, 'fecha': f, 'hll': self.tabla[(r, f)]['hll']} for r, f in pares]
+
+    def fetchall(self):
+        return self._rows
+
+
+class FakeConn:
+    def __init__(self):
+        self.begins = self.commits = 0
+
+    def begin(self):
+        self.begins += 1
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        pass
+
+
+def test_escribir_sketches_acumula_entre_batches_y_global():
+    tabla = {}
+    conn, cur = FakeConn(), FakeCursor(tabla)
+    hoy = date.today().isoformat()
+
+    def batch(rid, ips):
+        return [{'restaurante_id': rid, 'ip_address': ip, 'user_agent': 'ua', 'fecha': hoy} for ip in ips]
+
+    analytics.escribir_sketches(conn, cur, batch(1, ['a', 'b', 'c']))
+    analytics.escribir_sketches(conn, cur, batch(1, ['c', 'd']) + batch(2, ['a']))
+
+    assert tabla[(1, hoy)]['unicos'] == 4
+    assert tabla[(2, hoy)]['unicos'] == 1
+    # La fila global cuenta personas distintas de toda la plataforma
+    assert tabla[(analytics.HLL_GLOBAL_ID, hoy)]['unicos'] == 4
+    assert conn.begins == conn.commits == 2
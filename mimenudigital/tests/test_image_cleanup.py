@@ -0,0 +1,196 @@
+import os
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+from image_cleanup import ColaBorrados, encolar_borrado, limpiar_archivos_locales, reconciliar_cloudinary
+
+
+class FakeBorradosCursor:
+    """Simula cloudinary_borrados y los public_ids que siguen en uso."""
+
+    def __init__(self, filas, en_uso=(), urls_en_uso=()):
+        self.filas = filas
+        self.en_uso = set(en_uso)
+        self.urls_en_uso = set(urls_en_uso)
+        self.many = []
+        self._last = []
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split())
+        self._last = []
+        if q.startswith("UPDATE cloudinary_borrados SET status = 'processing'"):
+            token, limite = params
+            for f in [f for f in self.filas if f['status'] == 'pending' and not f.get('espera')][:limite]:
+                f.update(status='processing', claim_token=token)
+        elif q.startswith('SELECT id, public_id'):
+            self._last = [dict(f) for f in self.filas if f.get('claim_token') == params[0]]
+        elif q.startswith('SELECT imagen_public_id as public_id'):
+            self._last = [{'public_id': p} for p in params if p in self.en_uso]
+        elif q.startswith('SELECT imagen_url as url'):
+            self._last = [{'url': u} for u in params if u in self.urls_en_uso]
+        elif q.startswith('UPDATE cloudinary_borrados SET') and 'IN (' in q:
+            ids = set(params[-q.count('%s', q.index('IN (')):])
+            for f in self.filas:
+                if f['public_id'] in ids and f.get('claim_token') == params[-len(ids) - 1]:
+                    if "'cancelled'" in q:
+                        f['status'] = 'cancelled'
+                    elif "'deleted'" in q:
+                        f.update(status='deleted', claim_token=None)
+                    else:
+                        f['attempts'] += 1
+                        f.update(status='failed' if f['attempts'] >= params[0] else 'pending',
+                                 claim_token=None, espera=True, last_error=params[3])
+
+    def executemany(self, query, params):
+        self.many.extend(params)
+
+    def fetchall(self):
+        return self._last
+
+
+class FakeConn:
+    def __init__(self, cur):
+        self.cur = cur
+
+    @contextmanager
+    def cursor(self):
+        yield self.cur
+
+    def commit(self):
+        pass
+
+
+def _conexion(cur):
+    @contextmanager
+    def conexion():
+        yield FakeConn(cur)
+    return conexion
+
+
+def _cola(cur, borrar_lote):
+    return ColaBorrados(borrar_lote=borrar_lote, conexion=_conexion(cur))
+
+
+def _filas(n):
+    return [{'id': i, 'public_id': f'mimenudigital/platos/1/{i}', 'resource_type': 'image',
+             'attempts': 0, 'status': 'pending'} for i in range(n)]
+
+
+def test_encolar_deduplica_y_omite_vacios():
+    cur = FakeBorradosCursor([])
+    assert encolar_borrado(cur, ['b', None, 'a', 'b', ''], 3, motivo='plato_editado') == 2
+    assert cur.many == [('a', 'image', 3, 'plato_editado'), ('b', 'image', 3, 'plato_editado')]
+    assert encolar_borrado(cur, set(), 3) == 0
+
+
+def test_borra_de_a_100_y_cancela_los_que_volvieron_a_usarse():
+    filas = _filas(250)
+    cur = FakeBorradosCursor(filas, en_uso={'mimenudigital/platos/1/7'})
+    llamadas = []
+
+    def borrar_lote(ids, resource_type):
+        llamadas.append(list(ids))
+        # not_found: el asset ya no existía, se da por borrado
+        return {p: 'not_found' if p.endswith('/0') else 'deleted' for p in ids}
+
+    resumen = _cola(cur, borrar_lote).procesar(limite=1000)
+    assert [len(lote) for lote in llamadas] == [100, 100, 49]
+    assert resumen == {'reclamados': 250, 'deleted': 249, 'reintentar': 0, 'cancelled': 1, 'llamadas': 3}
+    assert filas[7]['status'] == 'cancelled'
+    assert {f['status'] for i, f in enumerate(filas) if i != 7} == {'deleted'}
+
+
+def test_lote_fallido_vuelve_a_pending_con_backoff():
+    filas = _filas(3)
+    filas[0]['attempts'] = 4
+    cur = FakeBorradosCursor(filas)
+
+    def borrar_lote(ids, resource_type):
+        raise RuntimeError('Cloudinary 500')
+
+    resumen = _cola(cur, borrar_lote).procesar()
+    assert resumen['reintentar'] == 3 and resumen['deleted'] == 0
+    assert [f['status'] for f in filas] == ['failed', 'pending', 'pending']
+    assert all(f['espera'] and f['last_error'] == 'Cloudinary 500' for f in filas)
+    # Con next_attempt_at en el futuro no se reclaman en la pasada siguiente
+    assert _cola(cur, borrar_lote).procesar()['reclamados'] == 0
+
+
+def test_cloudinary_borrar_lote_usa_delete_resources(monkeypatch):
+    import app_menu
+    from test_http_client import FakeAdapter, _sesion
+
+    fake = FakeAdapter(cuerpo={'deleted': {'a/1': 'deleted', 'a/2': 'not_found'}})
+    monkeypatch.setattr(app_menu, '_cloudinary_session', _sesion('cloudinary', fake))
+    monkeypatch.setattr(app_menu, '_cloudinary_config', {'cloud_name': 'demo', 'api_key': 'k', 'api_secret': 's'})
+
+    assert app_menu.cloudinary_borrar_lote(['a/1', 'a/2']) == {'a/1': 'deleted', 'a/2': 'not_found'}
+    req, _ = fake.llamadas[0]
+    assert req.method == 'DELETE'
+    assert req.url == 'https://api.cloudinary.com/v1_1/demo/resources/image/upload'
+    assert req.body == 'public_ids%5B%5D=a%2F1&public_ids%5B%5D=a%2F2'
+    assert req.headers['Authorization'].startswith('Basic ')
+
+
+AHORA = datetime(2026, 5, 10, 12, 0, tzinfo=timezone.utc)
+
+
+def test_reconciliacion_pagina_y_encola_solo_huerfanos_viejos():
+    paginas = {
+        None: {'resources': [
+            {'public_id': 'mimenudigital/platos/1/usada', 'created_at': '2026-05-01T10:00:00Z'},
+            {'public_id': 'mimenudigital/platos/1/huerfana', 'created_at': '2026-05-01T10:00:00Z'},
+            {'public_id': 'mimenudigital/platos/2/recien', 'created_at': '2026-05-10T11:00:00Z'},
+        ], 'next_cursor': 'c2'},
+        'c2': {'resources': [
+            {'public_id': 'mimenudigital/platos/anon/x', 'created_at': '2026-04-01T00:00:00Z'},
+        ]},
+    }
+    pedidas = []
+
+    def listar(prefix, cursor):
+        pedidas.append((prefix, cursor))
+        return paginas[cursor]
+
+    cur = FakeBorradosCursor([], en_uso={'mimenudigital/platos/1/usada'})
+    resumen = reconciliar_cloudinary(listar, conexion=_conexion(cur), gracia_horas=48, ahora=AHORA)
+
+    assert pedidas == [('mimenudigital/platos/', None), ('mimenudigital/platos/', 'c2')]
+    assert resumen == {'paginas': 2, 'revisados': 4, 'en_gracia': 1, 'huerfanos': 2, 'completo': True}
+    assert cur.many == [('mimenudigital/platos/1/huerfana', 'image', 1, 'huerfano'),
+                        ('mimenudigital/platos/anon/x', 'image', None, 'huerfano')]
+
+
+def test_limpieza_local_respeta_gracia_referencias_y_qrs(tmp_path):
+    viejo = AHORA.timestamp() - 72 * 3600
+    for nombre in ('1_huerfano.jpg', '1_en_plato.jpg', '1_reciente.jpg', '.gitkeep'):
+        (tmp_path / nombre).write_bytes(b'x' * 10)
+        if nombre != '1_reciente.jpg':
+            os.utime(tmp_path / nombre, (viejo, viejo))
+    (tmp_path / 'qrs').mkdir()
+    (tmp_path / 'qrs' / 'menu.png').write_bytes(b'qr')
+
+    cur = FakeBorradosCursor([], urls_en_uso={'/static/uploads/1_en_plato.jpg'})
+    resumen = limpiar_archivos_locales(str(tmp_path), conexion=_conexion(cur), gracia_horas=48, lote=1, ahora=AHORA)
+
+    assert resumen == {'revisados': 2, 'borrados': 1, 'bytes': 10}
+    assert sorted(os.listdir(tmp_path)) == ['.gitkeep', '1_en_plato.jpg', '1_reciente.jpg', 'qrs']
+
+
+def test_listar_recursos_contra_api_local(monkeypatch):
+    import app_menu
+    from test_http_client import FakeAdapter
+
+    # CLOUDINARY_API_BASE permite apuntar a un emulador local de la Admin API
+    fake = FakeAdapter(cuerpo={'resources': [{'public_id': 'mimenudigital/platos/1/a'}], 'next_cursor': 'n2'})
+    sesion = app_menu.http_client.crear_sesion('cloudinary')
+    sesion.mount('http://', fake)
+    monkeypatch.setattr(app_menu, '_cloudinary_session', sesion)
+    monkeypatch.setattr(app_menu, 'CLOUDINARY_API_BASE', 'http://127.0.0.1:8765/v1_1')
+    monkeypatch.setattr(app_menu, '_cloudinary_config', {'cloud_name': 'demo', 'api_key': 'k', 'api_secret': 's'})
+
+    pagina = app_menu.cloudinary_listar_recursos('mimenudigital/platos/', next_cursor='n1')
+    assert pagina == {'resources': [{'public_id': 'mimenudigital/platos/1/a'}], 'next_cursor': 'n2'}
+    req, _ = fake.llamadas[0]
+    assert req.url.startswith('http://127.0.0.1:8765/v1_1/demo/resources/image?')
+    assert 'prefix=mimenudigital%2Fplatos%2F' in req.url and 'next_cursor=n1' in req.url
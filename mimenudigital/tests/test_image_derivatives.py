@@ -0,0 +1,66 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+import app_menu
+from image_derivatives import CacheDerivados, ajustar_ancho, srcset_derivados, url_derivado
+
+
+def _foto(ruta, tamano=(1600, 1200)):
+    Image.effect_noise(tamano, 60).convert('RGB').save(ruta, format='JPEG', quality=95)
+
+
+def test_urls_y_anchos_permitidos():
+    assert ajustar_ancho(500) == 640
+    assert ajustar_ancho(5000) == 1024
+    assert ajustar_ancho(None) == 640
+    assert url_derivado('/static/uploads/1_ab.jpg', 320) == '/img/1_ab.jpg?w=320'
+    assert url_derivado('https://res.cloudinary.com/x.jpg', 320) is None
+    assert srcset_derivados('/static/uploads/1_ab.jpg', [320, 640]) == \
+        '/img/1_ab.jpg?w=320 320w, /img/1_ab.jpg?w=640 640w'
+
+
+def test_genera_una_vez_y_comparte_por_contenido(tmp_path, monkeypatch):
+    origen = tmp_path / 'uploads'
+    origen.mkdir()
+    _foto(origen / '1_a.jpg')
+    (origen / '2_b.jpg').write_bytes((origen / '1_a.jpg').read_bytes())
+    cache = CacheDerivados(str(origen), str(origen / '.derivados'))
+
+    d = cache.obtener('1_a.jpg', 600, webp=True)
+    assert d['content_type'] == 'image/webp'
+    with Image.open(d['ruta']) as img:
+        assert img.size == (640, 480)
+
+    # Mismo contenido bajo otro nombre: reutiliza el derivado sin decodificar
+    monkeypatch.setattr('image_derivatives.preprocesar_imagen', lambda *a, **k: pytest.fail('regenerado'))
+    assert cache.obtener('2_b.jpg', 640)['ruta'] == d['ruta']
+
+    assert cache.obtener('../uploads/1_a.jpg', 640) is None
+    assert cache.obtener('no_existe.jpg', 640) is None
+
+
+def test_ruta_img_cache_larga_etag_y_fallback_srcset(tmp_path, monkeypatch, client):
+    _foto(tmp_path / '1_c.jpg')
+    monkeypatch.setattr(app_menu, 'cache_derivados', CacheDerivados(str(tmp_path), str(tmp_path / '.derivados')))
+
+    r = client.get('/img/1_c.jpg?w=320', headers={'Accept': 'image/avif,image/webp,*/*'})
+    assert r.status_code == 200
+    assert r.mimetype == 'image/webp'
+    assert 'immutable' in r.headers['Cache-Control'] and 'max-age=31536000' in r.headers['Cache-Control']
+    assert 'Accept' in r.headers['Vary']
+    with Image.open(io.BytesIO(r.data)) as img:
+        assert img.width == 320
+
+    r304 = client.get('/img/1_c.jpg?w=320', headers={'Accept': 'image/webp', 'If-None-Match': r.headers['ETag']})
+    assert r304.status_code == 304
+    assert client.get('/img/1_c.jpg?w=320', headers={'Accept': 'image/jpeg'}).mimetype == 'image/jpeg'
+    assert client.get('/img/nada.jpg').status_code == 404
+
+    monkeypatch.setattr(app_menu, 'CLOUDINARY_CONFIGURED', False)
+    src, srcset = app_menu.imagen_responsiva('mimenudigital/platos/1/x', '/static/uploads/1_c.jpg')
+    assert src == '/img/1_c.jpg?w=640'
+    assert srcset == app_menu.cloudinary_srcset(None, url='/static/uploads/1_c.jpg')
+    assert srcset.endswith('/img/1_c.jpg?w=1024 1024w')
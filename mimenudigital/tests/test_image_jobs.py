@@ -0,0 +1,388 @@
+import io
+from contextlib import contextmanager
+
+import pytest
+from flask import Flask
+
+import image_jobs
+from image_jobs import PipelineImagenes, resolver_imagenes
+
+
+class FakeCursor:
+    """Simula imagenes_pendientes con un solo job y registra las queries."""
+
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+        self.lastrowid = None
+        self._last = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split())
+        self.db.queries.append((q, params))
+        job = self.db.job
+        if q.startswith('INSERT INTO imagenes_pendientes'):
+            job.update(restaurante_id=params[0], plato_id=params[1], tipo=params[2],
+                       local_path=params[3], local_url=params[4], max_attempts=params[5])
+            self.lastrowid = job['id']
+        elif q.startswith("UPDATE imagenes_pendientes SET status = 'processing'"):
+            self.rowcount = 1 if job['status'] == 'pending' else 0
+            if self.rowcount:
+                job.update(status='processing', attempts=job['attempts'] + 1)
+        elif q.startswith('SELECT id, restaurante_id'):
+            self._last = [dict(job)]
+        elif q.startswith("UPDATE imagenes_pendientes SET status = 'uploaded'"):
+            job.update(status='uploaded', url=params[0], public_id=params[1])
+        elif q.startswith('UPDATE imagenes_pendientes SET status = %s'):
+            job.update(status=params[0], last_error=params[1])
+        elif q.startswith('SELECT id FROM platos'):
+            self._last = [{'id': 7}]
+        elif q.startswith('SELECT LAST_INSERT_ID()'):
+            self._last = [{'version': 3}]
+        elif q.startswith('SELECT local_url'):
+            self._last = [dict(job)]
+
+    def fetchone(self):
+        return self._last[0] if self._last else None
+
+    def fetchall(self):
+        return self._last
+
+
+class FakeDB:
+    def __init__(self):
+        self.job = {'id': 11, 'status': 'pending', 'attempts': 0, 'max_attempts': 5, 'url': None, 'public_id': None}
+        self.queries = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+@pytest.fixture
+def entorno(monkeypatch, tmp_path):
+    db = FakeDB()
+
+    @contextmanager
+    def fake_get_connection():
+        yield db
+
+    monkeypatch.setattr(image_jobs, 'get_connection', fake_get_connection)
+    app = Flask(__name__)
+    app.config['UPLOAD_FOLDER'] = str(tmp_path)
+    return app, db
+
+
+class Archivo(io.BytesIO):
+    filename = 'foto.JPG'
+
+    def save(self, path):
+        with open(path, 'wb') as fh:
+            fh.write(self.getvalue())
+
+
+def test_encolar_y_procesar_reemplaza_url_provisoria(entorno):
+    app, db = entorno
+    subidas, invalidados = [], []
+
+    def subir(fh, **opciones):
+        subidas.append((fh.read(), opciones))
+        return {'secure_url': 'https://res.cloudinary.com/x.jpg', 'public_id': 'x'}
+
+    pipeline = PipelineImagenes(app, subir=subir, invalidar=invalidados.append)
+    job = pipeline.encolar(db, Archivo(b'img'), 5, tipo='plato')
+    assert job['job_id'] == 11
+    assert job['url'].startswith('/static/uploads/5_') and job['url'].endswith('.jpg')
+
+    assert pipeline.procesar(11) == 'uploaded'
+    assert subidas == [(b'img', {'folder': 'mimenudigital/platos/5'})]
+    reemplazos = [p for q, p in db.queries if q.startswith(('UPDATE platos SET imagen_url', 'UPDATE platos_imagenes',
+                                                           'UPDATE restaurantes SET logo_url'))]
+    assert len(reemplazos) == 3
+    assert all(p[-1] == job['url'] for p in reemplazos)
+    assert any(q.startswith('UPDATE platos SET row_version') for q, _ in db.queries)
+    assert invalidados == [5]
+    assert not list(__import__('os').scandir(app.config['UPLOAD_FOLDER']))
+
+    # Un segundo worker no lo vuelve a subir
+    assert pipeline.procesar(11) is None
+
+
+def test_fallo_reintenta_y_luego_falla(entorno):
+    app, db = entorno
+
+    def subir(fh, **opciones):
+        raise TimeoutError('proxy timeout')
+
+    pipeline = PipelineImagenes(app, subir=subir)
+    pipeline.encolar(db, Archivo(b'img'), 5)
+    assert pipeline.procesar(11) == 'pending'
+    assert 'proxy timeout' in db.job['last_error']
+
+    db.job.update(status='pending', attempts=4)
+    assert pipeline.procesar(11) == 'failed'
+
+
+def test_resolver_imagenes_traduce_jobs_terminados(entorno):
+    _, db = entorno
+    db.job.update(status='uploaded', local_url='/static/uploads/5_a.jpg',
+                  url='https://res.cloudinary.com/a.jpg', public_id='a')
+    galeria = [{'imagen_url': '/static/uploads/5_a.jpg'}, {'imagen_url': 'https://otra.jpg'}]
+    cur = FakeCursor(db)
+
+    assert resolver_imagenes(cur, 5, '/static/uploads/5_a.jpg', None, galeria) == ('https://res.cloudinary.com/a.jpg', 'a')
+    assert galeria[0] == {'imagen_url': 'https://res.cloudinary.com/a.jpg', 'imagen_public_id': 'a'}
+    assert 'FOR UPDATE' in db.queries[-1][0]
+    # Sin URLs locales no hay query
+    n = len(db.queries)
+    assert resolver_imagenes(cur, 5, 'https://x.jpg', 'x') == ('https://x.jpg', 'x')
+    assert len(db.queries) == n
+
+
+def test_espera_reintento_exponencial():
+    assert [image_jobs.espera_reintento(n) for n in (1, 2, 3, 4)] == [60, 120, 240, 480]
+    assert image_jobs.espera_reintento(20) == image_jobs.BACKOFF_MAX
+
+
+class FakeColaCursor:
+    """Simula una cola de varios jobs con reclamo por claim_token."""
+
+    def __init__(self, db):
+        self.db = db
+        self._last = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split())
+        with self.db.lock:
+            self.db.queries.append(q)
+            if q.startswith("UPDATE imagenes_pendientes SET status = 'processing', claim_token"):
+                token, limite = params[0], params[-1]
+                vencidos = [j for j in self.db.jobs.values()
+                            if j['status'] == 'pending' and not j.get('next_attempt_at')][:limite]
+                for j in vencidos:
+                    j.update(status='processing', claim_token=token, attempts=j['attempts'] + 1)
+            elif q.startswith('SELECT id, restaurante_id') and 'claim_token' in q:
+                self._last = [dict(j) for j in self.db.jobs.values()
+                              if j.get('claim_token') == params[0] and j['status'] == 'processing']
+            elif q.startswith("UPDATE imagenes_pendientes SET status = 'uploaded'"):
+                self.db.jobs[params[-1]].update(status='uploaded', url=params[0], duracion_ms=params[2])
+            elif q.startswith('UPDATE imagenes_pendientes SET status = %s'):
+                self.db.jobs[params[-1]].update(status=params[0], last_error=params[1],
+                                                next_attempt_at=params[2], duracion_ms=params[3])
+            elif q.startswith('UPDATE platos SET imagen_url'):
+                self.db.platos.append(params)
+            elif q.startswith('SELECT LAST_INSERT_ID()'):
+                self._last = [{'version': 1}]
+
+    def fetchone(self):
+        return self._last[0] if self._last else None
+
+    def fetchall(self):
+        return self._last
+
+
+class FakeColaDB:
+    def __init__(self, jobs):
+        import threading
+        self.lock = threading.Lock()
+        self.jobs = {j['id']: j for j in jobs}
+        self.queries = []
+        self.platos = []
+
+    def cursor(self):
+        return FakeColaCursor(self)
+
+    def commit(self):
+        pass
+
+
+def test_procesar_pendientes_sube_lote_en_paralelo(monkeypatch, tmp_path):
+    import threading
+    jobs = []
+    for i in range(1, 6):
+        f = tmp_path / f'{i}.jpg'
+        f.write_bytes(b'img')
+        jobs.append({'id': i, 'restaurante_id': 5, 'plato_id': None, 'tipo': 'plato', 'local_path': str(f),
+                     'local_url': None, 'attempts': 0, 'max_attempts': 5, 'status': 'pending'})
+    # Fila antigua (sin URL provisoria): se actualiza el plato por id
+    jobs[0].update(plato_id=70)
+    # Fila en backoff: no se reclama
+    jobs[4].update(next_attempt_at='2099-01-01')
+    db = FakeColaDB(jobs)
+
+    @contextmanager
+    def fake_get_connection():
+        yield db
+
+    monkeypatch.setattr(image_jobs, 'get_connection', fake_get_connection)
+    hilos = set()
+    barrera = threading.Barrier(2, timeout=5)
+
+    def subir(fh, **opciones):
+        hilos.add(threading.current_thread().name)
+        if len(hilos) <= 2:
+            barrera.wait()  # dos subidas simultáneas
+        if fh.name.endswith('3.jpg'):
+            raise TimeoutError('proxy timeout')
+        return {'secure_url': 'https://res.cloudinary.com/' + fh.name[-5:], 'public_id': fh.name[-5:]}
+
+    pipeline = PipelineImagenes(subir=subir, max_workers=2)
+    resumen = pipeline.procesar_pendientes(limite=10)
+    pipeline.cerrar()
+
+    assert resumen['reclamados'] == 4
+    assert (resumen['uploaded'], resumen['pending']) == (3, 1)
+    assert len(hilos) == 2
+    assert db.jobs[3]['status'] == 'pending' and db.jobs[3]['next_attempt_at'] == 60
+    assert db.jobs[5]['status'] == 'pending' and db.jobs[5]['attempts'] == 0
+    assert all(isinstance(db.jobs[i]['duracion_ms'], int) for i in (1, 2, 3, 4))
+    assert {j['claim_token'] for j in db.jobs.values() if j.get('claim_token')} == {resumen['lote']}
+    assert db.platos == [('https://res.cloudinary.com/1.jpg', '1.jpg', 70, 5)]
+    # Los jobs vencidos se recuperan y los agotados se cierran antes de reclamar
+    assert any("SET status = 'failed'" in q for q in db.queries)
+
+
+def test_procesar_en_paralelo_mantiene_orden_y_errores():
+    import threading
+    import time
+    barrera = threading.Barrier(3, timeout=5)
+
+    def lenta(n):
+        barrera.wait()  # las tres corren a la vez
+        time.sleep(0.01 * (3 - n))
+        if n == 1:
+            raise ValueError('mala')
+        return n * 10
+
+    resultados = image_jobs.procesar_en_paralelo([0, 1, 2], lenta, max_workers=3)
+    assert [r for r, _ in resultados] == [0, None, 20]
+    assert isinstance(resultados[1][1], ValueError)
+
+
+def test_upload_images_lote_en_orden(client, monkeypatch):
+    import app_menu
+    monkeypatch.setitem(app_menu.app.config, 'WTF_CSRF_ENABLED', False)
+    monkeypatch.setattr(app_menu, 'CLOUDINARY_AVAILABLE', True)
+    monkeypatch.setattr(app_menu, 'is_cloudinary_ready', lambda: True)
+    monkeypatch.setattr(app_menu, 'IMAGENES_ASYNC', False)
+    monkeypatch.setattr(app_menu, 'get_db', lambda: None)
+
+    def fake_upload(f, **opciones):
+        return {'secure_url': f'https://res.cloudinary.com/{f.filename}', 'public_id': f.filename}
+
+    monkeypatch.setattr(app_menu, 'cloudinary_upload', fake_upload)
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['restaurante_id'] = 1
+        sess['rol'] = 'admin'
+
+    data = {'images': [(io.BytesIO(b'\xff\xd8\xff' + bytes([i])), f'{i}.jpg') for i in range(3)]
+            + [(io.BytesIO(b'x'), 'doc.pdf')]}
+    res = client.post('/api/upload-images', data=data, content_type='multipart/form-data')
+    assert res.status_code == 200
+    body = res.get_json()
+    assert (body['subidas'], body['errores']) == (3, 1)
+    assert [r['filename'] for r in body['resultados']] == ['0.jpg', '1.jpg', '2.jpg', 'doc.pdf']
+    assert [r.get('public_id') for r in body['resultados'][:3]] == ['0.jpg', '1.jpg', '2.jpg']
+    assert body['resultados'][3]['success'] is False
+
+
+class RegistroCursor:
+    """Cursor de api_platos: registra queries y commits en orden."""
+
+    def __init__(self, log):
+        self.log = log
+        self.lastrowid = 55
+        self.rowcount = 1
+        self._one = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split())
+        self.log.append(q)
+        self._one = {'id': 3} if q.startswith('SELECT id FROM categorias') else (
+            {'version': 7} if q.startswith('SELECT LAST_INSERT_ID()') else None)
+
+    def fetchone(self):
+        return self._one
+
+    def fetchall(self):
+        return []
+
+
+class RegistroDB:
+    def __init__(self):
+        self.log = []
+
+    def cursor(self):
+        return RegistroCursor(self.log)
+
+    def commit(self):
+        self.log.append('COMMIT')
+
+    def rollback(self):
+        self.log.append('ROLLBACK')
+
+
+def _crear_plato_con_galeria(client, monkeypatch):
+    import app_menu
+    db = RegistroDB()
+    monkeypatch.setitem(app_menu.app.config, 'WTF_CSRF_ENABLED', False)
+    monkeypatch.setattr(app_menu, 'get_db', lambda: db)
+    monkeypatch.setattr(app_menu, 'invalidar_cache_restaurante', lambda rid: None)
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['restaurante_id'] = 1
+        sess['rol'] = 'admin'
+    res = client.post('/api/platos', json={
+        'nombre': 'Lomo', 'categoria_id': 3, 'precio': 9990,
+        'imagenes': [{'imagen_url': '/static/uploads/1_a.jpg', 'orden': 0, 'es_principal': 1}],
+    })
+    assert res.status_code == 200, res.get_json()
+    return db.log
+
+
+def test_crear_plato_inserta_galeria_antes_de_liberar_los_jobs(client, monkeypatch):
+    log = _crear_plato_con_galeria(client, monkeypatch)
+    bloqueo = next(i for i, q in enumerate(log) if q.endswith('FOR UPDATE'))
+    galeria = max(i for i, q in enumerate(log) if q.startswith('INSERT INTO platos_imagenes'))
+    # Ningún commit libera las filas de imagenes_pendientes antes de escribir la galería
+    assert 'COMMIT' not in log[bloqueo:galeria]
+
+
+def test_crear_plato_confirma_galeria_y_version_juntas(client, monkeypatch):
+    log = _crear_plato_con_galeria(client, monkeypatch)
+    plato = log.index(next(q for q in log if q.startswith('INSERT INTO platos ')))
+    version = log.index(next(q for q in log if q.startswith('UPDATE restaurantes SET sync_version')))
+    commit = log.index('COMMIT', plato)
+    galeria = [i for i, q in enumerate(log) if q.startswith('INSERT INTO platos_imagenes')]
+    # ?since= nunca ve el plato nuevo sin su galería: todo entra en el mismo commit
+    assert plato < min(galeria) and max(galeria) < version < commit
+
+
+def test_crear_plato_aplica_placeholders_antes_de_la_version(client, monkeypatch):
+    log = _crear_plato_con_galeria(client, monkeypatch)
+    version = log.index(next(q for q in log if q.startswith('UPDATE restaurantes SET sync_version')))
+    placeholders = [i for i, q in enumerate(log) if 'LEFT JOIN imagenes_meta' in q]
+    assert len(placeholders) == 2 and max(placeholders) < version
+    assert log[version:].count('COMMIT') == 1
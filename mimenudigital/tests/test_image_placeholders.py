@@ -0,0 +1,76 @@
+import hashlib
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+import app_menu
+from image_placeholders import aplicar_placeholders, calcular_placeholder, registrar_placeholder
+from image_preprocess import preprocesar_imagen
+
+
+class FakeCursor:
+    def __init__(self):
+        self.queries = []
+
+    def execute(self, query, params=None):
+        self.queries.append((' '.join(query.split()), params))
+
+
+def _jpeg(tamano, color, orientacion=None):
+    buf = io.BytesIO()
+    opciones = {}
+    if orientacion:
+        exif = Image.Exif()
+        exif[0x0112] = orientacion
+        opciones['exif'] = exif
+    Image.new('RGB', tamano, color).save(buf, format='JPEG', quality=95, **opciones)
+    buf.seek(0)
+    return buf
+
+
+def test_dimensiones_orientadas_color_y_lqip():
+    foto = _jpeg((1600, 800), (200, 30, 30), orientacion=6)
+    foto.seek(3)
+    p = calcular_placeholder(foto)
+    assert foto.tell() == 3
+    assert (p['ancho'], p['alto']) == (800, 1600)
+    r, g, b = (int(p['color'][i:i + 2], 16) for i in (1, 3, 5))
+    assert abs(r - 200) < 12 and g < 45 and b < 45
+    assert p['lqip'].startswith('data:image/') and len(p['lqip']) <= 1024
+
+    assert calcular_placeholder(io.BytesIO(b'<svg/>')) is None
+
+
+def test_preprocesar_devuelve_placeholder_de_la_salida():
+    r = preprocesar_imagen(_jpeg((4000, 3000), (20, 120, 40)), max_dim=1000)
+    assert (r['placeholder']['ancho'], r['placeholder']['alto']) == (1000, 750)
+    assert r['placeholder']['color'].startswith('#')
+
+
+def test_registrar_por_url_y_aplicar_a_platos_y_galeria():
+    cur = FakeCursor()
+    url = 'https://res.cloudinary.com/demo/image/upload/v1/mimenudigital/platos/1/a.webp'
+    assert registrar_placeholder(cur, url, {'ancho': 640, 'alto': 480, 'color': '#aabbcc', 'lqip': None})
+    assert cur.queries[0][1][:4] == (hashlib.sha1(url.encode()).hexdigest(), url, 640, 480)
+    assert not registrar_placeholder(cur, url, None)
+
+    aplicar_placeholders(cur, 7, [3, 4])
+    (platos, p1), (galeria, p2) = cur.queries[1:]
+    assert 'UPDATE platos p LEFT JOIN imagenes_meta m ON m.url_hash = SHA1(p.imagen_url)' in platos
+    assert 'UPDATE platos_imagenes pi LEFT JOIN imagenes_meta m' in galeria
+    assert p1 == p2 == [7, 3, 4]
+
+
+def test_menu_publico_reserva_caja_y_placeholder():
+    plato = {'id': 1, 'nombre': 'Lomo', 'precio': 1000, 'imagen_src': '/img/1_a.jpg?w=640', 'imagenes': [],
+             'etiquetas': [], 'imagen_ancho': 640, 'imagen_alto': 480, 'imagen_color': '#aabbcc',
+             'imagen_lqip': 'data:image/webp;base64,UklGRg=='}
+    with app_menu.app.test_request_context('/'):
+        html = app_menu.app.jinja_env.get_template('menu_publico.html').render(
+            restaurante={'id': 1, 'nombre': 'R', 'mostrar_imagenes': 1},
+            menu=[{'nombre': 'Carnes', 'platos': [plato]}],
+        )
+    assert 'width="640" height="480"' in html
+    assert "style=\"background: #aabbcc url('data:image/webp;base64,UklGRg==') center / cover no-repeat;\"" in html
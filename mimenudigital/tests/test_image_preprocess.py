@@ -0,0 +1,79 @@
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+from image_preprocess import preprocesar_imagen
+
+
+class Archivo(io.BytesIO):
+    """Imita un FileStorage de werkzeug."""
+
+    def __init__(self, data, filename):
+        super().__init__(data)
+        self.filename = filename
+
+
+def _jpeg_con_exif(ancho, alto, orientacion):
+    img = Image.new('RGB', (ancho, alto), (200, 30, 30))
+    exif = Image.Exif()
+    exif[0x0112] = orientacion
+    exif[0x010F] = 'PhoneMaker'
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=98, exif=exif)
+    return buf.getvalue()
+
+
+def test_orienta_reduce_y_quita_exif():
+    # Orientación 6: el teléfono guardó la foto acostada
+    data = _jpeg_con_exif(4000, 3000, 6)
+    r = preprocesar_imagen(Archivo(data, 'IMG_0001.JPG'), max_dim=2048, formato='webp', calidad=80)
+
+    assert r['filename'] == 'IMG_0001.webp'
+    assert r['content_type'] == 'image/webp'
+    assert (r['ancho'], r['alto']) == (1536, 2048)
+    assert r['bytes'] < r['bytes_original'] == len(data)
+
+    out = Image.open(r['stream'])
+    assert out.format == 'WEBP'
+    assert out.size == (1536, 2048)
+    assert not out.getexif()
+
+
+def test_png_con_alfa_a_jpeg_y_ruta(tmp_path):
+    img = Image.new('RGBA', (3000, 1000), (0, 0, 0, 0))
+    ruta = tmp_path / 'logo.png'
+    img.save(ruta, format='PNG')
+
+    r = preprocesar_imagen(str(ruta), max_dim=600, formato='jpeg')
+    out = Image.open(r['stream'])
+    assert r['filename'] == 'logo.jpg'
+    assert out.format == 'JPEG' and out.mode == 'RGB'
+    assert out.size == (600, 200)
+    # El fondo transparente queda blanco, no negro
+    assert out.getpixel((10, 10)) > (240, 240, 240)
+
+
+def test_no_imagen_o_animada_sube_original():
+    archivo = Archivo(b'<svg xmlns="http://www.w3.org/2000/svg"/>', 'icono.svg')
+    archivo.seek(0)
+    assert preprocesar_imagen(archivo) is None
+    assert archivo.tell() == 0
+
+    frames = [Image.new('RGB', (50, 50), c) for c in ((255, 0, 0), (0, 255, 0))]
+    buf = io.BytesIO()
+    frames[0].save(buf, format='GIF', save_all=True, append_images=frames[1:])
+    gif = Archivo(buf.getvalue(), 'anim.gif')
+    assert preprocesar_imagen(gif) is None
+    assert gif.tell() == 0
+
+
+def test_imagen_ya_optimizada_no_crece():
+    img = Image.effect_noise((64, 64), 80).convert('RGB')
+    buf = io.BytesIO()
+    img.save(buf, format='JPEG', quality=30)
+    archivo = Archivo(buf.getvalue(), 'mini.jpg')
+    # Re-codificar con calidad 100 pesaría más que el original
+    assert preprocesar_imagen(archivo, formato='jpeg', calidad=100) is None
+    assert archivo.read() == buf.getvalue()
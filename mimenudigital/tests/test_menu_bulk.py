@@ -0,0 +1,184 @@
+import pytest
+
+from menu_bulk import COLUMNAS_PLATO, aplicar_orden, importar_platos, leer_csv, validar_filas, ErrorImportacion
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self._last = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, query, params=None):
+        self.db.queries.append((query, params))
+        if query.startswith('SELECT id, nombre FROM categorias'):
+            self._last = self.db.categorias
+        elif query.startswith('SELECT COALESCE(MAX(orden)'):
+            self._last = [{'max_orden': 2}]
+        elif query.startswith('INSERT INTO categorias'):
+            for i in range(0, len(params), 3):
+                self.db.categorias.append({'id': 100 + i // 3, 'nombre': params[i + 1]})
+        elif query.startswith('SELECT id, categoria_id, nombre FROM platos'):
+            self._last = self.db.platos
+        elif query.startswith('SELECT LAST_INSERT_ID()'):
+            self._last = [{'version': 42}]
+
+    def fetchall(self):
+        return self._last
+
+    def fetchone(self):
+        return self._last[0] if self._last else None
+
+
+class FakeDB:
+    def __init__(self):
+        self.categorias = [{'id': 1, 'nombre': 'Entradas'}, {'id': 2, 'nombre': 'Fondos'}]
+        self.platos = [{'id': 10, 'categoria_id': 2, 'nombre': 'Lomo a lo pobre'}]
+        self.queries = []
+        self.commits = 0
+        self.rollbacks = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+
+def test_leer_csv_con_punto_y_coma():
+    filas = leer_csv('\ufeffNombre;Categoria;Precio\nEmpanada;Entradas;2.500\n')
+    assert filas == [{'nombre': 'Empanada', 'categoria': 'Entradas', 'precio': '2.500'}]
+    platos, nuevas = validar_filas(filas, {'entradas': 1})
+    assert platos[0]['precio'] == 2500 and platos[0]['categoria_id'] == 1
+    assert nuevas == []
+
+
+def test_errores_por_fila_sin_escribir():
+    db = FakeDB()
+    with pytest.raises(ErrorImportacion) as exc:
+        importar_platos(db, 5, [
+            {'nombre': 'Ok', 'categoria': 'entradas', 'precio': 1000},
+            {'nombre': '', 'categoria': 'entradas', 'precio': 1000},
+            {'nombre': 'Sopa', 'categoria': 'Postres', 'precio': 1000},
+            {'nombre': 'Caro', 'categoria': 'Fondos', 'precio': -1},
+        ])
+    assert [e['fila'] for e in exc.value.errores] == [2, 3, 4]
+    assert not any(q.startswith('INSERT') for q, _ in db.queries)
+    assert db.commits == 0
+
+
+def test_upsert_multifila_en_una_transaccion():
+    db = FakeDB()
+    filas = [{'nombre': f'Plato {i}', 'categoria': 'Postres', 'precio': 1990} for i in range(250)]
+    filas.append({'nombre': 'lomo a lo  pobre', 'categoria': 'FONDOS', 'precio': '12.990', 'es_popular': 'si'})
+
+    resultado = importar_platos(db, 5, filas, crear_categorias=True)
+    assert resultado == {'creados': 250, 'actualizados': 1, 'categorias_creadas': 1}
+
+    inserts = [(q, p) for q, p in db.queries if q.startswith('INSERT INTO platos')]
+    assert len(inserts) == 3  # lotes de 200 + la fila con otro conjunto de columnas
+    assert all('ON DUPLICATE KEY UPDATE' in q for q, _ in inserts)
+    ultimo = inserts[-1][1][-len(COLUMNAS_PLATO):]
+    assert ultimo[:2] == [10, 5]  # id existente emparejado por (categoría, nombre)
+    assert ultimo[-1] == 42        # versión de sincronización del lote
+    assert inserts[0][1][2] == 100     # categoría 'Postres' creada en el mismo lote
+    assert db.commits == 1
+
+
+def test_id_ajeno_se_rechaza():
+    db = FakeDB()
+    with pytest.raises(ErrorImportacion) as exc:
+        importar_platos(db, 5, [{'id': 999, 'nombre': 'X', 'categoria_id': 1, 'precio': 1}])
+    assert exc.value.errores[0]['error'] == 'Plato no encontrado'
+    assert db.rollbacks == 1 and db.commits == 0
+
+
+class FakeOrdenCursor:
+    def __init__(self, propios):
+        self.propios = propios
+        self.queries = []
+        self._last = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        if query.startswith('SELECT id FROM'):
+            tabla = query.split()[3]
+            self._last = [{'id': i} for i in params[1:] if i in self.propios[tabla]]
+
+    def fetchall(self):
+        return self._last
+
+    def fetchone(self):
+        return {'version': 1}
+
+
+class FakeOrdenDB(FakeDB):
+    def __init__(self):
+        super().__init__()
+        self.cur = FakeOrdenCursor({'categorias': {1, 2, 3}, 'platos': {10, 11, 12}})
+
+    def cursor(self):
+        return self.cur
+
+
+def test_orden_un_update_case_por_tabla():
+    db = FakeOrdenDB()
+    assert aplicar_orden(db, 5, categorias=[3, 1, 2], platos=[12, 10, 11]) == {'categorias': 3, 'platos': 3}
+
+    updates = [(q, p) for q, p in db.cur.queries if q.startswith('UPDATE') and 'CASE' in q]
+    assert len(updates) == 2
+    assert 'SET orden = CASE id WHEN %s THEN %s' in updates[0][0]
+    assert updates[0][1] == [3, 1, 1, 2, 2, 3, 5, 3, 1, 2]
+    assert db.commits == 1
+
+
+def test_orden_mueve_platos_de_categoria():
+    db = FakeOrdenDB()
+    aplicar_orden(db, 5, platos={'2': [11], '1': [10, 12]})
+    updates = [p for q, p in db.cur.queries if q.startswith('UPDATE platos SET categoria_id')]
+    assert updates[0][:6] == [11, 2, 10, 1, 12, 1]
+
+
+def test_orden_rechaza_ids_ajenos_y_repetidos():
+    db = FakeOrdenDB()
+    with pytest.raises(ValueError):
+        aplicar_orden(db, 5, categorias=[1, 1])
+    with pytest.raises(ValueError):
+        aplicar_orden(db, 5, platos=[10, 99])
+    assert not any(q.startswith('UPDATE') for q, _ in db.cur.queries)
+    assert db.commits == 0 and db.rollbacks == 1
+
+
+def test_actualizacion_solo_escribe_columnas_presentes():
+    db = FakeDB()
+    importar_platos(db, 5, [
+        {'nombre': 'Lomo a lo pobre', 'categoria': 'Fondos', 'precio': 13990},
+        {'nombre': 'Sopa', 'categoria': 'Entradas', 'precio': 3500, 'activo': '0', 'etiquetas': 'x' * 600},
+    ])
+    inserts = [(q, p) for q, p in db.queries if q.startswith('INSERT INTO platos')]
+    assert len(inserts) == 2
+
+    solo_precio = inserts[0][0].split('ON DUPLICATE KEY UPDATE')[1]
+    assert 'precio = VALUES(precio)' in solo_precio and 'row_version' in solo_precio
+    for c in ('descripcion', 'etiquetas', 'precio_oferta', 'es_popular', 'orden', 'activo'):
+        assert f'{c} = VALUES({c})' not in solo_precio
+
+    con_activo = inserts[1][0].split('ON DUPLICATE KEY UPDATE')[1]
+    assert 'activo = VALUES(activo)' in con_activo and 'etiquetas = VALUES(etiquetas)' in con_activo
+    assert 'descripcion = VALUES(descripcion)' not in con_activo
+    fila = dict(zip(COLUMNAS_PLATO, inserts[1][1]))
+    assert fila['activo'] == 0 and len(fila['etiquetas']) == 500
@@ -0,0 +1,66 @@
+from menu_sync import cambios_desde, marcar_platos, registrar_eliminados
+
+
+class FakeCursor:
+    def __init__(self, estado, platos=(), eliminados=()):
+        self.estado = estado
+        self.platos = list(platos)
+        self.eliminados = list(eliminados)
+        self.queries = []
+        self.many = []
+        self._last = []
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split())
+        self.queries.append((q, params))
+        if q.startswith('SELECT sync_version'):
+            self._last = [self.estado]
+        elif q.startswith('SELECT LAST_INSERT_ID()'):
+            self._last = [{'version': self.estado['sync_version'] + 1}]
+        elif q.startswith('SELECT p.*'):
+            self._last = self.platos if len(params) == 1 else [p for p in self.platos if p['row_version'] > params[1]]
+        elif q.startswith('SELECT plato_id FROM platos_eliminados'):
+            self._last = [{'plato_id': e} for e in self.eliminados]
+        elif q.startswith('SELECT id FROM platos'):
+            self._last = [{'id': 3}, {'id': 4}]
+
+    def executemany(self, query, params):
+        self.many.extend(params)
+
+    def fetchone(self):
+        return self._last[0] if self._last else None
+
+    def fetchall(self):
+        return self._last
+
+
+PLATOS = [{'id': 1, 'row_version': 0}, {'id': 2, 'row_version': 8}]
+
+
+def test_delta_devuelve_cambios_y_eliminados():
+    cur = FakeCursor({'sync_version': 9, 'sync_purgado_hasta': 0}, PLATOS, eliminados=[5])
+    cambios = cambios_desde(cur, 1, 7)
+    assert cambios['version'] == 9
+    assert not cambios['completo']
+    assert [p['id'] for p in cambios['platos']] == [2]
+    assert cambios['eliminados'] == [5]
+
+
+def test_cursor_purgado_o_inicial_pide_lista_completa():
+    for since in (0, 3, 50):
+        cur = FakeCursor({'sync_version': 9, 'sync_purgado_hasta': 4}, PLATOS)
+        cambios = cambios_desde(cur, 1, since)
+        assert cambios['completo']
+        assert [p['id'] for p in cambios['platos']] == [1, 2]
+        assert cambios['eliminados'] == []
+
+
+def test_escrituras_toman_version_nueva():
+    cur = FakeCursor({'sync_version': 9})
+    assert marcar_platos(cur, 1, [2]) == 10
+    assert 'LAST_INSERT_ID(sync_version + 1)' in cur.queries[0][0]
+    assert cur.queries[-1][1] == [10, 1, 2]
+    assert marcar_platos(cur, 1, []) == 0
+
+    assert registrar_eliminados(cur, 1, categoria_id=7) == 10
+    assert cur.many == [(1, 3, 10), (1, 4, 10)]
@@ -91,6 +91,7 @@ def test_webhook_processing_approved(client, monkeypatch):
         def commit(self):
             return None
     monkeypatch.setattr('app_menu.get_db', lambda: FakeDB())
+    monkeypatch.setattr('app_menu.recalcular_estado_efectivo', lambda cur, ids: None)
     # Also stub subscription info to avoid DB calls in before_request
     monkeypatch.setattr('app_menu.get_subscription_info', lambda rid: None)
 
@@ -98,3 +99,40 @@ def test_webhook_processing_approved(client, monkeypatch):
     res = client.post('/webhook/mercado-pago', json=payload)
     assert res.status_code == 200
     assert res.get_json().get('status') == 'success'
+
+def test_webhook_recalcula_estado_efectivo_con_el_clasificador(client, monkeypatch):
+    dummy_client = DummyMPClient({})
+    monkeypatch.setattr('app_menu.MERCADOPAGO_CLIENT', dummy_client)
+
+    consultas = []
+    recalculos = []
+
+    class FakeCur:
+        def execute(self, q, params=None):
+            consultas.append(q)
+        def fetchone(self):
+            return {'fecha_vencimiento': None}
+    class FakeCtx:
+        def __enter__(self):
+            return FakeCur()
+        def __exit__(self, *a):
+            pass
+    class FakeDB:
+        def cursor(self):
+            return FakeCtx()
+        def commit(self):
+            consultas.append('COMMIT')
+    monkeypatch.setattr('app_menu.get_db', lambda: FakeDB())
+    monkeypatch.setattr('app_menu.get_subscription_info', lambda rid: None)
+    monkeypatch.setattr(
+        'app_menu.recalcular_estado_efectivo',
+        lambda cur, ids: (recalculos.append(list(ids)), consultas.append('RECALCULO')),
+    )
+
+    res = client.post('/webhook/mercado-pago', json={"data": {"id": "pay_1"}})
+    assert res.status_code == 200
+
+    update = [q for q in consultas if q not in ('COMMIT', 'RECALCULO') and 'UPDATE restaurantes' in q]
+    assert update and 'estado_efectivo' not in update[0]
+    assert recalculos == [[1]]
+    assert consultas.index('RECALCULO') < consultas.index('COMMIT')
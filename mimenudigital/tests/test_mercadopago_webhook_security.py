@@ -69,6 +69,7 @@ def test_webhook_signature_valid(client, monkeypatch):
         def commit(self):
             return None
     monkeypatch.setattr('app_menu.get_db', lambda: FakeDB())
+    monkeypatch.setattr('app_menu.recalcular_estado_efectivo', lambda cur, ids: None)
 
     res = client.post('/webhook/mercado-pago', data=body, headers=headers, content_type='application/json')
     assert res.status_code == 200
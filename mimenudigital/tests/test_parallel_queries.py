@@ -0,0 +1,120 @@
+import threading
+import time
+from contextlib import contextmanager
+
+import database
+from database import run_parallel_queries
+
+
+class FakeCursor:
+    def __init__(self, resultados):
+        self.resultados = resultados
+        self._last = None
+
+    def execute(self, query, params=None):
+        if query.startswith('SET SESSION'):
+            return
+        if query == 'FALLA':
+            raise RuntimeError('tabla no existe')
+        if query == 'LENTA':
+            time.sleep(0.5)
+        if query == 'MEDIA':
+            time.sleep(0.15)
+        if query == 'JUNTAS':
+            self.resultados['barrera'].wait()
+        self._last = self.resultados.get(query)
+
+    def fetchone(self):
+        return self._last[0] if self._last else None
+
+    def fetchall(self):
+        return self._last or []
+
+    def close(self):
+        pass
+
+
+class FakeConn:
+    def __init__(self, resultados):
+        self.resultados = resultados
+
+    def cursor(self):
+        return FakeCursor(self.resultados)
+
+
+def _fake_pool(monkeypatch, resultados):
+    hilos = set()
+
+    @contextmanager
+    def fake_get_connection():
+        hilos.add(threading.current_thread().name)
+        yield FakeConn(resultados)
+
+    monkeypatch.setattr(database, 'get_connection', fake_get_connection)
+    return hilos
+
+
+def test_resultados_por_nombre_en_threads_del_pool(monkeypatch):
+    hilos = _fake_pool(monkeypatch, {
+        'Q1': [{'total': 3}],
+        'Q2': [{'id': 1}, {'id': 2}],
+    })
+    res = run_parallel_queries({
+        'uno': ('Q1', None, 'one'),
+        'varios': ('Q2', None),
+        'callable': lambda cur: 'ok',
+    })
+    assert res['uno'] == {'total': 3}
+    assert res['varios'] == [{'id': 1}, {'id': 2}]
+    assert res['callable'] == 'ok'
+    assert res.errors == {}
+    assert all(h.startswith('db-fanout') for h in hilos)
+
+
+def test_query_que_falla_no_aborta_las_demas(monkeypatch):
+    _fake_pool(monkeypatch, {'Q1': [{'total': 3}]})
+    res = run_parallel_queries(
+        {'ok': ('Q1', None, 'one'), 'mala': ('FALLA', None)},
+        defaults={'mala': []},
+    )
+    assert res['ok'] == {'total': 3}
+    assert res['mala'] == []
+    assert 'tabla no existe' in res.errors['mala']
+
+
+def test_timeout_usa_default(monkeypatch):
+    _fake_pool(monkeypatch, {'Q1': [{'total': 3}]})
+    inicio = time.time()
+    res = run_parallel_queries(
+        {'ok': ('Q1', None, 'one'), 'lenta': ('LENTA', None, 'one')},
+        timeout=0.1,
+        defaults={'lenta': {'total': 0}},
+    )
+    assert time.time() - inicio < 0.4
+    assert res['ok'] == {'total': 3}
+    assert res['lenta'] == {'total': 0}
+    assert res.errors['lenta'] == 'timeout'
+
+
+def test_timeout_es_por_query_aunque_esperen_conexion(monkeypatch):
+    _fake_pool(monkeypatch, {'MEDIA': [{'total': 1}]})
+    monkeypatch.setattr(database, '_workers_fanout', lambda n: 2)
+    # 6 queries de 0.15 s en 2 threads: 0.45 s en total, pero ninguna excede 0.3 s
+    res = run_parallel_queries({f'q{i}': ('MEDIA', None, 'one') for i in range(6)}, timeout=0.3)
+    assert res.errors == {}
+    assert all(v == {'total': 1} for v in res.values())
+
+
+def test_un_thread_por_query_acotado_por_el_pool(monkeypatch):
+    barrera = threading.Barrier(5, timeout=2)
+    hilos = _fake_pool(monkeypatch, {'barrera': barrera, 'JUNTAS': [{'ok': 1}]})
+    # Las 5 queries solo terminan si corren a la vez
+    res = run_parallel_queries({f'q{i}': ('JUNTAS', None, 'one') for i in range(5)}, timeout=1)
+    assert res.errors == {}
+    assert len(hilos) == 5
+
+    status = {'max_total': 15, 'in_use': 11}
+    monkeypatch.setattr(database, '_pool', type('Pool', (), {'status': status})())
+    assert database._workers_fanout(19) == 15 - 11 - database.FANOUT_CONEXIONES_LIBRES
+    status['in_use'] = 15
+    assert database._workers_fanout(19) == 1
@@ -98,3 +98,29 @@ def test_process_missing_file_marks_failed(monkeypatch):
     rc = process(limit=10, max_attempts=3, dry_run=False)
     assert rc == 0
     assert fake_db.commits >= 1
+
+
+def test_admin_endpoint_encola_lote_sin_bloquear(client, monkeypatch):
+    llamadas = []
+
+    def fake_procesar_pendientes(**kwargs):
+        llamadas.append(kwargs)
+        return {'lote': 'abc123', 'reclamados': 4}
+
+    monkeypatch.setitem(app_menu.app.config, 'WTF_CSRF_ENABLED', False)
+    monkeypatch.setattr(app_menu, 'CLOUDINARY_AVAILABLE', True)
+    monkeypatch.setattr(app_menu, 'is_cloudinary_ready', lambda: True)
+    monkeypatch.setattr(app_menu.pipeline_imagenes, 'procesar_pendientes', fake_procesar_pendientes)
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['restaurante_id'] = 1
+        sess['rol'] = 'admin'
+
+    res = client.post('/admin/cloudinary/process-pendings', json={'limit': 10})
+    assert res.status_code == 202
+    body = res.get_json()
+    assert body['lote'] == 'abc123' and body['reclamados'] == 4
+    assert body['estado_url'].endswith('/admin/cloudinary/process-pendings/abc123')
+    # Un admin solo encola las imágenes de su restaurante
+    assert llamadas == [{'limite': 10, 'restaurante_id': 1, 'max_intentos': 5, 'esperar': False}]
@@ -0,0 +1,163 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+
+import scheduler as scheduler_mod
+from scheduler import CronSpec, Scheduler
+
+
+def test_cron_siguiente():
+    diario = CronSpec('5 0 * * *')
+    assert diario.siguiente(datetime(2026, 3, 10, 0, 4)) == datetime(2026, 3, 10, 0, 5)
+    assert diario.siguiente(datetime(2026, 3, 10, 0, 5)) == datetime(2026, 3, 11, 0, 5)
+
+    cada_15 = CronSpec('*/15 8-9 * * *')
+    assert cada_15.siguiente(datetime(2026, 3, 10, 9, 50)) == datetime(2026, 3, 11, 8, 0)
+
+    # Lunes (1) a las 03:30; 2026-03-10 es martes
+    lunes = CronSpec('30 3 * * 1')
+    assert lunes.siguiente(datetime(2026, 3, 10, 12, 0)) == datetime(2026, 3, 16, 3, 30)
+
+    fin_de_anio = CronSpec('0 0 1 1 *')
+    assert fin_de_anio.siguiente(datetime(2026, 3, 10)) == datetime(2027, 1, 1, 0, 0)
+
+
+def test_cron_invalido():
+    with pytest.raises(ValueError):
+        CronSpec('* * *')
+    with pytest.raises(ValueError):
+        CronSpec('61 * * * *')
+
+
+class FakeLeaseCursor:
+    """Simula jobs_programados / jobs_historial para el protocolo de lease."""
+
+    def __init__(self, db):
+        self.db = db
+        self.rowcount = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split())
+        if q.startswith('INSERT IGNORE INTO jobs_programados'):
+            self.db.jobs.setdefault(params[0], {'lease_owner': None, 'lease_hasta': None,
+                                                'proxima_ejecucion': params[1], 'ejecuciones': 0, 'fallos': 0})
+        elif q.startswith('UPDATE jobs_programados SET lease_owner = %s, lease_hasta = %s'):
+            owner, hasta, nombre, ahora = params[:4]
+            fila = self.db.jobs[nombre]
+            libre = fila['lease_hasta'] is None or fila['lease_hasta'] < ahora
+            vencido = len(params) == 4 or fila['proxima_ejecucion'] <= params[4]
+            self.rowcount = 0
+            if libre and vencido:
+                fila.update(lease_owner=owner, lease_hasta=hasta)
+                self.rowcount = 1
+        elif q.startswith('UPDATE jobs_programados SET lease_owner = NULL'):
+            nombre, owner = params[-2:]
+            fila = self.db.jobs[nombre]
+            if fila['lease_owner'] == owner:
+                fila.update(lease_owner=None, lease_hasta=None, proxima_ejecucion=params[1],
+                            ultimo_estado=params[2], ejecuciones=fila['ejecuciones'] + 1,
+                            fallos=fila['fallos'] + params[5])
+        elif q.startswith('INSERT INTO jobs_historial'):
+            self.db.historial.append(params)
+
+
+class FakeLeaseDB:
+    def __init__(self):
+        self.jobs = {}
+        self.historial = []
+
+    def cursor(self):
+        return FakeLeaseCursor(self)
+
+    def commit(self):
+        pass
+
+
+@pytest.fixture
+def lease_db(monkeypatch):
+    db = FakeLeaseDB()
+
+    @contextmanager
+    def fake_get_connection():
+        yield db
+
+    monkeypatch.setattr(scheduler_mod, 'get_connection', fake_get_connection)
+    return db
+
+
+def test_job_corre_una_vez_por_periodo(lease_db):
+    llamadas = []
+    a = Scheduler(worker_id='web-1')
+    b = Scheduler(worker_id='web-2')
+    for s in (a, b):
+        s.registrar('limpieza', lambda: llamadas.append(1) or {'ok': True}, cada=3600)
+
+    assert [r['estado'] for r in a.ejecutar_pendientes()] == ['ok']
+    # El otro worker ve proxima_ejecucion en el futuro y no lo repite
+    assert b.ejecutar_pendientes() == []
+    assert len(llamadas) == 1
+    assert lease_db.jobs['limpieza']['ejecuciones'] == 1
+    assert lease_db.jobs['limpieza']['proxima_ejecucion'] > datetime.now()
+
+
+def test_cron_nuevo_espera_su_horario(lease_db):
+    llamadas = []
+    s = Scheduler(worker_id='web-1')
+    s.registrar('nocturno', lambda: llamadas.append(1), cron='30 3 * * *')
+    s.registrar('frecuente', lambda: llamadas.append(2), cada=600)
+
+    # Primer tick tras desplegar: solo corre el de intervalo
+    assert [r['nombre'] for r in s.ejecutar_pendientes()] == ['frecuente']
+    assert llamadas == [2]
+    proxima = lease_db.jobs['nocturno']['proxima_ejecucion']
+    assert (proxima.hour, proxima.minute) == (3, 30) and proxima > datetime.now()
+
+
+def test_lease_tomado_bloquea_aunque_se_fuerce(lease_db):
+    a = Scheduler(worker_id='web-1')
+    a.registrar('lento', lambda: None, cada=60)
+    assert a._tomar_lease(a._jobs['lento'], datetime.now())
+
+    b = Scheduler(worker_id='web-2')
+    b.registrar('lento', lambda: None, cada=60)
+    assert b.ejecutar('lento', forzar=True) is None
+
+
+def test_error_queda_en_historial(lease_db):
+    s = Scheduler(worker_id='web-1')
+
+    def falla():
+        raise RuntimeError('sin conexión')
+    s.registrar('roto', falla, cron='0 * * * *')
+
+    resultado = s.ejecutar('roto', forzar=True)
+    assert resultado['estado'] == 'error'
+    assert 'sin conexión' in resultado['error']
+    assert lease_db.jobs['roto']['fallos'] == 1
+    assert lease_db.jobs['roto']['lease_owner'] is None
+    assert lease_db.historial[0][5] == 'error'
+
+
+def test_api_jobs_requiere_superadmin(client, monkeypatch):
+    import app_menu
+    monkeypatch.setattr(app_menu.scheduler, 'estado', lambda: {'worker': 'w', 'jobs': [], 'historial': []})
+
+    res = client.get('/api/superadmin/jobs')
+    assert res.status_code in (302, 401, 403)
+
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['rol'] = 'superadmin'
+    res = client.get('/api/superadmin/jobs')
+    assert res.status_code == 200
+    assert res.get_json()['worker'] == 'w'
+    assert {'snapshot_stats', 'barrido_suscripciones', 'limpiar_password_resets'} <= {
+        j.nombre for j in app_menu.scheduler.jobs()
+    }
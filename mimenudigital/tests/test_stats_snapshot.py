@@ -0,0 +1,97 @@
+import json
+
+import app_menu
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+        self._one = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split()).lower()
+        self.db.executed.append(q)
+        if 'from estadisticas_snapshot' in q:
+            self._one = self.db.snapshot_row
+        elif q.startswith('insert into estadisticas_snapshot'):
+            self.db.guardado = json.loads(params[1])
+
+    def fetchone(self):
+        return self._one
+
+
+class FakeDB:
+    def __init__(self, snapshot_row=None):
+        self.snapshot_row = snapshot_row
+        self.executed = []
+        self.guardado = None
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        pass
+
+
+def login_as_superadmin(client):
+    with client.session_transaction() as sess:
+        sess['user_id'] = 1
+        sess['rol'] = 'superadmin'
+
+
+def _limpiar_cache():
+    if app_menu.SECURITY_MIDDLEWARE_AVAILABLE:
+        app_menu.get_cache().delete(f"stats_snapshot:{app_menu.STATS_SNAPSHOT_KEY}")
+
+
+def test_sirve_snapshot_persistido_sin_recalcular(client, monkeypatch):
+    _limpiar_cache()
+    row = {'payload': json.dumps({'total_visitas': 42, 'computed_at': '2026-01-01T10:00:00'}), 'edad': 10}
+    fake_db = FakeDB(snapshot_row=row)
+    monkeypatch.setattr(app_menu, 'get_db', lambda: fake_db)
+
+    def no_recalcular():
+        raise AssertionError('no debería recalcular')
+    monkeypatch.setattr(app_menu, '_calcular_stats_extendidas', no_recalcular)
+
+    login_as_superadmin(client)
+    res = client.get('/api/superadmin/stats-extended')
+    assert res.status_code == 200
+    data = res.get_json()
+    assert data['total_visitas'] == 42
+    assert data['computed_at'] == '2026-01-01T10:00:00'
+    _limpiar_cache()
+
+
+def test_refresh_recalcula_y_persiste(client, monkeypatch):
+    _limpiar_cache()
+    fake_db = FakeDB(snapshot_row={'payload': json.dumps({'total_visitas': 1}), 'edad': 5})
+    monkeypatch.setattr(app_menu, 'get_db', lambda: fake_db)
+    monkeypatch.setattr(app_menu, '_calcular_stats_extendidas', lambda: {'total_visitas': 7})
+
+    login_as_superadmin(client)
+    res = client.get('/api/superadmin/stats-extended?refresh=1')
+    assert res.status_code == 200
+    data = res.get_json()
+    assert data['total_visitas'] == 7
+    assert data['computed_at']
+    assert fake_db.guardado['total_visitas'] == 7
+    _limpiar_cache()
+
+
+def test_snapshot_vencido_se_recalcula(client, monkeypatch):
+    _limpiar_cache()
+    row = {'payload': json.dumps({'total_visitas': 1}), 'edad': app_menu.STATS_SNAPSHOT_INTERVAL + 1}
+    fake_db = FakeDB(snapshot_row=row)
+    monkeypatch.setattr(app_menu, 'get_db', lambda: fake_db)
+    monkeypatch.setattr(app_menu, '_calcular_stats_extendidas', lambda: {'total_visitas': 3})
+
+    login_as_superadmin(client)
+    assert client.get('/api/superadmin/stats-extended').get_json()['total_visitas'] == 3
+    _limpiar_cache()
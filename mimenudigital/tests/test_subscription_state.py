@@ -0,0 +1,114 @@
+import os
+from contextlib import contextmanager
+from datetime import date
+
+import flask
+
+import subscription_state
+from scripts import sweep_suscripciones
+from subscription_state import (
+    calcular_estado_efectivo, clasificar_planes, recalcular_estado_efectivo, barrido_vencimientos
+)
+
+HOY = date(2026, 3, 10)
+PLANES = [{'id': 1, 'nombre': 'Gratis'}, {'id': 2, 'nombre': 'Premium'}]
+
+
+def _rest(**kw):
+    r = {'id': 1, 'plan_id': 2, 'estado_suscripcion': 'activa', 'fecha_vencimiento': date(2026, 4, 1), 'activo': 1}
+    r.update(kw)
+    return r
+
+
+def test_calcular_estado_efectivo():
+    premium, gratuitos = clasificar_planes(PLANES)
+    assert (premium, gratuitos) == ([2], [1])
+
+    assert calcular_estado_efectivo(_rest(), premium, gratuitos, HOY) == 'activa'
+    assert calcular_estado_efectivo(_rest(fecha_vencimiento=date(2026, 3, 1)), premium, gratuitos, HOY) == 'vencida'
+    assert calcular_estado_efectivo(_rest(activo=0), premium, gratuitos, HOY) == 'suspendida'
+    assert calcular_estado_efectivo(_rest(estado_suscripcion='Trial'), premium, gratuitos, HOY) == 'prueba'
+    assert calcular_estado_efectivo(_rest(plan_id=1, estado_suscripcion=''), premium, gratuitos, HOY) == 'gratuito'
+
+
+class FakeCursor:
+    def __init__(self, restaurantes):
+        self.restaurantes = restaurantes
+        self.queries = []
+        self.updates = []
+        self._last = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, query, params=None):
+        self.queries.append((query, params))
+        if 'FROM planes' in query:
+            self._last = PLANES
+        else:
+            self._last = self.restaurantes
+
+    def fetchall(self):
+        return self._last
+
+    def executemany(self, query, params):
+        self.updates.extend(params)
+
+
+class FakeDB:
+    def __init__(self, cur):
+        self.cur = cur
+        self.commits = 0
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+
+def test_recalcular_solo_actualiza_cambios():
+    cur = FakeCursor([
+        _rest(id=1, estado_efectivo='activa'),
+        _rest(id=2, activo=0, estado_efectivo='activa'),
+    ])
+    assert recalcular_estado_efectivo(cur, [1, 2], hoy=HOY) == 1
+    assert cur.updates == [('suspendida', 2)]
+    assert cur.queries[0][1] == [1, 2]
+
+
+def test_barrido_marca_vencidas_y_completa_nulos():
+    cur = FakeCursor([
+        _rest(id=1, fecha_vencimiento=date(2026, 3, 9), estado_efectivo='activa'),
+        _rest(id=2, plan_id=1, estado_suscripcion='prueba', estado_efectivo=None),
+    ])
+    db = FakeDB(cur)
+    assert barrido_vencimientos(db, hoy=HOY) == {'actualizados': 2}
+    assert cur.updates == [('vencida', 1), ('prueba', 2)]
+    assert "estado_efectivo = 'activa' AND fecha_vencimiento < %s" in cur.queries[0][0]
+    assert db.commits == 1
+
+
+def test_script_corre_sin_app_context(monkeypatch):
+    db = FakeDB(FakeCursor([_rest(id=1, fecha_vencimiento=date(2999, 1, 1), estado_efectivo=None)]))
+
+    @contextmanager
+    def conexion():
+        yield db
+
+    monkeypatch.setattr(sweep_suscripciones, 'get_connection', conexion)
+    assert not flask.has_app_context()
+    assert sweep_suscripciones.run() == 0
+    assert db.cur.updates == [('activa', 1)] and db.commits == 1
+
+
+def test_backfill_sql_usa_los_mismos_estados():
+    ruta = os.path.join(os.path.dirname(subscription_state.__file__), 'migrations', '021_add_estado_efectivo.sql')
+    sql = open(ruta, encoding='utf-8').read()
+    for estados in (subscription_state._ESTADOS_PRUEBA, subscription_state._ESTADOS_SUSPENDIDA,
+                    subscription_state._ESTADOS_ACTIVA):
+        assert '(' + ', '.join(f"'{e}'" for e in estados) + ')' in sql
+    assert 'WHERE r.estado_efectivo IS NULL' in sql
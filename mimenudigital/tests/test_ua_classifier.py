@@ -0,0 +1,46 @@
+from ua_classifier import clasificar_user_agent, cache_info
+
+IPHONE_INSTAGRAM = ('Mozilla/5.0 (iPhone; CPU iPhone OS 17_1 like Mac OS X) AppleWebKit/605.1.15 '
+                    '(KHTML, like Gecko) Mobile/15E148 Instagram 307.0.0.34.111')
+ANDROID_CHROME = ('Mozilla/5.0 (Linux; Android 13; SM-S901B) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/112.0.0.0 Mobile Safari/537.36')
+ANDROID_TABLET = ('Mozilla/5.0 (Linux; Android 12; SM-X700) AppleWebKit/537.36 '
+                  '(KHTML, like Gecko) Chrome/112.0.0.0 Safari/537.36')
+WINDOWS_EDGE = ('Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 '
+                '(KHTML, like Gecko) Chrome/120.0 Safari/537.36 Edg/120.0')
+IPHONE_FACEBOOK = ('Mozilla/5.0 (iPhone; CPU iPhone OS 16_0 like Mac OS X) AppleWebKit/605.1.15 '
+                   '(KHTML, like Gecko) Mobile/15E148 [FBAN/FBIOS;FBAV/400.0.0]')
+
+
+def test_mismos_criterios_movil_y_qr_que_antes():
+    assert clasificar_user_agent(ANDROID_CHROME).es_movil
+    assert clasificar_user_agent(ANDROID_TABLET).es_movil  # 'android' contaba como móvil
+    assert not clasificar_user_agent(WINDOWS_EDGE).es_movil
+    assert clasificar_user_agent('ZXing Barcode Scanner').ua_qr
+    assert not clasificar_user_agent(ANDROID_CHROME).ua_qr
+    assert not clasificar_user_agent('').es_movil
+
+
+def test_campos_enriquecidos():
+    info = clasificar_user_agent(IPHONE_INSTAGRAM)
+    assert (info.dispositivo, info.os, info.navegador, info.app) == ('movil', 'ios', 'in-app', 'instagram')
+
+    info = clasificar_user_agent(IPHONE_FACEBOOK)
+    assert info.app == 'facebook'
+
+    info = clasificar_user_agent(ANDROID_CHROME)
+    assert (info.dispositivo, info.os, info.navegador, info.app) == ('movil', 'android', 'chrome', None)
+
+    assert clasificar_user_agent(ANDROID_TABLET).dispositivo == 'tablet'
+
+    info = clasificar_user_agent(WINDOWS_EDGE)
+    assert (info.dispositivo, info.os, info.navegador) == ('desktop', 'windows', 'edge')
+
+    assert clasificar_user_agent('Googlebot/2.1 (+http://www.google.com/bot.html)').dispositivo == 'bot'
+
+
+def test_resultado_cacheado_por_ua():
+    antes = cache_info()['hits']
+    clasificar_user_agent(ANDROID_CHROME)
+    clasificar_user_agent(ANDROID_CHROME)
+    assert cache_info()['hits'] >= antes + 1
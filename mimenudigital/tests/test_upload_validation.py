@@ -0,0 +1,67 @@
+import io
+
+import pytest
+from werkzeug.datastructures import FileStorage
+
+import app_menu
+from upload_validation import ArchivoDemasiadoGrande, inspeccionar_upload
+
+
+class StreamContado(io.BytesIO):
+    """BytesIO que registra cuántos bytes se leyeron."""
+
+    def __init__(self, data, seekable=True):
+        super().__init__(data)
+        self._seekable = seekable
+        self.leidos = 0
+
+    def read(self, n=-1):
+        data = super().read(n)
+        self.leidos += len(data)
+        return data
+
+    def seekable(self):
+        return self._seekable
+
+
+JPEG = b'\xff\xd8\xff\xe0' + b'\x00' * (3 * 1024 * 1024)
+
+
+def test_mide_con_seek_y_lee_solo_la_cabecera():
+    stream = StreamContado(JPEG)
+    stream.seek(0)
+    tamano, cabecera = inspeccionar_upload(FileStorage(stream, 'a.jpg'), max_len=5 * 1024 * 1024)
+    assert tamano == len(JPEG)
+    assert cabecera == JPEG[:2048]
+    assert stream.leidos == 2048
+    assert stream.tell() == 0
+
+    grande = StreamContado(JPEG)
+    with pytest.raises(ArchivoDemasiadoGrande):
+        inspeccionar_upload(FileStorage(grande, 'a.jpg'), max_len=1024 * 1024)
+    assert grande.leidos == 0
+
+
+def test_stream_no_seekable_se_copia_y_la_subida_lee_la_copia():
+    archivo = FileStorage(StreamContado(JPEG, seekable=False), 'a.jpg')
+    tamano, cabecera = inspeccionar_upload(archivo, max_len=5 * 1024 * 1024)
+    assert tamano == len(JPEG) and cabecera.startswith(b'\xff\xd8\xff')
+    # file.stream ahora es el spool: read() devuelve el archivo completo desde el inicio
+    assert archivo.read() == JPEG
+
+    with pytest.raises(ArchivoDemasiadoGrande):
+        inspeccionar_upload(FileStorage(StreamContado(JPEG, seekable=False), 'a.jpg'), max_len=1024 * 1024)
+
+
+def test_validate_image_file_una_sola_lectura_de_cabecera(monkeypatch):
+    monkeypatch.setitem(app_menu.app.config, 'TESTING', False)
+    monkeypatch.setattr(app_menu, 'MAGIC_AVAILABLE', False)
+
+    stream = StreamContado(JPEG)
+    assert app_menu.validate_image_file(FileStorage(stream, 'ok.jpg')) == (True, None)
+    assert stream.leidos <= 2048 and stream.tell() == 0
+
+    texto = FileStorage(StreamContado(b'not-an-image-bytes'), 'fake.jpg')
+    assert app_menu.validate_image_file(texto) == (False, 'Contenido no es imagen')
+    grande = FileStorage(StreamContado(b'\xff\xd8\xff' + b'\x00' * (6 * 1024 * 1024)), 'big.jpg')
+    assert app_menu.validate_image_file(grande) == (False, 'Archivo demasiado grande')
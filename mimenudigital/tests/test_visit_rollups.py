@@ -0,0 +1,164 @@
+import os
+import re
+from datetime import datetime
+
+import analytics
+from analytics import agregar_visitas, escribir_rollups, clasificar_origen, dia_semana_mysql, inicio_semana
+
+
+class FakeCursor:
+    def __init__(self):
+        self.calls = []
+
+    def executemany(self, query, params):
+        self.calls.append((query, list(params)))
+
+
+def _visita(rid=1, movil=True, qr=False, referer='', hora=13, dia=2, fecha='2026-01-05'):
+    return {
+        'restaurante_id': rid,
+        'ip_address': '1.2.3.4',
+        'user_agent': 'ua',
+        'referer': referer,
+        'es_movil': movil,
+        'es_qr': qr,
+        'fecha': fecha,
+        'hora': hora,
+        'dia_semana': dia,
+    }
+
+
+def test_dia_semana_sigue_convencion_mysql():
+    assert dia_semana_mysql(datetime(2026, 1, 4)) == 1  # domingo
+    assert dia_semana_mysql(datetime(2026, 1, 5)) == 2  # lunes
+    assert dia_semana_mysql(datetime(2026, 1, 10)) == 7  # sábado
+
+
+def test_clasificar_origen():
+    assert clasificar_origen(True, 'https://google.com/') == 'qr'
+    assert clasificar_origen(False, '') == 'directo'
+    assert clasificar_origen(False, 'https://l.instagram.com/?u=x') == 'social'
+    assert clasificar_origen(False, 'https://www.google.cl/search') == 'buscador'
+    assert clasificar_origen(False, 'https://blog.example.com/') == 'referido'
+
+
+def test_dispositivo_mantiene_el_dominio_del_backfill():
+    tablet = dict(_visita(), dispositivo='tablet')
+    bot = dict(_visita(movil=False), dispositivo='bot')
+    agg = agregar_visitas([tablet, bot])
+    valores = {valor for (_, _, dim, valor) in agg['dimensiones'] if dim == 'dispositivo'}
+    assert valores == {'movil', 'desktop'}
+
+    ruta = os.path.join(os.path.dirname(analytics.__file__), 'migrations', '017_create_analytics_rollups.sql')
+    sql = open(ruta, encoding='utf-8').read()
+    assert "'dispositivo' (movil, desktop)" in sql
+    assert "CASE WHEN es_movil = 1 THEN 'movil' ELSE 'desktop' END" in sql
+
+
+def test_semana_hora_separa_semanas():
+    assert inicio_semana('2026-01-11') == '2026-01-05'  # domingo -> lunes anterior
+    assert inicio_semana(datetime(2026, 1, 12, 9)) == '2026-01-12'
+    agg = agregar_visitas([_visita(fecha='2026-01-05'), _visita(fecha='2026-01-12')])
+    assert set(agg['semana_hora']) == {(1, '2026-01-05', 2, 13), (1, '2026-01-12', 2, 13)}
+
+
+def test_backfill_de_origen_usa_las_mismas_listas_de_dominios():
+    ruta = os.path.join(os.path.dirname(analytics.__file__), 'migrations', '017_create_analytics_rollups.sql')
+    sql = open(ruta, encoding='utf-8').read()
+    en_sql = set(re.findall(r"host LIKE '%([^%']+)%'", sql))
+    assert en_sql == set(analytics._DOMINIOS_SOCIALES) | set(analytics._DOMINIOS_BUSCADORES)
+    for origen in ('qr', 'directo', 'social', 'buscador', 'referido'):
+        assert f"'{origen}'" in sql
+
+
+def test_agregar_visitas_por_hora_y_dimension():
+    batch = [
+        _visita(qr=True),
+        _visita(movil=False, referer='https://www.google.com/'),
+        _visita(hora=20),
+        _visita(rid=2),
+    ]
+    agg = agregar_visitas(batch)
+
+    assert agg['diarias'][(1, '2026-01-05')] == {'visitas': 3, 'qr': 1, 'movil': 2, 'desktop': 1}
+    assert agg['horarias'][(1, '2026-01-05', 13)]['visitas'] == 2
+    assert agg['horarias'][(1, '2026-01-05', 20)]['visitas'] == 1
+    assert agg['semana_hora'][(1, '2026-01-05', 2, 13)]['qr'] == 1
+    assert agg['dimensiones'][(1, '2026-01-05', 'origen', 'buscador')] == 1
+    assert agg['dimensiones'][(1, '2026-01-05', 'origen', 'directo')] == 1
+    assert agg['dimensiones'][(1, '2026-01-05', 'dispositivo', 'movil')] == 2
+    assert agg['dimensiones'][(2, '2026-01-05', 'dispositivo', 'movil')] == 1
+
+
+def test_escribir_rollups_un_executemany_por_tabla():
+    cur = FakeCursor()
+    escribir_rollups(cur, agregar_visitas([_visita(), _visita(hora=9)]))
+
+    tablas = [q.split('INSERT INTO')[1].split()[0] for q, _ in cur.calls]
+    assert tablas == [
+        'estadisticas_diarias',
+        'estadisticas_horarias',
+        'estadisticas_semana_hora',
+        'estadisticas_dimensiones',
+    ]
+    # Dos horas distintas -> dos filas en el rollup horario
+    assert len(cur.calls[1][1]) == 2
+    assert all('ON DUPLICATE KEY UPDATE' in q for q, _ in cur.calls)
+
+
+class FakeDimCursor:
+    """Simula la tabla diccionario: INSERT IGNORE por hash + SELECT id, hash."""
+
+    def __init__(self):
+        self.tabla = {}
+        self.roundtrips = 0
+        self._last = []
+
+    def executemany(self, query, params):
+        self.roundtrips += 1
+        for h, _valor in params:
+            self.tabla.setdefault(h, len(self.tabla) + 1)
+
+    def execute(self, query, params=None):
+        self.roundtrips += 1
+        self._last = [{'id': self.tabla[h], 'hash': h} for h in params if h in self.tabla]
+
+    def fetchall(self):
+        return self._last
+
+
+def test_diccionario_resuelve_ids_y_usa_lru():
+    from analytics import DiccionarioDimension
+
+    cur = FakeDimCursor()
+    dic = DiccionarioDimension('user_agents', 'user_agent', capacidad=2)
+
+    ids = dic.resolver(cur, ['ua-a', 'ua-b', 'ua-a', ''])
+    assert set(ids) == {'ua-a', 'ua-b'}
+    assert ids['ua-a'] != ids['ua-b']
+    assert cur.roundtrips == 2  # un INSERT IGNORE + un SELECT para todo el batch
+
+    # Segundo batch con valores conocidos: no toca la BD
+    assert dic.resolver(cur, ['ua-b', 'ua-a']) == ids
+    assert cur.roundtrips == 2
+
+    # Capacidad 2: al entrar 'ua-c' se expulsa el menos usado ('ua-b')
+    dic.resolver(cur, ['ua-c'])
+    assert dic.stats()['size'] == 2
+    assert dic.resolver(cur, ['ua-b'])['ua-b'] == ids['ua-b']
+
+
+def test_filas_visitas_normaliza_referer(monkeypatch):
+    import analytics
+
+    monkeypatch.setattr(analytics, 'user_agents_dict', analytics.DiccionarioDimension('user_agents', 'user_agent'))
+    monkeypatch.setattr(analytics, 'referers_dict', analytics.DiccionarioDimension('referers', 'referer'))
+    cur = FakeDimCursor()
+    filas = analytics.filas_visitas(cur, [
+        _visita(referer='https://l.facebook.com/?fbclid=1'),
+        _visita(referer='https://l.facebook.com/?fbclid=2'),
+        _visita(referer=''),
+    ])
+    assert filas[0][3] == filas[1][3] is not None
+    assert filas[2][3] is None
+    assert filas[0][2] == filas[2][2]  # mismo user agent -> mismo id
@@ -0,0 +1,90 @@
+import csv
+import gzip
+from contextlib import contextmanager
+from datetime import datetime
+
+import flask
+
+import retention
+from scripts import purge_visitas
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def execute(self, query, params=None):
+        q = ' '.join(query.split()).lower()
+        self.db.executed.append((q, params))
+        if q.startswith('delete from visitas'):
+            borrar = set(params)
+            self.db.rows = [r for r in self.db.rows if r['id'] not in borrar]
+
+    def fetchall(self):
+        q, params = self.db.executed[-1]
+        corte, limit = params
+        return [r for r in self.db.rows if r['fecha'] < corte][:limit]
+
+
+class FakeDB:
+    def __init__(self, rows):
+        self.rows = rows
+        self.executed = []
+        self.commits = 0
+
+    def cursor(self):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+
+def _row(i, fecha):
+    return {'id': i, 'restaurante_id': 1, 'ip_address': '1.1.1.1', 'user_agent': 'ua',
+            'referer': '', 'es_movil': 1, 'es_qr': 0, 'fecha': fecha}
+
+
+def test_purga_por_chunks_exporta_antes_de_borrar(tmp_path):
+    viejas = [_row(i, datetime(2020, 1 + i % 2, 10)) for i in range(1, 6)]
+    reciente = _row(99, datetime(2999, 1, 1))
+    db = FakeDB(viejas + [reciente])
+
+    res = retention.purgar_visitas(db, dias=30, chunk_size=2, archivo_dir=str(tmp_path), pausa=0)
+
+    assert res['filas_eliminadas'] == 5
+    assert res['chunks'] == 3
+    assert db.commits == 3
+    assert [r['id'] for r in db.rows] == [99]
+
+    # Un archivo por mes, con cabecera una sola vez aunque se escriba en varios chunks
+    assert [p.rsplit('/', 1)[-1] for p in res['archivos']] == ['visitas-2020-01.csv.gz', 'visitas-2020-02.csv.gz']
+    with gzip.open(res['archivos'][0], 'rt') as fh:
+        filas = list(csv.reader(fh))
+    assert filas[0] == list(retention.COLUMNAS_ARCHIVO)
+    assert sorted(int(f[0]) for f in filas[1:]) == [2, 4]
+
+
+def test_max_chunks_limita_la_ejecucion(tmp_path):
+    db = FakeDB([_row(i, datetime(2020, 1, 1)) for i in range(1, 11)])
+    res = retention.purgar_visitas(db, dias=30, chunk_size=3, archivo_dir=str(tmp_path), pausa=0, max_chunks=2)
+    assert res['filas_eliminadas'] == 6
+    assert len(db.rows) == 4
+
+
+def test_script_corre_sin_app_context(monkeypatch):
+    db = FakeDB([_row(i, datetime(2020, 1, 1)) for i in range(1, 4)])
+
+    @contextmanager
+    def conexion():
+        yield db
+
+    monkeypatch.setattr(purge_visitas, 'get_connection', conexion)
+    assert not flask.has_app_context()
+    assert purge_visitas.run(days=30, export=False) == 0
+    assert db.rows == [] and db.commits == 1
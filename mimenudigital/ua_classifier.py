@@ -0,0 +1,118 @@
+# ============================================================
+# UA CLASSIFIER - Clasificación compilada de User-Agent
+# ============================================================
+# registrar_visita() se ejecuta en el thread del request en cada hit al
+# menú público (incluso con el menú en caché). En lugar de varios
+# any(x in ua_lower ...) por request:
+#
+# - Regex precompilados (alternancia = un solo recorrido del string
+#   con re.IGNORECASE, sin lower()).
+# - LRU por string de UA: hay pocos cientos de UAs distintos, así que
+#   casi todos los hits son un lookup de dict.
+#
+# Además entrega campos para analytics: SO, navegador y navegador in-app
+# (Instagram, Facebook, WhatsApp, ...). `dispositivo` (con tablet y bot)
+# no va a los rollups: la dimensión 'dispositivo' sale de es_movil, igual
+# que en el backfill de la migración 017.
+# ============================================================
+
+import re
+from collections import namedtuple
+from functools import lru_cache
+
+UA_CACHE_SIZE = 4096
+
+InfoUA = namedtuple('InfoUA', ['es_movil', 'ua_qr', 'dispositivo', 'os', 'navegador', 'app'])
+
+# Mismos tokens que usaba registrar_visita()
+_RE_MOVIL = re.compile(r'mobile|android|iphone|ipad|ipod', re.IGNORECASE)
+_RE_QR = re.compile(r'qr|scanner|barcode|zxing|nfc', re.IGNORECASE)
+
+_RE_BOT = re.compile(r'bot\b|crawler|spider|slurp|facebookexternalhit|whatsapp/\d|preview|headless', re.IGNORECASE)
+_RE_TABLET = re.compile(r'ipad|tablet|kindle|silk/|playbook', re.IGNORECASE)
+_RE_ANDROID = re.compile(r'android', re.IGNORECASE)
+_RE_MOBILE = re.compile(r'mobile', re.IGNORECASE)
+
+# El orden importa: gana el primer patrón de la lista que coincide
+# (un UA de Android también dice "Linux"; uno de Edge también dice "Chrome/")
+_OS = (
+    ('ios', re.compile(r'iphone|ipad|ipod|cpu (?:iphone )?os \d', re.IGNORECASE)),
+    ('android', re.compile(r'android', re.IGNORECASE)),
+    ('windows', re.compile(r'windows nt|windows phone', re.IGNORECASE)),
+    ('macos', re.compile(r'mac os x|macintosh', re.IGNORECASE)),
+    ('chromeos', re.compile(r'\bcros\b', re.IGNORECASE)),
+    ('linux', re.compile(r'linux', re.IGNORECASE)),
+)
+
+# In-app browsers: tokens que agregan las apps a su WebView
+# (WhatsApp abre los links en el navegador; su UA propio es el bot de preview)
+_RE_APP = re.compile(
+    r'(?P<instagram>instagram)'
+    r'|(?P<facebook>fban|fbav|fb_iab|fbios|fb4a)'
+    r'|(?P<tiktok>tiktok|musical_ly|bytedancewebview)'
+    r'|(?P<messenger>messenger)'
+    r'|(?P<line>\bline/)'
+    r'|(?P<snapchat>snapchat)'
+    r'|(?P<twitter>twitter)',
+    re.IGNORECASE
+)
+
+# Edge/Opera/Samsung antes que Chrome (todos dicen "Chrome/"), Chrome antes que Safari
+_NAVEGADORES = (
+    ('edge', re.compile(r'edg(?:e|a|ios)?/', re.IGNORECASE)),
+    ('opera', re.compile(r'opr/|opera', re.IGNORECASE)),
+    ('samsung', re.compile(r'samsungbrowser', re.IGNORECASE)),
+    ('firefox', re.compile(r'firefox|fxios', re.IGNORECASE)),
+    ('chrome', re.compile(r'chrome/|crios', re.IGNORECASE)),
+    ('safari', re.compile(r'safari', re.IGNORECASE)),
+)
+
+
+def _grupo(regex, texto, default='otro'):
+    m = regex.search(texto)
+    return m.lastgroup if m else default
+
+
+def _primero(patrones, texto, default='otro'):
+    for nombre, regex in patrones:
+        if regex.search(texto):
+            return nombre
+    return default
+
+
+@lru_cache(maxsize=UA_CACHE_SIZE)
+def clasificar_user_agent(user_agent):
+    """
+    Clasifica un User-Agent (resultado cacheado por string).
+
+    Returns:
+        InfoUA: es_movil, ua_qr (UA de app lectora QR/NFC), dispositivo
+        ('movil', 'tablet', 'desktop', 'bot'), os, navegador, app (o None)
+    """
+    ua = user_agent or ''
+    es_movil = bool(_RE_MOVIL.search(ua))
+    app = _grupo(_RE_APP, ua, default=None)
+
+    if ua and app is None and _RE_BOT.search(ua):
+        dispositivo = 'bot'
+    elif _RE_TABLET.search(ua) or (_RE_ANDROID.search(ua) and not _RE_MOBILE.search(ua)):
+        dispositivo = 'tablet'
+    elif es_movil:
+        dispositivo = 'movil'
+    else:
+        dispositivo = 'desktop'
+
+    return InfoUA(
+        es_movil=es_movil,
+        ua_qr=bool(_RE_QR.search(ua)),
+        dispositivo=dispositivo,
+        os=_primero(_OS, ua),
+        navegador='in-app' if app else _primero(_NAVEGADORES, ua),
+        app=app,
+    )
+
+
+def cache_info():
+    """Estadísticas del LRU (hits/misses/currsize) para /healthz."""
+    info = clasificar_user_agent.cache_info()
+    return {'hits': info.hits, 'misses': info.misses, 'size': info.currsize, 'max': info.maxsize}
@@ -0,0 +1,109 @@
+# ============================================================
+# UPLOAD VALIDATION - Inspección de archivos subidos en una pasada
+# ============================================================
+# validate_image_file() leía max_len + 1 bytes (hasta 5 MB) solo para
+# medir el archivo, volvía al inicio y leía de nuevo la cabecera. Ahora:
+#
+# - El tamaño sale de content_length o de seek(0, SEEK_END) sobre el
+#   stream (werkzeug guarda los uploads en un SpooledTemporaryFile, que
+#   siempre es seekable): no se lee ningún byte para medir.
+# - La cabecera (CABECERA_BYTES) se lee una sola vez y se usa para el
+#   MIME sniffing y para las firmas binarias.
+# - Si el stream no es seekable se copia por bloques a un
+#   SpooledTemporaryFile (cortando apenas supera el máximo) y pasa a ser
+#   file.stream: la subida posterior lee esa misma copia.
+#
+# El stream siempre queda en su posición inicial.
+# ============================================================
+
+import os
+import tempfile
+
+CABECERA_BYTES = 2048
+SPOOL_MAX_BYTES = 512 * 1024   # En memoria hasta 512 KB; más, a disco
+BLOQUE_BYTES = 64 * 1024
+
+# Firmas de los formatos de ALLOWED_EXTENSIONS (se usan sin python-magic)
+FIRMAS_IMAGEN = (
+    (b'\xff\xd8\xff', 'image/jpeg'),
+    (b'\x89PNG', 'image/png'),
+    (b'GIF8', 'image/gif'),
+)
+
+
+class ArchivoDemasiadoGrande(Exception):
+    pass
+
+
+def tipo_por_firma(cabecera):
+    """MIME según los primeros bytes, o None si no es un formato conocido."""
+    for firma, mime in FIRMAS_IMAGEN:
+        if cabecera.startswith(firma):
+            return mime
+    if len(cabecera) >= 12 and cabecera[0:4] == b'RIFF' and cabecera[8:12] == b'WEBP':
+        return 'image/webp'
+    return None
+
+
+def _seekable(stream):
+    try:
+        return stream.seekable()
+    except (AttributeError, ValueError):
+        return hasattr(stream, 'seek') and hasattr(stream, 'tell')
+
+
+def _spool(file, max_len):
+    """Copia un stream no seekable a un SpooledTemporaryFile y lo deja como file.stream."""
+    spool = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_BYTES)
+    total = 0
+    while True:
+        bloque = file.stream.read(BLOQUE_BYTES)
+        if not bloque:
+            break
+        total += len(bloque)
+        if total > max_len:
+            spool.close()
+            raise ArchivoDemasiadoGrande()
+        spool.write(bloque)
+    spool.seek(0)
+    file.stream = spool
+    return total
+
+
+def inspeccionar_upload(file, max_len, cabecera_bytes=CABECERA_BYTES):
+    """
+    Mide el archivo y lee su cabecera sin cargarlo en memoria.
+
+    Args:
+        file: FileStorage (o cualquier objeto con .stream)
+        max_len: tamaño máximo en bytes
+
+    Returns:
+        tuple: (tamaño en bytes o None si no se pudo medir, cabecera)
+
+    Raises:
+        ArchivoDemasiadoGrande: si supera max_len
+    """
+    cl = getattr(file, 'content_length', None)
+    if cl and cl > max_len:
+        raise ArchivoDemasiadoGrande()
+
+    stream = file.stream
+    if not _seekable(stream):
+        tamano = _spool(file, max_len)
+        stream = file.stream
+    else:
+        try:
+            pos = stream.tell()
+            stream.seek(0, os.SEEK_END)
+            tamano = stream.tell() - pos
+            stream.seek(pos)
+        except (OSError, ValueError):
+            tamano = None
+        if tamano is not None and tamano > max_len:
+            raise ArchivoDemasiadoGrande()
+
+    pos = stream.tell()
+    cabecera = stream.read(cabecera_bytes)
+    stream.seek(pos)
+    return tamano, cabecera